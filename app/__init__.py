@@ -1,8 +1,8 @@
 import os
+from collections import defaultdict
 from flask import Flask, render_template, request, redirect, url_for, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from sqlalchemy import func
 
 
 # Datenbank-Instanz erstellen
@@ -63,6 +63,15 @@ def create_app(test_config=None):
         ConsumptionData,
         CostType,
     )
+    # Rollup-Pflege (after_flush-Listener) registrieren
+    from app import consumption_rollup
+    # Startseiten-Kennzahlen (after_flush-Listener) registrieren
+    from app.dashboard_stats import dashboard_snapshot
+    # Invalidierung des Stammdaten-Caches (Session-Listener) registrieren
+    from app import reference_data
+    from app.reference_data import get_cost_type
+    # Änderungszähler für den Verteilungs-Cache (after_flush-Listener) registrieren
+    from app import allocation_cache
 
     # Blueprints registrieren
     from app.tenants import bp_tenants as tenants_bp
@@ -98,49 +107,49 @@ def create_app(test_config=None):
     from app.billing import billing_bp
     app.register_blueprint(billing_bp)
 
+    # Jobs Blueprint registrieren (Hintergrundaufgaben)
+    from app.jobs import jobs_bp
+    app.register_blueprint(jobs_bp)
+
+    # CLI-Befehle registrieren
+    from app.cli import register_cli
+    register_cli(app)
+
+    # Optionales Profiling (PROFILING_ENABLED): Server-Timing, JSON-Log, /debug/perf
+    from app.profiling import init_profiling
+    init_profiling(app)
+
     @app.route('/')
     @app.route('/index')
     def index():
-        # Aggregierte Kennzahlen
+        # Kennzahlen aus dem materialisierten Schnappschuss (eine Abfrage, siehe app.dashboard_stats)
+        selected_building_id = session.get('building_id')
+        snapshot = dashboard_snapshot(selected_building_id)
+        counts = snapshot['counts']
         stats = {
-            'buildings': db.session.query(Building).count(),
-            'apartments': db.session.query(Apartment).count(),
-            'tenants': db.session.query(Tenant).count(),
-            'contracts': db.session.query(Contract).count(),
-            'invoices': db.session.query(Invoice).count(),
+            'buildings': counts[Building.__tablename__],
+            'apartments': counts[Apartment.__tablename__],
+            'tenants': counts[Tenant.__tablename__],
+            'contracts': counts[Contract.__tablename__],
+            'invoices': counts[Invoice.__tablename__],
         }
 
-        # Optional nach Gebäude filtern, falls gewählt (nur für Rechnungen sinnvoll, da Feld vorhanden)
-        selected_building_id = session.get('building_id')
-
-        invoice_ct_query = (
-            db.session.query(CostType.name.label('name'), func.sum(Invoice.amount).label('total'))
-            .select_from(Invoice)
-            .join(CostType, Invoice.cost_type_id == CostType.id)
-        )
-        if selected_building_id:
-            invoice_ct_query = invoice_ct_query.filter(Invoice.building_id == selected_building_id)
-        invoice_ct_query = invoice_ct_query.group_by(CostType.name).order_by(CostType.name)
-        invoices_by_cost_type = invoice_ct_query.all()
-
+        # Rechnungssummen je Kostenart, optional nach gewähltem Gebäude gefiltert
+        invoices_by_cost_type = defaultdict(float)
+        for cost_type_id, total in snapshot['invoice_totals'].items():
+            cost_type = get_cost_type(cost_type_id)
+            if cost_type is not None:
+                invoices_by_cost_type[cost_type.name] += total
         chart_invoices = {
-            'labels': [row.name for row in invoices_by_cost_type],
-            'data': [float(row.total or 0) for row in invoices_by_cost_type],
+            'labels': sorted(invoices_by_cost_type),
+            'data': [invoices_by_cost_type[name] for name in sorted(invoices_by_cost_type)],
         }
 
-        # Verbrauch nach Monat (SQLite: strftime). Gesamtsicht, da ConsumptionData kein building_id hat
-        consumption_query = (
-            db.session.query(
-                func.strftime('%Y-%m', ConsumptionData.date).label('month'),
-                func.sum(ConsumptionData.value).label('total'),
-            )
-            .group_by('month')
-            .order_by('month')
-        )
-        consumption_by_month = consumption_query.all()
+        # Verbrauch nach Monat aus dem Monats-Rollup. Gesamtsicht, da ConsumptionData kein building_id hat
+        consumption_by_month = snapshot['consumption_by_month']
         chart_consumption = {
-            'labels': [row.month for row in consumption_by_month],
-            'data': [float(row.total or 0) for row in consumption_by_month],
+            'labels': [month.strftime('%Y-%m') for month, _ in consumption_by_month],
+            'data': [total for _, total in consumption_by_month],
         }
 
         return render_template(
@@ -149,6 +158,7 @@ def create_app(test_config=None):
             stats=stats,
             chart_invoices=chart_invoices,
             chart_consumption=chart_consumption,
+            refreshed_at=snapshot['refreshed_at'],
         )
 
     # Navbar: Gebäude-Auswahl bereitstellen
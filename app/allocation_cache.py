@@ -0,0 +1,162 @@
+"""
+Cache für berechnete Verteilungen (Kostenposition × Zeitraum × Gebäude).
+
+Vorschau und PDF derselben Abrechnung berechnen alle Verteilungen aus den
+Rohdaten neu. Der Cache hält die Ergebnisse von ``_compute_item`` je Prozess
+(LRU mit Größenlimit ``ALLOCATION_CACHE_SIZE``, 0 = aus). Der Schlüssel enthält
+neben Kostenposition, Zeitraum, Gebäude und Rundung den Daten-Fingerabdruck:
+die Änderungszähler aus ``data_version``. Flushes auf eine der ``TRACKED_MODELS``
+merken die geänderten Tabellen nur vor; erhöht wird einmal je Transaktion kurz
+vor dem Commit (``before_commit``), sodass Schreiber – etwa ein Import mit vielen
+Flushes – die Zählerzeilen nur am Ende kurz sperren. Nach einer Änderung passt
+kein alter Eintrag mehr; veraltete Einträge fallen per LRU heraus.
+
+Die Zähler liegen in der Datenbank und gelten damit auch für Änderungen aus
+anderen Prozessen (Worker, CLI). Schreibvorgänge an der Session vorbei
+(Core-Inserts) müssen ``mark_data_changed`` (Erhöhung beim Commit) oder
+``bump_data_versions`` (sofort) selbst aufrufen.
+"""
+import copy
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (
+    Apartment, ApartmentShare, ConsumptionData, Contract, CostType, DataVersion, Invoice, OccupancyPeriod,
+)
+
+DEFAULT_CACHE_SIZE = 256
+
+# Alle Tabellen, von denen eine Verteilung abhängt
+TRACKED_MODELS = (ConsumptionData, ApartmentShare, OccupancyPeriod, Invoice, Contract, Apartment, CostType)
+TRACKED_TABLES = tuple(sorted(model.__tablename__ for model in TRACKED_MODELS))
+
+_VERSIONS = DataVersion.__table__
+
+
+class AllocationCache:
+    """LRU-Cache {Schlüssel: Ergebnis einer Kostenposition}, threadsicher."""
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+def get_allocation_cache() -> Optional[AllocationCache]:
+    """Cache der aktuellen App (None ohne App-Kontext oder bei ``ALLOCATION_CACHE_SIZE = 0``)."""
+    if not has_app_context():
+        return None
+    cache = current_app.extensions.get('allocation_cache')
+    if cache is None:
+        size = int(current_app.config.get('ALLOCATION_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+        cache = current_app.extensions['allocation_cache'] = AllocationCache(size)
+    return cache if cache.max_size > 0 else None
+
+
+def data_fingerprint(session=None) -> Optional[Tuple[Tuple[str, int], ...]]:
+    """Änderungszähler aller abrechnungsrelevanten Tabellen (eine Abfrage).
+
+    Liefert None, solange die Session eigene, noch nicht committete Änderungen
+    enthält: deren Zählerstände könnten nach einem Rollback von einem anderen
+    Prozess mit anderen Daten erneut erreicht werden.
+    """
+    session = session or db.session
+    if session.info.get('data_versions_pending'):
+        return None
+    versions = dict(session.execute(
+        select(_VERSIONS.c.table_name, _VERSIONS.c.version).where(_VERSIONS.c.table_name.in_(TRACKED_TABLES))
+    ).all())
+    return tuple((table, versions.get(table, 0)) for table in TRACKED_TABLES)
+
+
+def cache_key(item: dict, period_start: date, period_end: date, building_id: Optional[int], rounding: str,
+              fingerprint) -> tuple:
+    definition = json.dumps(item, sort_keys=True, default=str)
+    return definition, period_start, period_end, building_id, rounding, fingerprint
+
+
+def bump_data_versions(tables, connection=None):
+    """Erhöht die Änderungszähler der angegebenen Tabellen (ohne Commit)."""
+    connection = connection if connection is not None else db.session.connection()
+    for table in sorted(set(tables)):
+        result = connection.execute(
+            update(_VERSIONS).where(_VERSIONS.c.table_name == table).values(version=_VERSIONS.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(_VERSIONS).values(table_name=table, version=1))
+
+
+def mark_data_changed(tables, session=None):
+    """Merkt Tabellen vor, deren Änderungszähler beim nächsten Commit erhöht werden."""
+    session = session or db.session
+    session.info.setdefault('data_versions_pending', set()).update(tables)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_tables(session, flush_context):
+    tables = {obj.__tablename__ for obj in (*session.new, *session.deleted) if isinstance(obj, TRACKED_MODELS)}
+    tables.update(obj.__tablename__ for obj in session.dirty
+                  if isinstance(obj, TRACKED_MODELS) and session.is_modified(obj))
+    if tables:
+        mark_data_changed(tables, session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_once_per_transaction(session):
+    session.flush()  # Änderungen, die erst der Commit flushen würde, mit erfassen
+    tables = session.info.get('data_versions_pending')
+    if tables:
+        bump_data_versions(tables, session.connection())
+
+
+@event.listens_for(Session, 'after_commit')
+def _clear_pending_on_commit(session):
+    session.info.pop('data_versions_pending', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _clear_pending_on_rollback(session, previous_transaction):
+    # Ein zurückgerollter Savepoint lässt die äußere Transaktion (und deren Zähler) bestehen
+    if previous_transaction.parent is None:
+        session.info.pop('data_versions_pending', None)
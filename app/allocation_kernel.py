@@ -0,0 +1,208 @@
+"""
+Spaltenorientierter Kern für proportionale Kostenverteilung.
+
+Alle Verteilschlüssel (Anteile, Verbrauch, Personentage) reduzieren sich auf
+"Betrag proportional zu Gewichten verteilen". Dieser Kern nimmt die Gewichte als
+Spalten (Wohnungs-IDs, Gewichte) entgegen und berechnet alle Anteile in einem
+vektorisierten Durchlauf mit NumPy. Ist NumPy nicht installiert, wird eine
+reine Python-Implementierung mit identischer Semantik verwendet. Beide Backends
+rechnen mit derselben (korrekt gerundeten) Gewichtssumme und runden über
+``round_cents``; ihre Ergebnisse sind damit centgenau gleich.
+
+Rundungsmodi:
+    ``ROUNDING_PER_SHARE`` (Standard): jeder Anteil wird einzeln auf Cent gerundet;
+        die Summe kann um einige Cent vom Gesamtbetrag abweichen.
+    ``ROUNDING_LARGEST_REMAINDER``: Beträge werden als ganze Cent verteilt
+        (Hare/Largest-Remainder), die Summe entspricht exakt dem Gesamtbetrag.
+"""
+import math
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optionale Abhängigkeit
+    np = None
+
+HAS_NUMPY = np is not None
+
+ROUNDING_PER_SHARE = 'per_share'
+ROUNDING_LARGEST_REMAINDER = 'largest_remainder'
+ROUNDING_MODES = (ROUNDING_PER_SHARE, ROUNDING_LARGEST_REMAINDER)
+
+
+def _use_numpy(backend: Optional[str]) -> bool:
+    if backend is None:
+        return HAS_NUMPY
+    if backend == 'numpy':
+        if not HAS_NUMPY:
+            raise ValueError("Backend 'numpy' angefordert, aber NumPy ist nicht installiert.")
+        return True
+    if backend == 'python':
+        return False
+    raise ValueError(f"Unbekanntes Backend '{backend}' (erlaubt: 'numpy', 'python').")
+
+
+def _check_rounding(rounding: str):
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f"Unbekannter Rundungsmodus '{rounding}' (erlaubt: {', '.join(ROUNDING_MODES)}).")
+
+
+def _weight_total(weights) -> float:
+    # Korrekt gerundete Summe: unabhängig von Reihenfolge und Backend
+    if np is not None and isinstance(weights, np.ndarray):
+        weights = weights.tolist()
+    return math.fsum(weights)
+
+
+def round_cents(cents):
+    """Rundet Cent-Beträge kaufmännisch auf ganze Cent (halbe Cent vom Nullpunkt weg).
+
+    Für float und NumPy-Arrays mit denselben Gleitkommaoperationen (Betrag + 0.5,
+    abrunden), damit beide Backends identisch runden. Liefert float bzw. ein float-Array.
+    """
+    if np is not None and isinstance(cents, np.ndarray):
+        return np.copysign(np.floor(np.abs(cents) + 0.5), cents)
+    return math.copysign(math.floor(abs(cents) + 0.5), cents)
+
+
+def to_cents(amount: float) -> int:
+    """Wandelt einen Euro-Betrag in ganze Cent um (kaufmännisch gerundet)."""
+    return int((Decimal(str(float(amount))) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def allocate_cents(apartment_ids: Sequence[int], weights: Sequence[float], total_cents: int,
+                   backend: Optional[str] = None) -> Dict[int, int]:
+    """
+    Verteilt ``total_cents`` ganzzahlig nach dem Largest-Remainder-Verfahren.
+
+    Jede Wohnung mit positivem Gewicht erhält zunächst den abgerundeten Cent-Anteil;
+    die verbleibenden Cent gehen an die Wohnungen mit den größten Nachkommaresten
+    (bei Gleichstand an die kleinere Wohnungs-ID). Die Summe entspricht exakt
+    ``total_cents``, sofern mindestens ein Gewicht positiv ist. Gewichte <= 0
+    erhalten 0 und zählen nicht zum Nenner.
+
+    Returns:
+        dict: {apartment_id: Cent-Betrag}
+    """
+    if len(apartment_ids) != len(weights):
+        raise ValueError("apartment_ids und weights müssen gleich lang sein.")
+    if len(apartment_ids) == 0:
+        return {}
+    sign = -1 if total_cents < 0 else 1
+    amount = abs(int(total_cents))
+
+    if _use_numpy(backend):
+        w = np.asarray(weights, dtype=float)
+        w = np.where(w > 0, w, 0.0)
+        total_weight = _weight_total(w)
+        cents = np.zeros(len(w), dtype=np.int64)
+        if total_weight > 0 and amount:
+            quotas = (w / total_weight) * amount
+            floors = np.floor(quotas)
+            cents = floors.astype(np.int64)
+            remainder = amount - int(cents.sum())
+            if remainder > 0:
+                positive = np.flatnonzero(w > 0)
+                ids = np.asarray(apartment_ids)[positive]
+                order = positive[np.lexsort((ids, -(quotas - floors)[positive]))]
+                np.add.at(cents, order[np.arange(remainder) % len(order)], 1)
+        return dict(zip(apartment_ids, (sign * cents).tolist()))
+
+    positive = [(apartment_id, weight) for apartment_id, weight in zip(apartment_ids, weights) if weight > 0]
+    total_weight = _weight_total(weight for _, weight in positive)
+    cents = {apartment_id: 0 for apartment_id in apartment_ids}
+    if total_weight > 0 and amount:
+        fractions = []
+        for apartment_id, weight in positive:
+            quota = (weight / total_weight) * amount
+            cents[apartment_id] = int(quota)
+            fractions.append((-(quota - int(quota)), apartment_id))
+        remainder = amount - sum(cents.values())
+        fractions.sort()
+        for i in range(remainder):
+            cents[fractions[i % len(fractions)][1]] += 1
+    return {apartment_id: sign * value for apartment_id, value in cents.items()}
+
+
+def allocate_columns(apartment_ids: Sequence[int], weights: Sequence[float], total_cost: float,
+                     backend: Optional[str] = None, rounding: str = ROUNDING_PER_SHARE) -> Dict[int, float]:
+    """
+    Verteilt ``total_cost`` proportional zu ``weights`` auf ``apartment_ids``.
+
+    Gewichte <= 0 erhalten 0.00; ist die Summe aller Gewichte <= 0, erhalten alle
+    Einträge 0.00. Jeder Anteil wird kaufmännisch auf Cent gerundet (``round_cents``) bzw. im Modus
+    ``ROUNDING_LARGEST_REMAINDER`` centgenau über ``allocate_cents`` verteilt.
+
+    Args:
+        apartment_ids: Wohnungs-IDs (gleiche Länge wie ``weights``).
+        weights: Gewichte je Wohnung (Anteil, Verbrauch, Personentage, ...).
+        total_cost: Der zu verteilende Gesamtbetrag.
+        backend: 'numpy', 'python' oder None (automatisch: NumPy, falls verfügbar).
+        rounding: ``ROUNDING_PER_SHARE`` oder ``ROUNDING_LARGEST_REMAINDER``.
+
+    Returns:
+        dict: {apartment_id: allocated_cost}
+    """
+    _check_rounding(rounding)
+    if len(apartment_ids) != len(weights):
+        raise ValueError("apartment_ids und weights müssen gleich lang sein.")
+    if len(apartment_ids) == 0:
+        return {}
+    if rounding == ROUNDING_LARGEST_REMAINDER:
+        cents = allocate_cents(apartment_ids, weights, to_cents(total_cost), backend=backend)
+        return {apartment_id: value / 100 for apartment_id, value in cents.items()}
+
+    if _use_numpy(backend):
+        w = np.asarray(weights, dtype=float)
+        total_weight = _weight_total(w)
+        if total_weight > 0:
+            shares = np.where(w > 0, round_cents((w / total_weight) * total_cost * 100) / 100, 0.0)
+        else:
+            shares = np.zeros(len(w))
+        return dict(zip(apartment_ids, shares.tolist()))
+
+    total_weight = _weight_total(weights)
+    if total_weight <= 0:
+        return {apartment_id: 0.00 for apartment_id in apartment_ids}
+    return {
+        apartment_id: round_cents((weight / total_weight) * total_cost * 100) / 100 if weight > 0 else 0.00
+        for apartment_id, weight in zip(apartment_ids, weights)
+    }
+
+
+def sum_allocations(allocations: Iterable[Dict[int, float]], backend: Optional[str] = None,
+                    rounding: str = ROUNDING_PER_SHARE) -> Dict[int, float]:
+    """
+    Summiert mehrere Teilverteilungen je Wohnung und rundet das Ergebnis auf Cent (``round_cents``).
+
+    Wohnungen, die nur in einer Teilverteilung vorkommen, sind im Ergebnis enthalten.
+    Im Modus ``ROUNDING_LARGEST_REMAINDER`` wird in ganzen Cent summiert, die
+    Summe bleibt damit exakt die Summe der (centgenauen) Teilverteilungen.
+    """
+    _check_rounding(rounding)
+    if rounding == ROUNDING_LARGEST_REMAINDER:
+        cents: Dict[int, int] = {}
+        for allocation in allocations:
+            for apartment_id, amount in allocation.items():
+                cents[apartment_id] = cents.get(apartment_id, 0) + to_cents(amount)
+        return {apartment_id: value / 100 for apartment_id, value in cents.items()}
+
+    index: Dict[int, int] = {}
+    columns = []
+    for allocation in allocations:
+        positions = [index.setdefault(apartment_id, len(index)) for apartment_id in allocation]
+        columns.append((positions, list(allocation.values())))
+
+    apartment_ids = list(index)
+    if _use_numpy(backend):
+        totals = np.zeros(len(apartment_ids))
+        for positions, amounts in columns:
+            np.add.at(totals, np.asarray(positions, dtype=np.intp), np.asarray(amounts, dtype=float))
+        return dict(zip(apartment_ids, (round_cents(totals * 100) / 100).tolist()))
+
+    totals = [0.0] * len(apartment_ids)
+    for positions, amounts in columns:
+        for position, amount in zip(positions, amounts):
+            totals[position] += amount
+    return {apartment_id: round_cents(total * 100) / 100 for apartment_id, total in zip(apartment_ids, totals)}
@@ -0,0 +1,131 @@
+"""
+Sammelexport aller Abrechnungen eines Gebäudes als ZIP oder als ein Sammel-PDF.
+
+Die Verteilungen werden einmal im Elternprozess berechnet (``compute_billing_run``).
+Das CPU-lastige Rendern mit ReportLab wird anschließend über einen
+``ProcessPoolExecutor`` auf alle Kerne verteilt. Über die Prozessgrenze gehen
+nur einfache Payload-Dictionaries (keine SQLAlchemy-Objekte); die fertigen PDFs
+werden in Reihenfolge direkt in das ZIP geschrieben.
+
+Das Sammel-PDF (``export_statements_bundle``) für den Druck entsteht dagegen in
+einem einzigen Dokumentaufbau im aktuellen Prozess: alle Abrechnungen teilen
+sich Logo, Stile und Schriften, je Mieter beginnt eine neue Seite.
+"""
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Callable, Optional
+
+from flask import current_app
+
+from app.billing.engine import compute_billing_run, contracts_for_period
+from app.pdf_generation import build_statement_payload, get_statement_renderer, render_statement_pdf
+from app.profiling import profile_block
+
+
+EXPORT_ZIP = 'zip'
+EXPORT_PDF = 'pdf'
+EXPORT_FORMATS = (EXPORT_ZIP, EXPORT_PDF)
+
+
+def _configured_workers() -> int:
+    try:
+        workers = current_app.config.get('BILLING_BULK_WORKERS')
+    except Exception:
+        workers = None
+    return int(workers) if workers else (os.cpu_count() or 1)
+
+
+def statement_filename(payload: dict) -> str:
+    return f"abrechnung_{payload['contract_id']}_{payload['period_start']}_{payload['period_end']}.pdf"
+
+
+def build_statement_payloads(building_id: Optional[int], period_start: date, period_end: date, cost_items: list) -> list:
+    """Berechnet alle Verteilungen einmal und liefert ein Payload pro Vertrag."""
+    run = compute_billing_run(period_start, period_end, cost_items, building_id)
+    return [
+        build_statement_payload(contract, run.rows_for_apartment(contract.apartment_id), period_start, period_end)
+        for contract in contracts_for_period(period_start, period_end, building_id)
+    ]
+
+
+def render_payloads(payloads: list, max_workers: Optional[int] = None):
+    """Rendert Payloads (parallel, falls mehr als ein Worker) und liefert (payload, pdf_bytes) in Reihenfolge."""
+    workers = max_workers if max_workers is not None else _configured_workers()
+    workers = max(1, min(workers, len(payloads)))
+    if workers == 1:
+        for payload in payloads:
+            yield payload, render_statement_pdf(payload)
+        return
+
+    # 'spawn' statt 'fork': der Webserver ist multithreaded, ein Fork könnte gehaltene Locks erben
+    context = multiprocessing.get_context('spawn')
+    chunksize = max(1, len(payloads) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for payload, pdf_bytes in zip(payloads, executor.map(render_statement_pdf, payloads, chunksize=chunksize)):
+            yield payload, pdf_bytes
+
+
+def export_statements_zip(fileobj, building_id: Optional[int], period_start: date, period_end: date,
+                          cost_items: list, max_workers: Optional[int] = None,
+                          progress_callback: Optional[Callable[[int, int], None]] = None) -> dict:
+    """
+    Schreibt die Abrechnungen aller Verträge eines Gebäudes als ZIP in ``fileobj``.
+
+    Args:
+        fileobj: Beschreibbares, binäres File-like Object (Datei, SpooledTemporaryFile, BytesIO).
+        building_id: ID des Gebäudes (None = alle Verträge).
+        period_start: Startdatum des Abrechnungszeitraums.
+        period_end: Enddatum des Abrechnungszeitraums.
+        cost_items: Kostenpositionen im Format von ``generate_utility_statement_pdf``.
+        max_workers: Anzahl Render-Prozesse (Default: ``BILLING_BULK_WORKERS`` bzw. Anzahl CPUs).
+        progress_callback: Optional, wird nach jedem PDF mit (erledigt, gesamt) aufgerufen.
+
+    Returns:
+        dict: {'statements': Anzahl geschriebener PDFs, 'failed': [contract_id, ...]}
+    """
+    with profile_block('billing_export', building_id=building_id):
+        payloads = build_statement_payloads(building_id, period_start, period_end, cost_items)
+        written = 0
+        failed = []
+        with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for done, (payload, pdf_bytes) in enumerate(render_payloads(payloads, max_workers), start=1):
+                if pdf_bytes:
+                    zf.writestr(statement_filename(payload), pdf_bytes)
+                    written += 1
+                else:
+                    failed.append(payload['contract_id'])
+                if progress_callback:
+                    progress_callback(done, len(payloads))
+    return {'statements': written, 'failed': failed}
+
+
+def export_statements_bundle(fileobj, building_id: Optional[int], period_start: date, period_end: date,
+                             cost_items: list, toc: bool = False,
+                             progress_callback: Optional[Callable[[int, int], None]] = None) -> dict:
+    """
+    Schreibt die Abrechnungen aller Verträge eines Gebäudes als ein PDF in ``fileobj``.
+
+    Args:
+        fileobj: Beschreibbares, binäres File-like Object.
+        building_id: ID des Gebäudes (None = alle Verträge).
+        period_start: Startdatum des Abrechnungszeitraums.
+        period_end: Enddatum des Abrechnungszeitraums.
+        cost_items: Kostenpositionen im Format von ``generate_utility_statement_pdf``.
+        toc: Inhaltsverzeichnis (Mieter mit Blattnummer) voranstellen.
+        progress_callback: Optional, wird nach jeder Abrechnung mit (erledigt, gesamt) aufgerufen.
+
+    Returns:
+        dict: {'statements': Anzahl Abrechnungen im PDF, 'failed': [contract_id, ...]}
+    """
+    with profile_block('billing_export', building_id=building_id):
+        payloads = build_statement_payloads(building_id, period_start, period_end, cost_items)
+        if not payloads:
+            return {'statements': 0, 'failed': []}
+        renderer = get_statement_renderer(payloads[0]['header'])
+        written = renderer.render_bundle(fileobj, payloads, toc=toc, progress_callback=progress_callback)
+    if written is None:
+        return {'statements': 0, 'failed': [payload['contract_id'] for payload in payloads]}
+    return {'statements': written, 'failed': []}
@@ -0,0 +1,262 @@
+"""
+Abrechnungslauf für ein ganzes Gebäude.
+
+Statt für jeden Vertrag alle Verteilungen des Hauses neu zu berechnen, wird jede
+Kostenposition genau einmal verteilt. Das Ergebnis ist eine Matrix
+Wohnung × Kostenposition, aus der alle Mieterabrechnungen (PDF und Vorschau)
+gerendert werden. Die Anzahl der Abfragen wächst damit mit der Anzahl der
+Kostenpositionen, nicht mit Verträge × Kostenpositionen.
+"""
+from datetime import date
+from typing import Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from app.models import Apartment, Contract
+from app.allocation_kernel import ROUNDING_LARGEST_REMAINDER, sum_allocations
+from app.calculations import (
+    allocate_by_weights,
+    get_share_values,
+    get_consumption_totals,
+    get_person_days_by_apartment,
+    calculate_direct_allocation,
+    split_heating_cost,
+)
+from app.pdf_generation import build_statement_payload, render_statement_pdf
+from app.profiling import profile_block
+from app.allocation_cache import get_allocation_cache, data_fingerprint, cache_key
+from app.reference_data import get_cost_type
+
+
+class BillingRun:
+    """Ergebnis eines Abrechnungslaufs: eine berechnete Verteilung pro Kostenposition.
+
+    Jede Position in ``items`` ist ein Dictionary mit den Schlüsseln
+    ``name``, ``total_cost``, ``allocation`` ({apartment_id: Betrag}),
+    ``kind`` und den für die Beschreibung des Verteilschlüssels nötigen Daten
+    (``key_values``, ``unit``, ``hot_water_percentage``).
+    """
+
+    def __init__(self, period_start: date, period_end: date, cost_items: list, building_id: Optional[int] = None,
+                 rounding: str = ROUNDING_LARGEST_REMAINDER):
+        self.rounding = rounding
+        self.period_start = period_start
+        self.period_end = period_end
+        self.cost_items = cost_items
+        self.building_id = building_id
+        self.items: List[dict] = []
+        # {contract_id: pdf_bytes}, wird von run_building_billing befüllt
+        self.statements: Dict[int, bytes] = {}
+
+    @property
+    def matrix(self) -> Dict[int, List[float]]:
+        """Ergebnis-Matrix {apartment_id: [Betrag je Kostenposition]}."""
+        apartment_ids = set()
+        for item in self.items:
+            apartment_ids.update(item['allocation'].keys())
+        return {
+            apt_id: [item['allocation'].get(apt_id, 0.0) for item in self.items]
+            for apt_id in apartment_ids
+        }
+
+    def rows_for_apartment(self, apartment_id: int) -> List[dict]:
+        """Liefert die Abrechnungszeilen einer Wohnung aus der berechneten Matrix.
+
+        Returns:
+            list: [{'name', 'total_cost', 'key_desc', 'tenant_share', 'error'}, ...]
+        """
+        rows = []
+        for item in self.items:
+            rows.append({
+                'name': item['name'],
+                'total_cost': item['total_cost'],
+                'key_desc': _describe_key(item, apartment_id),
+                'tenant_share': item['allocation'].get(apartment_id, 0.0),
+                'error': item['kind'] == 'missing',
+            })
+        return rows
+
+
+def _describe_key(item: dict, apartment_id: int) -> str:
+    kind = item['kind']
+    if kind == 'share':
+        share_value = item['key_values'].get(apartment_id, 'N/A')
+        return f"Anteil ({item['unit']}: {share_value})"
+    if kind == 'consumption':
+        return f"Verbrauch ({item['unit']}: {item['key_values'].get(apartment_id, 0.0):.2f})"
+    if kind == 'person_days':
+        return f"Personentage: {item['key_values'].get(apartment_id, 0)}"
+    if kind == 'heating':
+        hot_water_percentage = item['hot_water_percentage']
+        return f"Heizung/Warmwasser Split ({hot_water_percentage:.0f}% | {100-hot_water_percentage:.0f}%) verbrauchsbasiert"
+    if kind == 'direct':
+        return "Direkt zugeordnet (Rechnungen im Zeitraum)"
+    if kind == 'missing':
+        return "Fehler"
+    return item.get('key_desc', '')
+
+
+def _configured_rounding() -> str:
+    """Rundungsmodus für PDF/Vorschau (Konfiguration ``BILLING_ROUNDING``, Default centgenau)."""
+    try:
+        return current_app.config.get('BILLING_ROUNDING') or ROUNDING_LARGEST_REMAINDER
+    except RuntimeError:
+        return ROUNDING_LARGEST_REMAINDER
+
+
+def derive_allocation(result: dict, rounding: str) -> dict:
+    """Leitet ``allocation`` aus Gewichten (``key_values``) und Betrag ab, ohne Datenbankzugriff.
+
+    Heizkosten bestehen aus zwei verbrauchsabhängigen Teilen (``parts``), deren
+    Verteilungen summiert werden (wie ``calculate_heating_allocation``).
+    """
+    if 'parts' in result:
+        result['allocation'] = sum_allocations(
+            [allocate_by_weights(part['key_values'], part['total_cost'], rounding) for part in result['parts']],
+            rounding=rounding,
+        )
+    else:
+        result['allocation'] = allocate_by_weights(result['key_values'], result['total_cost'], rounding)
+    return result
+
+
+def _compute_heating_item(item: dict, period_start: date, period_end: date, rounding: str,
+                          building_id: Optional[int] = None) -> dict:
+    """Heizkosten: Warmwasser- und Heizungsanteil je nach eigenem Verbrauch (Gewichte bleiben erhalten)."""
+    total_cost = float(item.get('total_cost', 0.0))
+    hot_water_percentage = float(item.get('hot_water_percentage', 0.0))
+    result = {'name': 'Heiz-/Warmwasserkosten', 'total_cost': total_cost, 'allocation': {},
+              'kind': 'heating', 'hot_water_percentage': hot_water_percentage}
+    if hot_water_percentage < 0 or hot_water_percentage > 100:
+        return result
+
+    hot_water_cost, heating_cost = split_heating_cost(total_cost, hot_water_percentage, rounding)
+    result['parts'] = []
+    for cost_type_id, part_cost in ((int(item.get('hot_water_consumption_cost_type_id')), hot_water_cost),
+                                    (int(item.get('heating_consumption_cost_type_id')), heating_cost)):
+        cost_type = get_cost_type(cost_type_id)
+        if cost_type and cost_type.type == 'consumption':
+            key_values = get_consumption_totals(cost_type_id, period_start, period_end, building_id)
+        else:
+            print(f"Error: CostType {cost_type_id} not found or not type 'consumption'.")
+            key_values = {}
+        result['parts'].append({'cost_type_id': cost_type_id, 'total_cost': part_cost, 'key_values': key_values,
+                                'weight_total': sum(key_values.values())})
+    return derive_allocation(result, rounding)
+
+
+def _compute_item(item: dict, period_start: date, period_end: date, rounding: str,
+                  building_id: Optional[int] = None) -> dict:
+    """Berechnet die Verteilung einer einzelnen Kostenposition (einmal für das ganze Haus)."""
+    if item.get('type') == 'heating':
+        return _compute_heating_item(item, period_start, period_end, rounding, building_id)
+
+    if item.get('type') == 'direct':
+        allocation = calculate_direct_allocation(period_start=period_start, period_end=period_end, rounding=rounding,
+                                                 building_id=building_id)
+        return {'name': 'Direkt zugeordnete Kosten', 'total_cost': sum(allocation.values()),
+                'allocation': allocation, 'kind': 'direct'}
+
+    cost_type_id = item.get('cost_type_id')
+    total_cost = float(item.get('total_cost', 0.0))
+    cost_type = get_cost_type(cost_type_id)
+    if not cost_type:
+        print(f"Warning: CostType ID {cost_type_id} not found. Skipping item.")
+        return {'name': f"Unbekannt (ID: {cost_type_id})", 'total_cost': total_cost, 'allocation': {}, 'kind': 'missing'}
+
+    result = {'name': cost_type.name, 'total_cost': total_cost, 'allocation': {}, 'cost_type_id': cost_type.id,
+              'kind': cost_type.type, 'unit': cost_type.unit, 'key_values': {}}
+    try:
+        if cost_type.type == 'share':
+            key_values = get_share_values(cost_type.id, building_id)
+        elif cost_type.type == 'consumption':
+            key_values = get_consumption_totals(cost_type.id, period_start, period_end, building_id)
+        elif cost_type.type == 'person_days':
+            # Alle Wohnungen erhalten einen Eintrag, auch ohne Belegung
+            key_values = get_person_days_by_apartment(period_start, period_end, building_id)
+        else:
+            print(f"Warning: Unknown CostType type '{cost_type.type}' for ID {cost_type_id}. Cannot allocate.")
+            result.update({'kind': 'unknown', 'key_desc': f"Unbek. Typ: {cost_type.type}"})
+            return result
+        result['key_values'] = key_values
+        result['weight_total'] = sum(key_values.values())
+        derive_allocation(result, rounding)
+    except Exception as e:
+        print(f"Error calculating allocation for CostType ID {cost_type_id}: {e}")
+        result.update({'kind': 'unknown', 'key_desc': 'Berechnungsfehler', 'allocation': {}})
+    return result
+
+
+def compute_billing_run(period_start: date, period_end: date, cost_items: list,
+                        building_id: Optional[int] = None, rounding: Optional[str] = None) -> BillingRun:
+    """Berechnet alle Kostenpositionen genau einmal und liefert die Ergebnis-Matrix.
+
+    Unveränderte Kostenpositionen kommen aus dem Verteilungs-Cache
+    (``app.allocation_cache``), solange sich keine abrechnungsrelevanten Daten geändert haben.
+
+    Args:
+        period_start: Startdatum des Abrechnungszeitraums.
+        period_end: Enddatum des Abrechnungszeitraums.
+        cost_items: Kostenpositionen im Format von ``generate_utility_statement_pdf``.
+        building_id: Optionales Gebäude; alle Verteilungen laufen nur über dessen Wohnungen.
+        rounding: Rundungsmodus (Default: ``BILLING_ROUNDING`` bzw. centgenaues
+                  Largest-Remainder-Verfahren, Summe je Position == Gesamtbetrag).
+
+    Returns:
+        BillingRun: Der berechnete Lauf (ohne gerenderte PDFs).
+    """
+    rounding = rounding or _configured_rounding()
+    run = BillingRun(period_start, period_end, cost_items, building_id, rounding)
+    with profile_block('billing_run', building_id=building_id, items=len(cost_items)):
+        cache = get_allocation_cache()
+        fingerprint = data_fingerprint() if cache is not None else None
+        for item in cost_items:
+            if fingerprint is None:
+                run.items.append(_compute_item(item, period_start, period_end, rounding, building_id))
+                continue
+            key = cache_key(item, period_start, period_end, building_id, rounding, fingerprint)
+            result = cache.get(key)
+            if result is None:
+                result = _compute_item(item, period_start, period_end, rounding, building_id)
+                cache.put(key, result)
+            run.items.append(result)
+    return run
+
+
+def contracts_for_period(period_start: date, period_end: date, building_id: Optional[int] = None) -> List[Contract]:
+    """Alle Verträge (inkl. Mieter und Wohnung), die den Zeitraum überschneiden."""
+    query = Contract.query.options(
+        joinedload(Contract.tenant), joinedload(Contract.apartment)
+    ).join(Apartment, Contract.apartment_id == Apartment.id).filter(
+        Contract.start_date <= period_end,
+        or_(Contract.end_date == None, Contract.end_date >= period_start),
+    )
+    if building_id is not None:
+        query = query.filter(Apartment.building_id == building_id)
+    return query.order_by(Apartment.number, Contract.start_date).all()
+
+
+def run_building_billing(building_id: Optional[int], period_start: date, period_end: date, cost_items: list) -> BillingRun:
+    """Abrechnungslauf für alle Verträge eines Gebäudes.
+
+    Jede Verteilung wird genau einmal berechnet, anschließend wird für jeden
+    Vertrag im Zeitraum eine Abrechnung aus der Matrix gerendert.
+
+    Args:
+        building_id: ID des Gebäudes (None = alle Verträge).
+        period_start: Startdatum des Abrechnungszeitraums.
+        period_end: Enddatum des Abrechnungszeitraums.
+        cost_items: Kostenpositionen im Format von ``generate_utility_statement_pdf``.
+
+    Returns:
+        BillingRun: Lauf mit Matrix und ``statements`` {contract_id: pdf_bytes}.
+    """
+    run = compute_billing_run(period_start, period_end, cost_items, building_id)
+    for contract in contracts_for_period(period_start, period_end, building_id):
+        payload = build_statement_payload(contract, run.rows_for_apartment(contract.apartment_id), period_start, period_end)
+        pdf_bytes = render_statement_pdf(payload)
+        if pdf_bytes:
+            run.statements[contract.id] = pdf_bytes
+    return run
@@ -0,0 +1,152 @@
+"""
+Inkrementelle Neuberechnung eines Abrechnungslaufs nach Änderung einzelner Zeilen.
+
+Jede Kostenposition eines ``BillingRun`` hält ihre Gewichte je Wohnung
+(``key_values``, die Zähler) und deren Summe (``weight_total``, der Nenner).
+Wird ein Verbrauchswert, ein Anteil oder eine Belegung geändert, werden nur die
+Gewichte der betroffenen Wohnung angepasst und die Verteilungen der betroffenen
+Positionen daraus neu abgeleitet (reine Arithmetik über die Wohnungen, keine
+Datenbankabfrage). Zurückgegeben werden die Wohnungen, deren Beträge sich
+geändert haben; nur deren Abrechnungen müssen neu gerendert werden::
+
+    before = row_values(reading)
+    reading.value = 12.5
+    db.session.commit()
+    changed = apply_row_change(run, ConsumptionData, before, row_values(reading))
+    refresh_statements(run, changed)
+"""
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.billing.engine import contracts_for_period, derive_allocation
+from app.consumption_rollup import period_bounds
+from app.models import ApartmentShare, ConsumptionData, OccupancyPeriod
+from app.pdf_generation import build_statement_payload, render_statement_pdf
+from app.reference_data import get_apartment, reference_data
+
+# (Art, cost_type_id, apartment_id) -> Gewichtsänderung; cost_type_id None = gilt für alle Positionen der Art
+WeightKey = Tuple[str, Optional[int], int]
+
+# Gewichte und Änderungen werden auf diese Nachkommastellen gerundet, damit sich nach vielen
+# Änderungen keine Gleitkommareste ansammeln (0.1 + 0.2 - 0.3 != 0)
+WEIGHT_DECIMALS = 6
+
+
+def row_values(obj) -> dict:
+    """Spaltenwerte einer Zeile als Dictionary (Schnappschuss vor bzw. nach einer Änderung)."""
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+def _person_days(values: dict, period_start: date, period_end: date) -> int:
+    start = max(values['start_date'], period_start)
+    end = min(values.get('end_date') or period_end, period_end)
+    days = (end - start).days + 1
+    return days * (values.get('number_of_occupants') or 0) if days > 0 else 0
+
+
+def _contribution(model, values: Optional[dict], period_start: date, period_end: date) -> Dict[WeightKey, float]:
+    """Beitrag einer Zeile zu den Gewichten des Laufs."""
+    if values is None:
+        return {}
+    if model is ConsumptionData:
+        start, end = period_bounds(period_start, period_end)
+        if values.get('value') is None or not start <= values['date'] < end:
+            return {}
+        return {('consumption', values['cost_type_id'], values['apartment_id']): values['value']}
+    if model is ApartmentShare:
+        if values.get('value') is None:
+            return {}
+        return {('share', values['cost_type_id'], values['apartment_id']): values['value']}
+    if model is OccupancyPeriod:
+        days = _person_days(values, period_start, period_end)
+        return {('person_days', None, values['apartment_id']): days} if days else {}
+    raise ValueError(f"Incremental update not supported for {model.__name__}")
+
+
+def _belongs_to_run(run, apartment_id: int) -> bool:
+    if run.building_id is None:
+        return get_apartment(apartment_id) is not None
+    return any(apartment.id == apartment_id for apartment in reference_data().apartments_in_building(run.building_id))
+
+
+def _weight_holders(item: dict) -> List[Tuple[str, Optional[int], dict]]:
+    """(Art, cost_type_id, Gewichts-Container) einer Position; Heizkosten haben zwei Teile."""
+    if item['kind'] == 'heating':
+        return [('consumption', part['cost_type_id'], part) for part in item.get('parts', [])]
+    if item['kind'] in ('share', 'consumption', 'person_days'):
+        return [(item['kind'], item.get('cost_type_id'), item)]
+    return []
+
+
+def apply_row_change(run, model, before: Optional[dict] = None, after: Optional[dict] = None) -> Set[int]:
+    """Passt einen Lauf an die Änderung einer Zeile an.
+
+    Args:
+        run: ``BillingRun`` aus ``compute_billing_run``.
+        model: ``ConsumptionData``, ``ApartmentShare`` oder ``OccupancyPeriod``.
+        before: Spaltenwerte vor der Änderung (``row_values``), None bei neuen Zeilen.
+        after: Spaltenwerte nach der Änderung, None bei gelöschten Zeilen.
+
+    Returns:
+        set: IDs der Wohnungen, deren Betrag oder Schlüsselwert sich in mindestens einer Position geändert hat.
+    """
+    old = _contribution(model, before, run.period_start, run.period_end)
+    new = _contribution(model, after, run.period_start, run.period_end)
+    # Ohne Share-Eintrag taucht eine Wohnung nicht mehr in der Verteilung auf
+    removed_shares = {key for key in old.keys() - new.keys() if key[0] == 'share'}
+    deltas = {key: round(new.get(key, 0) - old.get(key, 0), WEIGHT_DECIMALS) for key in old.keys() | new.keys()}
+    deltas = {key: delta for key, delta in deltas.items()
+              if (delta != 0 or key in removed_shares) and _belongs_to_run(run, key[2])}
+    if not deltas:
+        return set()
+
+    changed: Set[int] = set()
+    for item in run.items:
+        touched = False
+        for kind, cost_type_id, holder in _weight_holders(item):
+            for key, delta in deltas.items():
+                delta_kind, delta_cost_type_id, apartment_id = key
+                if delta_kind != kind or (delta_cost_type_id is not None and delta_cost_type_id != cost_type_id):
+                    continue
+                weights = holder['key_values']
+                weight = round(weights.get(apartment_id, 0) + delta, WEIGHT_DECIMALS)
+                total = holder.get('weight_total', 0) + delta
+                # Wie bei der vollständigen Berechnung: ohne Share-Eintrag bzw. ohne verbleibenden
+                # Verbrauch fehlt die Wohnung in der Verteilung (statt mit Gewicht 0 zu bleiben)
+                if key in removed_shares or (kind == 'consumption' and weight == 0 and key not in new):
+                    weights.pop(apartment_id, None)
+                    total -= weight
+                else:
+                    weights[apartment_id] = weight
+                holder['weight_total'] = round(total, WEIGHT_DECIMALS)
+                touched = True
+                # Der Verteilschlüssel (Verbrauch, Anteil, Personentage) steht auf der Abrechnung
+                changed.add(apartment_id)
+        if touched:
+            old_allocation = item['allocation']
+            derive_allocation(item, run.rounding)
+            changed.update(apartment_id for apartment_id in old_allocation.keys() | item['allocation'].keys()
+                           if old_allocation.get(apartment_id) != item['allocation'].get(apartment_id))
+    return changed
+
+
+def refresh_statements(run, apartment_ids) -> List[int]:
+    """Rendert die Abrechnungen der angegebenen Wohnungen neu (in ``run.statements``).
+
+    Returns:
+        list: IDs der neu gerenderten Verträge.
+    """
+    apartment_ids = set(apartment_ids)
+    if not apartment_ids:
+        return []
+    refreshed = []
+    for contract in contracts_for_period(run.period_start, run.period_end, run.building_id):
+        if contract.apartment_id not in apartment_ids:
+            continue
+        payload = build_statement_payload(contract, run.rows_for_apartment(contract.apartment_id),
+                                          run.period_start, run.period_end)
+        pdf_bytes = render_statement_pdf(payload)
+        if pdf_bytes:
+            run.statements[contract.id] = pdf_bytes
+            refreshed.append(contract.id)
+    return refreshed
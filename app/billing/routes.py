@@ -1,5 +1,5 @@
 from datetime import date
-from flask import request, render_template, send_file, flash, session
+from flask import request, render_template, send_file, flash, session, redirect, url_for
 from io import BytesIO
 
 from app import db
@@ -7,14 +7,11 @@ from app.models import Contract
 from app.pdf_generation import generate_utility_statement_pdf
 from . import billing_bp
 from app.pdf_generation import _format_euro as fmt_euro  # reuse formatting
-from app.calculations import (
-    calculate_share_allocation,
-    calculate_consumption_allocation,
-    calculate_person_day_allocation,
-    calculate_heating_allocation,
-    calculate_direct_allocation,
-)
-from app.models import CostType, ApartmentShare, ConsumptionData
+from app.billing.bulk import EXPORT_FORMATS, EXPORT_ZIP
+from app.billing.engine import compute_billing_run
+from app.jobs.queue import enqueue_job
+from app.models import Building
+from app.reference_data import get_apartment, reference_data
 from sqlalchemy import func
 
 
@@ -36,41 +33,7 @@ def index():
             return render_template('billing/index.html', contracts=contracts, title='Abrechnung erstellen')
 
         # Presets in Cost-Items übersetzen (scoped auf Gebäude des Vertrags oder Session)
-        contract = db.session.get(Contract, contract_id)
-        building_id = None
-        if contract and contract.apartment:
-            building_id = contract.apartment.building_id
-        if building_id is None:
-            building_id = session.get('building_id')
-        cost_items = []
-        if preset == 'standard':
-            # Beispielhaft: Wasser (consumption), Müll (person_days), Grundsteuer (share), Direktkosten
-            # Finde typische Kostenarten fallweise, falls vorhanden
-            water = CostType.query.filter_by(type='consumption').filter(CostType.name.ilike('%wasser%')).first()
-            trash = CostType.query.filter_by(type='person_days').first()
-            share = CostType.query.filter_by(type='share').first()
-            if share:
-                cost_items.append({'cost_type_id': share.id, 'total_cost': _sum_invoices_total(share.id, ps, pe, building_id)})
-            if water:
-                cost_items.append({'cost_type_id': water.id, 'total_cost': _sum_invoices_total(water.id, ps, pe, building_id)})
-            if trash:
-                cost_items.append({'cost_type_id': trash.id, 'total_cost': _sum_invoices_total(trash.id, ps, pe, building_id)})
-            cost_items.append({'type': 'direct'})
-        elif preset == 'heating_30_70':
-            heat = CostType.query.filter_by(type='consumption').filter(CostType.name.ilike('%heiz%')).first()
-            hot = CostType.query.filter_by(type='consumption').filter(CostType.name.ilike('%warmwasser%')).first()
-            total_heat_related = _sum_invoices_total(heat.id, ps, pe, building_id) + _sum_invoices_total(hot.id, ps, pe, building_id) if (heat and hot) else 0.0
-            if heat and hot and total_heat_related > 0:
-                cost_items.append({
-                    'type': 'heating',
-                    'total_cost': total_heat_related,
-                    'hot_water_percentage': 30.0,
-                    'heating_consumption_cost_type_id': heat.id,
-                    'hot_water_consumption_cost_type_id': hot.id,
-                })
-            cost_items.append({'type': 'direct'})
-        elif preset == 'direct_only':
-            cost_items.append({'type': 'direct'})
+        cost_items = build_preset_cost_items(preset, ps, pe, _contract_building_id(contract_id))
 
         if action == 'preview':
             rows, total = _preview_rows(contract_id, ps, pe, cost_items)
@@ -88,6 +51,55 @@ def index():
     return render_template('billing/index.html', contracts=contracts, title='Abrechnung erstellen')
 
 
+def build_preset_cost_items(preset: str, ps: date, pe: date, building_id: int | None = None) -> list[dict]:
+    """Übersetzt ein Preset in Kostenpositionen (Rechnungssummen optional je Gebäude)."""
+    refs = reference_data()
+    cost_items = []
+    if preset == 'standard':
+        # Beispielhaft: Wasser (consumption), Müll (person_days), Grundsteuer (share), Direktkosten
+        # Finde typische Kostenarten fallweise, falls vorhanden
+        water = _first(refs.cost_types_by_type('consumption', 'wasser'))
+        trash = _first(refs.cost_types_by_type('person_days'))
+        share = _first(refs.cost_types_by_type('share'))
+        if share:
+            cost_items.append({'cost_type_id': share.id, 'total_cost': _sum_invoices_total(share.id, ps, pe, building_id)})
+        if water:
+            cost_items.append({'cost_type_id': water.id, 'total_cost': _sum_invoices_total(water.id, ps, pe, building_id)})
+        if trash:
+            cost_items.append({'cost_type_id': trash.id, 'total_cost': _sum_invoices_total(trash.id, ps, pe, building_id)})
+        cost_items.append({'type': 'direct'})
+    elif preset == 'heating_30_70':
+        heat = _first(refs.cost_types_by_type('consumption', 'heiz'))
+        hot = _first(refs.cost_types_by_type('consumption', 'warmwasser'))
+        total_heat_related = _sum_invoices_total(heat.id, ps, pe, building_id) + _sum_invoices_total(hot.id, ps, pe, building_id) if (heat and hot) else 0.0
+        if heat and hot and total_heat_related > 0:
+            cost_items.append({
+                'type': 'heating',
+                'total_cost': total_heat_related,
+                'hot_water_percentage': 30.0,
+                'heating_consumption_cost_type_id': heat.id,
+                'hot_water_consumption_cost_type_id': hot.id,
+            })
+        cost_items.append({'type': 'direct'})
+    elif preset == 'direct_only':
+        cost_items.append({'type': 'direct'})
+    return cost_items
+
+
+def _contract_building_id(contract_id) -> int | None:
+    """Gebäude des Vertrags (über die Wohnung), sonst das in der Session gewählte Gebäude."""
+    contract = db.session.get(Contract, contract_id)
+    apartment = get_apartment(contract.apartment_id) if contract else None
+    building_id = apartment.building_id if apartment else None
+    if building_id is None:
+        building_id = session.get('building_id')
+    return building_id
+
+
+def _first(items):
+    return items[0] if items else None
+
+
 def _sum_invoices_total(cost_type_id: int, ps: date, pe: date, building_id: int | None = None) -> float:
     from app.models import Invoice
     q = db.session.query(func.sum(Invoice.amount)).filter(
@@ -105,62 +117,19 @@ def _preview_rows(contract_id: int, ps: date, pe: date, cost_items: list[dict]):
     contract = db.session.get(Contract, contract_id)
     if not contract:
         return [], 0.0
-    apartment = contract.apartment
+    apartment = get_apartment(contract.apartment_id)
+    run = compute_billing_run(ps, pe, cost_items, apartment.building_id if apartment else None)
     rows = []
     total = 0.0
 
-    for item in cost_items:
-        if item.get('type') == 'direct':
-            alloc = calculate_direct_allocation(ps, pe)
-            tenant_share = alloc.get(apartment.id, 0.0)
-            name = 'Direkt zugeordnete Kosten'
-            key_desc = 'Direkt (Rechnungen im Zeitraum)'
-            total_cost = sum(alloc.values())
-        elif item.get('type') == 'heating':
-            total_cost = float(item.get('total_cost', 0.0))
-            hot_perc = float(item.get('hot_water_percentage', 0.0))
-            heat_ct = int(item.get('heating_consumption_cost_type_id'))
-            hot_ct = int(item.get('hot_water_consumption_cost_type_id'))
-            alloc = calculate_heating_allocation(total_cost, hot_perc, heat_ct, hot_ct, ps, pe)
-            tenant_share = alloc.get(apartment.id, 0.0)
-            key_desc = f"Heizung/Warmwasser Split ({hot_perc:.0f}% | {100-hot_perc:.0f}%) verbrauchsbasiert"
-            name = 'Heiz-/Warmwasserkosten'
-        else:
-            ct_id = int(item.get('cost_type_id'))
-            total_cost = float(item.get('total_cost', 0.0))
-            from app.models import CostType
-            ct = db.session.get(CostType, ct_id)
-            name = ct.name if ct else f'Kostenart {ct_id}'
-            alloc = {}
-            key_desc = ''
-            if ct and ct.type == 'share':
-                alloc = calculate_share_allocation(ct_id, total_cost)
-                share_entry = ApartmentShare.query.filter_by(apartment_id=apartment.id, cost_type_id=ct.id).first()
-                share_val = share_entry.value if share_entry else 'N/A'
-                key_desc = f"Anteil ({ct.unit}: {share_val})"
-            elif ct and ct.type == 'consumption':
-                alloc = calculate_consumption_allocation(ct_id, total_cost, ps, pe)
-                total_apt_cons = db.session.query(func.sum(ConsumptionData.value)).filter(
-                    ConsumptionData.apartment_id == apartment.id,
-                    ConsumptionData.cost_type_id == ct.id,
-                    ConsumptionData.date >= ps,
-                    ConsumptionData.date <= pe,
-                ).scalar() or 0.0
-                key_desc = f"Verbrauch ({ct.unit}: {total_apt_cons:.2f})"
-            elif ct and ct.type == 'person_days':
-                alloc = calculate_person_day_allocation(ct_id, total_cost, ps, pe)
-                from app.calculations import calculate_person_days
-                pdays = calculate_person_days(apartment.id, ps, pe)
-                key_desc = f"Personentage: {pdays}"
-            tenant_share = alloc.get(apartment.id, 0.0)
-
+    for row in run.rows_for_apartment(contract.apartment_id):
         rows.append({
-            'name': name,
-            'total_cost_fmt': fmt_euro(total_cost),
-            'key_desc': key_desc,
-            'tenant_share_fmt': fmt_euro(tenant_share),
+            'name': row['name'],
+            'total_cost_fmt': fmt_euro(row['total_cost']),
+            'key_desc': row['key_desc'],
+            'tenant_share_fmt': fmt_euro(row['tenant_share']),
         })
-        total += tenant_share
+        total += row['tenant_share']
 
     return rows, total
 
@@ -220,56 +189,89 @@ def wizard():
 
 
 def _wizard_step2_context():
+    refs = reference_data()
+
+    def by_name(cost_types):
+        return sorted(cost_types, key=lambda ct: ct.name)
+
     return {
-        'share_types': CostType.query.filter_by(type='share').order_by(CostType.name).all(),
-        'consumption_types': CostType.query.filter_by(type='consumption').order_by(CostType.name).all(),
-        'person_day_types': CostType.query.filter_by(type='person_days').order_by(CostType.name).all(),
-        'heating_candidates': CostType.query.filter_by(type='consumption').filter(CostType.name.ilike('%heiz%')).all(),
-        'hot_water_candidates': CostType.query.filter_by(type='consumption').filter(CostType.name.ilike('%warmwasser%')).all(),
+        'share_types': by_name(refs.cost_types_by_type('share')),
+        'consumption_types': by_name(refs.cost_types_by_type('consumption')),
+        'person_day_types': by_name(refs.cost_types_by_type('person_days')),
+        'heating_candidates': refs.cost_types_by_type('consumption', 'heiz'),
+        'hot_water_candidates': refs.cost_types_by_type('consumption', 'warmwasser'),
     }
 
 
 def _build_cost_items_from_selection(req):
-    # Basic sets
+    # Rechnungssummen nur des Gebäudes, dessen Wohnungen die Kosten tragen (wie Vorschau/PDF)
     items = []
-    # Shares
-    for sid in req.form.getlist('share_ids'):
-        try:
-            ct_id = int(sid)
-            items.append({'cost_type_id': ct_id, 'total_cost': _sum_invoices_total(ct_id, date.fromisoformat(req.form['period_start']), date.fromisoformat(req.form['period_end']))})
-        except Exception:
-            continue
-    # Consumption
-    for cid in req.form.getlist('consumption_ids'):
-        try:
-            ct_id = int(cid)
-            items.append({'cost_type_id': ct_id, 'total_cost': _sum_invoices_total(ct_id, date.fromisoformat(req.form['period_start']), date.fromisoformat(req.form['period_end']))})
-        except Exception:
-            continue
-    # Person days
-    for pid in req.form.getlist('person_days_ids'):
-        try:
-            ct_id = int(pid)
-            items.append({'cost_type_id': ct_id, 'total_cost': _sum_invoices_total(ct_id, date.fromisoformat(req.form['period_start']), date.fromisoformat(req.form['period_end']))})
-        except Exception:
-            continue
-    # Heating
-    if req.form.get('use_heating') == 'on':
-        try:
-            heat_id = int(req.form.get('heating_ct_id'))
-            hot_id = int(req.form.get('hot_water_ct_id'))
-            perc = float(req.form.get('hot_water_percentage') or 30.0)
-            total = _sum_invoices_total(heat_id, date.fromisoformat(req.form['period_start']), date.fromisoformat(req.form['period_end'])) + \
-                    _sum_invoices_total(hot_id, date.fromisoformat(req.form['period_start']), date.fromisoformat(req.form['period_end']))
-            if total > 0:
-                items.append({'type': 'heating', 'total_cost': total, 'hot_water_percentage': perc,
-                              'heating_consumption_cost_type_id': heat_id,
-                              'hot_water_consumption_cost_type_id': hot_id})
-        except Exception:
-            pass
+    try:
+        ps = date.fromisoformat(req.form['period_start'])
+        pe = date.fromisoformat(req.form['period_end'])
+    except Exception:
+        ps = pe = None
+    try:
+        building_id = _contract_building_id(int(req.form['contract_id']))
+    except (KeyError, ValueError):
+        building_id = session.get('building_id')
+    if ps is not None:
+        # Shares, Consumption, Person days
+        for field in ('share_ids', 'consumption_ids', 'person_days_ids'):
+            for raw_id in req.form.getlist(field):
+                try:
+                    ct_id = int(raw_id)
+                except ValueError:
+                    continue
+                items.append({'cost_type_id': ct_id, 'total_cost': _sum_invoices_total(ct_id, ps, pe, building_id)})
+        # Heating
+        if req.form.get('use_heating') == 'on':
+            try:
+                heat_id = int(req.form.get('heating_ct_id'))
+                hot_id = int(req.form.get('hot_water_ct_id'))
+                perc = float(req.form.get('hot_water_percentage') or 30.0)
+                total = _sum_invoices_total(heat_id, ps, pe, building_id) + _sum_invoices_total(hot_id, ps, pe, building_id)
+                if total > 0:
+                    items.append({'type': 'heating', 'total_cost': total, 'hot_water_percentage': perc,
+                                  'heating_consumption_cost_type_id': heat_id,
+                                  'hot_water_consumption_cost_type_id': hot_id})
+            except Exception:
+                pass
     # Direct
     if req.form.get('use_direct') == 'on':
         items.append({'type': 'direct'})
     return items
 
 
+@billing_bp.route('/bulk', methods=['GET', 'POST'])
+def bulk():
+    buildings = Building.query.order_by(Building.name).all()
+    context = {'title': 'Sammelexport', 'buildings': buildings, 'selected_building_id': session.get('building_id')}
+
+    if request.method == 'POST':
+        building_raw = (request.form.get('building_id') or '').strip()
+        preset = (request.form.get('preset') or 'standard').strip()
+        export_format = (request.form.get('format') or EXPORT_ZIP).strip()
+        try:
+            if export_format not in EXPORT_FORMATS:
+                raise ValueError(export_format)
+            ps = date.fromisoformat(request.form.get('period_start'))
+            pe = date.fromisoformat(request.form.get('period_end'))
+            building_id = int(building_raw) if building_raw else None
+        except Exception:
+            flash('Ungültige Eingabe. Bitte Gebäude, Zeitraum (YYYY-MM-DD) und Format prüfen.', 'danger')
+            return render_template('billing/bulk.html', **context)
+
+        # Erzeugung läuft im Worker (flask jobs worker), Download über die Job-Seite
+        job = enqueue_job('billing_export', {
+            'building_id': building_id,
+            'period_start': ps.isoformat(),
+            'period_end': pe.isoformat(),
+            'preset': preset,
+            'format': export_format,
+            'toc': request.form.get('toc') == 'on',
+        })
+        flash(f'Sammelexport als Aufgabe #{job.id} eingereiht.', 'info')
+        return redirect(url_for('jobs.job_detail', job_id=job.id))
+
+    return render_template('billing/bulk.html', **context)
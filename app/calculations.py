@@ -1,11 +1,134 @@
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, and_, cast, literal, Date, Integer
 from app import db
 from app.models import ConsumptionData, Apartment, CostType, ApartmentShare, OccupancyPeriod, Invoice, Contract
-from collections import defaultdict
-from typing import Dict
+from app.consumption_rollup import is_month_aligned, period_bounds, get_monthly_totals
+from app.reference_data import get_cost_type, reference_data
+from app.allocation_kernel import (
+    allocate_columns,
+    sum_allocations,
+    to_cents,
+    ROUNDING_PER_SHARE,
+    ROUNDING_LARGEST_REMAINDER,
+)
+from typing import Dict, Optional, Tuple
 from datetime import date
 
-def calculate_consumption_allocation(cost_type_id, total_cost, period_start, period_end):
+def allocate_by_weights(weights: Dict[int, float], total_cost: float,
+                        rounding: str = ROUNDING_PER_SHARE) -> Dict[int, float]:
+    """Verteilt einen Betrag proportional zu den übergebenen Gewichten.
+
+    Gemeinsamer Kern aller Verteilschlüssel: Gewichte <= 0 erhalten 0.00, ist die
+    Summe aller Gewichte <= 0, erhalten alle Einträge 0.00. Die Berechnung läuft
+    spaltenweise über ``app.allocation_kernel`` (NumPy, falls installiert).
+
+    Args:
+        weights: {apartment_id: Gewicht} (Anteil, Verbrauch, Personentage, ...).
+        total_cost: Der zu verteilende Gesamtbetrag.
+        rounding: ``ROUNDING_PER_SHARE`` (jeder Anteil einzeln gerundet) oder
+                  ``ROUNDING_LARGEST_REMAINDER`` (centgenau, Summe == total_cost).
+
+    Returns:
+        dict: {apartment_id: allocated_cost}, auf 2 Dezimalstellen gerundet.
+    """
+    return allocate_columns(list(weights.keys()), list(weights.values()), total_cost, rounding=rounding)
+
+
+def get_consumption_totals(cost_type_id: int, period_start: date, period_end: date,
+                           building_id: Optional[int] = None) -> Dict[int, float]:
+    """Summiert den Verbrauch pro Wohnung für einen CostType im Zeitraum (eine Abfrage).
+
+    Umfasst der Zeitraum ganze Kalendermonate, wird aus dem Monats-Rollup
+    (``ConsumptionMonthly``) gelesen, sonst aus den Rohdaten. Der Endtag zählt
+    jeweils vollständig mit. Mit ``building_id`` nur Wohnungen dieses Gebäudes.
+
+    Returns:
+        dict: {apartment_id: Verbrauchssumme}, nur Wohnungen mit Einträgen.
+    """
+    if is_month_aligned(period_start, period_end):
+        return get_monthly_totals(cost_type_id, period_start, period_end, building_id)
+
+    start, end = period_bounds(period_start, period_end)
+    query = db.session.query(
+        ConsumptionData.apartment_id,
+        func.sum(ConsumptionData.value).label('total_value')
+    ).filter(
+        ConsumptionData.cost_type_id == cost_type_id,
+        ConsumptionData.date >= start,
+        ConsumptionData.date < end
+    )
+    if building_id is not None:
+        query = query.join(Apartment, ConsumptionData.apartment_id == Apartment.id).filter(
+            Apartment.building_id == building_id
+        )
+    rows = query.group_by(ConsumptionData.apartment_id).all()
+    return {row.apartment_id: row.total_value for row in rows if row.total_value is not None}
+
+
+def get_share_values(cost_type_id: int, building_id: Optional[int] = None) -> Dict[int, float]:
+    """Liefert die Anteilswerte aller Wohnungen für einen CostType (Stammdaten-Cache, eine Abfrage je Lauf).
+
+    Returns:
+        dict: {apartment_id: Anteilswert}, nur Wohnungen mit Share-Eintrag
+        (mit ``building_id`` nur Wohnungen dieses Gebäudes).
+    """
+    return reference_data().shares(cost_type_id, building_id)
+
+
+def _overlap_days_expression(dialect_name: str, period_start: date, period_end: date):
+    """SQL-Ausdruck: Tage der Überlappung einer Belegung mit dem Zeitraum (inklusive, ggf. <= 0)."""
+    ps = literal(period_start, Date)
+    pe = literal(period_end, Date)
+    end_date = func.coalesce(OccupancyPeriod.end_date, pe)
+    if dialect_name == 'sqlite':
+        # max()/min() mit zwei Argumenten sind in SQLite skalare Funktionen
+        overlap_start = func.max(OccupancyPeriod.start_date, ps)
+        overlap_end = func.min(end_date, pe)
+        return cast(func.julianday(overlap_end) - func.julianday(overlap_start) + 1, Integer)
+    # PostgreSQL (und ANSI-nahe Dialekte): date - date liefert Tage als Integer
+    return func.least(end_date, pe) - func.greatest(OccupancyPeriod.start_date, ps) + 1
+
+
+def get_person_days_by_apartment(period_start: date, period_end: date, building_id: Optional[int] = None,
+                                 apartment_ids: Optional[list] = None) -> Dict[int, int]:
+    """Berechnet die Personentage aller Wohnungen im Zeitraum (eine gruppierte Abfrage).
+
+    Die Überlappung jeder Belegung mit dem Zeitraum wird in SQL berechnet
+    (Start/Ende geklemmt, Start- und Endtag inklusive) und pro Wohnung summiert.
+
+    Args:
+        period_start: Startdatum des Abrechnungszeitraums.
+        period_end: Enddatum des Abrechnungszeitraums.
+        building_id: Optional, nur Wohnungen dieses Gebäudes.
+        apartment_ids: Optional, nur diese Wohnungen.
+
+    Returns:
+        dict: {apartment_id: Personentage}, alle (ausgewählten) Wohnungen, unbelegte mit 0.
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    days = _overlap_days_expression(dialect_name, period_start, period_end)
+    query = db.session.query(
+        Apartment.id,
+        func.coalesce(func.sum(days * OccupancyPeriod.number_of_occupants), 0).label('person_days')
+    ).outerjoin(
+        OccupancyPeriod,
+        and_(
+            OccupancyPeriod.apartment_id == Apartment.id,
+            OccupancyPeriod.start_date <= period_end,
+            or_(
+                OccupancyPeriod.end_date == None,
+                OccupancyPeriod.end_date >= period_start
+            )
+        )
+    )
+    if building_id is not None:
+        query = query.filter(Apartment.building_id == building_id)
+    if apartment_ids is not None:
+        query = query.filter(Apartment.id.in_(apartment_ids))
+    return {apartment_id: int(person_days) for apartment_id, person_days in query.group_by(Apartment.id)}
+
+
+def calculate_consumption_allocation(cost_type_id, total_cost, period_start, period_end, rounding=ROUNDING_PER_SHARE,
+                                     building_id=None):
     """
     Berechnet die Kostenverteilung für einen bestimmten Kosten-Typ basierend auf Verbrauch.
 
@@ -14,113 +137,67 @@ def calculate_consumption_allocation(cost_type_id, total_cost, period_start, per
         total_cost: Der Gesamtbetrag, der verteilt werden soll.
         period_start: Startdatum des Abrechnungszeitraums.
         period_end: Enddatum des Abrechnungszeitraums.
+        rounding: Rundungsmodus, siehe ``allocate_by_weights``.
+        building_id: Optional, nur auf die Wohnungen dieses Gebäudes verteilen.
 
     Returns:
         dict: Ein Dictionary {apartment_id: allocated_cost} oder None bei Fehlern.
     """
     
     # Sicherstellen, dass der CostType existiert und vom Typ 'consumption' ist
-    cost_type = db.session.get(CostType, cost_type_id) # Verwendung der neueren Session.get Methode
+    cost_type = get_cost_type(cost_type_id)
     if not cost_type or cost_type.type != 'consumption':
         print(f"Error: CostType {cost_type_id} not found or not type 'consumption'.")
         return {}
 
-    # 1. Alle relevanten Verbrauchsdaten im Zeitraum holen
-    consumption_query = db.session.query(
-        ConsumptionData.apartment_id,
-        func.sum(ConsumptionData.value).label('total_value')
-    ).filter(
-        ConsumptionData.cost_type_id == cost_type_id,
-        ConsumptionData.date >= period_start,
-        ConsumptionData.date <= period_end
-    ).group_by(
-        ConsumptionData.apartment_id
-    )
-    
-    all_consumptions = consumption_query.all()
-
-    # 2. Gesamtverbrauch berechnen
-    total_consumption = sum(c.total_value for c in all_consumptions if c.total_value is not None)
+    # 1. Verbrauch pro Wohnung im Zeitraum holen
+    consumption_per_apartment = get_consumption_totals(cost_type_id, period_start, period_end, building_id)
 
-    allocation = {}
-    
-    # 3. Anteile berechnen, wenn Gesamtverbrauch > 0
-    if total_consumption > 0:
-        for consumption in all_consumptions:
-            if consumption.total_value is not None and consumption.total_value > 0:
-                apartment_id = consumption.apartment_id
-                apartment_consumption = consumption.total_value
-                allocated_cost = (apartment_consumption / total_consumption) * total_cost
-                allocation[apartment_id] = round(allocated_cost, 2) # Runden auf 2 Dezimalstellen
-            elif consumption.total_value is not None and consumption.total_value <= 0:
-                 # Explizit 0 zuweisen, wenn Verbrauch <= 0 war
-                 allocation[consumption.apartment_id] = 0.00
-    else:
+    # 2. Gesamtverbrauch prüfen
+    total_consumption = sum(consumption_per_apartment.values())
+    if total_consumption <= 0:
         print(f"Warning: Total consumption for CostType {cost_type_id} in period is 0 or less. No allocation possible.")
-        # Optional: Kosten gleichmäßig verteilen? Vorerst nicht.
-        # Fallback: Jedem Apartment, das theoretisch hätte verbrauchen können, 0 zuweisen?
-        # Holen aller Apartments, die diesen CostType haben könnten (komplexer)
-        # Einfachster Fall: Leeres Dictionary zurückgeben oder 0 für die mit Einträgen
-        for consumption in all_consumptions:
-             allocation[consumption.apartment_id] = 0.00
 
-    # Sicherstellen, dass alle Apartments, die im Zeitraum hätten sein können, 
-    # aber keinen Verbrauch hatten, auch mit 0 auftauchen? - Vorerst nicht, nur die mit Daten.
+    # 3. Anteile berechnen (Wohnungen ohne Verbrauch bzw. mit Verbrauch <= 0 erhalten 0.00).
+    # Wohnungen ganz ohne Einträge tauchen weiterhin nicht im Ergebnis auf.
+    allocation = allocate_by_weights(consumption_per_apartment, total_cost, rounding)
 
     return allocation 
 
-def calculate_share_allocation(cost_type_id, total_cost):
+def calculate_share_allocation(cost_type_id, total_cost, rounding=ROUNDING_PER_SHARE, building_id=None):
     """
     Berechnet die Kostenverteilung für einen bestimmten Kosten-Typ basierend auf Anteilen.
 
     Args:
         cost_type_id: Die ID des zu verteilenden CostType (muss Typ 'share' sein).
         total_cost: Der Gesamtbetrag, der verteilt werden soll.
+        rounding: Rundungsmodus, siehe ``allocate_by_weights``.
+        building_id: Optional, nur auf die Wohnungen dieses Gebäudes verteilen.
 
     Returns:
         dict: Ein Dictionary {apartment_id: allocated_cost} oder None bei Fehlern.
     """
     
     # Sicherstellen, dass der CostType existiert und vom Typ 'share' ist
-    cost_type = db.session.get(CostType, cost_type_id)
+    cost_type = get_cost_type(cost_type_id)
     if not cost_type or cost_type.type != 'share':
         print(f"Error: CostType {cost_type_id} not found or not type 'share'.")
         return {}
 
     # 1. Alle relevanten Anteilswerte für diesen CostType holen
-    share_query = db.session.query(ApartmentShare).filter(
-        ApartmentShare.cost_type_id == cost_type_id
-    )
-    all_shares = share_query.all()
-
-    # 2. Gesamtsumme der Anteile berechnen
-    total_share_value = sum(s.value for s in all_shares if s.value is not None)
-
-    allocation = {}
-
-    # 3. Anteile berechnen, wenn Gesamtsumme > 0
-    if total_share_value > 0:
-        for share in all_shares:
-            if share.value is not None and share.value > 0:
-                apartment_id = share.apartment_id
-                apartment_share_value = share.value
-                allocated_cost = (apartment_share_value / total_share_value) * total_cost
-                allocation[apartment_id] = round(allocated_cost, 2)
-            elif share.value is not None and share.value <= 0:
-                 # Explizit 0 zuweisen, wenn Anteil <= 0 ist
-                 allocation[share.apartment_id] = 0.00
-    else:
+    share_per_apartment = get_share_values(cost_type_id, building_id)
+
+    # 2. Gesamtsumme der Anteile prüfen
+    if sum(share_per_apartment.values()) <= 0:
         print(f"Warning: Total share value for CostType {cost_type_id} is 0 or less. No allocation possible.")
-        # Fallback: Jedem Apartment mit Anteil 0 zuweisen
-        for share in all_shares:
-            allocation[share.apartment_id] = 0.00
-            
-    # Anders als beim Verbrauch sollten hier alle Apartments mit einem Share-Eintrag 
-    # auch im Ergebnis auftauchen (ggf. mit 0.00).
-    
+
+    # 3. Anteile berechnen. Anders als beim Verbrauch tauchen hier alle Apartments
+    # mit einem Share-Eintrag auch im Ergebnis auf (ggf. mit 0.00).
+    allocation = allocate_by_weights(share_per_apartment, total_cost, rounding)
+
     return allocation 
 
-def calculate_combined_allocation(rules):
+def calculate_combined_allocation(rules, rounding=ROUNDING_PER_SHARE, building_id=None):
     """
     Berechnet die Kostenverteilung basierend auf einer Liste von Regeln,
     die Verbrauchs- und/oder Anteilsschlüssel mit Prozentsätzen kombinieren.
@@ -134,13 +211,16 @@ def calculate_combined_allocation(rules):
                        'period_start': date,    # Nur relevant für 'consumption'
                        'period_end': date       # Nur relevant für 'consumption'
                       }
+        rounding: Rundungsmodus, siehe ``allocate_by_weights``. Mit
+                  ``ROUNDING_LARGEST_REMAINDER`` wird in ganzen Cent summiert, die
+                  Summe entspricht exakt der Summe aller ``total_cost_part``.
+        building_id: Optional, alle Regeln nur auf die Wohnungen dieses Gebäudes verteilen.
 
     Returns:
         dict: Ein Dictionary {apartment_id: total_allocated_cost} oder None bei Fehlern.
     """
-    final_allocation = defaultdict(float) # Startet jeden neuen Key mit 0.0
+    partial_allocations = [] # Teilverteilungen je Regel, werden am Ende spaltenweise summiert
     total_percentage = 0
-    all_apartments_involved = set() # Um alle potenziell betroffenen Apartments zu sammeln
 
     if not isinstance(rules, list) or not rules:
         print("Error: Invalid or empty rules list provided.")
@@ -157,7 +237,7 @@ def calculate_combined_allocation(rules):
             
             total_percentage += percentage
 
-            cost_type = db.session.get(CostType, cost_type_id)
+            cost_type = get_cost_type(cost_type_id)
             if not cost_type:
                 print(f"Error: CostType {cost_type_id} in rule not found. Skipping rule.")
                 continue # Nächste Regel versuchen oder ganz abbrechen? Vorerst: überspringen
@@ -168,11 +248,11 @@ def calculate_combined_allocation(rules):
                      print(f"Error: period_start and period_end required for consumption rule (CostType {cost_type_id}). Skipping rule.")
                      continue
                 partial_allocation = calculate_consumption_allocation(
-                    cost_type_id, total_cost_part, period_start, period_end
+                    cost_type_id, total_cost_part, period_start, period_end, rounding, building_id
                 )
             elif cost_type.type == 'share':
                 partial_allocation = calculate_share_allocation(
-                    cost_type_id, total_cost_part
+                    cost_type_id, total_cost_part, rounding, building_id
                 )
             else:
                 print(f"Error: Unknown CostType type '{cost_type.type}' for CostType {cost_type_id}. Skipping rule.")
@@ -183,10 +263,7 @@ def calculate_combined_allocation(rules):
                 # Hier könnte man entscheiden, ob der gesamte Prozess fehlschlagen soll
                 continue
 
-            # Ergebnisse zusammenführen
-            for apt_id, cost in partial_allocation.items():
-                final_allocation[apt_id] += cost
-                all_apartments_involved.add(apt_id)
+            partial_allocations.append(partial_allocation)
         except KeyError as e:
             print(f"Error: Missing key {e} in rule definition. Skipping rule.")
             continue
@@ -199,37 +276,9 @@ def calculate_combined_allocation(rules):
         print(f"Warning: Sum of percentages ({total_percentage}%) in rules is not 100%.")
         # Hier entscheiden, ob Abbruch oder nur Warnung?
 
-    # Runden der Endergebnisse
-    for apt_id in final_allocation:
-        final_allocation[apt_id] = round(final_allocation[apt_id], 2)
-        
-    # Sicherstellen, dass alle Apartments, die in *irgendeiner* Teilberechnung 
-    # beteiligt waren, auch im Endergebnis sind (ggf. mit 0.0)
-    # Dies ist durch defaultdict bereits sichergestellt.
-
-    return dict(final_allocation) 
-
-def _get_relevant_occupancy_periods(apartment_id, period_start, period_end):
-    """Holt alle Belegungsperioden für eine Wohnung, die den Abrechnungszeitraum überschneiden.
-
-    Args:
-        apartment_id (int): ID der Wohnung.
-        period_start (date): Startdatum des Abrechnungszeitraums.
-        period_end (date): Enddatum des Abrechnungszeitraums.
-
-    Returns:
-        list: Eine Liste von OccupancyPeriod-Objekten.
-    """
-    periods = db.session.query(OccupancyPeriod).filter(
-        OccupancyPeriod.apartment_id == apartment_id,
-        OccupancyPeriod.start_date <= period_end, # Periode beginnt vor oder am Ende des Abrechnungszeitraums
-        or_(
-            OccupancyPeriod.end_date == None,      # Periode läuft noch oder...
-            OccupancyPeriod.end_date >= period_start # Periode endet nach oder am Beginn des Abrechnungszeitraums
-        )
-    ).order_by(OccupancyPeriod.start_date).all()
-
-    return periods
+    # Ergebnisse zusammenführen und runden. Alle Apartments, die in *irgendeiner*
+    # Teilberechnung beteiligt waren, sind auch im Endergebnis (ggf. mit 0.0).
+    return sum_allocations(partial_allocations, rounding=rounding)
 
 def calculate_person_days(apartment_id, period_start, period_end):
     """Berechnet die gesamten Personentage für eine Wohnung im Abrechnungszeitraum.
@@ -242,24 +291,12 @@ def calculate_person_days(apartment_id, period_start, period_end):
     Returns:
         int: Gesamte Anzahl der Personentage.
     """
-    relevant_periods = _get_relevant_occupancy_periods(apartment_id, period_start, period_end)
-    total_person_days = 0
-
-    for period in relevant_periods:
-        # Bestimme den tatsächlichen Start- und Endzeitpunkt des Überlappungsintervalls
-        overlap_start = max(period.start_date, period_start)
-        overlap_end = min(period.end_date, period_end) if period.end_date else period_end
-
-        # Berechne die Anzahl der Tage im Überlappungsintervall (inklusive Start- und Endtag)
-        if overlap_end >= overlap_start:
-            # +1, da sowohl Start- als auch Endtag inklusiv sind
-            duration_days = (overlap_end - overlap_start).days + 1 
-            total_person_days += duration_days * period.number_of_occupants
-
-    return total_person_days
+    return get_person_days_by_apartment(period_start, period_end, apartment_ids=[apartment_id]).get(apartment_id, 0)
 
 def calculate_person_day_allocation(cost_type_id: int, total_cost: float, 
-                                  billing_start: date, billing_end: date) -> Dict[int, float]:
+                                  billing_start: date, billing_end: date,
+                                  rounding: str = ROUNDING_PER_SHARE,
+                                  building_id: Optional[int] = None) -> Dict[int, float]:
     """
     Berechnet die Kostenverteilung für einen bestimmten Kosten-Typ basierend auf Personentagen.
 
@@ -268,101 +305,93 @@ def calculate_person_day_allocation(cost_type_id: int, total_cost: float,
         total_cost: Der Gesamtbetrag, der verteilt werden soll.
         billing_start: Startdatum des Abrechnungszeitraums.
         billing_end: Enddatum des Abrechnungszeitraums.
+        rounding: Rundungsmodus, siehe ``allocate_by_weights``.
+        building_id: Optional, nur auf die Wohnungen dieses Gebäudes verteilen.
 
     Returns:
         dict: Ein Dictionary {apartment_id: allocated_cost} oder None bei Fehlern.
     """
 
     # Sicherstellen, dass der CostType existiert und vom Typ 'share' ist (oder wie auch immer der Typ heißt)
-    cost_type = db.session.get(CostType, cost_type_id)
+    cost_type = get_cost_type(cost_type_id)
     # Annahme: Es gibt einen Typ 'person_days' oder eine ähnliche Kennzeichnung
     if not cost_type: # or cost_type.type != 'person_days':
         print(f"Error: CostType {cost_type_id} not found or not applicable for person-day allocation.")
         return {}
 
-    # 1. Alle relevanten Wohnungen finden (die im Zeitraum belegt waren)
-    #    Wir holen alle Occupancy Periods, die den Zeitraum überschneiden
-    all_relevant_periods_query = db.session.query(OccupancyPeriod).filter(
-        OccupancyPeriod.start_date <= billing_end,
-        or_(
-            OccupancyPeriod.end_date == None,
-            OccupancyPeriod.end_date >= billing_start
-        )
-    )
-    all_relevant_periods = all_relevant_periods_query.all()
-
-    # Alle Wohnungen holen, die existieren
-    all_apartments = {apt.id: apt for apt in Apartment.query.all()}
-    if not all_apartments:
+    # 1. Personentage pro Wohnung (alle Wohnungen, auch unbelegte, in einer Abfrage)
+    weights = get_person_days_by_apartment(billing_start, billing_end, building_id)
+    if not weights:
         return {}
 
-    # 2. Personentage pro Wohnung berechnen und Gesamt-Personentage ermitteln
-    person_days_per_apartment = defaultdict(int)
-    total_person_days_all_apts = 0
-
-    for period in all_relevant_periods:
-        apt_id = period.apartment_id
-        # Berechne Überlappungstage für DIESE Periode
-        overlap_start = max(period.start_date, billing_start)
-        overlap_end = min(period.end_date, billing_end) if period.end_date else billing_end
-        person_days_for_period = 0
-        if overlap_end >= overlap_start:
-            duration_days = (overlap_end - overlap_start).days + 1
-            person_days_for_period = duration_days * period.number_of_occupants
-        
-        person_days_per_apartment[apt_id] += person_days_for_period
-        total_person_days_all_apts += person_days_for_period
-
-    allocation = {}
-
-    # 3. Anteile berechnen
-    if total_person_days_all_apts > 0:
-        # Wenn es Personentage gibt, nach diesen verteilen
-        for apt_id in all_apartments:
-            apt_person_days = person_days_per_apartment[apt_id]
-            if apt_person_days > 0:
-                allocated_cost = (apt_person_days / total_person_days_all_apts) * total_cost
-                allocation[apt_id] = round(allocated_cost, 2)
-            else:
-                allocation[apt_id] = 0.00
-    else:
-        # Wenn keine Personentage vorhanden sind, allen Wohnungen 0.00 zuweisen
+    if sum(weights.values()) <= 0:
+        # Wenn keine Personentage vorhanden sind, erhalten alle Wohnungen 0.00
         print(f"Warning: No occupancy periods found for period {billing_start} to {billing_end}. No allocation possible.")
-        for apt_id in all_apartments:
-            allocation[apt_id] = 0.00
+
+    # 2. Anteile berechnen
+    allocation = allocate_by_weights(weights, total_cost, rounding)
 
     return allocation 
 
 
-def calculate_direct_allocation(period_start: date, period_end: date) -> Dict[int, float]:
+def direct_costs_query(period_start: date, period_end: date, building_id: Optional[int] = None):
+    """Abfrage der direkt zugeordneten Rechnungsbeträge je Wohnung (Invoice ⋈ Contract, gruppiert).
+
+    Berücksichtigt Rechnungen, deren Leistungszeitraum den Abrechnungszeitraum
+    überschneidet. Spalten: ``apartment_id``, ``total`` (Summe der Beträge) und
+    ``total_cents`` (Summe der je Rechnung auf Cent gerundeten Beträge).
+    """
+    query = db.session.query(
+        Contract.apartment_id.label('apartment_id'),
+        func.sum(Invoice.amount).label('total'),
+        func.sum(func.round(Invoice.amount * 100)).label('total_cents'),
+    ).join(
+        Contract, Invoice.direct_allocation_contract_id == Contract.id
+    ).filter(
+        Invoice.period_end >= period_start,
+        Invoice.period_start <= period_end,
+    )
+    if building_id is not None:
+        query = query.join(Apartment, Contract.apartment_id == Apartment.id).filter(
+            Apartment.building_id == building_id
+        )
+    return query.group_by(Contract.apartment_id)
+
+
+def calculate_direct_allocation(period_start: date, period_end: date,
+                                rounding: str = ROUNDING_PER_SHARE,
+                                building_id: Optional[int] = None) -> Dict[int, float]:
     """
-    Summiert alle direkt zugeordneten Rechnungsbeträge pro Wohnung im Abrechnungszeitraum.
+    Summiert alle direkt zugeordneten Rechnungsbeträge pro Wohnung im Abrechnungszeitraum (eine Abfrage).
 
     Args:
         period_start: Start des Abrechnungszeitraums
         period_end: Ende des Abrechnungszeitraums
+        rounding: Mit ``ROUNDING_LARGEST_REMAINDER`` wird in ganzen Cent summiert.
+        building_id: Optional, nur Verträge über Wohnungen dieses Gebäudes.
 
     Returns:
         dict: {apartment_id: sum(amount)}
     """
-    allocation = defaultdict(float)
-    # Hole alle Rechnungen mit direkter Zuordnung, deren Leistungszeitraum den Abrechnungszeitraum überschneidet
-    invoices = db.session.query(Invoice).filter(
-        Invoice.direct_allocation_contract_id.isnot(None),
-        Invoice.period_end >= period_start,
-        Invoice.period_start <= period_end,
-    ).all()
+    rows = direct_costs_query(period_start, period_end, building_id).all()
+    if rounding == ROUNDING_LARGEST_REMAINDER:
+        return {row.apartment_id: int(row.total_cents) / 100 for row in rows}
+    # Rundung vereinheitlichen
+    return {row.apartment_id: round(float(row.total), 2) for row in rows}
 
-    for inv in invoices:
-        # Ermittle zugehörige Wohnung über den Vertrag
-        contract = db.session.get(Contract, inv.direct_allocation_contract_id)
-        if not contract:
-            continue
-        apartment_id = contract.apartment_id
-        allocation[apartment_id] += float(inv.amount)
 
-    # Rundung vereinheitlichen
-    return {apt_id: round(amount, 2) for apt_id, amount in allocation.items()}
+def split_heating_cost(total_cost: float, hot_water_percentage: float,
+                       rounding: str = ROUNDING_PER_SHARE) -> Tuple[float, float]:
+    """Teilt die Heizkosten in (Warmwasser-Anteil, Heizungs-Anteil) auf.
+
+    Mit ``ROUNDING_LARGEST_REMAINDER`` in ganzen Cent, die Summe ist dann exakt ``total_cost``.
+    """
+    if rounding == ROUNDING_LARGEST_REMAINDER:
+        total_cents = to_cents(total_cost)
+        hot_water_cents = to_cents(total_cents * (hot_water_percentage / 100.0) / 100)
+        return hot_water_cents / 100, (total_cents - hot_water_cents) / 100
+    hot_water_cost = round(total_cost * (hot_water_percentage / 100.0), 2)
+    return hot_water_cost, round(total_cost - hot_water_cost, 2)
 
 
 def calculate_heating_allocation(
@@ -372,30 +401,30 @@ def calculate_heating_allocation(
     hot_water_consumption_cost_type_id: int,
     period_start: date,
     period_end: date,
+    rounding: str = ROUNDING_PER_SHARE,
+    building_id: Optional[int] = None,
 ) -> Dict[int, float]:
     """
     Heizkostenabrechnung mit vorhandenem Messwesen:
     - warm water share: hot_water_percentage% -> verteilt nach Warmwasser-Verbrauch
     - heating share: (100 - hot_water_percentage)% -> verteilt nach Heizenergie-Verbrauch
+
+    Mit ``rounding=ROUNDING_LARGEST_REMAINDER`` wird der Gesamtbetrag in ganzen Cent
+    aufgeteilt und verteilt; die Summe entspricht dann exakt ``total_cost``
+    (sofern für beide Teile Verbrauchsdaten vorliegen). Mit ``building_id`` wird
+    nur auf die Wohnungen dieses Gebäudes verteilt.
     """
     if hot_water_percentage < 0 or hot_water_percentage > 100:
         return {}
 
-    hot_water_cost = round(total_cost * (hot_water_percentage / 100.0), 2)
-    heating_cost = round(total_cost - hot_water_cost, 2)
+    hot_water_cost, heating_cost = split_heating_cost(total_cost, hot_water_percentage, rounding)
 
     hot_alloc = calculate_consumption_allocation(
-        hot_water_consumption_cost_type_id, hot_water_cost, period_start, period_end
+        hot_water_consumption_cost_type_id, hot_water_cost, period_start, period_end, rounding, building_id
     ) or {}
     heat_alloc = calculate_consumption_allocation(
-        heating_consumption_cost_type_id, heating_cost, period_start, period_end
+        heating_consumption_cost_type_id, heating_cost, period_start, period_end, rounding, building_id
     ) or {}
 
-    final = defaultdict(float)
-    for apt_id, amt in hot_alloc.items():
-        final[apt_id] += amt
-    for apt_id, amt in heat_alloc.items():
-        final[apt_id] += amt
-
-    # Runden und in normales Dict konvertieren
-    return {apt_id: round(amt, 2) for apt_id, amt in final.items()}
\ No newline at end of file
+    # Summieren und runden
+    return sum_allocations([hot_alloc, heat_alloc], rounding=rounding)
\ No newline at end of file
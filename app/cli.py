@@ -0,0 +1,131 @@
+"""Flask-CLI-Befehle (``flask billing ...``, ``flask consumption ...``, ``flask jobs ...``)."""
+from datetime import date
+
+import click
+from flask.cli import AppGroup
+
+
+billing_cli = AppGroup('billing', help='Abrechnungsläufe und Sammelexporte.')
+consumption_cli = AppGroup('consumption', help='Wartung der Verbrauchsdaten.')
+jobs_cli = AppGroup('jobs', help='Hintergrundaufgaben (Job-Warteschlange).')
+dashboard_cli = AppGroup('dashboard', help='Kennzahlen der Startseite.')
+
+
+def _parse_date(ctx, param, value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise click.BadParameter('Datum im Format YYYY-MM-DD erwartet.')
+
+
+@billing_cli.command('export')
+@click.option('--building', 'building_id', type=int, default=None, help='Gebäude-ID (Default: alle Verträge).')
+@click.option('--start', 'period_start', required=True, callback=_parse_date, help='Start des Abrechnungszeitraums (YYYY-MM-DD).')
+@click.option('--end', 'period_end', required=True, callback=_parse_date, help='Ende des Abrechnungszeitraums (YYYY-MM-DD).')
+@click.option('--preset', default='standard', type=click.Choice(['standard', 'heating_30_70', 'direct_only']), show_default=True)
+@click.option('--output', '-o', required=True, type=click.Path(dir_okay=False, writable=True), help='Ziel-Datei (ZIP bzw. PDF).')
+@click.option('--workers', type=int, default=None, help='Anzahl Render-Prozesse (Default: Anzahl CPUs).')
+@click.option('--format', 'export_format', default='zip', type=click.Choice(['zip', 'pdf']), show_default=True,
+              help='zip: ein PDF je Vertrag; pdf: alle Abrechnungen in einem Sammel-PDF.')
+@click.option('--toc', is_flag=True, help='Sammel-PDF mit Inhaltsverzeichnis.')
+def export_statements(building_id, period_start, period_end, preset, output, workers, export_format, toc):
+    """Erzeugt alle Abrechnungen eines Gebäudes und schreibt sie als ZIP oder Sammel-PDF."""
+    from app.billing.bulk import EXPORT_PDF, export_statements_bundle, export_statements_zip
+    from app.billing.routes import build_preset_cost_items
+
+    cost_items = build_preset_cost_items(preset, period_start, period_end, building_id)
+
+    def _progress(done, total):
+        if done == total or done % 100 == 0:
+            click.echo(f'{done}/{total} Abrechnungen gerendert')
+
+    with open(output, 'wb') as fh:
+        if export_format == EXPORT_PDF:
+            result = export_statements_bundle(fh, building_id, period_start, period_end, cost_items, toc=toc,
+                                              progress_callback=_progress)
+        else:
+            result = export_statements_zip(fh, building_id, period_start, period_end, cost_items,
+                                           max_workers=workers, progress_callback=_progress)
+    click.echo(f"{result['statements']} Abrechnungen nach {output} geschrieben.")
+    if result['failed']:
+        click.echo(f"Fehlgeschlagen (Vertrag-IDs): {', '.join(map(str, result['failed']))}", err=True)
+
+
+@consumption_cli.command('rebuild-rollup')
+def rebuild_consumption_rollup():
+    """Baut den Monats-Rollup (ConsumptionMonthly) vollständig aus den Rohdaten neu auf."""
+    from app import db
+    from app.consumption_rollup import rebuild_rollup
+
+    buckets = rebuild_rollup()
+    db.session.commit()
+    click.echo(f'Rollup neu aufgebaut: {buckets} Monatswerte.')
+
+
+@dashboard_cli.command('refresh')
+def refresh_dashboard():
+    """Berechnet die Kennzahlen der Startseite (DashboardStat) vollständig neu."""
+    from app import db
+    from app.dashboard_stats import refresh_dashboard_stats
+
+    stats = refresh_dashboard_stats()
+    db.session.commit()
+    click.echo(f'Startseiten-Kennzahlen neu berechnet: {stats} Werte.')
+
+
+@consumption_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=None, help='Zeilen pro Batch/Checkpoint.')
+def import_consumption(path, chunk_size):
+    """Importiert eine Verbrauchs-CSV als fortsetzbaren Job (erneuter Aufruf setzt nach Abbruch fort)."""
+    from app.import_data import CONSUMPTION_IMPORT_CHUNK_SIZE
+    from app.import_jobs import import_consumption_file
+
+    def _progress(job):
+        click.echo(f'Zeile {job.last_committed_row}: {job.processed_rows} importiert, '
+                   f'{job.skipped_rows} übersprungen, {job.duplicate_rows} Duplikate')
+
+    try:
+        job = import_consumption_file(path, chunk_size=chunk_size or CONSUMPTION_IMPORT_CHUNK_SIZE,
+                                      progress_callback=_progress)
+    except ValueError as e:
+        click.echo(f'Fehler: {e}', err=True)
+        raise SystemExit(1)
+    click.echo(f'Import-Job {job.id}: {job.status} ({job.processed_rows} importiert, '
+               f'{job.skipped_rows} übersprungen, {job.duplicate_rows} Duplikate)')
+    if job.status != 'completed':
+        click.echo(f'Fehler: {job.error}', err=True)
+        raise SystemExit(1)
+
+
+@jobs_cli.command('worker')
+@click.option('--once', is_flag=True, help='Nur wartende Jobs abarbeiten und dann beenden.')
+@click.option('--poll-interval', type=float, default=2.0, show_default=True, help='Wartezeit in Sekunden bei leerer Warteschlange.')
+def jobs_worker(once, poll_interval):
+    """Startet einen Worker, der Jobs aus der Tabelle ``job`` abarbeitet."""
+    from app.jobs.queue import run_worker
+
+    try:
+        processed = run_worker(once=once, poll_interval=poll_interval, echo=click.echo)
+    except KeyboardInterrupt:
+        click.echo('Worker beendet.')
+        return
+    click.echo(f'{processed} Job(s) abgearbeitet.')
+
+
+@jobs_cli.command('requeue-stale')
+@click.option('--lease-seconds', type=float, default=None,
+              help='Sekunden ohne Rückmeldung, nach denen ein laufender Job als verwaist gilt (Standard: JOB_LEASE_SECONDS).')
+def jobs_requeue_stale(lease_seconds):
+    """Stellt laufende Jobs abgestürzter Worker wieder ein (bzw. markiert sie nach zu vielen Versuchen als fehlgeschlagen)."""
+    from app.jobs.queue import requeue_stale_jobs
+
+    requeued, failed = requeue_stale_jobs(lease_seconds)
+    click.echo(f'{requeued} Job(s) wieder eingereiht, {failed} als fehlgeschlagen markiert.')
+
+
+def register_cli(app):
+    app.cli.add_command(billing_cli)
+    app.cli.add_command(consumption_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(dashboard_cli)
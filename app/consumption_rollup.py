@@ -0,0 +1,234 @@
+"""
+Monats-Rollup der Verbrauchsdaten (``ConsumptionMonthly``).
+
+Jede Schreiboperation auf ``ConsumptionData`` über die ORM-Session (CSV-Import,
+manuelle Erfassung, Zählerstände) aktualisiert den Rollup im selben Flush:
+neue Einträge werden inkrementell addiert (Summe, Anzahl, Min/Max), bei Änderungen
+und Löschungen werden die betroffenen Monate aus den Rohdaten neu berechnet.
+Schreibvorgänge an der Session vorbei (Core-Bulk-Inserts, SQL von Hand) müssen
+``add_to_rollup`` aufrufen oder den Rollup per ``flask consumption rebuild-rollup``
+neu aufbauen.
+
+Abrechnungen über ganze Kalendermonate lesen den Verbrauch aus dem Rollup statt
+die Rohdaten zu aggregieren. Jede Änderung eines Monats wird als Differenz an die
+Startseiten-Kennzahlen (``app.dashboard_stats``) weitergegeben.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, case, cast, delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.dashboard_stats import bump_dashboard_stats, month_key, refresh_dashboard_stats
+from app.models import Apartment, ConsumptionData, ConsumptionMonthly
+
+_ROLLUP = ConsumptionMonthly.__table__
+_RAW = ConsumptionData.__table__
+
+
+def month_start(value) -> date:
+    """Erster Tag des Monats zu einem Datum/Zeitpunkt."""
+    return date(value.year, value.month, 1)
+
+
+def next_month(value: date) -> date:
+    return date(value.year + 1, 1, 1) if value.month == 12 else date(value.year, value.month + 1, 1)
+
+
+def is_month_aligned(period_start: date, period_end: date) -> bool:
+    """True, wenn der Zeitraum am Monatsersten beginnt und am Monatsletzten endet."""
+    return period_start.day == 1 and (period_end + timedelta(days=1)).day == 1 and period_start <= period_end
+
+
+def period_bounds(period_start: date, period_end: date) -> Tuple[datetime, datetime]:
+    """Halboffene Zeitpunkt-Grenzen [Start 00:00, Tag nach Ende 00:00) für ``ConsumptionData.date``.
+
+    Verbrauchswerte am letzten Tag des Zeitraums zählen damit unabhängig von der
+    Uhrzeit mit (ein Vergleich ``date <= period_end`` schließt sie auf SQLite aus).
+    """
+    return (datetime(period_start.year, period_start.month, period_start.day),
+            datetime(period_end.year, period_end.month, period_end.day) + timedelta(days=1))
+
+
+def _merge_rows(rows: Iterable[Tuple[int, int, object, float]]) -> Dict[tuple, list]:
+    """Fasst (apartment_id, cost_type_id, date, value) zu {bucket: [sum, count, min, max]} zusammen."""
+    deltas: Dict[tuple, list] = {}
+    for apartment_id, cost_type_id, value_date, value in rows:
+        key = (apartment_id, cost_type_id, month_start(value_date))
+        delta = deltas.get(key)
+        if delta is None:
+            deltas[key] = [value, 1, value, value]
+        else:
+            delta[0] += value
+            delta[1] += 1
+            delta[2] = min(delta[2], value)
+            delta[3] = max(delta[3], value)
+    return deltas
+
+
+def _bucket_filter(table, apartment_id, cost_type_id, month):
+    return (table.c.apartment_id == apartment_id, table.c.cost_type_id == cost_type_id, table.c.month == month)
+
+
+def _bump_months(connection, month_deltas: Dict[date, list]):
+    """Gibt die Änderung je Monat (Summe, Anzahl) an die Startseiten-Kennzahlen weiter."""
+    bump_dashboard_stats({month_key(month): tuple(delta) for month, delta in month_deltas.items()}, connection)
+
+
+def _apply_deltas(connection, deltas: Dict[tuple, list]):
+    month_deltas: Dict[date, list] = {}
+    for (apartment_id, cost_type_id, month), (total, count, min_value, max_value) in deltas.items():
+        result = connection.execute(
+            update(_ROLLUP).where(*_bucket_filter(_ROLLUP, apartment_id, cost_type_id, month)).values(
+                total=_ROLLUP.c.total + total,
+                count=_ROLLUP.c.count + count,
+                min_value=case((_ROLLUP.c.min_value == None, min_value), (_ROLLUP.c.min_value > min_value, min_value),
+                               else_=_ROLLUP.c.min_value),
+                max_value=case((_ROLLUP.c.max_value == None, max_value), (_ROLLUP.c.max_value < max_value, max_value),
+                               else_=_ROLLUP.c.max_value),
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(_ROLLUP).values(
+                apartment_id=apartment_id, cost_type_id=cost_type_id, month=month,
+                total=total, count=count, min_value=min_value, max_value=max_value,
+            ))
+        month_delta = month_deltas.setdefault(month, [0.0, 0])
+        month_delta[0] += total
+        month_delta[1] += count
+    _bump_months(connection, month_deltas)
+
+
+def _refresh_buckets(connection, buckets: Iterable[tuple]):
+    """Berechnet einzelne Monate vollständig aus den Rohdaten neu (nach Änderung/Löschung)."""
+    month_deltas: Dict[date, list] = {}
+    for apartment_id, cost_type_id, month in buckets:
+        old_total, old_count = connection.execute(
+            select(_ROLLUP.c.total, _ROLLUP.c.count).where(*_bucket_filter(_ROLLUP, apartment_id, cost_type_id, month))
+        ).one_or_none() or (0.0, 0)
+        start, end = period_bounds(month, next_month(month) - timedelta(days=1))
+        total, count, min_value, max_value = connection.execute(
+            select(func.sum(_RAW.c.value), func.count(_RAW.c.id), func.min(_RAW.c.value), func.max(_RAW.c.value))
+            .where(_RAW.c.apartment_id == apartment_id, _RAW.c.cost_type_id == cost_type_id,
+                   _RAW.c.date >= start, _RAW.c.date < end)
+        ).one()
+        connection.execute(delete(_ROLLUP).where(*_bucket_filter(_ROLLUP, apartment_id, cost_type_id, month)))
+        if count:
+            connection.execute(insert(_ROLLUP).values(
+                apartment_id=apartment_id, cost_type_id=cost_type_id, month=month,
+                total=total, count=count, min_value=min_value, max_value=max_value,
+            ))
+        month_delta = month_deltas.setdefault(month, [0.0, 0])
+        month_delta[0] += (total or 0.0) - (old_total or 0.0)
+        month_delta[1] += count - (old_count or 0)
+    _bump_months(connection, month_deltas)
+
+
+def add_to_rollup(rows: Iterable[Tuple[int, int, object, float]], connection=None):
+    """Addiert neu eingefügte Rohwerte (apartment_id, cost_type_id, date, value) zum Rollup.
+
+    Nur für Einfügungen an der ORM-Session vorbei nötig; ORM-Inserts werden automatisch erfasst.
+    """
+    deltas = _merge_rows(rows)
+    if deltas:
+        _apply_deltas(connection if connection is not None else db.session.connection(), deltas)
+
+
+def _buckets_for_ids(connection, ids) -> set:
+    if not ids:
+        return set()
+    rows = connection.execute(
+        select(_RAW.c.apartment_id, _RAW.c.cost_type_id, _RAW.c.date).where(_RAW.c.id.in_(ids))
+    )
+    return {(apartment_id, cost_type_id, month_start(value_date)) for apartment_id, cost_type_id, value_date in rows}
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_stale_buckets(session, flush_context, instances):
+    """Merkt sich die Monate geänderter/gelöschter Einträge, solange die alten Werte noch in der DB stehen."""
+    dirty_ids = [inspect(obj).identity[0] for obj in session.dirty
+                 if isinstance(obj, ConsumptionData) and inspect(obj).identity and session.is_modified(obj)]
+    deleted_ids = [inspect(obj).identity[0] for obj in session.deleted
+                   if isinstance(obj, ConsumptionData) and inspect(obj).identity]
+    if dirty_ids or deleted_ids:
+        stale = session.info.setdefault('consumption_rollup_stale', set())
+        stale.update(_buckets_for_ids(session.connection(), dirty_ids + deleted_ids))
+        session.info.setdefault('consumption_rollup_dirty', set()).update(dirty_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_rollup(session, flush_context):
+    new_rows = [(obj.apartment_id, obj.cost_type_id, obj.date, obj.value)
+                for obj in session.new if isinstance(obj, ConsumptionData)]
+    stale = session.info.pop('consumption_rollup_stale', set())
+    dirty_ids = session.info.pop('consumption_rollup_dirty', set())
+    if not new_rows and not stale:
+        return
+
+    connection = session.connection()
+    # Geänderte Einträge können in einen anderen Monat gewandert sein
+    stale |= _buckets_for_ids(connection, list(dirty_ids))
+    deltas = _merge_rows(new_rows)
+    # Neu berechnete Monate enthalten die neuen Einträge bereits
+    _apply_deltas(connection, {key: delta for key, delta in deltas.items() if key not in stale})
+    _refresh_buckets(connection, stale)
+
+
+def _month_expression(dialect_name: str):
+    if dialect_name == 'sqlite':
+        return func.date(_RAW.c.date, 'start of month')
+    if dialect_name == 'postgresql':
+        return cast(func.date_trunc('month', _RAW.c.date), Date)
+    return None
+
+
+def rebuild_rollup() -> int:
+    """Baut den Rollup und die Startseiten-Kennzahlen vollständig neu auf (ohne Commit).
+
+    Returns:
+        int: Anzahl der Rollup-Zeilen (Wohnung × Kostenart × Monat).
+    """
+    connection = db.session.connection()
+    connection.execute(delete(_ROLLUP))
+    month = _month_expression(connection.dialect.name)
+    if month is not None:
+        month = month.label('month')
+        connection.execute(insert(_ROLLUP).from_select(
+            ['apartment_id', 'cost_type_id', 'month', 'total', 'count', 'min_value', 'max_value'],
+            select(_RAW.c.apartment_id, _RAW.c.cost_type_id, month, func.sum(_RAW.c.value), func.count(_RAW.c.id),
+                   func.min(_RAW.c.value), func.max(_RAW.c.value))
+            .group_by(_RAW.c.apartment_id, _RAW.c.cost_type_id, month)
+        ))
+    else:
+        rows = connection.execute(select(_RAW.c.apartment_id, _RAW.c.cost_type_id, _RAW.c.date, _RAW.c.value))
+        _apply_deltas(connection, _merge_rows(rows))
+    refresh_dashboard_stats(connection)
+    return connection.execute(select(func.count()).select_from(_ROLLUP)).scalar_one()
+
+
+def get_monthly_totals(cost_type_id: int, period_start: date, period_end: date,
+                       building_id: Optional[int] = None) -> Dict[int, float]:
+    """Verbrauch pro Wohnung aus dem Rollup (alle Monate, die im Zeitraum beginnen), optional je Gebäude."""
+    query = db.session.query(
+        ConsumptionMonthly.apartment_id,
+        func.sum(ConsumptionMonthly.total).label('total_value')
+    ).filter(
+        ConsumptionMonthly.cost_type_id == cost_type_id,
+        ConsumptionMonthly.month >= month_start(period_start),
+        ConsumptionMonthly.month <= month_start(period_end)
+    )
+    if building_id is not None:
+        query = query.join(Apartment, ConsumptionMonthly.apartment_id == Apartment.id).filter(
+            Apartment.building_id == building_id
+        )
+    rows = query.group_by(ConsumptionMonthly.apartment_id).all()
+    return {row.apartment_id: row.total_value for row in rows if row.total_value is not None}
+
+
+def monthly_series(cost_type_id: Optional[int] = None) -> List[Tuple[date, float]]:
+    """Gesamtverbrauch je Monat [(Monatserster, Summe), ...], aufsteigend sortiert."""
+    query = db.session.query(ConsumptionMonthly.month, func.sum(ConsumptionMonthly.total).label('total'))
+    if cost_type_id is not None:
+        query = query.filter(ConsumptionMonthly.cost_type_id == cost_type_id)
+    return [(row.month, float(row.total or 0)) for row in query.group_by(ConsumptionMonthly.month).order_by(ConsumptionMonthly.month)]
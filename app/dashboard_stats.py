@@ -0,0 +1,226 @@
+"""
+Materialisierte Kennzahlen der Startseite (``DashboardStat``).
+
+Die Startseite liest nur noch den Schnappschuss (eine Abfrage) statt bei jedem
+Aufruf zu zählen und zu summieren. Fortgeschrieben wird er im selben Flush wie
+die Daten:
+
+* Anzahlen (Gebäude, Wohnungen, Mieter, Verträge, Rechnungen) und
+  Rechnungssummen je Kostenart und Gebäude über den ``after_flush``-Listener;
+  bei geänderten Rechnungen liest ``before_flush`` die alten Werte (alter Betrag
+  raus, neuer rein).
+* Monatsverbrauch aus dem Monats-Rollup: ``app.consumption_rollup`` meldet jede
+  Änderung eines Rollup-Monats als Differenz (``bump_dashboard_stats``).
+
+Die Differenzen werden per Upsert (``INSERT ... ON CONFLICT DO UPDATE SET value =
+value + x``) geschrieben und damit mit der Transaktion committet oder
+zurückgerollt; gleichzeitige Schreiber addieren, statt sich zu überschreiben.
+Den Anfangsbestand legt die Migration an. Was die Flush-Ereignisse nicht sehen –
+ORM-Massenoperationen (``query.delete()``/``update()``, ``session.execute(insert(...))``)
+und ``ON DELETE``-Kaskaden der Datenbank – löst beim Commit eine vollständige
+Neuberechnung aus. Schreibvorgänge ganz an der Session vorbei (Core, SQL von Hand)
+erfordern ``refresh_dashboard_stats`` bzw. ``flask dashboard refresh``;
+``rebuild_rollup`` ruft es selbst auf. Die Startseite selbst liest nur.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Apartment, Building, Contract, ConsumptionMonthly, DashboardStat, Invoice, Tenant
+
+COUNTED_MODELS = (Building, Apartment, Tenant, Contract, Invoice)
+# Markiert einen vollständigen Schnappschuss; updated_at = letzte vollständige Neuberechnung
+REFRESHED_KEY = 'meta:refreshed'
+
+_STATS = DashboardStat.__table__
+_UPSERT_DIALECTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+# Tabellen, deren Löschung gezählte Zeilen per ON DELETE CASCADE/SET NULL in der Datenbank ändert
+_CASCADE_PARENTS = {foreign_key.column.table.name for model in COUNTED_MODELS
+                    for foreign_key in model.__table__.foreign_keys if foreign_key.ondelete}
+
+
+def count_key(model) -> str:
+    return f'count:{model.__tablename__}'
+
+
+def invoice_key(cost_type_id: int, building_id: Optional[int]) -> str:
+    return f"invoice:{cost_type_id}:{building_id if building_id is not None else '-'}"
+
+
+def month_key(month: date) -> str:
+    return f'consumption_month:{month.isoformat()}'
+
+
+def bump_dashboard_stats(deltas: Dict[str, Tuple[float, int]], connection=None):
+    """Addiert (Wert, Anzahl) je Schlüssel auf den Schnappschuss (ohne Commit)."""
+    connection = connection if connection is not None else db.session.connection()
+    now = datetime.utcnow()
+    rows = [{'key': key, 'value': value, 'count': count, 'updated_at': now}
+            for key, (value, count) in sorted(deltas.items()) if value or count]
+    if not rows:
+        return
+    dialect_insert = _UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(_STATS)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[_STATS.c.key],
+            set_={'value': _STATS.c.value + statement.excluded.value, 'count': _STATS.c.count + statement.excluded.count,
+                  'updated_at': statement.excluded.updated_at},
+        ), rows)
+        return
+    # Andere Datenbanken: ohne Upsert-Syntax, nicht sicher gegen gleichzeitiges erstes Einfügen
+    for row in rows:
+        result = connection.execute(
+            update(_STATS).where(_STATS.c.key == row['key']).values(
+                value=_STATS.c.value + row['value'], count=_STATS.c.count + row['count'], updated_at=now,
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(_STATS).values(**row))
+
+
+def refresh_dashboard_stats(connection=None) -> int:
+    """Berechnet den Schnappschuss vollständig aus den Tabellen neu (ohne Commit).
+
+    Returns:
+        int: Anzahl der Kennzahlen.
+    """
+    connection = connection if connection is not None else db.session.connection()
+    now = datetime.utcnow()
+    rows = [{'key': REFRESHED_KEY, 'value': 0.0, 'count': 0, 'updated_at': now}]
+    for model in COUNTED_MODELS:
+        count = connection.execute(select(func.count()).select_from(model.__table__)).scalar_one()
+        rows.append({'key': count_key(model), 'value': 0.0, 'count': count, 'updated_at': now})
+    invoices = connection.execute(
+        select(Invoice.cost_type_id, Invoice.building_id, func.sum(Invoice.amount), func.count(Invoice.id))
+        .group_by(Invoice.cost_type_id, Invoice.building_id)
+    )
+    rows.extend({'key': invoice_key(cost_type_id, building_id), 'value': float(total or 0), 'count': count,
+                 'updated_at': now} for cost_type_id, building_id, total, count in invoices)
+    months = connection.execute(
+        select(ConsumptionMonthly.month, func.sum(ConsumptionMonthly.total), func.sum(ConsumptionMonthly.count))
+        .group_by(ConsumptionMonthly.month)
+    )
+    rows.extend({'key': month_key(month), 'value': float(total or 0), 'count': int(count or 0), 'updated_at': now}
+                for month, total, count in months)
+
+    connection.execute(delete(_STATS))
+    connection.execute(insert(_STATS), rows)
+    return len(rows)
+
+
+def dashboard_snapshot(building_id: Optional[int] = None) -> dict:
+    """Kennzahlen der Startseite aus dem Schnappschuss (eine Abfrage, schreibt nicht).
+
+    Returns:
+        dict: {'counts': {tabelle: anzahl}, 'invoice_totals': {cost_type_id: summe},
+               'consumption_by_month': [(monatserster, summe), ...],
+               'refreshed_at': letzte Änderung (datetime) oder None bei leerem Schnappschuss}
+    """
+    rows = db.session.execute(select(_STATS.c.key, _STATS.c.value, _STATS.c.count, _STATS.c.updated_at)).all()
+
+    counts = {model.__tablename__: 0 for model in COUNTED_MODELS}
+    invoice_totals: Dict[int, float] = defaultdict(float)
+    months = []
+    for row in rows:
+        kind, _, rest = row.key.partition(':')
+        if kind == 'count':
+            counts[rest] = row.count
+        elif kind == 'invoice' and row.count > 0:
+            cost_type_id, _, invoice_building = rest.partition(':')
+            if building_id is None or invoice_building == str(building_id):
+                invoice_totals[int(cost_type_id)] += row.value
+        elif kind == 'consumption_month' and row.count > 0:
+            months.append((date.fromisoformat(rest), row.value))
+    return {
+        'counts': counts,
+        'invoice_totals': dict(invoice_totals),
+        'consumption_by_month': sorted(months),
+        'refreshed_at': max((row.updated_at for row in rows), default=None),
+    }
+
+
+def _add(deltas, key: str, value: float, count: int):
+    delta = deltas[key]
+    delta[0] += value
+    delta[1] += count
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_old_invoices(session, flush_context, instances):
+    """Merkt sich Kostenart, Gebäude und Betrag geänderter/gelöschter Rechnungen, solange sie noch in der DB stehen.
+
+    Nach einem Commit sind die Objekte abgelaufen; die Attribut-Historie kennt den alten Wert dann nicht.
+    """
+    ids = [inspect(obj).identity[0] for obj in session.dirty
+           if isinstance(obj, Invoice) and inspect(obj).identity and session.is_modified(obj)]
+    ids += [inspect(obj).identity[0] for obj in session.deleted if isinstance(obj, Invoice) and inspect(obj).identity]
+    if ids:
+        rows = session.connection().execute(
+            select(Invoice.id, Invoice.cost_type_id, Invoice.building_id, Invoice.amount).where(Invoice.id.in_(ids))
+        )
+        old = session.info.setdefault('dashboard_stats_invoices', {})
+        old.update({invoice_id: (cost_type_id, building_id, amount or 0.0)
+                    for invoice_id, cost_type_id, building_id, amount in rows})
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_dashboard_stats(session, flush_context):
+    old_invoices = session.info.pop('dashboard_stats_invoices', {})
+    deltas = defaultdict(lambda: [0.0, 0])
+    for obj in session.new:
+        if isinstance(obj, COUNTED_MODELS):
+            _add(deltas, count_key(type(obj)), 0.0, 1)
+        if isinstance(obj, Invoice):
+            _add(deltas, invoice_key(obj.cost_type_id, obj.building_id), obj.amount or 0.0, 1)
+    for obj in session.deleted:
+        if isinstance(obj, COUNTED_MODELS):
+            _add(deltas, count_key(type(obj)), 0.0, -1)
+        if getattr(obj, '__tablename__', None) in _CASCADE_PARENTS:
+            session.info['dashboard_stats_stale'] = True
+    # Geänderte Rechnungen: alter Betrag raus, neuer rein; gelöschte nur raus
+    deleted = {id(obj) for obj in session.deleted}
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Invoice) or not inspect(obj).identity:
+            continue
+        old = old_invoices.get(inspect(obj).identity[0])
+        if old is None:
+            continue
+        new = None if id(obj) in deleted else (obj.cost_type_id, obj.building_id, obj.amount or 0.0)
+        if old != new:
+            _add(deltas, invoice_key(old[0], old[1]), -old[2], -1)
+            if new is not None:
+                _add(deltas, invoice_key(new[0], new[1]), new[2], 1)
+    if deltas:
+        bump_dashboard_stats({key: tuple(delta) for key, delta in deltas.items()}, session.connection())
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _flag_bulk_statements(orm_execute_state):
+    """ORM-Massenoperationen laufen an den Flush-Ereignissen vorbei: beim Commit neu berechnen."""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, COUNTED_MODELS):
+        orm_execute_state.session.info['dashboard_stats_stale'] = True
+
+
+@event.listens_for(Session, 'before_commit')
+def _refresh_stale_stats(session):
+    # Ausstehende Änderungen zuerst: ihr Flush kann die Markierung setzen und zählte nach der
+    # Neuberechnung sonst doppelt
+    session.flush()
+    if session.info.pop('dashboard_stats_stale', False):
+        refresh_dashboard_stats(session.connection())
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_stale_stats(session, previous_transaction):
+    # Nur am Ende der äußeren Transaktion: ein zurückgerollter Savepoint lässt deren Massenoperationen bestehen
+    if previous_transaction.parent is None:
+        session.info.pop('dashboard_stats_stale', None)
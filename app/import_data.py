@@ -1,49 +1,195 @@
+import codecs
 import csv
 import io
+import time
 from datetime import datetime
+from sqlalchemy import insert
 from app import db
 from app.models import Apartment, CostType, ConsumptionData, Tenant
+from app.consumption_rollup import add_to_rollup
+from app.allocation_cache import mark_data_changed
 
-def import_consumption_csv(file_path_or_stream):
+# Zeilen pro Batch (INSERT + Commit) beim CSV-Import
+CONSUMPTION_IMPORT_CHUNK_SIZE = 5000
+TENANT_IMPORT_CHUNK_SIZE = 1000
+
+
+class _CsvSource:
+    """
+    Zeilenweiser Text-Zugriff auf eine CSV-Quelle, ohne den Inhalt vollständig zu lesen.
+
+    Pfade werden binär geöffnet, binäre Streams (BytesIO, Dateien, der Stream eines
+    Werkzeug-``FileStorage``) über ``io.TextIOWrapper`` blockweise dekodiert,
+    Text-Streams (z.B. StringIO) direkt verwendet. ``offset`` ist die Byte-Position
+    hinter der zuletzt gelesenen Zeile und dient als Checkpoint für ``seek``.
+    Übergebene Streams bleiben nach ``close`` offen.
+    """
+
+    def __init__(self, file_path_or_stream):
+        self._owned = isinstance(file_path_or_stream, str)
+        if self._owned:
+            stream = open(file_path_or_stream, 'rb')
+        else:
+            stream = getattr(file_path_or_stream, 'stream', file_path_or_stream) # FileStorage -> Stream
+        if not hasattr(stream, 'read'):
+            raise TypeError("Stream must be a text or binary file-like object")
+
+        self.offset = 0
+        if isinstance(stream, io.TextIOBase):
+            self._binary = None
+            self._text = stream
+            return
+
+        self._binary = stream
+        encoding = 'utf-8-sig'
+        if isinstance(stream, io.BytesIO):
+            stream.seek(0)
+        if stream.seekable():
+            # BOM selbst überspringen, damit ``offset`` die echte Byte-Position ist
+            start = stream.tell()
+            if stream.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+                stream.seek(start)
+            self.offset = stream.tell()
+            encoding = 'utf-8'
+        self._text = io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+    def __iter__(self):
+        for line in self._text:
+            self.offset += len(line.encode('utf-8'))
+            yield line
+
+    def seek(self, offset):
+        """Setzt das Lesen an einer zuvor über ``offset`` gemeldeten Position fort."""
+        if self._binary is None or not self._binary.seekable():
+            raise ValueError("Resuming requires a file path or a seekable binary stream")
+        self._text.detach()
+        self._binary.seek(offset)
+        self._text = io.TextIOWrapper(self._binary, encoding='utf-8', newline='')
+        self.offset = offset
+
+    def close(self):
+        if self._binary is None:
+            return
+        if self._owned:
+            self._text.close()
+        else:
+            self._text.detach()
+
+
+def _insert_consumption_chunk(rows):
+    """Schreibt einen Batch (apartment_id, cost_type_id, date, value) per executemany und pflegt den Rollup."""
+    db.session.execute(insert(ConsumptionData.__table__), [
+        {'apartment_id': apartment_id, 'cost_type_id': cost_type_id, 'date': consumption_date,
+         'value': value, 'entry_type': 'csv_import'}
+        for apartment_id, cost_type_id, consumption_date, value in rows
+    ])
+    # Core-Inserts laufen an der ORM-Session vorbei, daher Rollup und Änderungszähler explizit pflegen
+    add_to_rollup(rows)
+    mark_data_changed([ConsumptionData.__tablename__])
+
+
+def _drop_existing_rows(rows):
+    """Entfernt Zeilen, deren natürlicher Schlüssel (Wohnung, Kostenart, Datum, 'csv_import') schon existiert.
+
+    Auch Wiederholungen innerhalb von ``rows`` werden nur einmal übernommen.
+    """
+    if not rows:
+        return rows
+    dates = [consumption_date for _, _, consumption_date, _ in rows]
+    existing = set(db.session.query(
+        ConsumptionData.apartment_id, ConsumptionData.cost_type_id, ConsumptionData.date
+    ).filter(
+        ConsumptionData.entry_type == 'csv_import',
+        ConsumptionData.apartment_id.in_({row[0] for row in rows}),
+        ConsumptionData.cost_type_id.in_({row[1] for row in rows}),
+        ConsumptionData.date >= min(dates),
+        ConsumptionData.date <= max(dates)
+    ).all())
+    unique_rows = []
+    for row in rows:
+        key = row[:3]
+        if key not in existing:
+            existing.add(key)
+            unique_rows.append(row)
+    return unique_rows
+
+
+def import_consumption_csv(file_path_or_stream, chunk_size=CONSUMPTION_IMPORT_CHUNK_SIZE, progress_callback=None,
+                           start_offset=0, start_row=1, skip_duplicates=False):
     """
     Importiert Verbrauchsdaten aus einer CSV-Datei oder einem Stream.
 
+    Die Quelle wird zeilenweise gelesen (auch Uploads als Binär-Stream bzw.
+    ``FileStorage``), der Speicherbedarf hängt nur von ``chunk_size`` ab.
+    Wohnungsnummern und Kostenartnamen werden einmal vorab in Dictionaries geladen,
+    gültige Zeilen als Tupel gesammelt und je ``chunk_size`` Zeilen per
+    Core-``insert()`` (executemany) geschrieben und committet.
+
     Args:
-        file_path_or_stream: Pfad zur CSV-Datei oder ein File-like Object.
+        file_path_or_stream: Pfad, Text-/Binär-Stream oder Werkzeug-FileStorage.
+        chunk_size: Anzahl Zeilen pro Batch (INSERT + Commit).
+        progress_callback: Optional, wird je Batch nach dem INSERT und vor dem Commit
+                           (also in derselben Transaktion) mit einem Dictionary
+                           {'batch', 'row_num', 'byte_offset', 'processed_rows',
+                           'skipped_rows', 'duplicate_rows'} aufgerufen.
+        start_offset: Byte-Position, ab der gelesen wird (``byte_offset`` eines Checkpoints).
+        start_row: Zeilennummer der Zeile vor ``start_offset`` (1 = Kopfzeile).
+        skip_duplicates: Zeilen überspringen, deren (Wohnung, Kostenart, Datum, entry_type)
+                         bereits importiert ist; ein erneuter Import ist dann wirkungslos.
 
     Returns:
-        dict: Ein Dictionary mit 'processed_rows' und 'skipped_rows'.
+        dict: Ein Dictionary mit 'processed_rows', 'skipped_rows', 'duplicate_rows' und
+              'rows_per_second'. Bei einem Abbruch zählen nur bereits committete Zeilen
+              als verarbeitet, der Fehler steht unter 'error'.
     """
     processed_rows = 0
     skipped_rows = 0
+    duplicate_rows = 0
     required_headers = {'apartment_number', 'cost_type_name', 'date', 'value'}
+    committed_rows = 0
+    batch = 0
+    started = time.perf_counter()
     
     try:
-        # Unterscheiden, ob Pfad oder Stream übergeben wurde
-        if isinstance(file_path_or_stream, str):
-            f = open(file_path_or_stream, 'r', encoding='utf-8')
-            should_close = True
-        else: # Annahme: file-like object (z.B. aus StringIO für Tests)
-            # Wichtig: Stream muss im Textmodus sein
-            if isinstance(file_path_or_stream, io.BytesIO):
-                 # Versuche BytesIO in StringIO umzuwandeln, wenn nötig
-                 file_path_or_stream.seek(0)
-                 file_path_or_stream = io.StringIO(file_path_or_stream.read().decode('utf-8'))
-            elif not isinstance(file_path_or_stream, io.StringIO):
-                 raise TypeError("Stream must be StringIO or BytesIO")
-            f = file_path_or_stream
-            should_close = False
+        source = _CsvSource(file_path_or_stream)
         
-        reader = csv.DictReader(f)
+        reader = csv.DictReader(source)
         
         # Header validieren
-        if not required_headers.issubset(reader.fieldnames):
-            missing = required_headers - set(reader.fieldnames)
+        if not reader.fieldnames or not required_headers.issubset(reader.fieldnames):
+            missing = required_headers - set(reader.fieldnames or [])
             print(f"Error: Missing required CSV headers: {missing}")
-            if should_close: f.close()
             return {'processed_rows': 0, 'skipped_rows': -1} # Spezieller Wert für Header-Fehler
 
-        for row_num, row in enumerate(reader, start=2): # start=2 wegen Header
+        if start_offset > source.offset:
+            # Fortsetzen hinter dem letzten Checkpoint, Kopfzeile wurde bereits gelesen
+            source.seek(start_offset)
+            reader = csv.DictReader(source, fieldnames=reader.fieldnames)
+
+        def commit_batch(rows, row_num):
+            nonlocal processed_rows, duplicate_rows, committed_rows, batch
+            if skip_duplicates:
+                unique_rows = _drop_existing_rows(rows)
+                duplicate_rows += len(rows) - len(unique_rows)
+                processed_rows -= len(rows) - len(unique_rows)
+                rows = unique_rows
+            if rows:
+                _insert_consumption_chunk(rows)
+            batch += 1
+            if progress_callback:
+                progress_callback({'batch': batch, 'row_num': row_num, 'byte_offset': source.offset,
+                                   'processed_rows': processed_rows, 'skipped_rows': skipped_rows,
+                                   'duplicate_rows': duplicate_rows})
+            db.session.commit()
+            committed_rows = processed_rows
+
+        # Nachschlagetabellen einmalig laden statt zwei Abfragen pro Zeile
+        apartment_ids = dict(db.session.query(Apartment.number, Apartment.id).all())
+        cost_type_ids = dict(db.session.query(CostType.name, CostType.id).all())
+        pending = []
+        row_num = start_row
+
+        for row_num, row in enumerate(reader, start=start_row + 1):
             try:
                 apartment_number = row['apartment_number']
                 cost_type_name = row['cost_type_name']
@@ -51,15 +197,15 @@ def import_consumption_csv(file_path_or_stream):
                 value_str = row['value']
 
                 # Zugehörige Objekte finden
-                apartment = Apartment.query.filter_by(number=apartment_number).first()
-                cost_type = CostType.query.filter_by(name=cost_type_name).first()
+                apartment_id = apartment_ids.get(apartment_number)
+                cost_type_id = cost_type_ids.get(cost_type_name)
 
-                if not apartment:
+                if apartment_id is None:
                     print(f"Warning: Row {row_num}: Apartment '{apartment_number}' not found. Skipping.")
                     skipped_rows += 1
                     continue
                 
-                if not cost_type:
+                if cost_type_id is None:
                     print(f"Warning: Row {row_num}: CostType '{cost_type_name}' not found. Skipping.")
                     skipped_rows += 1
                     continue
@@ -79,84 +225,96 @@ def import_consumption_csv(file_path_or_stream):
                     skipped_rows += 1
                     continue
 
-                # ConsumptionData-Objekt erstellen und hinzufügen
-                consumption_entry = ConsumptionData(
-                    apartment_id=apartment.id,
-                    cost_type_id=cost_type.id,
-                    date=consumption_date,
-                    value=consumption_value
-                )
-                db.session.add(consumption_entry)
+                pending.append((apartment_id, cost_type_id, consumption_date, consumption_value))
                 processed_rows += 1
 
             except KeyError as e:
                 print(f"Warning: Row {row_num}: Missing expected column {e}. Skipping.")
                 skipped_rows += 1
+                continue
             except Exception as e:
                 print(f"Warning: Row {row_num}: Unexpected error processing row: {e}. Skipping.")
                 skipped_rows += 1
-        
-        # Änderungen speichern
-        db.session.commit()
+                continue
+
+            if len(pending) >= chunk_size:
+                commit_batch(pending, row_num)
+                pending = []
+
+        # Restliche Zeilen speichern
+        if pending or batch == 0:
+            commit_batch(pending, row_num)
         print(f"CSV import finished. Processed: {processed_rows}, Skipped: {skipped_rows}")
         
     except FileNotFoundError:
         print(f"Error: File not found at {file_path_or_stream}")
         return {'processed_rows': 0, 'skipped_rows': -1}
     except Exception as e:
-        db.session.rollback() # Bei generellem Fehler Rollback durchführen
+        db.session.rollback() # Nur der laufende Batch geht verloren
         print(f"Error during CSV import: {e}")
-        return {'processed_rows': processed_rows, 'skipped_rows': skipped_rows + (row_num - 1 - processed_rows - skipped_rows if 'row_num' in locals() else 0)} # Schätzung
+        unaccounted = (row_num - start_row - processed_rows - skipped_rows - duplicate_rows) if 'row_num' in locals() else 0
+        return {'processed_rows': committed_rows,
+                'skipped_rows': skipped_rows + (processed_rows - committed_rows) + max(unaccounted, 0), # Schätzung
+                'duplicate_rows': duplicate_rows, 'error': str(e)}
     finally:
-        if should_close and 'f' in locals() and f:
-            f.close()
-            
-    return {'processed_rows': processed_rows, 'skipped_rows': skipped_rows} 
+        if 'source' in locals():
+            source.close()
 
-def import_tenant_csv(file_path_or_stream):
+    elapsed = time.perf_counter() - started
+    rows_per_second = round(processed_rows / elapsed, 1) if elapsed > 0 else float(processed_rows)
+    return {'processed_rows': processed_rows, 'skipped_rows': skipped_rows, 'duplicate_rows': duplicate_rows,
+            'rows_per_second': rows_per_second}
+
+def import_tenant_csv(file_path_or_stream, chunk_size=TENANT_IMPORT_CHUNK_SIZE, progress_callback=None):
     """
     Importiert Mieterdaten aus einer CSV-Datei oder einem Stream.
 
+    Die Quelle wird zeilenweise gelesen und je ``chunk_size`` Mieter committet
+    (siehe ``import_consumption_csv``).
+
     CSV Format erwartet:
         Name (string, required): Name des Mieters.
         Kontaktinfo (string, optional): Kontaktinformationen (E-Mail, Tel, etc.).
 
     Args:
-        file_path_or_stream: Pfad zur CSV-Datei oder ein File-like Object.
+        file_path_or_stream: Pfad, Text-/Binär-Stream oder Werkzeug-FileStorage.
+        chunk_size: Anzahl Mieter pro Commit.
+        progress_callback: Optional, wird je Batch vor dem Commit mit einem Dictionary
+                           {'batch', 'row_num', 'byte_offset', 'processed_rows', 'skipped_rows'}
+                           aufgerufen.
 
     Returns:
         dict: Ein Dictionary mit 'processed_rows' und 'skipped_rows'.
     """
     processed_rows = 0
     skipped_rows = 0
+    committed_rows = 0
+    batch = 0
     required_headers = {'Name'} # Nur Name ist initial Pflicht
     optional_headers = {'Kontaktinfo'}
     all_expected_headers = required_headers.union(optional_headers)
 
     try:
-        # Unterscheiden, ob Pfad oder Stream übergeben wurde
-        if isinstance(file_path_or_stream, str):
-            f = open(file_path_or_stream, 'r', encoding='utf-8')
-            should_close = True
-        else: # Annahme: file-like object
-            if isinstance(file_path_or_stream, io.BytesIO):
-                 file_path_or_stream.seek(0)
-                 file_path_or_stream = io.StringIO(file_path_or_stream.read().decode('utf-8'))
-            elif not isinstance(file_path_or_stream, io.StringIO):
-                 raise TypeError("Stream must be StringIO or BytesIO")
-            f = file_path_or_stream
-            should_close = False
-
-        reader = csv.DictReader(f)
+        source = _CsvSource(file_path_or_stream)
+
+        reader = csv.DictReader(source)
 
         # Header validieren (Mindestens die Pflicht-Header müssen da sein)
-        actual_headers = set(reader.fieldnames)
+        actual_headers = set(reader.fieldnames or [])
         if not required_headers.issubset(actual_headers):
             missing = required_headers - actual_headers
             print(f"Error: Missing required CSV headers: {missing}")
-            if should_close: f.close()
             return {'processed_rows': 0, 'skipped_rows': -1}
 
+        def commit_batch(row_num):
+            nonlocal committed_rows, batch
+            batch += 1
+            if progress_callback:
+                progress_callback({'batch': batch, 'row_num': row_num, 'byte_offset': source.offset,
+                                   'processed_rows': processed_rows, 'skipped_rows': skipped_rows})
+            db.session.commit()
+            committed_rows = processed_rows
+
         # Warnung für unerwartete Header (optional)
         unexpected = actual_headers - all_expected_headers
         if unexpected:
@@ -187,6 +345,8 @@ def import_tenant_csv(file_path_or_stream):
                 )
                 db.session.add(tenant_entry)
                 processed_rows += 1
+                if processed_rows - committed_rows >= chunk_size:
+                    commit_batch(row_num)
 
             except KeyError as e: # Sollte durch row.get() abgefangen sein, aber sicherheitshalber
                 print(f"Warning: Row {row_num}: Error accessing column {e}. Skipping.")
@@ -195,7 +355,8 @@ def import_tenant_csv(file_path_or_stream):
                 print(f"Warning: Row {row_num}: Unexpected error processing row: {e}. Skipping.")
                 skipped_rows += 1
 
-        db.session.commit()
+        if processed_rows > committed_rows or batch == 0:
+            commit_batch(row_num if 'row_num' in locals() else 1)
         print(f"Tenant CSV import finished. Processed: {processed_rows}, Skipped: {skipped_rows}")
 
     except FileNotFoundError:
@@ -204,9 +365,9 @@ def import_tenant_csv(file_path_or_stream):
     except Exception as e:
         db.session.rollback()
         print(f"Error during Tenant CSV import: {e}")
-        # Bessere Schätzung für skipped rows bei generischem Fehler
-        processed_in_batch = processed_rows
-        skipped_in_batch = skipped_rows
+        # Bessere Schätzung für skipped rows bei generischem Fehler (nur der laufende Batch geht verloren)
+        processed_in_batch = committed_rows
+        skipped_in_batch = skipped_rows + (processed_rows - committed_rows)
         current_row_num = row_num if 'row_num' in locals() else 1
         total_rows_estimate = current_row_num -1 # Exklusive Header
         if total_rows_estimate < 0: total_rows_estimate = 0
@@ -215,7 +376,7 @@ def import_tenant_csv(file_path_or_stream):
         final_skipped = skipped_in_batch + unaccounted_rows
         return {'processed_rows': processed_in_batch, 'skipped_rows': final_skipped}
     finally:
-        if 'should_close' in locals() and should_close and 'f' in locals() and f:
-            f.close()
+        if 'source' in locals():
+            source.close()
 
     return {'processed_rows': processed_rows, 'skipped_rows': skipped_rows} 
\ No newline at end of file
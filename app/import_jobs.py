@@ -0,0 +1,153 @@
+"""
+Fortsetzbare Verbrauchsimporte (``ImportJob``).
+
+Ein Job ist über den SHA-256-Hash der Datei identifiziert. Nach jedem Batch wird
+im selben Commit ein Checkpoint gespeichert (Byte-Position hinter der letzten
+Zeile, Zeilennummer, Zähler). Bricht ein Import ab, setzt ein erneuter Start mit
+derselben Datei hinter dem letzten Checkpoint fort, statt von vorne zu beginnen.
+Ein laufender Import wird nur fortgesetzt, wenn sein letzter Checkpoint älter als
+``JOB_LEASE_SECONDS`` ist (Prozess abgestürzt); zwei Prozesse importieren nie
+gleichzeitig ab demselben Checkpoint.
+Zeilen werden über den natürlichen Schlüssel (Wohnung, Kostenart, Datum,
+entry_type) dedupliziert, ein erneuter Import verdoppelt keinen Verbrauch.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from flask import current_app
+from sqlalchemy import or_, update
+
+from app import db
+from app.jobs.queue import DEFAULT_LEASE_SECONDS
+from app.models import ImportJob
+from app.import_data import import_consumption_csv, CONSUMPTION_IMPORT_CHUNK_SIZE
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path_or_stream):
+    """SHA-256 (hex) und Größe einer Datei bzw. eines seekbaren Binär-Streams.
+
+    Die Stream-Position wird danach wiederhergestellt.
+
+    Returns:
+        tuple: (hex_digest, size_in_bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    if isinstance(file_path_or_stream, str):
+        with open(file_path_or_stream, 'rb') as fh:
+            for block in iter(lambda: fh.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+                size += len(block)
+        return digest.hexdigest(), size
+
+    stream = getattr(file_path_or_stream, 'stream', file_path_or_stream) # FileStorage -> Stream
+    position = stream.tell()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+        size += len(block)
+    stream.seek(position)
+    return digest.hexdigest(), size
+
+
+def find_or_create_import_job(file_path_or_stream, filename: Optional[str] = None, kind: str = 'consumption') -> ImportJob:
+    """Liefert den letzten Job zu derselben Datei (gleicher Hash) oder legt einen neuen an.
+
+    Der Job kann noch laufen; ob er fortgesetzt werden darf, entscheidet ``run_import_job``.
+    """
+    file_hash, file_size = file_sha256(file_path_or_stream)
+    job = ImportJob.query.filter_by(kind=kind, file_hash=file_hash).order_by(ImportJob.id.desc()).first()
+    if job is None:
+        if filename is None:
+            filename = (os.path.basename(file_path_or_stream) if isinstance(file_path_or_stream, str)
+                        else getattr(file_path_or_stream, 'filename', None))
+        job = ImportJob(kind=kind, filename=filename, file_hash=file_hash, file_size=file_size, status='pending')
+        db.session.add(job)
+        db.session.commit()
+    return job
+
+
+def run_import_job(job: ImportJob, file_path_or_stream, chunk_size: int = CONSUMPTION_IMPORT_CHUNK_SIZE,
+                   progress_callback: Optional[Callable[[ImportJob], None]] = None) -> ImportJob:
+    """
+    Führt einen Import-Job ab seinem letzten Checkpoint aus.
+
+    Ein bereits abgeschlossener Job wird nicht erneut ausgeführt. Bei einem Fehler
+    bleibt der Job mit Status 'failed' und dem letzten Checkpoint stehen und kann
+    mit derselben Datei fortgesetzt werden. Ein laufender Job wird nur übernommen,
+    wenn sein letzter Checkpoint älter als ``JOB_LEASE_SECONDS`` ist.
+
+    Args:
+        job: Der Job (siehe ``find_or_create_import_job``).
+        file_path_or_stream: Dieselbe Datei, aus der der Job erstellt wurde.
+        chunk_size: Zeilen pro Batch (INSERT + Checkpoint + Commit).
+        progress_callback: Optional, wird je Batch mit dem aktualisierten Job aufgerufen.
+
+    Returns:
+        ImportJob: Der Job mit Status 'completed' oder 'failed'.
+
+    Raises:
+        ValueError: Der Job läuft bereits in einem anderen Prozess.
+    """
+    if job.status == 'completed':
+        return job
+
+    # Atomar übernehmen: nicht laufend oder seit der Lease-Zeit ohne Checkpoint
+    now = datetime.utcnow()
+    lease_seconds = float(current_app.config.get('JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    claimed = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job.id, ImportJob.status != 'completed',
+               or_(ImportJob.status != 'running', ImportJob.updated_at < now - timedelta(seconds=lease_seconds)))
+        .values(status='running', error=None, updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        if job.status == 'completed':
+            return job
+        raise ValueError(f'Import-Job {job.id} für diese Datei läuft bereits.')
+
+    base_processed, base_skipped, base_duplicates = job.processed_rows, job.skipped_rows, job.duplicate_rows
+
+    def checkpoint(progress):
+        # Läuft vor dem Commit des Batches: Daten und Checkpoint werden gemeinsam gespeichert
+        job.byte_offset = progress['byte_offset']
+        job.last_committed_row = progress['row_num']
+        job.processed_rows = base_processed + progress['processed_rows']
+        job.skipped_rows = base_skipped + progress['skipped_rows']
+        job.duplicate_rows = base_duplicates + progress['duplicate_rows']
+        if progress_callback:
+            progress_callback(job)
+
+    result = import_consumption_csv(
+        file_path_or_stream,
+        chunk_size=chunk_size,
+        progress_callback=checkpoint,
+        start_offset=job.byte_offset,
+        start_row=job.last_committed_row,
+        skip_duplicates=True,
+    )
+
+    if result['skipped_rows'] == -1:
+        job.status = 'failed'
+        job.error = 'Missing required CSV headers or file not found.'
+    elif 'error' in result:
+        job.status = 'failed'
+        job.error = result['error']
+    else:
+        job.status = 'completed'
+    db.session.commit()
+    return job
+
+
+def import_consumption_file(file_path_or_stream, filename: Optional[str] = None,
+                            chunk_size: int = CONSUMPTION_IMPORT_CHUNK_SIZE,
+                            progress_callback: Optional[Callable[[ImportJob], None]] = None) -> ImportJob:
+    """Startet den Import einer Verbrauchsdatei oder setzt einen abgebrochenen Import derselben Datei fort."""
+    job = find_or_create_import_job(file_path_or_stream, filename=filename)
+    return run_import_job(job, file_path_or_stream, chunk_size=chunk_size, progress_callback=progress_callback)
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+jobs_bp = Blueprint('jobs', __name__, template_folder='../templates/jobs', url_prefix='/jobs')
+
+from . import handlers  # noqa: E402,F401  (registriert die Job-Arten)
+from . import routes  # noqa: E402,F401
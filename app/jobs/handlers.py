@@ -0,0 +1,88 @@
+"""
+Job-Handler für Sammelexport, Warnungen und Verbrauchsimport.
+"""
+import os
+from datetime import date, datetime
+
+from app.jobs.queue import job_handler, job_params, job_results_folder, progress_reporter
+from app.models import Job
+
+
+@job_handler('billing_export')
+def run_billing_export(job: Job) -> dict:
+    """Erzeugt das ZIP bzw. Sammel-PDF des Sammelexports unter ``JOB_RESULTS_FOLDER``."""
+    from app.billing.bulk import EXPORT_PDF, export_statements_bundle, export_statements_zip
+    from app.billing.routes import build_preset_cost_items
+
+    params = job_params(job)
+    ps = date.fromisoformat(params['period_start'])
+    pe = date.fromisoformat(params['period_end'])
+    building_id = params.get('building_id')
+    cost_items = build_preset_cost_items(params.get('preset', 'standard'), ps, pe, building_id)
+    extension = 'pdf' if params.get('format') == EXPORT_PDF else 'zip'
+
+    report = progress_reporter(job)
+    report(0, message='Abrechnungen werden erzeugt')
+    path = os.path.join(job_results_folder(), f'job_{job.id}.{extension}')
+    with open(path, 'wb') as fh:
+        if extension == 'pdf':
+            result = export_statements_bundle(fh, building_id, ps, pe, cost_items, toc=bool(params.get('toc')),
+                                              progress_callback=lambda done, total: report(done, total))
+        else:
+            result = export_statements_zip(fh, building_id, ps, pe, cost_items,
+                                           progress_callback=lambda done, total: report(done, total))
+    if not result['statements']:
+        os.remove(path)
+        raise ValueError('Keine Abrechnungen für die Auswahl erzeugt.')
+
+    suffix = f'_{building_id}' if building_id else ''
+    job.result_path = path
+    job.result_filename = f'abrechnungen{suffix}_{ps}_{pe}.{extension}'
+    return result
+
+
+@job_handler('warnings')
+def run_warnings(job: Job) -> dict:
+    """Berechnet die Warnungen eines Zeitraums und speichert sie als ``WarningEntry``-Zeilen.
+
+    Das Job-Ergebnis enthält nur die Anzahl je Art; die Zeilen liefert ``/warnings/api`` seitenweise.
+    """
+    from app.validation import generate_warnings
+    from app.warnings.entries import store_warnings
+
+    params = job_params(job)
+    # Rückmeldung (Lease) vor und nach der Berechnung
+    report = progress_reporter(job, min_interval=0)
+    report(0, 2, message='Warnungen werden berechnet')
+    warnings = generate_warnings(period_start=date.fromisoformat(params['period_start']),
+                                 period_end=date.fromisoformat(params['period_end']))
+    report(1, message='Warnungen werden gespeichert')
+    return store_warnings(job.id, warnings)
+
+
+@job_handler('consumption_import')
+def run_consumption_import(job: Job) -> dict:
+    """Importiert eine hochgeladene Verbrauchs-CSV als fortsetzbaren ``ImportJob``."""
+    from app.import_jobs import import_consumption_file
+
+    params = job_params(job)
+    path = params['path']
+    total = os.path.getsize(path)
+    job.progress_total = total
+
+    def on_batch(import_job):
+        # Läuft vor dem Commit des Batches, Fortschritt und Rückmeldung (Lease) werden mitgespeichert
+        job.progress_current = import_job.byte_offset
+        job.message = f'{import_job.processed_rows} Zeilen importiert'
+        job.heartbeat_at = datetime.utcnow()
+
+    import_job = import_consumption_file(path, filename=params.get('filename'), progress_callback=on_batch)
+    if import_job.status != 'completed':
+        raise ValueError(import_job.error or 'Import fehlgeschlagen.')
+    os.remove(path)
+    return {
+        'import_job_id': import_job.id,
+        'processed_rows': import_job.processed_rows,
+        'skipped_rows': import_job.skipped_rows,
+        'duplicate_rows': import_job.duplicate_rows,
+    }
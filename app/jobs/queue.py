@@ -0,0 +1,213 @@
+"""
+Einfache Job-Warteschlange auf Basis der Tabelle ``job``.
+
+Routen legen Jobs per ``enqueue_job`` an und kehren sofort zurück; ein separater
+Worker-Prozess (``flask jobs worker``) holt sich Jobs per atomarem UPDATE
+(``claim_next_job``) und führt den registrierten Handler aus. Handler erhalten
+den Job, melden Fortschritt über ``progress_reporter`` und liefern ein
+JSON-serialisierbares Ergebnis.
+
+Übernahme und Fortschrittsmeldungen setzen ``heartbeat_at`` (Lease). Meldet sich
+ein laufender Job länger als ``JOB_LEASE_SECONDS`` nicht (Worker abgestürzt oder
+beendet), stellt ``requeue_stale_jobs`` ihn wieder ein – bei jeder Übernahme
+automatisch oder per ``flask jobs requeue-stale``; nach ``JOB_MAX_ATTEMPTS``
+Übernahmen wird er als fehlgeschlagen markiert.
+"""
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from app import db
+from app.models import Job
+from app.reference_data import reset_reference_data
+
+# Ohne Rückmeldung so lange gilt ein laufender Job als verwaist (Konfiguration JOB_LEASE_SECONDS)
+DEFAULT_LEASE_SECONDS = 30 * 60
+# Übernahmen, nach denen ein verwaister Job fehlschlägt statt erneut zu laufen (JOB_MAX_ATTEMPTS)
+DEFAULT_MAX_ATTEMPTS = 3
+
+# {kind: handler(job) -> dict}
+JOB_HANDLERS: Dict[str, Callable[[Job], Optional[dict]]] = {}
+
+
+def job_handler(kind: str):
+    """Registriert einen Handler für eine Job-Art."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def job_params(job: Job) -> dict:
+    return json.loads(job.params) if job.params else {}
+
+
+def job_result(job: Job) -> Optional[dict]:
+    return json.loads(job.result) if job.result else None
+
+
+def job_results_folder() -> str:
+    """Ablageort für Job-Dateien (Uploads, ZIPs); Konfiguration ``JOB_RESULTS_FOLDER``."""
+    folder = current_app.config.get('JOB_RESULTS_FOLDER') or os.path.join(current_app.instance_path, 'jobs')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def enqueue_job(kind: str, params: Optional[dict] = None, message: Optional[str] = None) -> Job:
+    """Legt einen Job mit Status 'queued' an und committet ihn."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    job = Job(kind=kind, status='queued', params=json.dumps(params or {}), message=message or 'Wartet auf Worker')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def requeue_stale_jobs(lease_seconds: Optional[float] = None, max_attempts: Optional[int] = None) -> Tuple[int, int]:
+    """Stellt laufende Jobs ohne Rückmeldung seit ``lease_seconds`` wieder ein (committet).
+
+    Jobs, die schon ``max_attempts`` Mal übernommen wurden, werden stattdessen als
+    fehlgeschlagen markiert.
+
+    Returns:
+        tuple: (wieder eingestellt, fehlgeschlagen)
+    """
+    if lease_seconds is None:
+        lease_seconds = float(current_app.config.get('JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    if max_attempts is None:
+        max_attempts = int(current_app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+    now = datetime.utcnow()
+    stale = (Job.status == 'running', Job.heartbeat_at < now - timedelta(seconds=lease_seconds))
+    requeued = db.session.execute(
+        update(Job).where(*stale, Job.attempts < max_attempts)
+        .values(status='queued', worker_id=None, message='Erneut eingereiht (Worker ohne Rückmeldung)')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    failed = db.session.execute(
+        update(Job).where(*stale, Job.attempts >= max_attempts)
+        .values(status='failed', finished_at=now, message='Fehlgeschlagen',
+                error=f'Worker ohne Rückmeldung (nach {max_attempts} Versuchen abgebrochen)')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return requeued, failed
+
+
+def claim_next_job(worker_id: Optional[str] = None) -> Optional[Job]:
+    """Übernimmt den ältesten wartenden Job (atomar, auch bei mehreren Workern).
+
+    Verwaiste laufende Jobs werden vorher wieder eingestellt (``requeue_stale_jobs``).
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    requeue_stale_jobs()
+    while True:
+        candidate = db.session.query(Job.id).filter(Job.status == 'queued').order_by(Job.id).first()
+        if candidate is None:
+            db.session.rollback()
+            return None
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == candidate.id, Job.status == 'queued')
+            .values(status='running', started_at=now, heartbeat_at=now, worker_id=worker_id,
+                    attempts=Job.attempts + 1, message='Läuft')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if claimed.rowcount == 1:
+            return db.session.get(Job, candidate.id)
+        # Ein anderer Worker war schneller: nächsten Kandidaten versuchen
+
+
+def progress_reporter(job: Job, min_interval: float = 1.0):
+    """Liefert ``report(current, total=None, message=None)``, das den Fortschritt höchstens alle ``min_interval`` s committet."""
+    last_commit = [0.0]
+
+    def report(current: int, total: Optional[int] = None, message: Optional[str] = None, commit: bool = True):
+        job.progress_current = current
+        if total is not None:
+            job.progress_total = total
+        if message:
+            job.message = message
+        now = time.monotonic()
+        finished = total is not None and current >= total
+        if commit and (finished or now - last_commit[0] >= min_interval):
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+            last_commit[0] = now
+
+    return report
+
+
+def run_job(job: Job) -> Job:
+    """Führt einen (bereits übernommenen) Job aus und speichert Ergebnis bzw. Fehler.
+
+    Wurde der Job inzwischen als verwaist an einen anderen Worker gegeben oder
+    aufgegeben, bleibt dessen Stand unangetastet.
+    """
+    job_id = job.id
+    worker_id = job.worker_id
+    handler = JOB_HANDLERS.get(job.kind)
+    # Der Worker hält einen App-Kontext über viele Jobs: Stammdaten je Job frisch laden
+    reset_reference_data()
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind '{job.kind}'")
+        result = handler(job)
+        job = _owned_job(job_id, worker_id)
+        if job is None:
+            return db.session.get(Job, job_id)
+        job.status = 'completed'
+        job.result = json.dumps(result) if result is not None else None
+        job.message = 'Abgeschlossen'
+        if job.progress_total is not None:
+            job.progress_current = job.progress_total
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error running job {job_id} ({job.kind}): {e}")
+        job = _owned_job(job_id, worker_id)
+        if job is None:
+            return db.session.get(Job, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.message = 'Fehlgeschlagen'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def _owned_job(job_id: int, worker_id: Optional[str]) -> Optional[Job]:
+    """Der Job mit aktuellem Stand, solange er noch diesem Worker gehört, sonst None."""
+    status, current_worker = db.session.execute(select(Job.status, Job.worker_id).where(Job.id == job_id)).one()
+    if status != 'running' or current_worker != worker_id:
+        print(f"Job {job_id} wurde inzwischen neu vergeben ({status}); Ergebnis verworfen")
+        db.session.rollback()
+        return None
+    return db.session.get(Job, job_id)
+
+
+def run_worker(once: bool = False, poll_interval: float = 2.0, worker_id: Optional[str] = None,
+               echo: Callable[[str], None] = print) -> int:
+    """Arbeitet die Warteschlange ab; mit ``once`` nur bis sie leer ist.
+
+    Returns:
+        int: Anzahl ausgeführter Jobs.
+    """
+    processed = 0
+    while True:
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        echo(f'Job {job.id} ({job.kind}) gestartet')
+        job = run_job(job)
+        processed += 1
+        echo(f'Job {job.id} ({job.kind}): {job.status}' + (f' – {job.error}' if job.error else ''))
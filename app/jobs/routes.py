@@ -0,0 +1,55 @@
+import os
+
+from flask import render_template, jsonify, send_file, abort, url_for
+
+from app import db
+from app.models import Job
+from app.jobs.queue import job_params, job_result
+from . import jobs_bp
+
+
+def job_status_dict(job: Job) -> dict:
+    percent = None
+    if job.progress_total:
+        percent = round(100.0 * job.progress_current / job.progress_total, 1)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'message': job.message,
+        'error': job.error,
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'percent': percent,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'download_url': url_for('jobs.download', job_id=job.id) if job.status == 'completed' and job.result_path else None,
+    }
+
+
+@jobs_bp.route('/')
+def list_jobs():
+    jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return render_template('jobs/list.html', title='Hintergrundaufgaben', jobs=jobs)
+
+
+@jobs_bp.route('/<int:job_id>')
+def job_detail(job_id):
+    job = db.get_or_404(Job, job_id)
+    return render_template('jobs/detail.html', title=f'Aufgabe #{job.id}', job=job,
+                           params=job_params(job), result=job_result(job), status=job_status_dict(job))
+
+
+@jobs_bp.route('/<int:job_id>/status')
+def job_status(job_id):
+    job = db.get_or_404(Job, job_id)
+    return jsonify(job_status_dict(job))
+
+
+@jobs_bp.route('/<int:job_id>/download')
+def download(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.status != 'completed' or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(job.result_path, as_attachment=True, download_name=job.result_filename)
@@ -3,6 +3,10 @@ from app import db
 from app.models import Apartment, CostType, ConsumptionData
 from app.cost_types.forms import ManualConsumptionForm
 from datetime import datetime
+import os
+import uuid
+from werkzeug.utils import secure_filename
+from app.jobs.queue import enqueue_job, job_results_folder
 
 manual_entry_bp = Blueprint('manual_entry', 
                             __name__, 
@@ -44,4 +48,26 @@ def consumption_entry():
             flash(f'Fehler beim Speichern: {str(e)}', 'danger')
     
     # Bei GET-Request oder wenn Validierung fehlschlägt:
-    return render_template('consumption_entry.html', title='Manuelle Verbrauchserfassung', form=form) 
\ No newline at end of file
+    return render_template('consumption_entry.html', title='Manuelle Verbrauchserfassung', form=form)
+
+
+@manual_entry_bp.route('/consumption/import', methods=['GET', 'POST'])
+def consumption_import():
+    """CSV-Upload für Verbrauchsdaten; der Import läuft als Hintergrundaufgabe."""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Bitte eine CSV-Datei auswählen.', 'danger')
+            return render_template('consumption_import.html', title='Verbrauchsdaten importieren')
+
+        filename = secure_filename(upload.filename) or 'verbrauch.csv'
+        upload_folder = os.path.join(job_results_folder(), 'uploads')
+        os.makedirs(upload_folder, exist_ok=True)
+        path = os.path.join(upload_folder, f'{uuid.uuid4().hex}_{filename}')
+        upload.save(path)
+
+        job = enqueue_job('consumption_import', {'path': path, 'filename': filename})
+        flash(f'Import als Aufgabe #{job.id} eingereiht.', 'info')
+        return redirect(url_for('jobs.job_detail', job_id=job.id))
+
+    return render_template('consumption_import.html', title='Verbrauchsdaten importieren')
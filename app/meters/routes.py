@@ -1,4 +1,4 @@
-from flask import render_template, redirect, url_for, flash, abort, session
+from flask import render_template, redirect, url_for, flash, abort, session, request
 from app import db
 from app.models import Meter, Apartment, ConsumptionData, CostType
 from . import meters_bp
@@ -132,12 +132,7 @@ def create_meter_reading():
 def create_meter_readings_bulk():
     # Auswahl der Wohnung
     apartments = Apartment.query.order_by(Apartment.number).all()
-    selected_apartment_id = request.args.get('apartment_id') if 'request' in globals() else None
-    try:
-        from flask import request
-        selected_apartment_id = request.values.get('apartment_id') or selected_apartment_id
-    except Exception:
-        pass
+    selected_apartment_id = request.values.get('apartment_id')
 
     selected_apartment = None
     meters = []
@@ -150,53 +145,51 @@ def create_meter_readings_bulk():
     if selected_apartment:
         meters = Meter.query.filter_by(apartment_id=selected_apartment.id).order_by(Meter.serial_number).all()
 
-    if 'request' in globals():
-        from flask import request, redirect, url_for, flash, render_template
-        if request.method == 'POST' and selected_apartment:
-            date_str = request.form.get('date')
+    if request.method == 'POST' and selected_apartment:
+        date_str = request.form.get('date')
+        try:
+            y, m, d = map(int, date_str.split('-'))
+            date_obj = datetime(y, m, d)
+        except Exception:
+            flash('Ungültiges Datum im Bulk-Formular.', 'danger')
+            return render_template('meters/reading_bulk.html', apartments=apartments, selected_apartment=selected_apartment, meters=meters, title='Zählerstände (Bulk)')
+
+        created = 0
+        for meter in meters:
+            val = request.form.get(f'value_{meter.id}')
+            if val is None or str(val).strip() == '':
+                continue
             try:
-                y, m, d = map(int, date_str.split('-'))
-                date_obj = datetime(y, m, d)
-            except Exception:
-                flash('Ungültiges Datum im Bulk-Formular.', 'danger')
-                return render_template('meters/reading_bulk.html', apartments=apartments, selected_apartment=selected_apartment, meters=meters, title='Zählerstände (Bulk)')
-
-            created = 0
-            for meter in meters:
-                val = request.form.get(f'value_{meter.id}')
-                if val is None or str(val).strip() == '':
-                    continue
-                try:
-                    fval = float(val)
-                except ValueError:
-                    continue
-
-                cost_type = CostType.query.filter_by(unit=meter.unit, type='consumption').first()
-                if not cost_type:
-                    cost_type = CostType.query.filter_by(type='consumption').first()
-                if not cost_type:
-                    cost_type = CostType(name=f"{meter.meter_type} (auto)", unit=meter.unit, type='consumption')
-                    db.session.add(cost_type)
-                    db.session.flush()
-
-                entry = ConsumptionData(
-                    apartment_id=meter.apartment_id,
-                    cost_type_id=cost_type.id,
-                    date=date_obj,
-                    value=fval,
-                    entry_type='manual'
-                )
-                db.session.add(entry)
-                created += 1
+                fval = float(val)
+            except ValueError:
+                continue
+
+            cost_type = CostType.query.filter_by(unit=meter.unit, type='consumption').first()
+            if not cost_type:
+                cost_type = CostType.query.filter_by(type='consumption').first()
+            if not cost_type:
+                cost_type = CostType(name=f"{meter.meter_type} (auto)", unit=meter.unit, type='consumption')
+                db.session.add(cost_type)
+                db.session.flush()
+
+            entry = ConsumptionData(
+                apartment_id=meter.apartment_id,
+                cost_type_id=cost_type.id,
+                date=date_obj,
+                value=fval,
+                entry_type='manual'
+            )
+            db.session.add(entry)
+            created += 1
 
-            try:
-                db.session.commit()
-                flash(f'{created} Zählerstände gespeichert.', 'success')
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Fehler beim Speichern: {e}', 'danger')
+        try:
+            db.session.commit()
+            flash(f'{created} Zählerstände gespeichert.', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Fehler beim Speichern: {e}', 'danger')
 
-            return redirect(url_for('meters.create_meter_readings_bulk', apartment_id=selected_apartment.id))
+        return redirect(url_for('meters.create_meter_readings_bulk', apartment_id=selected_apartment.id))
 
-        return render_template('meters/reading_bulk.html', apartments=apartments, selected_apartment=selected_apartment, meters=meters, title='Zählerstände (Bulk)')
+    return render_template('meters/reading_bulk.html', apartments=apartments, selected_apartment=selected_apartment, meters=meters, title='Zählerstände (Bulk)')
 
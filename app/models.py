@@ -20,7 +20,7 @@ class Apartment(db.Model):
     number = db.Column(db.String(50), index=True, unique=True, nullable=False)
     address = db.Column(db.String(200), nullable=False) # NEU: Adresse der Wohnung
     size_sqm = db.Column(db.Float, nullable=False) # NEU: Größe in Quadratmetern
-    building_id = db.Column(db.Integer, db.ForeignKey('building.id'), nullable=True)
+    building_id = db.Column(db.Integer, db.ForeignKey('building.id'), nullable=True, index=True)
     contracts = db.relationship('Contract', backref='apartment', lazy='dynamic')
     consumption_data = db.relationship('ConsumptionData', backref='apartment', lazy='dynamic')
     shares = db.relationship('ApartmentShare', backref='apartment', lazy='dynamic', cascade="all, delete-orphan")
@@ -58,14 +58,48 @@ class ConsumptionData(db.Model):
     value = db.Column(db.Float, nullable=False)
     entry_type = db.Column(db.String(20), nullable=False, default='csv_import', server_default='csv_import') # csv_import, manual
 
+    # Zusammengesetzte Indizes für Bereichsaggregationen: (Kostenart, Zeitraum) gruppiert
+    # nach Wohnung sowie Abfragen pro Wohnung. Auf PostgreSQL deckt INCLUDE(value) die
+    # Summen ohne Tabellenzugriff ab.
+    __table_args__ = (
+        db.Index('ix_consumption_data_cost_type_date_apartment', 'cost_type_id', 'date', 'apartment_id',
+                 postgresql_include=['value']),
+        db.Index('ix_consumption_data_apartment_cost_type_date', 'apartment_id', 'cost_type_id', 'date',
+                 postgresql_include=['value']),
+    )
+
     def __repr__(self):
         return f'<ConsumptionData Apt:{self.apartment_id} Type:{self.cost_type_id} Date:{self.date} Val:{self.value}>'
 
+class ConsumptionMonthly(db.Model):
+    """Monats-Rollup der Verbrauchsdaten (Wohnung × Kostenart × Monat).
+
+    Wird beim Schreiben von ``ConsumptionData`` inkrementell gepflegt
+    (siehe ``app.consumption_rollup``) und kann jederzeit neu aufgebaut werden.
+    """
+    __tablename__ = 'consumption_monthly'
+    id = db.Column(db.Integer, primary_key=True)
+    apartment_id = db.Column(db.Integer, db.ForeignKey('apartment.id'), nullable=False)
+    cost_type_id = db.Column(db.Integer, db.ForeignKey('cost_type.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False) # Erster Tag des Monats
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    min_value = db.Column(db.Float, nullable=True)
+    max_value = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('apartment_id', 'cost_type_id', 'month', name='uq_consumption_monthly_bucket'),
+        db.Index('ix_consumption_monthly_cost_type_month', 'cost_type_id', 'month'),
+    )
+
+    def __repr__(self):
+        return f'<ConsumptionMonthly Apt:{self.apartment_id} Type:{self.cost_type_id} Month:{self.month} Sum:{self.total}>'
+
 # NEUES MODELL: Contract
 class Contract(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tenant_id = db.Column(db.Integer, db.ForeignKey('tenant.id'), nullable=False)
-    apartment_id = db.Column(db.Integer, db.ForeignKey('apartment.id'), nullable=False)
+    apartment_id = db.Column(db.Integer, db.ForeignKey('apartment.id'), nullable=False, index=True)
 
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=True) # Kann unbefristet sein
@@ -194,4 +228,136 @@ class Invoice(db.Model):
     def __repr__(self):
         allocation_type = f"Contract:{self.direct_allocation_contract_id}" if self.direct_allocation_contract_id else "Distributed"
         ct_name = self.cost_type.name if self.cost_type else 'N/A'
-        return f'<Invoice {self.id} Date:{self.date} Amount:{self.amount} CostType:{ct_name} Allocation:{allocation_type}>' 
\ No newline at end of file
+        return f'<Invoice {self.id} Date:{self.date} Amount:{self.amount} CostType:{ct_name} Allocation:{allocation_type}>'
+
+
+# NEUES MODELL: ImportJob
+class ImportJob(db.Model):
+    """Fortsetzbarer CSV-Import mit Checkpoint je committetem Batch.
+
+    ``byte_offset`` zeigt hinter die zuletzt committete Zeile, ``last_committed_row``
+    ist deren Zeilennummer (1 = Kopfzeile). Ein abgebrochener Import derselben Datei
+    (gleicher ``file_hash``) setzt dort fort.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False, default='consumption') # consumption
+    filename = db.Column(db.String(255), nullable=True)
+    file_hash = db.Column(db.String(64), nullable=False, index=True) # SHA-256 (hex)
+    file_size = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, running, failed, completed
+
+    # Checkpoint des letzten committeten Batches
+    byte_offset = db.Column(db.Integer, nullable=False, default=0)
+    last_committed_row = db.Column(db.Integer, nullable=False, default=1)
+
+    # Zeilenzähler
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    skipped_rows = db.Column(db.Integer, nullable=False, default=0)
+    duplicate_rows = db.Column(db.Integer, nullable=False, default=0)
+
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.kind} {self.status} Row:{self.last_committed_row}>'
+
+
+# NEUES MODELL: Job
+class Job(db.Model):
+    """Hintergrundaufgabe (Sammelexport, Warnungen, Import), abgearbeitet von ``flask jobs worker``.
+
+    ``params`` und ``result`` sind JSON-Texte; erzeugte Dateien liegen unter ``result_path``.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False) # billing_export, warnings, consumption_import
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, completed, failed
+    params = db.Column(db.Text, nullable=True)
+
+    # Ergebnis
+    result = db.Column(db.Text, nullable=True)
+    result_path = db.Column(db.String(500), nullable=True)
+    result_filename = db.Column(db.String(255), nullable=True)
+
+    # Fortschritt und Fehler
+    progress_current = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    # Worker und Lease
+    worker_id = db.Column(db.String(100), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0) # Anzahl Übernahmen durch einen Worker
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True) # letzte Rückmeldung des Workers (Lease)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+
+# NEUES MODELL: DataVersion
+class DataVersion(db.Model):
+    """Änderungszähler je Tabelle, wird einmal je Transaktion mit abrechnungsrelevanten Änderungen erhöht.
+
+    Die Zähler bilden den Daten-Fingerabdruck für den Verteilungs-Cache
+    (siehe ``app.allocation_cache``) und gelten prozessübergreifend.
+    """
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.table_name} v{self.version}>'
+
+
+# NEUES MODELL: WarningEntry
+class WarningEntry(db.Model):
+    """Eine Warnung aus einem Warnungs-Job (fehlender, ungültiger oder auffälliger Verbrauch).
+
+    Die Zeilen sind eine Momentaufnahme des Jobs; Wohnung, Gebäude und Kostenart
+    werden daher ohne Fremdschlüssel gespeichert. Abgerufen werden sie seitenweise
+    über ``/warnings/api`` (Keyset-Pagination über ``id``).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(40), nullable=False) # missing_consumption, invalid_consumption_values, consumption_spikes
+    apartment_id = db.Column(db.Integer, nullable=False)
+    building_id = db.Column(db.Integer, nullable=True)
+    cost_type_id = db.Column(db.Integer, nullable=False)
+
+    # Ablesung und Kennzahlen (je nach Art)
+    date = db.Column(db.DateTime, nullable=True)
+    value = db.Column(db.Float, nullable=True)
+    threshold = db.Column(db.Float, nullable=True)
+    median = db.Column(db.Float, nullable=True)
+    mad = db.Column(db.Float, nullable=True)
+    scope = db.Column(db.String(20), nullable=True) # apartment, cost_type
+
+    __table_args__ = (
+        db.Index('ix_warning_entry_job_kind_id', 'job_id', 'kind', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<WarningEntry {self.id} {self.kind} Apt:{self.apartment_id} Type:{self.cost_type_id}>'
+
+
+# NEUES MODELL: DashboardStat
+class DashboardStat(db.Model):
+    """Kennzahl der Startseite (Anzahl, Rechnungssumme, Monatsverbrauch) als Schnappschuss.
+
+    Wird bei jedem Flush inkrementell fortgeschrieben (siehe ``app.dashboard_stats``)
+    und kann per ``flask dashboard refresh`` neu berechnet werden.
+    """
+    key = db.Column(db.String(100), primary_key=True) # z. B. count:apartment, invoice:3:1, consumption_month:2024-01-01
+    value = db.Column(db.Float, nullable=False, default=0.0) # Summe (Rechnungsbetrag, Verbrauch)
+    count = db.Column(db.Integer, nullable=False, default=0) # Anzahl Datensätze
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DashboardStat {self.key} {self.value} ({self.count})>'
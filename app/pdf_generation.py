@@ -1,27 +1,30 @@
 import io
 from datetime import datetime
 
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import (
+    BaseDocTemplate, Flowable, Frame, PageBreak, PageTemplate, SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle,
+)
+from reportlab.platypus.paraparser import ParaParser
+from reportlab.platypus.tableofcontents import TableOfContents
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
 from reportlab.lib.units import cm
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen.canvas import Canvas
+from types import SimpleNamespace
 import os
 from flask import current_app
-from sqlalchemy import func
 
 from app import db
-from app.models import Contract, Tenant, Apartment, CostType, ApartmentShare, ConsumptionData, OccupancyPeriod
-from app.calculations import (
-    calculate_share_allocation,
-    calculate_consumption_allocation,
-    calculate_person_day_allocation,
-    calculate_heating_allocation,
-    calculate_direct_allocation,
-)
-# TODO: Import calculate_combined_allocation if needed
+from app.models import Contract
+
+RENDERER_PLATYPUS = 'platypus'
+RENDERER_CANVAS = 'canvas'
+# Innenabstand des Platypus-Rahmens (pt)
+FRAME_PADDING = 6
+
 
 def _format_euro(amount: float) -> str:
     # Deutsche Formatierung: Tausenderpunkt, Dezimalkomma
@@ -51,202 +54,41 @@ def _resolve_logo_path(configured_path):
     return os.path.join(os.path.dirname(__file__), 'static', 'logo.png')
 
 
-def _page_decorator(canvas, doc):
-    canvas.saveState()
-    # Header mit optionalem Logo und Adresse
-    header_y = A4[1] - 1.5*cm
-    configured_logo = _safe_config_get('PDF_LOGO_PATH', None)
-    logo_path = _resolve_logo_path(configured_logo)
-    try:
-        if os.path.exists(logo_path):
-            logo = ImageReader(logo_path)
-            canvas.drawImage(logo, 2*cm, header_y - 1.0*cm, width=2.5*cm, height=1.0*cm, preserveAspectRatio=True, mask='auto')
-    except Exception:
-        # Logo ist optional – bei Fehler einfach ohne Logo rendern
-        pass
-
-    header_name = _safe_config_get('PDF_HEADER_NAME', 'Vermieter GmbH')
-    header_address = _safe_config_get('PDF_HEADER_ADDRESS', 'Musterstraße 1, 12345 Musterstadt')
-    header_contact = _safe_config_get('PDF_HEADER_CONTACT', 'E-Mail: info@vermieter.example | Tel: 01234 567890')
-
-    canvas.setFont('Helvetica-Bold', 10)
-    canvas.drawRightString(A4[0] - 2*cm, header_y, header_name)
-    canvas.setFont('Helvetica', 9)
-    canvas.drawRightString(A4[0] - 2*cm, header_y - 0.4*cm, header_address)
-    canvas.drawRightString(A4[0] - 2*cm, header_y - 0.8*cm, header_contact)
+def _header_config() -> dict:
+    """Liest Header/Logo-Konfiguration einmalig aus der App-Konfiguration."""
+    return {
+        'logo_path': _resolve_logo_path(_safe_config_get('PDF_LOGO_PATH', None)),
+        'name': _safe_config_get('PDF_HEADER_NAME', 'Vermieter GmbH'),
+        'address': _safe_config_get('PDF_HEADER_ADDRESS', 'Musterstraße 1, 12345 Musterstadt'),
+        'contact': _safe_config_get('PDF_HEADER_CONTACT', 'E-Mail: info@vermieter.example | Tel: 01234 567890'),
+    }
 
-    # Footer mit Seitenzahl
-    footer_text = f"Seite {doc.page}"
-    canvas.setFont('Helvetica', 8)
-    canvas.drawRightString(A4[0] - 2*cm, 1.5*cm, footer_text)
-    canvas.restoreState()
-
-
-def generate_utility_statement_pdf(contract_id, period_start, period_end, cost_items):
-    """
-    Generiert eine Betriebskostenabrechnung als PDF für einen bestimmten Vertrag und Zeitraum.
 
-    Args:
-        contract_id (int): Die ID des Vertrags, für den die Abrechnung erstellt wird.
-        period_start (date): Startdatum des Abrechnungszeitraums.
-        period_end (date): Enddatum des Abrechnungszeitraums.
-        cost_items (list): Eine Liste von Dictionaries, die die abzurechnenden Gesamtkosten enthalten.
-                           Format: [{'cost_type_id': int, 'total_cost': float}, ...]
+class StatementRenderer:
+    """Vorbereitete Ressourcen für das Rendern von Abrechnungen.
 
-    Returns:
-        bytes: Der Inhalt der generierten PDF-Datei als Byte-Stream, oder None bei Fehlern.
+    Logo (dekodiert), Absatz- und Tabellenstile sowie die Kopfzeilen werden einmal
+    je Header-Konfiguration und Prozess aufgebaut (``get_statement_renderer``) und
+    für alle Dokumente wiederverwendet. Die Stile werden beim Rendern nicht verändert.
     """
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4,
-                        leftMargin=2*cm, rightMargin=2*cm,
-                        topMargin=2*cm, bottomMargin=2*cm)
-    styles = getSampleStyleSheet()
-    story = []
-
-    # --- 1. Daten abrufen --- 
-    contract = db.session.get(Contract, contract_id)
-    if not contract:
-        print(f"Error: Contract with ID {contract_id} not found.")
-        return None
-    
-    tenant = contract.tenant
-    apartment = contract.apartment
-    if not tenant or not apartment:
-        print(f"Error: Tenant or Apartment not found for Contract ID {contract_id}.")
-        return None
-
-    # Platzhalter für Vermieteradresse
-    landlord_address = _safe_config_get(
-        'PDF_LANDLORD_ADDRESS',
-        "Vermieter GmbH\nMusterstraße 1\n12345 Musterstadt",
-    )
-
-    # --- 2. PDF-Struktur aufbauen --- 
-    story.append(Paragraph("Betriebs- und Heizkostenabrechnung", styles['h1']))
-    story.append(Spacer(1, 0.5*cm))
-
-    # Adressfelder
-    # TODO: Echte Adressdaten verwenden, wenn verfügbar
-    address_style = styles['Normal']
-    address_style.alignment = TA_LEFT
-    story.append(Paragraph(landlord_address.replace('\n', '<br/>'), address_style))
-    story.append(Spacer(1, 1*cm))
-    story.append(Paragraph(tenant.name, address_style))
-    if tenant.contact_info: # Annahme: contact_info enthält Adresse oder ist Teil davon
-         story.append(Paragraph(tenant.contact_info.replace('\n', '<br/>'), address_style))
-    story.append(Paragraph(f"Wohnung {apartment.number}", address_style))
-    story.append(Paragraph(f"Vertrag #{contract.id}", address_style))
-    story.append(Spacer(1, 1*cm))
-
-    # Rechte Seite: Datum
-    date_style = styles['Normal']
-    date_style.alignment = TA_RIGHT
-    story.append(Paragraph(f"Datum: {datetime.now().strftime('%d.%m.%Y')}", date_style))
-    story.append(Spacer(1, 0.5*cm))
-
-    story.append(Paragraph(f"<b>Abrechnungszeitraum: {period_start.strftime('%d.%m.%Y')} - {period_end.strftime('%d.%m.%Y')}</b>", styles['Normal']))
-    story.append(Spacer(1, 1*cm))
-
-    # --- 3. Kostenpositionen verarbeiten und Tabelle erstellen --- 
-    table_data = [['Kostenart', 'Gesamtkosten', 'Verteilschlüssel', 'Ihr Anteil']]
-    total_tenant_cost = 0.0
-
-    for item in cost_items:
-        # Unterstützt Modi:
-        # 1) Klassisch pro CostType: {cost_type_id, total_cost}
-        # 2) Heizpaket: {'type': 'heating', 'total_cost', 'hot_water_percentage', 'heating_consumption_cost_type_id', 'hot_water_consumption_cost_type_id'}
-        # 3) Direkte Kosten aus Rechnungen: {'type': 'direct'} (Gesamtsumme wird aus DB ermittelt)
-        if item.get('type') == 'heating':
-            total_cost = float(item.get('total_cost', 0.0))
-            hot_water_percentage = float(item.get('hot_water_percentage', 0.0))
-            heat_ct = int(item.get('heating_consumption_cost_type_id'))
-            hot_ct = int(item.get('hot_water_consumption_cost_type_id'))
-
-            allocation_result = calculate_heating_allocation(
-                total_cost=total_cost,
-                hot_water_percentage=hot_water_percentage,
-                heating_consumption_cost_type_id=heat_ct,
-                hot_water_consumption_cost_type_id=hot_ct,
-                period_start=period_start,
-                period_end=period_end,
-            )
-            tenant_share_cost = allocation_result.get(apartment.id, 0.0)
-            key_description = f"Heizung/Warmwasser Split ({hot_water_percentage:.0f}% | {100-hot_water_percentage:.0f}%) verbrauchsbasiert"
-            name = "Heiz-/Warmwasserkosten"
-            total_for_row = total_cost
-        elif item.get('type') == 'direct':
-            # Direkte Kosten aus Rechnungen im Zeitraum ermitteln
-            allocation_result = calculate_direct_allocation(period_start=period_start, period_end=period_end)
-            tenant_share_cost = allocation_result.get(apartment.id, 0.0)
-            total_for_row = sum(allocation_result.values())
-            name = "Direkt zugeordnete Kosten"
-            key_description = "Direkt zugeordnet (Rechnungen im Zeitraum)"
-        else:
-            cost_type_id = item.get('cost_type_id')
-            total_cost = item.get('total_cost', 0.0)
-
-            cost_type = db.session.get(CostType, cost_type_id)
-            if not cost_type:
-                print(f"Warning: CostType ID {cost_type_id} not found. Skipping item.")
-                table_data.append([f"Unbekannt (ID: {cost_type_id})", f"{total_cost:.2f} €", "Fehler", "N/A"])
-                continue
-
-            allocation_result = {}
-            key_description = "Fehler bei Berechnung"
-            tenant_share_cost = 0.0
-            name = cost_type.name
-            total_for_row = total_cost
-
-            try:
-                if cost_type.type == 'share':
-                    allocation_result = calculate_share_allocation(cost_type_id, total_cost)
-                    share_entry = ApartmentShare.query.filter_by(apartment_id=apartment.id, cost_type_id=cost_type.id).first()
-                    share_value = share_entry.value if share_entry else 'N/A'
-                    key_description = f"Anteil ({cost_type.unit}: {share_value})"
-                elif cost_type.type == 'consumption':
-                    allocation_result = calculate_consumption_allocation(cost_type_id, total_cost, period_start, period_end)
-                    total_apt_consumption = db.session.query(func.sum(ConsumptionData.value)).filter(
-                        ConsumptionData.apartment_id == apartment.id,
-                        ConsumptionData.cost_type_id == cost_type.id,
-                        ConsumptionData.date >= period_start,
-                        ConsumptionData.date <= period_end
-                    ).scalar() or 0.0
-                    key_description = f"Verbrauch ({cost_type.unit}: {total_apt_consumption:.2f})"
-                elif cost_type.type == 'person_days':
-                    allocation_result = calculate_person_day_allocation(cost_type_id, total_cost, period_start, period_end)
-                    from app.calculations import calculate_person_days
-                    apt_person_days = calculate_person_days(apartment.id, period_start, period_end)
-                    key_description = f"Personentage: {apt_person_days}"
-                else:
-                    print(f"Warning: Unknown CostType type '{cost_type.type}' for ID {cost_type_id}. Cannot allocate.")
-                    key_description = f"Unbek. Typ: {cost_type.type}"
-
-                tenant_share_cost = allocation_result.get(apartment.id, 0.0)
-            except Exception as e:
-                print(f"Error calculating allocation for CostType ID {cost_type_id}: {e}")
-                key_description = "Berechnungsfehler"
-                tenant_share_cost = 0.0
-
-        table_data.append([
-            Paragraph(name, styles['Normal']), 
-            _format_euro(total_for_row), 
-            Paragraph(key_description, styles['Normal']), 
-            _format_euro(tenant_share_cost)
-        ])
-        total_tenant_cost += tenant_share_cost
-
-    # Tabelle nur hinzufügen, wenn Daten vorhanden sind (Header + mind. 1 Zeile)
-    if len(table_data) > 1:
-        # Summary-Zeile anhängen
-        table_data.append([
-            Paragraph('<b>Summe</b>', styles['Normal']),
-            '',
-            '',
-            Paragraph(f"<b>{_format_euro(total_tenant_cost)}</b>", styles['Normal'])
-        ])
 
-        table = Table(table_data, colWidths=[5*cm, 3*cm, 5*cm, 3*cm]) # Spaltenbreiten angepasst
-        table.setStyle(TableStyle([
+    TABLE_COL_WIDTHS = (5*cm, 3*cm, 5*cm, 3*cm)
+
+    def __init__(self, header: dict):
+        self.header_name = header['name']
+        self.header_address = header['address']
+        self.header_contact = header['contact']
+        self.logo = self._load_logo(header.get('logo_path'))
+
+        sample = getSampleStyleSheet()
+        self.styles = {
+            'title': sample['h1'],
+            'body': sample['Normal'],
+            'address': ParagraphStyle('StatementAddress', parent=sample['Normal'], alignment=TA_LEFT),
+            'date': ParagraphStyle('StatementDate', parent=sample['Normal'], alignment=TA_RIGHT),
+            'summary': ParagraphStyle('StatementSummary', parent=sample['h3'], alignment=TA_RIGHT),
+        }
+        self.table_style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
@@ -254,7 +96,6 @@ def generate_utility_statement_pdf(contract_id, period_start, period_end, cost_i
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
             ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
             ('TOPPADDING', (0, 0), (-1, 0), 6),
-            # ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black),
             ('ALIGN', (1, 1), (1, -1), 'RIGHT'), # Gesamtkosten rechts
             ('ALIGN', (3, 1), (3, -1), 'RIGHT'), # Anteil rechts
@@ -265,25 +106,546 @@ def generate_utility_statement_pdf(contract_id, period_start, period_end, cost_i
             # Summary styling (letzte Zeile)
             ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
             ('BACKGROUND', (0, -1), (-1, -1), colors.whitesmoke),
-        ]))
-        story.append(table)
+        ])
+
+    @staticmethod
+    def _load_logo(logo_path):
+        try:
+            if logo_path and os.path.exists(logo_path):
+                logo = ImageReader(logo_path)
+                logo.getSize() # Bild jetzt dekodieren, nicht erst auf der ersten Seite
+                return logo
+        except Exception:
+            # Logo ist optional – bei Fehler einfach ohne Logo rendern
+            pass
+        return None
+
+    def draw_page(self, canvas, doc):
+        """Kopf (Logo, Absender) und Fuß (Seitenzahl) einer Seite."""
+        self.draw_header(canvas, doc)
+        self.draw_footer(canvas, doc.page)
+
+    def draw_header(self, canvas, doc=None):
+        """Seitenkopf mit Logo und Absender."""
+        canvas.saveState()
+        header_y = A4[1] - 1.5*cm
+        if self.logo is not None:
+            canvas.drawImage(self.logo, 2*cm, header_y - 1.0*cm, width=2.5*cm, height=1.0*cm,
+                             preserveAspectRatio=True, mask='auto')
+
+        canvas.setFont('Helvetica-Bold', 10)
+        canvas.drawRightString(A4[0] - 2*cm, header_y, self.header_name)
+        canvas.setFont('Helvetica', 9)
+        canvas.drawRightString(A4[0] - 2*cm, header_y - 0.4*cm, self.header_address)
+        canvas.drawRightString(A4[0] - 2*cm, header_y - 0.8*cm, self.header_contact)
+        canvas.restoreState()
+
+    def draw_footer(self, canvas, page_number: int, sheet_number=None):
+        """Fußzeile mit Seitenzahl (im Sammel-PDF zusätzlich die fortlaufende Blattnummer)."""
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.drawRightString(A4[0] - 2*cm, 1.5*cm, f"Seite {page_number}")
+        if sheet_number is not None:
+            canvas.drawString(2*cm, 1.5*cm, f"Blatt {sheet_number}")
+        canvas.restoreState()
+
+    def story(self, payload: dict) -> list:
+        """Flowables einer Abrechnung (ohne Seitenkopf/-fuß)."""
+        styles = self.styles
+        story = []
+        period_start = payload['period_start']
+        period_end = payload['period_end']
+
+        # --- 1. PDF-Struktur aufbauen ---
+        story.append(Paragraph("Betriebs- und Heizkostenabrechnung", styles['title']))
         story.append(Spacer(1, 0.5*cm))
-    else:
-        story.append(Paragraph("Keine Kostenpositionen zum Anzeigen vorhanden.", styles['Normal']))
+
+        # Adressfelder
+        # TODO: Echte Adressdaten verwenden, wenn verfügbar
+        story.append(Paragraph(payload['landlord_address'].replace('\n', '<br/>'), styles['address']))
+        story.append(Spacer(1, 1*cm))
+        story.append(Paragraph(payload['tenant_name'], styles['address']))
+        if payload['tenant_contact']: # Annahme: contact_info enthält Adresse oder ist Teil davon
+            story.append(Paragraph(payload['tenant_contact'].replace('\n', '<br/>'), styles['address']))
+        story.append(Paragraph(f"Wohnung {payload['apartment_number']}", styles['address']))
+        story.append(Paragraph(f"Vertrag #{payload['contract_id']}", styles['address']))
+        story.append(Spacer(1, 1*cm))
+
+        # Rechte Seite: Datum
+        story.append(Paragraph(f"Datum: {datetime.now().strftime('%d.%m.%Y')}", styles['date']))
         story.append(Spacer(1, 0.5*cm))
 
-    # --- 4. Zusammenfassung --- 
-    summary_style = styles['h3']
-    summary_style.alignment = TA_RIGHT
-    story.append(Paragraph(f"Gesamtkosten für Sie: {_format_euro(total_tenant_cost)}", summary_style))
+        story.append(Paragraph(f"<b>Abrechnungszeitraum: {period_start.strftime('%d.%m.%Y')} - {period_end.strftime('%d.%m.%Y')}</b>", styles['body']))
+        story.append(Spacer(1, 1*cm))
 
-    # --- 5. PDF generieren --- 
-    try:
-        doc.build(story, onFirstPage=_page_decorator, onLaterPages=_page_decorator)
-    except Exception as e:
-        print(f"Error building PDF: {e}")
+        # --- 2. Kostenpositionen als Tabelle ---
+        table_data = [['Kostenart', 'Gesamtkosten', 'Verteilschlüssel', 'Ihr Anteil']]
+        total_tenant_cost = 0.0
+
+        for row in payload['rows']:
+            if row.get('error'):
+                table_data.append([row['name'], f"{row['total_cost']:.2f} €", "Fehler", "N/A"])
+                continue
+            table_data.append([
+                Paragraph(row['name'], styles['body']),
+                _format_euro(row['total_cost']),
+                Paragraph(row['key_desc'], styles['body']),
+                _format_euro(row['tenant_share'])
+            ])
+            total_tenant_cost += row['tenant_share']
+
+        # Tabelle nur hinzufügen, wenn Daten vorhanden sind (Header + mind. 1 Zeile)
+        if len(table_data) > 1:
+            # Summary-Zeile anhängen
+            table_data.append([
+                Paragraph('<b>Summe</b>', styles['body']),
+                '',
+                '',
+                Paragraph(f"<b>{_format_euro(total_tenant_cost)}</b>", styles['body'])
+            ])
+            table = Table(table_data, colWidths=self.TABLE_COL_WIDTHS)
+            table.setStyle(self.table_style)
+            story.append(table)
+        else:
+            story.append(Paragraph("Keine Kostenpositionen zum Anzeigen vorhanden.", styles['body']))
+        story.append(Spacer(1, 0.5*cm))
+
+        # --- 3. Zusammenfassung ---
+        story.append(Paragraph(f"Gesamtkosten für Sie: {_format_euro(total_tenant_cost)}", styles['summary']))
+        return story
+
+    def render(self, payload: dict):
+        """Rendert eine Abrechnung; liefert die PDF-Bytes oder None bei Fehlern.
+
+        Mit ``payload['renderer'] == 'canvas'`` werden einseitige Abrechnungen direkt
+        auf den Canvas gezeichnet; passt die Abrechnung nicht auf eine Seite, wird
+        automatisch mit Platypus gerendert.
+        """
+        if payload.get('renderer') == RENDERER_CANVAS:
+            operations = self.canvas_layout(payload)
+            if operations is not None:
+                return self.render_canvas(operations)
+        return self.render_platypus(payload)
+
+    def render_platypus(self, payload: dict):
+        """Rendert eine Abrechnung mit Platypus (beliebig viele Seiten)."""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4,
+                                leftMargin=2*cm, rightMargin=2*cm,
+                                topMargin=2*cm, bottomMargin=2*cm)
+        try:
+            doc.build(self.story(payload), onFirstPage=self.draw_page, onLaterPages=self.draw_page)
+        except Exception as e:
+            print(f"Error building PDF: {e}")
+            return None
+        pdf_data = buffer.getvalue()
+        buffer.close()
+        return pdf_data
+
+
+    # --- Canvas-Schnellpfad (einseitige Abrechnungen) ---
+
+    @staticmethod
+    def _markup_lines(text: str, style, width: float):
+        """Umbrochene Zeilen eines Paragraph-Texts und ihre Schrift, wie Platypus sie setzt.
+
+        Markup und Entities werden mit dem Parser von ``Paragraph`` aufgelöst (``<b>``,
+        ``&amp;``, ``<br/>``), Leerraum wie dort zusammengefasst. Wechselt die Schrift
+        innerhalb des Texts oder ist das Markup ungültig, liefert die Methode None.
+        """
+        parsed = ParaParser().parse(text, style)
+        if parsed is None:
+            return None
+        fragments = parsed[1]
+        fonts = {fragment.fontName for fragment in fragments if fragment.text}
+        if len(fonts) > 1 or any(fragment.fontSize != style.fontSize for fragment in fragments):
+            return None
+        font = fonts.pop() if fonts else style.fontName
+        pieces = ['']
+        for fragment in fragments:
+            if getattr(fragment, 'lineBreak', False):
+                pieces.append('')
+            else:
+                pieces[-1] += fragment.text
+        lines = []
+        for piece in pieces:
+            lines.extend(simpleSplit(' '.join(piece.split()), font, style.fontSize, width) or [''])
+        return lines, font
+
+    def _row_backgrounds(self, row_count: int) -> dict:
+        """Hintergrundfarbe je Tabellenzeile aus den BACKGROUND-Befehlen von ``table_style``."""
+        backgrounds = {}
+        for command in self.table_style.getCommands():
+            if command[0] != 'BACKGROUND':
+                continue
+            (_, start_row), (_, end_row), color = command[1], command[2], command[3]
+            start_row = start_row + row_count if start_row < 0 else start_row
+            end_row = end_row + row_count if end_row < 0 else end_row
+            for row_index in range(start_row, end_row + 1):
+                backgrounds[row_index] = color
+        return backgrounds
+
+    def canvas_layout(self, payload: dict):
+        """Berechnet die Zeichenoperationen einer Abrechnung wie im Platypus-Layout.
+
+        Schrift, Zeilenabstand, Polsterung und Ausrichtung der Tabellenzellen stammen aus
+        ``table_style`` bzw. dem Absatzstil der Zelle, Markup wird wie bei ``Paragraph``
+        aufgelöst; Zeilenhöhen und Seitenumbruch entsprechen damit ``render_platypus``.
+
+        Returns:
+            list: Operationen (``('text', ...)``, ``('rect', ...)``, ``('grid', ...)``) oder
+            None, wenn die Abrechnung nicht auf eine Seite passt oder Markup enthält, das
+            der Schnellpfad nicht abbildet (gemischte Schriften); dann rendert ``render``
+            mit Platypus.
+        """
+        styles = self.styles
+        left = 2*cm + FRAME_PADDING
+        width = A4[0] - 4*cm - 2 * FRAME_PADDING
+        bottom = 2*cm + FRAME_PADDING
+        operations = []
+        y = A4[1] - 2*cm - FRAME_PADDING
+
+        def paragraph(text, style, space_before=True):
+            nonlocal y
+            layout = self._markup_lines(text, style, width)
+            if layout is None:
+                return False
+            lines, font = layout
+            if space_before:
+                y -= style.spaceBefore
+            # Wie Frame.add: der Absatz selbst muss passen, spaceAfter nicht
+            if y - len(lines) * style.leading < bottom:
+                return False
+            for line in lines:
+                if style.alignment == TA_RIGHT:
+                    operations.append(('text', font, style.fontSize, left + width, y - style.fontSize, line, 'right'))
+                else:
+                    operations.append(('text', font, style.fontSize, left, y - style.fontSize, line, 'left'))
+                y -= style.leading
+            y -= style.spaceAfter
+            return True
+
+        period_start = payload['period_start']
+        period_end = payload['period_end']
+        # Dieselben Texte wie in story(); am Rahmenanfang entfällt spaceBefore (wie bei Platypus)
+        blocks = [("Betriebs- und Heizkostenabrechnung", styles['title'], 0.5*cm),
+                  (payload['landlord_address'].replace('\n', '<br/>'), styles['address'], 1*cm),
+                  (payload['tenant_name'], styles['address'], 0)]
+        if payload['tenant_contact']:
+            blocks.append((payload['tenant_contact'].replace('\n', '<br/>'), styles['address'], 0))
+        blocks += [(f"Wohnung {payload['apartment_number']}", styles['address'], 0),
+                   (f"Vertrag #{payload['contract_id']}", styles['address'], 1*cm),
+                   (f"Datum: {datetime.now().strftime('%d.%m.%Y')}", styles['date'], 0.5*cm),
+                   (f"<b>Abrechnungszeitraum: {period_start.strftime('%d.%m.%Y')} - {period_end.strftime('%d.%m.%Y')}</b>",
+                    styles['body'], 1*cm)]
+        for index, (text, style, spacer) in enumerate(blocks):
+            if not paragraph(text, style, space_before=index > 0):
+                return None
+            y -= spacer
+
+        # Zellen wie in story(): ('para', Markup, Stil) für Paragraph-Zellen, sonst Text
+        body = styles['body']
+        table_data = [[('text', title) for title in ('Kostenart', 'Gesamtkosten', 'Verteilschlüssel', 'Ihr Anteil')]]
+        total_tenant_cost = 0.0
+        for row in payload['rows']:
+            if row.get('error'):
+                table_data.append([('text', row['name']), ('text', f"{row['total_cost']:.2f} €"),
+                                   ('text', 'Fehler'), ('text', 'N/A')])
+                continue
+            table_data.append([('para', row['name'], body), ('text', _format_euro(row['total_cost'])),
+                               ('para', row['key_desc'], body), ('text', _format_euro(row['tenant_share']))])
+            total_tenant_cost += row['tenant_share']
+
+        if len(table_data) > 1:
+            table_data.append([('para', '<b>Summe</b>', body), ('text', ''), ('text', ''),
+                               ('para', f"<b>{_format_euro(total_tenant_cost)}</b>", body)])
+            col_widths = self.TABLE_COL_WIDTHS
+            # Zellstile (Schrift, Zeilenabstand, Polsterung, ...) so auflösen, wie Table es tut
+            styled = Table([[''] * len(col_widths) for _ in table_data], colWidths=col_widths)
+            styled.setStyle(self.table_style)
+            table_left = left + (width - sum(col_widths)) / 2
+            col_x = [table_left + sum(col_widths[:i]) for i in range(len(col_widths))]
+
+            backgrounds = self._row_backgrounds(len(table_data))
+
+            for row_index, (cells, cell_styles) in enumerate(zip(table_data, styled._cellStyles)):
+                # (Zeilen, Schrift, Größe, Zeilenabstand, Farbe, Zellstil) je Zelle
+                laid_out = []
+                for cell, cell_style, col_width in zip(cells, cell_styles, col_widths):
+                    if cell[0] == 'para':
+                        _, text, style = cell
+                        layout = self._markup_lines(
+                            text, style, col_width - cell_style.leftPadding - cell_style.rightPadding)
+                        if layout is None:
+                            return None
+                        lines, font = layout
+                        laid_out.append((lines, font, style.fontSize, style.leading, style.textColor, cell_style))
+                    else:
+                        laid_out.append((cell[1].split('\n'), cell_style.fontname, cell_style.fontsize,
+                                         cell_style.leading, cell_style.color, cell_style))
+                row_height = max(len(lines) * leading + cell_style.topPadding + cell_style.bottomPadding
+                                 for lines, _, _, leading, _, cell_style in laid_out)
+                row_top = y
+                y -= row_height
+                if y < bottom:
+                    return None
+                background = backgrounds.get(row_index)
+                if background is not None:
+                    operations.append(('rect', table_left, y, sum(col_widths), row_height, background))
+                for (lines, font, size, leading, color, cell_style), x, col_width in zip(laid_out, col_x, col_widths):
+                    # Vertikal zentriert (VALIGN MIDDLE), Formel wie Table._drawCell
+                    baseline = y + (cell_style.bottomPadding + row_height - cell_style.topPadding
+                                    + len(lines) * leading) / 2 - size
+                    alignment = cell_style.alignment.upper()
+                    for line in lines:
+                        if alignment == 'RIGHT':
+                            position, anchor = x + col_width - cell_style.rightPadding, 'right'
+                        elif alignment in ('CENTER', 'CENTRE'):
+                            position, anchor = x + (col_width + cell_style.leftPadding - cell_style.rightPadding) / 2, 'center'
+                        else:
+                            position, anchor = x + cell_style.leftPadding, 'left'
+                        if line:
+                            operations.append(('text', font, size, position, baseline, line, anchor, color))
+                        baseline -= leading
+                operations.append(('grid', col_x, col_widths, row_top, row_height))
+        elif not paragraph("Keine Kostenpositionen zum Anzeigen vorhanden.", body):
+            return None
+        y -= 0.5*cm
+
+        if not paragraph(f"Gesamtkosten für Sie: {_format_euro(total_tenant_cost)}", styles['summary']):
+            return None
+        return operations
+
+    def render_canvas(self, operations: list):
+        """Zeichnet vorberechnete Operationen auf eine Seite (ohne Platypus)."""
+        buffer = io.BytesIO()
+        pdf = Canvas(buffer, pagesize=A4)
+        try:
+            self.draw_page(pdf, SimpleNamespace(page=1))
+            for operation in operations:
+                kind = operation[0]
+                if kind == 'text':
+                    _, font, size, x, y, text, anchor, *color = operation
+                    pdf.setFillColor(color[0] if color else colors.black)
+                    pdf.setFont(font, size)
+                    if anchor == 'right':
+                        pdf.drawRightString(x, y, text)
+                    elif anchor == 'center':
+                        pdf.drawCentredString(x, y, text)
+                    else:
+                        pdf.drawString(x, y, text)
+                elif kind == 'rect':
+                    _, x, y, rect_width, rect_height, fill = operation
+                    pdf.setFillColor(fill)
+                    pdf.rect(x, y, rect_width, rect_height, stroke=0, fill=1)
+                elif kind == 'grid':
+                    _, col_x, col_widths, row_top, row_height = operation
+                    pdf.setStrokeColor(colors.black)
+                    pdf.setLineWidth(1)
+                    xs = list(col_x) + [col_x[-1] + col_widths[-1]]
+                    pdf.grid(xs, [row_top - row_height, row_top])
+            pdf.showPage()
+            pdf.save()
+        except Exception as e:
+            print(f"Error building PDF: {e}")
+            return None
+        pdf_data = buffer.getvalue()
+        buffer.close()
+        return pdf_data
+
+    # --- Sammel-PDF (alle Abrechnungen in einem Dokument) ---
+
+    def render_bundle(self, fileobj, payloads: list, toc: bool = False, progress_callback=None):
+        """Rendert mehrere Abrechnungen in ein einziges PDF (ein Dokumentaufbau).
+
+        Jede Abrechnung beginnt auf einer neuen Seite und hat eigene Seitenzahlen;
+        Logo, Stile und Schriften werden von allen Abrechnungen gemeinsam genutzt.
+        Optional steht vorne ein Inhaltsverzeichnis (erfordert einen zweiten
+        Layout-Durchlauf für die Blattnummern). Das PDF wird am Ende einmal in
+        ``fileobj`` geschrieben.
+
+        Args:
+            fileobj: Beschreibbares, binäres File-like Object.
+            payloads (list): Render-Payloads aus ``build_statement_payload``.
+            toc (bool): Inhaltsverzeichnis voranstellen.
+            progress_callback: Optional, wird je Abrechnung mit (erledigt, gesamt) aufgerufen.
+
+        Returns:
+            int: Anzahl der Abrechnungen im PDF, oder None bei Fehlern.
+        """
+        if not payloads:
+            return 0
+        doc = _BundleDocTemplate(fileobj, self, len(payloads), progress_callback)
+        story = []
+        if toc:
+            contents = TableOfContents()
+            contents.levelStyles = [ParagraphStyle('BundleTOC', parent=self.styles['body'], leftIndent=0,
+                                                   firstLineIndent=0, spaceBefore=2)]
+            story.extend([Paragraph("Inhalt", self.styles['title']), Spacer(1, 0.5*cm), contents])
+        for payload in payloads:
+            if story:
+                story.append(PageBreak())
+            story.append(_StatementStart(payload))
+            story.extend(self.story(payload))
+        try:
+            if toc:
+                doc.multiBuild(story)
+            else:
+                doc.build(story)
+        except Exception as e:
+            print(f"Error building PDF bundle: {e}")
+            return None
+        return len(payloads)
+
+
+class _StatementStart(Flowable):
+    """Unsichtbare Marke am Anfang einer Abrechnung im Sammel-PDF."""
+
+    def __init__(self, payload: dict):
+        super().__init__()
+        self.contract_id = payload['contract_id']
+        self.title = f"Wohnung {payload['apartment_number']} – {payload['tenant_name']} (Vertrag #{payload['contract_id']})"
+
+    def wrap(self, available_width, available_height):
+        return 0, 0
+
+    def draw(self):
+        pass
+
+
+class _BundleDocTemplate(BaseDocTemplate):
+    """Dokumentvorlage des Sammel-PDFs: Seitenzahlen je Abrechnung, Lesezeichen und Inhaltsverzeichnis."""
+
+    def __init__(self, fileobj, renderer: StatementRenderer, total: int, progress_callback=None):
+        super().__init__(fileobj, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+        self.renderer = renderer
+        self.total = total
+        self.progress_callback = progress_callback
+        self.progress_reported = 0
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+        self.addPageTemplates([PageTemplate(id='statement', frames=[frame], onPage=renderer.draw_header,
+                                            onPageEnd=self._draw_footer)])
+
+    def handle_documentBegin(self):
+        # Je Layout-Durchlauf neu zählen (multiBuild mit Inhaltsverzeichnis)
+        super().handle_documentBegin()
+        self.statement_first_page = None
+        self.statements_done = 0
+
+    def _draw_footer(self, canvas, doc):
+        # Seiten des Inhaltsverzeichnisses bekommen keine Fußzeile
+        if self.statement_first_page is not None:
+            self.renderer.draw_footer(canvas, self.page - self.statement_first_page + 1, self.page)
+
+    def afterFlowable(self, flowable):
+        if not isinstance(flowable, _StatementStart):
+            return
+        self.statement_first_page = self.page
+        key = f"contract-{flowable.contract_id}"
+        self.canv.bookmarkPage(key)
+        self.canv.addOutlineEntry(flowable.title, key, level=0)
+        self.notify('TOCEntry', (0, flowable.title, self.page, key))
+        self.statements_done += 1
+        # Im zweiten Durchlauf (Inhaltsverzeichnis) nicht erneut von vorn melden
+        if self.progress_callback and self.statements_done > self.progress_reported:
+            self.progress_reported = self.statements_done
+            self.progress_callback(self.statements_done, self.total)
+
+
+# Ein Renderer je Header-Konfiguration und Prozess (auch in den Worker-Prozessen des Sammelexports)
+_RENDERERS = {}
+
+
+def get_statement_renderer(header: dict) -> StatementRenderer:
+    """Liefert den (einmal aufgebauten) Renderer für eine Header-Konfiguration."""
+    key = tuple(sorted(header.items()))
+    renderer = _RENDERERS.get(key)
+    if renderer is None:
+        renderer = _RENDERERS[key] = StatementRenderer(header)
+    return renderer
+
+
+def build_statement_payload(contract, rows, period_start, period_end) -> dict:
+    """
+    Stellt alle Daten für das Rendern einer Abrechnung als einfaches Dictionary zusammen.
+
+    Das Ergebnis enthält nur Basistypen (keine SQLAlchemy-Objekte) und kann ohne
+    Datenbank- oder App-Kontext von ``render_statement_pdf`` verarbeitet werden.
+
+    Args:
+        contract (Contract): Vertrag inkl. Mieter und Wohnung.
+        rows (list): Abrechnungszeilen aus ``BillingRun.rows_for_apartment``.
+        period_start (date): Startdatum des Abrechnungszeitraums.
+        period_end (date): Enddatum des Abrechnungszeitraums.
+
+    Returns:
+        dict: Render-Payload für eine Abrechnung.
+    """
+    tenant = contract.tenant
+    apartment = contract.apartment
+    return {
+        'contract_id': contract.id,
+        'tenant_name': tenant.name,
+        'tenant_contact': tenant.contact_info,
+        'apartment_number': apartment.number,
+        # Platzhalter für Vermieteradresse
+        'landlord_address': _safe_config_get(
+            'PDF_LANDLORD_ADDRESS',
+            "Vermieter GmbH\nMusterstraße 1\n12345 Musterstadt",
+        ),
+        'header': _header_config(),
+        'renderer': _safe_config_get('PDF_RENDERER', RENDERER_PLATYPUS),
+        'period_start': period_start,
+        'period_end': period_end,
+        'rows': [dict(row) for row in rows],
+    }
+
+
+def render_statement_pdf(payload: dict):
+    """
+    Rendert eine Abrechnung aus einem Payload von ``build_statement_payload``.
+
+    Args:
+        payload (dict): Render-Payload (nur Basistypen).
+
+    Returns:
+        bytes: Der Inhalt der generierten PDF-Datei, oder None bei Fehlern.
+    """
+    return get_statement_renderer(payload['header']).render(payload)
+
+
+def generate_utility_statement_pdf(contract_id, period_start, period_end, cost_items):
+    """
+    Generiert eine Betriebskostenabrechnung als PDF für einen bestimmten Vertrag und Zeitraum.
+
+    Für Läufe über viele Verträge ``app.billing.engine.run_building_billing``
+    verwenden, das jede Verteilung nur einmal berechnet.
+
+    Args:
+        contract_id (int): Die ID des Vertrags, für den die Abrechnung erstellt wird.
+        period_start (date): Startdatum des Abrechnungszeitraums.
+        period_end (date): Enddatum des Abrechnungszeitraums.
+        cost_items (list): Eine Liste von Dictionaries, die die abzurechnenden Gesamtkosten enthalten.
+                           Format: [{'cost_type_id': int, 'total_cost': float}, ...]
+                           Heizpaket: {'type': 'heating', 'total_cost', 'hot_water_percentage',
+                           'heating_consumption_cost_type_id', 'hot_water_consumption_cost_type_id'}
+                           Direkte Kosten aus Rechnungen: {'type': 'direct'}
+
+    Returns:
+        bytes: Der Inhalt der generierten PDF-Datei als Byte-Stream, oder None bei Fehlern.
+    """
+    from app.billing.engine import compute_billing_run
+
+    contract = db.session.get(Contract, contract_id)
+    if not contract:
+        print(f"Error: Contract with ID {contract_id} not found.")
+        return None
+
+    if not contract.tenant or not contract.apartment:
+        print(f"Error: Tenant or Apartment not found for Contract ID {contract_id}.")
         return None
 
-    pdf_data = buffer.getvalue()
-    buffer.close()
-    return pdf_data 
\ No newline at end of file
+    # Verteilung nur über die Wohnungen des Gebäudes, zu dem der Vertrag gehört
+    run = compute_billing_run(period_start, period_end, cost_items, contract.apartment.building_id)
+    payload = build_statement_payload(contract, run.rows_for_apartment(contract.apartment_id), period_start, period_end)
+    return render_statement_pdf(payload)
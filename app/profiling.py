@@ -0,0 +1,224 @@
+"""
+Optionales Profiling: SQL-Statements, DB-Zeit und Renderzeit je Request bzw. Block.
+
+Grundlage sind die SQLAlchemy-Events ``before_cursor_execute`` /
+``after_cursor_execute`` (global für alle Engines registriert). Jedes Statement
+wird an alle gerade aktiven ``QueryCollector`` gemeldet; ohne aktiven Collector
+kostet ein Statement nur eine ContextVar-Abfrage.
+
+Mit ``PROFILING_ENABLED = True`` wird jeder Request gemessen:
+- ``Server-Timing``-Header (``db``, ``render``, ``total``),
+- eine JSON-Logzeile (Logger ``app.profiling``),
+- die letzten Requests unter ``/debug/perf`` (HTML bzw. ``?format=json``).
+
+Unabhängig davon eignen sich ``record_queries`` und ``query_budget`` für Tests::
+
+    with query_budget(10):
+        _preview_rows(contract_id, ps, pe, cost_items)
+"""
+import heapq
+import json
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from flask import current_app, g, jsonify, render_template, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('app.profiling')
+
+# Aktive Collector (verschachtelbar: Request > Abrechnungslauf > Testblock)
+_active_collectors: ContextVar[Tuple['QueryCollector', ...]] = ContextVar('profiling_collectors', default=())
+
+DEFAULT_SLOWEST = 5
+DEFAULT_HISTORY = 100
+
+
+class QueryCollector:
+    """Zählt SQL-Statements und summiert deren Dauer.
+
+    Behalten werden nur die ``slowest`` langsamsten Statements (Min-Heap); die
+    vollständige Liste ``statements`` gibt es nur mit ``keep_statements=True``.
+    """
+
+    def __init__(self, slowest: int = DEFAULT_SLOWEST, keep_statements: bool = False):
+        self.count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements: List[Tuple[str, float]] = []
+        self._keep_statements = keep_statements
+        self._slowest = slowest
+        # (Dauer, laufende Nummer, Statement); die Nummer verhindert String-Vergleiche bei gleicher Dauer
+        self._heap: List[Tuple[float, int, str]] = []
+
+    def add(self, statement: str, duration: float):
+        self.count += 1
+        self.db_time += duration
+        if self._keep_statements:
+            self.statements.append((statement, duration))
+        if len(self._heap) < self._slowest:
+            heapq.heappush(self._heap, (duration, self.count, statement))
+        elif duration > self._heap[0][0]:
+            heapq.heappushpop(self._heap, (duration, self.count, statement))
+
+    def slowest(self, n: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Die langsamsten Statements (höchstens ``slowest`` aus dem Konstruktor), absteigend nach Dauer."""
+        ranked = sorted(self._heap, reverse=True)[:n or self._slowest]
+        return [(statement, duration) for duration, _, statement in ranked]
+
+    def summary(self) -> dict:
+        return {
+            'queries': self.count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'render_ms': round(self.render_time * 1000, 2),
+            'slowest': [{'statement': stmt, 'ms': round(duration * 1000, 2)} for stmt, duration in self.slowest()],
+        }
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_collectors.get():
+        conn.info.setdefault('profiling_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _active_collectors.get()
+    starts = conn.info.get('profiling_start')
+    if not collectors or not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    for collector in collectors:
+        collector.add(statement, duration)
+
+
+def _start(collector: QueryCollector):
+    return _active_collectors.set(_active_collectors.get() + (collector,))
+
+
+def _stop(token):
+    _active_collectors.reset(token)
+
+
+@contextmanager
+def record_queries(slowest: int = DEFAULT_SLOWEST, keep_statements: bool = True):
+    """Sammelt alle SQL-Statements innerhalb des Blocks in einem ``QueryCollector``.
+
+    Für Tests bleibt ``statements`` vollständig; das Laufzeit-Profiling übergibt ``keep_statements=False``.
+    """
+    collector = QueryCollector(slowest, keep_statements)
+    token = _start(collector)
+    try:
+        yield collector
+    finally:
+        _stop(token)
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """Schlägt fehl (AssertionError), wenn der Block mehr als ``max_queries`` Statements absetzt."""
+    with record_queries() as collector:
+        yield collector
+    if collector.count > max_queries:
+        statements = '\n'.join(f'  {stmt}' for stmt, _ in collector.statements)
+        raise AssertionError(f'{collector.count} SQL statements executed, budget is {max_queries}:\n{statements}')
+
+
+def _enabled() -> bool:
+    try:
+        return bool(current_app.config.get('PROFILING_ENABLED'))
+    except RuntimeError:
+        return False
+
+
+def _remember(entry: dict):
+    history = current_app.extensions.get('profiling')
+    if history is not None:
+        history.append(entry)
+    logger.info(json.dumps(entry))
+
+
+@contextmanager
+def profile_block(name: str, **fields):
+    """Misst einen Block (z. B. Abrechnungslauf) wie einen Request, sofern Profiling aktiv ist."""
+    if not _enabled():
+        yield None
+        return
+    started = time.perf_counter()
+    slowest = current_app.config.get('PROFILING_SLOWEST', DEFAULT_SLOWEST)
+    with record_queries(slowest, keep_statements=False) as collector:
+        yield collector
+    entry = {'kind': 'block', 'name': name, **fields, **collector.summary(),
+             'total_ms': round((time.perf_counter() - started) * 1000, 2)}
+    _remember(entry)
+
+
+def _before_request():
+    if request.endpoint in ('static', 'debug_perf'):
+        return
+    collector = QueryCollector(current_app.config.get('PROFILING_SLOWEST', DEFAULT_SLOWEST))
+    g._profiling = {'collector': collector, 'token': _start(collector), 'started': time.perf_counter()}
+
+
+def _after_request(response):
+    state = g.pop('_profiling', None)
+    if state is None:
+        return response
+    _stop(state['token'])
+    collector = state['collector']
+    total = time.perf_counter() - state['started']
+    response.headers['Server-Timing'] = (
+        f'db;dur={collector.db_time * 1000:.2f};desc="{collector.count} queries", '
+        f'render;dur={collector.render_time * 1000:.2f}, '
+        f'total;dur={total * 1000:.2f}'
+    )
+    _remember({'kind': 'request', 'method': request.method, 'path': request.path, 'endpoint': request.endpoint,
+               'status': response.status_code, **collector.summary(), 'total_ms': round(total * 1000, 2)})
+    return response
+
+
+def _teardown_request(exc):
+    # Bei Fehlern vor after_request den Collector trotzdem abmelden
+    state = g.pop('_profiling', None)
+    if state is not None:
+        _stop(state['token'])
+
+
+def _template_started(sender, template, context, **extra):
+    state = g.get('_profiling')
+    if state is not None:
+        state.setdefault('render_started', []).append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    state = g.get('_profiling')
+    if state is not None and state.get('render_started'):
+        state['collector'].render_time += time.perf_counter() - state['render_started'].pop()
+
+
+def debug_perf():
+    history = list(reversed(current_app.extensions['profiling']))
+    if request.args.get('format') == 'json':
+        return jsonify(history)
+    return render_template('debug_perf.html', title='Performance', entries=history)
+
+
+def init_profiling(app):
+    """Registriert die Request-Hooks und ``/debug/perf``, wenn ``PROFILING_ENABLED`` gesetzt ist."""
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    app.extensions['profiling'] = deque(maxlen=app.config.get('PROFILING_HISTORY', DEFAULT_HISTORY))
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/debug/perf', 'debug_perf', debug_perf)
@@ -0,0 +1,213 @@
+"""
+Request- bzw. laufbezogener Cache für Stammdaten (Kostenarten, Wohnungen, Anteile).
+
+Innerhalb einer Abrechnung (PDF, Vorschau, Sammelexport) werden dieselben
+Kostenarten und Wohnungen von Presets, Verteilschlüsseln und Rendering mehrfach
+gebraucht. Der Cache liegt in ``flask.g`` (also je Request bzw. je App-Kontext
+eines CLI-/Worker-Laufs) und hält unveränderliche Schnappschüsse statt
+ORM-Objekten, damit ``expire_on_commit`` keine Nachlade-Abfragen auslöst.
+
+Invalidierung: Werden ``CostType``, ``Apartment`` oder ``ApartmentShare``
+geflusht, wird der betroffene Teil sofort verworfen und beim Commit bzw.
+Rollback erneut. Ohne App-Kontext wird nicht gecacht.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Apartment, ApartmentShare, CostType
+
+
+@dataclass(frozen=True)
+class CostTypeRef:
+    id: int
+    name: str
+    unit: str
+    type: str
+
+
+@dataclass(frozen=True)
+class ApartmentRef:
+    id: int
+    number: str
+    address: str
+    size_sqm: float
+    building_id: Optional[int]
+
+
+def _apartment_ref(apartment) -> ApartmentRef:
+    return ApartmentRef(apartment.id, apartment.number, apartment.address, apartment.size_sqm, apartment.building_id)
+
+
+class ReferenceData:
+    """Stammdaten-Cache; Kostenarten werden komplett, Wohnungen und Anteile bei Bedarf geladen."""
+
+    def __init__(self):
+        self._cost_types: Optional[Dict[int, CostTypeRef]] = None
+        self._apartments: Dict[int, Optional[ApartmentRef]] = {}
+        self._apartments_by_number: Dict[str, Optional[ApartmentRef]] = {}
+        self._apartments_by_building: Dict[Optional[int], List[ApartmentRef]] = {}
+        self._shares: Dict[Tuple[int, Optional[int]], Dict[int, float]] = {}
+
+    # --- Kostenarten ---
+    def _all_cost_types(self) -> Dict[int, CostTypeRef]:
+        if self._cost_types is None:
+            rows = db.session.query(CostType.id, CostType.name, CostType.unit, CostType.type).order_by(CostType.id)
+            self._cost_types = {row.id: CostTypeRef(row.id, row.name, row.unit, row.type) for row in rows}
+        return self._cost_types
+
+    def cost_type(self, cost_type_id) -> Optional[CostTypeRef]:
+        return self._all_cost_types().get(cost_type_id)
+
+    def cost_type_by_name(self, name: str) -> Optional[CostTypeRef]:
+        return next((ct for ct in self._all_cost_types().values() if ct.name == name), None)
+
+    def cost_types_by_type(self, cost_type_type: str, name_contains: Optional[str] = None) -> List[CostTypeRef]:
+        """Kostenarten eines Typs (nach ID), optional mit Namensfragment (ohne Groß-/Kleinschreibung)."""
+        needle = name_contains.lower() if name_contains else None
+        return [ct for ct in self._all_cost_types().values()
+                if ct.type == cost_type_type and (needle is None or needle in ct.name.lower())]
+
+    # --- Wohnungen ---
+    def apartment(self, apartment_id) -> Optional[ApartmentRef]:
+        if apartment_id not in self._apartments:
+            apartment = db.session.get(Apartment, apartment_id)
+            self._remember_apartment(_apartment_ref(apartment) if apartment else None, key=apartment_id)
+        return self._apartments[apartment_id]
+
+    def apartment_by_number(self, number: str) -> Optional[ApartmentRef]:
+        if number not in self._apartments_by_number:
+            apartment = Apartment.query.filter_by(number=number).first()
+            self._apartments_by_number[number] = _apartment_ref(apartment) if apartment else None
+        return self._apartments_by_number[number]
+
+    def apartments_in_building(self, building_id: Optional[int]) -> List[ApartmentRef]:
+        """Wohnungen eines Gebäudes (``None`` = alle), nach Nummer sortiert."""
+        if building_id not in self._apartments_by_building:
+            query = Apartment.query
+            if building_id is not None:
+                query = query.filter(Apartment.building_id == building_id)
+            refs = [_apartment_ref(apartment) for apartment in query.order_by(Apartment.number)]
+            for ref in refs:
+                self._remember_apartment(ref)
+            self._apartments_by_building[building_id] = refs
+        return self._apartments_by_building[building_id]
+
+    def _remember_apartment(self, ref: Optional[ApartmentRef], key=None):
+        self._apartments[ref.id if ref else key] = ref
+        if ref:
+            self._apartments_by_number[ref.number] = ref
+
+    # --- Anteile ---
+    def shares(self, cost_type_id: int, building_id: Optional[int] = None) -> Dict[int, float]:
+        """{apartment_id: Anteilswert} eines CostTypes (optional nur für ein Gebäude)."""
+        key = (cost_type_id, building_id)
+        if key not in self._shares:
+            query = db.session.query(ApartmentShare.apartment_id, ApartmentShare.value).filter(
+                ApartmentShare.cost_type_id == cost_type_id
+            )
+            if building_id is not None:
+                query = query.join(Apartment, ApartmentShare.apartment_id == Apartment.id).filter(
+                    Apartment.building_id == building_id
+                )
+            self._shares[key] = {apartment_id: value for apartment_id, value in query if value is not None}
+        return dict(self._shares[key])
+
+    def share(self, apartment_id: int, cost_type_id: int) -> Optional[float]:
+        return self.shares(cost_type_id).get(apartment_id)
+
+    # --- Invalidierung ---
+    def invalidate(self, kinds=None):
+        kinds = kinds or {'cost_type', 'apartment', 'apartment_share'}
+        if 'cost_type' in kinds:
+            self._cost_types = None
+        if 'apartment' in kinds:
+            self._apartments.clear()
+            self._apartments_by_number.clear()
+            self._apartments_by_building.clear()
+        if 'apartment' in kinds or 'apartment_share' in kinds:
+            self._shares.clear()
+
+
+def _flush_pending_reference_changes():
+    # Entspricht dem Autoflush einer Abfrage: ungeflushte Stammdaten-Änderungen
+    # erst schreiben (und damit invalidieren), bevor aus dem Cache gelesen wird
+    session = db.session
+    if not session.autoflush:
+        return
+    if any(_is_tracked(obj) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.flush()
+
+
+def reference_data() -> ReferenceData:
+    """Cache des aktuellen App-Kontexts (ohne Kontext: frischer, ungeteilter Cache)."""
+    if not has_app_context():
+        return ReferenceData()
+    _flush_pending_reference_changes()
+    cache = g.get('_reference_data')
+    if cache is None:
+        cache = g._reference_data = ReferenceData()
+    return cache
+
+
+def reset_reference_data():
+    """Verwirft den Cache des aktuellen App-Kontexts (z. B. vor jedem Job eines Workers)."""
+    if has_app_context():
+        g.pop('_reference_data', None)
+
+
+def get_cost_type(cost_type_id) -> Optional[CostTypeRef]:
+    return reference_data().cost_type(cost_type_id)
+
+
+def get_apartment(apartment_id) -> Optional[ApartmentRef]:
+    return reference_data().apartment(apartment_id)
+
+
+_TRACKED_TABLES = {
+    CostType.__table__.name: 'cost_type',
+    Apartment.__table__.name: 'apartment',
+    ApartmentShare.__table__.name: 'apartment_share',
+}
+
+
+def _is_tracked(obj) -> bool:
+    table = getattr(obj, '__table__', None)
+    return table is not None and table.name in _TRACKED_TABLES
+
+
+def _invalidate(kinds=None):
+    if has_app_context():
+        cache = g.get('_reference_data')
+        if cache is not None:
+            cache.invalidate(kinds)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_reference_changes(session, flush_context):
+    kinds = {
+        _TRACKED_TABLES[obj.__table__.name]
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if _is_tracked(obj)
+    }
+    if kinds:
+        session.info.setdefault('reference_data_changed', set()).update(kinds)
+        _invalidate(kinds)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    kinds = session.info.pop('reference_data_changed', None)
+    if kinds:
+        _invalidate(kinds)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _invalidate_on_rollback(session, previous_transaction):
+    # Geflushte, aber zurückgerollte Änderungen dürfen nicht im Cache bleiben
+    if session.info.pop('reference_data_changed', None):
+        _invalidate()
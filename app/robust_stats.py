@@ -0,0 +1,193 @@
+"""
+Robuste Kennzahlen (Median und MAD) je Gruppe für die Ausreißerprüfung.
+
+Median und MAD (Median der absoluten Abweichungen vom Median) werden von
+einzelnen extremen Werten kaum verschoben, anders als Mittelwert und
+Standardabweichung. Zwei Wege mit gleicher Schnittstelle:
+
+``robust_stats_sql``
+    Berechnet beides in der Datenbank über Fensterfunktionen (``row_number`` /
+    ``count`` je Gruppe), exakt, eine Abfrage je Gruppierung. Benötigt
+    SQLite >= 3.25 bzw. PostgreSQL.
+``robust_stats_stream``
+    Schätzt beides in zwei Durchläufen über die Werte mit ``P2Quantile``
+    (P²-Verfahren nach Jain & Chlamtac, 1985): fünf Marker je Gruppe,
+    konstanter Speicher unabhängig von der Anzahl der Werte. Bis fünf Werte je
+    Gruppe ist das Ergebnis exakt.
+"""
+from bisect import bisect_right, insort
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Iterable, List, Sequence
+
+from sqlalchemy import and_, func, select
+
+# Skaliert den MAD auf die Standardabweichung einer Normalverteilung
+MAD_SCALE = 1.4826
+
+
+@dataclass(frozen=True)
+class RobustStats:
+    count: int
+    median: float
+    mad: float
+
+    def upper_threshold(self, z: float, min_spread: float) -> float:
+        """Obere Schwelle ``Median + z * Streuung``.
+
+        Die Streuung ist ``MAD_SCALE * MAD``, mindestens aber ``min_spread * Median``:
+        bei (fast) identischen Werten wäre der MAD 0 und jede kleine Abweichung ein Ausreißer.
+        """
+        spread = max(MAD_SCALE * self.mad, min_spread * self.median)
+        return self.median + z * spread
+
+
+class P2Quantile:
+    """Schätzer für ein Quantil ``p`` im Durchlauf (P²-Verfahren, O(1) Speicher)."""
+
+    __slots__ = ('p', 'count', '_heights', '_positions', '_desired', '_increments')
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self._increments = (0.0, p / 2, p, (1 + p) / 2, 1.0)
+
+    def add(self, value: float):
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            insort(heights, value)
+            return
+
+        # Zelle k mit heights[k] <= value < heights[k + 1]; Randmarker ggf. verschieben
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = bisect_right(heights, value) - 1
+        positions = self._positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Innere Marker an ihre Sollposition nachführen (parabolisch, sonst linear)
+        for i in (1, 2, 3):
+            offset = self._desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or \
+                    (offset <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        """Aktuelle Schätzung (None ohne Werte); bis fünf Werte exakt, linear interpoliert."""
+        if not self.count:
+            return None
+        if self.count > 5:
+            return self._heights[2]
+        heights = self._heights
+        position = self.p * (len(heights) - 1)
+        lower = int(position)
+        upper = min(lower + 1, len(heights) - 1)
+        return heights[lower] + (position - lower) * (heights[upper] - heights[lower])
+
+
+def supports_window_functions(bind) -> bool:
+    """True, wenn die Datenbank Fensterfunktionen (``OVER (PARTITION BY ...)``) kann."""
+    dialect = bind.dialect
+    if dialect.name == 'sqlite':
+        return getattr(dialect.dbapi, 'sqlite_version_info', (0,)) >= (3, 25)
+    return dialect.name == 'postgresql'
+
+
+def _group_median(value, keys: Sequence, criteria: Sequence):
+    """Median von ``value`` je Gruppe: Mittelwert der ein bis zwei mittleren Werte nach Rang."""
+    ranked = select(
+        *[key.label(f'k{i}') for i, key in enumerate(keys)],
+        value.label('v'),
+        func.row_number().over(partition_by=list(keys), order_by=value).label('rn'),
+        func.count().over(partition_by=list(keys)).label('n'),
+    ).where(*criteria).subquery()
+    ranked_keys = [ranked.c[f'k{i}'] for i in range(len(keys))]
+    # Mittlere Ränge: n ungerade -> (n+1)/2, n gerade -> n/2 und n/2+1
+    return select(*ranked_keys, func.avg(ranked.c.v).label('median'), func.max(ranked.c.n).label('n')).where(
+        ranked.c.rn * 2 >= ranked.c.n, ranked.c.rn * 2 <= ranked.c.n + 2,
+    ).group_by(*ranked_keys)
+
+
+def robust_stats_sql(session, value, keys: Sequence, criteria: Sequence = ()) -> Dict[tuple, RobustStats]:
+    """Exakter Median und MAD von ``value`` je Gruppe ``keys`` (eine Abfrage, Fensterfunktionen).
+
+    Args:
+        session: SQLAlchemy-Session.
+        value: Wertspalte, z. B. ``ConsumptionData.value``.
+        keys: Gruppierungsspalten, z. B. ``(ConsumptionData.cost_type_id,)``.
+        criteria: Filterbedingungen für die Werte.
+
+    Returns:
+        dict: {Tupel der Gruppenschlüssel: RobustStats}
+    """
+    medians = _group_median(value, keys, criteria).cte('group_medians')
+    median_keys = [medians.c[f'k{i}'] for i in range(len(keys))]
+    same_group = [key == median_key for key, median_key in zip(keys, median_keys)]
+    mads = _group_median(func.abs(value - medians.c.median), keys, [*criteria, *same_group]).cte('group_mads')
+    mad_keys = [mads.c[f'k{i}'] for i in range(len(keys))]
+
+    rows = session.execute(
+        select(*median_keys, medians.c.n, medians.c.median, mads.c.median)
+        .join_from(medians, mads, and_(*[mk == dk for mk, dk in zip(median_keys, mad_keys)]))
+    )
+    stats = {}
+    for row in rows:
+        count, median, mad = row[len(keys):]
+        stats[tuple(row[:len(keys)])] = RobustStats(int(count), float(median), float(mad))
+    return stats
+
+
+def robust_stats_stream(make_rows: Callable[[], Iterable], groupings: Sequence[Callable]) -> List[Dict[Hashable, RobustStats]]:
+    """Geschätzter Median und MAD je Gruppe in zwei Durchläufen (P², O(Gruppen) Speicher).
+
+    Args:
+        make_rows: Liefert bei jedem Aufruf einen neuen Durchlauf über die Zeilen.
+        groupings: Funktionen Zeile -> (Gruppenschlüssel, Wert), eine je Gruppierung.
+
+    Returns:
+        list: Je Gruppierung ein dict {Gruppenschlüssel: RobustStats}.
+    """
+    medians: List[Dict[Hashable, P2Quantile]] = [{} for _ in groupings]
+    for row in make_rows():
+        for estimators, grouping in zip(medians, groupings):
+            key, value = grouping(row)
+            estimator = estimators.get(key)
+            if estimator is None:
+                estimator = estimators[key] = P2Quantile(0.5)
+            estimator.add(value)
+
+    centers = [{key: estimator.value() for key, estimator in estimators.items()} for estimators in medians]
+    deviations: List[Dict[Hashable, P2Quantile]] = [{key: P2Quantile(0.5) for key in level} for level in centers]
+    for row in make_rows():
+        for level, estimators, grouping in zip(centers, deviations, groupings):
+            key, value = grouping(row)
+            if key in estimators:  # zwischen den Durchläufen hinzugekommene Gruppen auslassen
+                estimators[key].add(abs(value - level[key]))
+
+    return [
+        {key: RobustStats(medians[i][key].count, level[key], deviations[i][key].value()) for key in level}
+        for i, level in enumerate(centers)
+    ]
@@ -1,101 +1,145 @@
 from datetime import date
-from typing import Dict, List
-from sqlalchemy import func
+from typing import Dict, List, Optional
+from sqlalchemy import and_, exists, func, select
 from app import db
+from app.consumption_rollup import period_bounds
 from app.models import Apartment, CostType, ConsumptionData
+from app.robust_stats import robust_stats_sql, robust_stats_stream, supports_window_functions
 
+# Zeilen je Abruf beim Durchlaufen der Verbrauchswerte
+STREAM_BATCH_SIZE = 1000
 
-def generate_warnings(period_start: date, period_end: date) -> Dict[str, List[dict]]:
+# Ausreißer: Wert > Median + SPIKE_Z * Streuung (robuster z-Wert nach Iglewicz/Hoaglin),
+# Streuung mindestens SPIKE_MIN_SPREAD * Median
+SPIKE_Z = 3.5
+SPIKE_MIN_SPREAD = 0.5
+# Mindestanzahl Werte für eigene Kennzahlen einer Wohnung bzw. Kostenart
+MIN_GROUP_READINGS = 4
+
+BACKENDS = ('sql', 'stream')
+
+
+def _use_sql(backend: Optional[str]) -> bool:
+    if backend is None:
+        return supports_window_functions(db.session.get_bind())
+    if backend not in BACKENDS:
+        raise ValueError(f"Unbekanntes Backend '{backend}' (erlaubt: {', '.join(BACKENDS)}).")
+    return backend == 'sql'
+
+
+def spike_statistics(period_start: date, period_end: date, backend: Optional[str] = None):
+    """Median und MAD der positiven Verbrauchswerte je (Wohnung, Kostenart) und je Kostenart.
+
+    Args:
+        backend: ``'sql'`` (Fensterfunktionen, exakt), ``'stream'`` (P²-Schätzung im
+            Durchlauf) oder None (SQL, wenn die Datenbank es kann).
+
+    Returns:
+        tuple: ({(apartment_id, cost_type_id): RobustStats}, {(cost_type_id,): RobustStats})
+    """
+    start, end = period_bounds(period_start, period_end)
+    criteria = (ConsumptionData.date >= start, ConsumptionData.date < end, ConsumptionData.value > 0)
+    if _use_sql(backend):
+        per_apartment = robust_stats_sql(db.session, ConsumptionData.value,
+                                         (ConsumptionData.apartment_id, ConsumptionData.cost_type_id), criteria)
+        per_cost_type = robust_stats_sql(db.session, ConsumptionData.value, (ConsumptionData.cost_type_id,), criteria)
+        return per_apartment, per_cost_type
+
+    def rows():
+        return db.session.execute(
+            select(ConsumptionData.apartment_id, ConsumptionData.cost_type_id, ConsumptionData.value)
+            .where(*criteria)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+
+    per_apartment, per_cost_type = robust_stats_stream(rows, (
+        lambda row: ((row[0], row[1]), row[2]),
+        lambda row: ((row[1],), row[2]),
+    ))
+    return per_apartment, per_cost_type
+
+
+def generate_warnings(period_start: date, period_end: date, backend: Optional[str] = None) -> Dict[str, List[dict]]:
+    """Plausibilitätswarnungen zu den Verbrauchsdaten eines Zeitraums.
+
+    Ein Aggregat liefert die Anzahl der Apartments und Verbrauchs-Kostenarten,
+    ein Anti-Join die fehlenden Paare (Apartment × Kostenart). Ausreißer werden
+    gegen Median und MAD der eigenen Werte (Wohnung × Kostenart) geprüft, bei
+    weniger als ``MIN_GROUP_READINGS`` Werten gegen die der Kostenart – kWh und m³
+    werden so nie miteinander verglichen (``spike_statistics``). Ungültige Werte
+    und Ausreißer entstehen danach in einem Durchlauf über die Verbrauchswerte.
+    Im Speicher stehen nur die Kennzahlen je Gruppe und die Warnungen selbst.
+    """
     warnings: Dict[str, List[dict]] = {
         'missing_consumption': [],
         'invalid_consumption_values': [],
         'consumption_spikes': [],
     }
 
-    # Alle Apartments und Verbrauchs-CostTypes bestimmen
-    apartments = db.session.query(Apartment.id).all()
-    consumption_cost_types = db.session.query(CostType.id).filter(CostType.type == 'consumption').all()
+    # Halboffen wie bei der Abrechnung: der Endtag zählt mit allen Uhrzeiten
+    start, end = period_bounds(period_start, period_end)
+    in_period = and_(ConsumptionData.date >= start, ConsumptionData.date < end)
+    is_consumption_type = CostType.type == 'consumption'
 
-    apt_ids = [a.id for a in apartments]
-    ct_ids = [c.id for c in consumption_cost_types]
+    apartment_count, cost_type_count = db.session.execute(select(
+        select(func.count(Apartment.id)).scalar_subquery(),
+        select(func.count(CostType.id)).where(is_consumption_type).scalar_subquery(),
+    )).one()
 
-    if not apt_ids or not ct_ids:
+    if not apartment_count or not cost_type_count:
         return warnings
 
-    # 1) Ungültige Verbrauchswerte (negativ oder None) im Zeitraum melden
-    invalid_rows = db.session.query(ConsumptionData).filter(
-        ConsumptionData.date >= period_start,
-        ConsumptionData.date <= period_end,
-        ConsumptionData.value <= 0
-    ).all()
-
-    for row in invalid_rows:
-        warnings['invalid_consumption_values'].append({
-            'apartment_id': row.apartment_id,
-            'cost_type_id': row.cost_type_id,
-            'date': row.date,
-            'value': row.value,
-        })
-
-    # 2) Fehlende Verbrauchsdaten pro Apartment/CostType im Zeitraum
-    # Aggregation der vorhandenen Werte
-    present = db.session.query(
-        ConsumptionData.apartment_id,
-        ConsumptionData.cost_type_id,
-        func.count(ConsumptionData.id)
-    ).filter(
-        ConsumptionData.date >= period_start,
-        ConsumptionData.date <= period_end,
-        ConsumptionData.cost_type_id.in_(ct_ids),
-        ConsumptionData.apartment_id.in_(apt_ids),
-        ConsumptionData.value > 0
-    ).group_by(
-        ConsumptionData.apartment_id, ConsumptionData.cost_type_id
-    ).all()
-
-    present_pairs = {(apt_id, ct_id) for (apt_id, ct_id, _) in present}
-
-    for apt_id in apt_ids:
-        for ct_id in ct_ids:
-            if (apt_id, ct_id) not in present_pairs:
-                warnings['missing_consumption'].append({
-                    'apartment_id': apt_id,
-                    'cost_type_id': ct_id,
-                })
-
-    # 3) Ausreißer (Spikes): Werte, die > 3 * Median aller positiven Werte im Zeitraum sind
-    pos_values = [
-        v for (v,) in db.session.query(ConsumptionData.value).filter(
-            ConsumptionData.date >= period_start,
-            ConsumptionData.date <= period_end,
-            ConsumptionData.value > 0
-        ).all()
+    # 1) Fehlende Verbrauchsdaten pro Apartment/CostType im Zeitraum (kein positiver Wert)
+    has_values = exists().where(
+        ConsumptionData.apartment_id == Apartment.id,
+        ConsumptionData.cost_type_id == CostType.id,
+        in_period,
+        ConsumptionData.value > 0,
+    )
+    missing = db.session.execute(
+        select(Apartment.id, CostType.id)
+        .join(CostType, is_consumption_type)  # Kreuzprodukt Apartment × Verbrauchs-Kostenart
+        .where(~has_values)
+        .order_by(Apartment.id, CostType.id)
+    )
+    warnings['missing_consumption'] = [
+        {'apartment_id': apt_id, 'cost_type_id': ct_id} for apt_id, ct_id in missing
     ]
-    if pos_values:
-        sorted_vals = sorted(pos_values)
-        n = len(sorted_vals)
-        if n % 2 == 1:
-            median = sorted_vals[n // 2]
-        else:
-            median = 0.5 * (sorted_vals[n // 2 - 1] + sorted_vals[n // 2])
-
-        threshold = 3.0 * median if median > 0 else None
-        if threshold is not None:
-            spike_rows = db.session.query(ConsumptionData).filter(
-                ConsumptionData.date >= period_start,
-                ConsumptionData.date <= period_end,
-                ConsumptionData.value > threshold
-            ).all()
-            for row in spike_rows:
-                warnings['consumption_spikes'].append({
-                    'apartment_id': row.apartment_id,
-                    'cost_type_id': row.cost_type_id,
-                    'date': row.date,
-                    'value': row.value,
-                    'threshold': threshold,
-                    'median': median,
-                })
 
-    return warnings
+    # 2) + 3) Ungültige Werte (<= 0) und Ausreißer je Wohnung/Kostenart
+    per_apartment, per_cost_type = spike_statistics(period_start, period_end, backend)
+    rows = db.session.execute(
+        select(ConsumptionData.apartment_id, ConsumptionData.cost_type_id, ConsumptionData.date, ConsumptionData.value)
+        .where(in_period)
+        .order_by(ConsumptionData.id)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    for apt_id, ct_id, row_date, value in rows:
+        if value <= 0:
+            warnings['invalid_consumption_values'].append({
+                'apartment_id': apt_id,
+                'cost_type_id': ct_id,
+                'date': row_date,
+                'value': value,
+            })
+            continue
 
+        scope, stats = 'apartment', per_apartment.get((apt_id, ct_id))
+        if stats is None or stats.count < MIN_GROUP_READINGS:
+            scope, stats = 'cost_type', per_cost_type.get((ct_id,))
+        if stats is None or stats.count < MIN_GROUP_READINGS:
+            continue
+        threshold = stats.upper_threshold(SPIKE_Z, SPIKE_MIN_SPREAD)
+        if value > threshold:
+            warnings['consumption_spikes'].append({
+                'apartment_id': apt_id,
+                'cost_type_id': ct_id,
+                'date': row_date,
+                'value': value,
+                'threshold': threshold,
+                'median': stats.median,
+                'mad': stats.mad,
+                'scope': scope,
+            })
 
+    return warnings
@@ -0,0 +1,128 @@
+"""
+Ablage und seitenweiser Abruf der Warnungen eines Warnungs-Jobs.
+
+Der Job schreibt jede Warnung als ``WarningEntry``-Zeile; im Job-Ergebnis stehen
+nur noch die Anzahlen je Art. Die Warnungsseite lädt die Zeilen über
+``/warnings/api`` nach (Keyset-Pagination: ``after`` = letzte gelieferte ID,
+Index ``(job_id, kind, id)``), sodass die Seite unabhängig von der Größe des
+Bestands sofort steht. Ein neuer Lauf ersetzt die Zeilen früherer Läufe für
+denselben Zeitraum in seiner Transaktion, die Tabelle wächst also nicht mit jeder
+Prüfung.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+
+from app import db
+from app.models import Job, WarningEntry
+from app.reference_data import get_apartment, get_cost_type
+
+WARNING_KINDS = ('missing_consumption', 'invalid_consumption_values', 'consumption_spikes')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Zeilen je INSERT beim Speichern
+INSERT_BATCH_SIZE = 1000
+
+_ENTRY_FIELDS = ('date', 'value', 'threshold', 'median', 'mad', 'scope')
+
+
+def store_warnings(job_id: int, warnings: Dict[str, List[dict]]) -> Dict[str, int]:
+    """Speichert die Warnungen aus ``generate_warnings`` zum Job (ohne Commit).
+
+    Zeilen früherer Warnungs-Jobs mit denselben Parametern (Zeitraum) werden
+    dabei gelöscht.
+
+    Returns:
+        dict: Anzahl Warnungen je Art.
+    """
+    earlier_runs = select(Job.id).where(
+        Job.kind == 'warnings', Job.id < job_id,
+        Job.params == select(Job.params).where(Job.id == job_id).scalar_subquery(),
+    )
+    db.session.execute(delete(WarningEntry).where(WarningEntry.job_id.in_(earlier_runs)))
+
+    counts = {}
+    batch = []
+    for kind in WARNING_KINDS:
+        entries = warnings.get(kind, [])
+        counts[kind] = len(entries)
+        for entry in entries:
+            apartment = get_apartment(entry['apartment_id'])
+            batch.append({
+                'job_id': job_id,
+                'kind': kind,
+                'apartment_id': entry['apartment_id'],
+                'building_id': apartment.building_id if apartment else None,
+                'cost_type_id': entry['cost_type_id'],
+                **{field: entry.get(field) for field in _ENTRY_FIELDS},
+            })
+            if len(batch) >= INSERT_BATCH_SIZE:
+                db.session.execute(insert(WarningEntry), batch)
+                batch = []
+    if batch:
+        db.session.execute(insert(WarningEntry), batch)
+    return counts
+
+
+def _filtered(statement, job_id: int, kind: Optional[str] = None, building_id: Optional[int] = None,
+              cost_type_id: Optional[int] = None):
+    statement = statement.where(WarningEntry.job_id == job_id)
+    if kind is not None:
+        statement = statement.where(WarningEntry.kind == kind)
+    if building_id is not None:
+        statement = statement.where(WarningEntry.building_id == building_id)
+    if cost_type_id is not None:
+        statement = statement.where(WarningEntry.cost_type_id == cost_type_id)
+    return statement
+
+
+def count_warnings(job_id: int, **filters) -> Dict[str, int]:
+    """Anzahl Warnungen je Art (eine gruppierte Abfrage), Filter wie ``warning_page``."""
+    rows = db.session.execute(
+        _filtered(select(WarningEntry.kind, func.count(WarningEntry.id)), job_id, **filters).group_by(WarningEntry.kind)
+    )
+    counts = dict.fromkeys(WARNING_KINDS, 0)
+    counts.update(dict(rows.all()))
+    return counts
+
+
+def entry_dict(entry: WarningEntry) -> dict:
+    apartment = get_apartment(entry.apartment_id)
+    cost_type = get_cost_type(entry.cost_type_id)
+    return {
+        'id': entry.id,
+        'kind': entry.kind,
+        'apartment_id': entry.apartment_id,
+        'apartment_number': apartment.number if apartment else None,
+        'building_id': entry.building_id,
+        'cost_type_id': entry.cost_type_id,
+        'cost_type_name': cost_type.name if cost_type else None,
+        'date': entry.date.isoformat() if entry.date else None,
+        'value': entry.value,
+        'threshold': entry.threshold,
+        'median': entry.median,
+        'mad': entry.mad,
+        'scope': entry.scope,
+    }
+
+
+def warning_page(job_id: int, kind: Optional[str] = None, building_id: Optional[int] = None,
+                 cost_type_id: Optional[int] = None, after: Optional[int] = None,
+                 limit: int = DEFAULT_PAGE_SIZE) -> dict:
+    """Eine Seite Warnungen nach ID aufsteigend, beginnend nach ``after``.
+
+    Returns:
+        dict: {'items': [...], 'next_after': ID für die nächste Seite oder None}
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    statement = _filtered(select(WarningEntry), job_id, kind, building_id, cost_type_id)
+    if after is not None:
+        statement = statement.where(WarningEntry.id > after)
+    # Eine Zeile mehr lesen: zeigt an, ob es eine weitere Seite gibt
+    entries = db.session.scalars(statement.order_by(WarningEntry.id).limit(limit + 1)).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return {
+        'items': [entry_dict(entry) for entry in entries],
+        'next_after': entries[-1].id if has_more else None,
+    }
@@ -1,14 +1,17 @@
+import json
 from datetime import date
-from flask import render_template, request
+from flask import render_template, request, redirect, url_for, flash, jsonify
 from . import warnings_bp
-from app.validation import generate_warnings
+from app.models import Building, Job
+from app.jobs.queue import enqueue_job
+from app.reference_data import reference_data
+from app.warnings.entries import DEFAULT_PAGE_SIZE, WARNING_KINDS, count_warnings, warning_page
 
 
-@warnings_bp.route('/')
-def list_warnings():
+def _requested_period(values):
     # Einfache Parameter (optional), ansonsten aktueller Monat
-    period_start_str = request.args.get('start')
-    period_end_str = request.args.get('end')
+    period_start_str = values.get('start')
+    period_end_str = values.get('end')
 
     today = date.today()
     default_start = date(today.year, today.month, 1)
@@ -18,14 +21,97 @@ def list_warnings():
         try:
             y1, m1, d1 = map(int, period_start_str.split('-'))
             y2, m2, d2 = map(int, period_end_str.split('-'))
-            period_start = date(y1, m1, d1)
-            period_end = date(y2, m2, d2)
+            return date(y1, m1, d1), date(y2, m2, d2)
         except Exception:
-            period_start, period_end = default_start, default_end
-    else:
-        period_start, period_end = default_start, default_end
+            pass
+    return default_start, default_end
+
+
+def _job_params(period_start: date, period_end: date) -> dict:
+    return {'period_start': period_start.isoformat(), 'period_end': period_end.isoformat()}
+
+
+def _period_jobs(period_start: date, period_end: date):
+    return Job.query.filter(Job.kind == 'warnings',
+                            Job.params == json.dumps(_job_params(period_start, period_end)))
+
+
+def _current_job(period_start: date, period_end: date):
+    # Nur der letzte abgeschlossene Lauf des Zeitraums hat noch Einträge (siehe store_warnings)
+    return _period_jobs(period_start, period_end).filter(Job.status == 'completed').order_by(Job.id.desc()).first()
+
+
+def _filters(values) -> dict:
+    """Filter aus den Query-Parametern; ValueError bei ungültigen Werten."""
+    kind = values.get('kind') or None
+    if kind is not None and kind not in WARNING_KINDS:
+        raise ValueError(f"Unbekannte Warnungsart '{kind}'")
+    filters = {'kind': kind}
+    for key, param in (('building_id', 'building'), ('cost_type_id', 'cost_type')):
+        raw = values.get(param)
+        filters[key] = int(raw) if raw else None
+    return filters
+
+
+@warnings_bp.route('/')
+def list_warnings():
+    period_start, period_end = _requested_period(request.args)
+    # Ein älterer Lauf (Parameter ``job``) ist ersetzt: immer den aktuellen zeigen
+    job = _current_job(period_start, period_end)
+    pending_job = _period_jobs(period_start, period_end).filter(
+        Job.status.in_(['queued', 'running'])).order_by(Job.id.desc()).first()
+
+    try:
+        filters = _filters(request.args)
+    except ValueError:
+        filters = {'kind': None, 'building_id': None, 'cost_type_id': None}
+
+    # Nur die Anzahlen; die Zeilen lädt die Seite über die API nach
+    counts = None
+    if job:
+        counts = count_warnings(job.id, building_id=filters['building_id'], cost_type_id=filters['cost_type_id'])
+    return render_template('warnings/list.html', counts=counts, job=job, pending_job=pending_job, filters=filters,
+                           period_start=period_start, period_end=period_end, page_size=DEFAULT_PAGE_SIZE,
+                           buildings=Building.query.order_by(Building.name).all(),
+                           cost_types=sorted(reference_data().cost_types_by_type('consumption'), key=lambda ct: ct.name))
+
+
+@warnings_bp.route('/api')
+def warnings_api():
+    """Warnungen als JSON.
+
+    Parameter: ``start``/``end``, optional ``job`` (410, wenn der Lauf inzwischen ersetzt wurde); Filter ``kind``, ``building``, ``cost_type``;
+    ``summary=1`` liefert nur die Anzahlen je Art, sonst eine Seite mit ``limit`` Einträgen
+    nach der ID ``after`` (Keyset-Pagination, ``next_after`` für die nächste Seite).
+    """
+    period_start, period_end = _requested_period(request.args)
+    job = _current_job(period_start, period_end)
+    if job is None:
+        return jsonify({'error': 'Für diesen Zeitraum liegt keine abgeschlossene Prüfung vor.'}), 404
+    requested_job = request.args.get('job', type=int)
+    if requested_job and requested_job != job.id:
+        # Seitenweises Nachladen darf nicht Einträge zweier Läufe mischen
+        return jsonify({'error': f'Die Prüfung wurde durch Aufgabe #{job.id} ersetzt.', 'job_id': job.id}), 410
+    try:
+        filters = _filters(request.args)
+        after = request.args.get('after')
+        after = int(after) if after else None
+        limit = int(request.args.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({'error': f'Ungültiger Parameter: {e}'}), 400
 
-    warnings = generate_warnings(period_start=period_start, period_end=period_end)
-    return render_template('warnings/list.html', warnings=warnings, period_start=period_start, period_end=period_end)
+    if request.args.get('summary') in ('1', 'true'):
+        kind = filters.pop('kind')
+        counts = count_warnings(job.id, **filters)
+        if kind is not None:
+            counts = {kind: counts[kind]}
+        return jsonify({'job_id': job.id, 'counts': counts})
+    return jsonify({'job_id': job.id, **warning_page(job.id, after=after, limit=limit, **filters)})
 
 
+@warnings_bp.route('/run', methods=['POST'])
+def run_warnings():
+    period_start, period_end = _requested_period(request.form)
+    job = enqueue_job('warnings', _job_params(period_start, period_end))
+    flash(f'Prüfung als Aufgabe #{job.id} eingereiht.', 'info')
+    return redirect(url_for('jobs.job_detail', job_id=job.id))
@@ -0,0 +1 @@
+"""Benchmarks für die Betriebskostenabrechnung (nicht Teil der Test-Suite)."""
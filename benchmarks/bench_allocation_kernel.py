@@ -0,0 +1,55 @@
+"""
+Benchmark: Verteilkern NumPy vs. reines Python.
+
+Aufruf:
+    python -m benchmarks.bench_allocation_kernel [--sizes 10000 100000] [--repeat 7]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.allocation_kernel import HAS_NUMPY, allocate_columns
+
+
+def _time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def run(sizes, repeat):
+    rng = random.Random(1)
+    results = []
+    for n in sizes:
+        ids = list(range(1, n + 1))
+        weights = [rng.uniform(0, 150) for _ in ids]
+        row = {'apartments': n}
+        row['python_s'] = _time(lambda: allocate_columns(ids, weights, 250000.0, backend='python'), repeat)
+        if HAS_NUMPY:
+            row['numpy_s'] = _time(lambda: allocate_columns(ids, weights, 250000.0, backend='numpy'), repeat)
+            row['speedup'] = row['python_s'] / row['numpy_s']
+        results.append(row)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    if not HAS_NUMPY:
+        print('NumPy nicht installiert - nur Python-Backend wird gemessen.')
+    print(f"{'Wohnungen':>10} {'Python [ms]':>12} {'NumPy [ms]':>12} {'Speedup':>8}")
+    for row in run(args.sizes, args.repeat):
+        numpy_ms = f"{row['numpy_s'] * 1000:12.2f}" if 'numpy_s' in row else f"{'-':>12}"
+        speedup = f"{row['speedup']:7.1f}x" if 'speedup' in row else f"{'-':>8}"
+        print(f"{row['apartments']:>10} {row['python_s'] * 1000:12.2f} {numpy_ms} {speedup}")
+
+
+if __name__ == '__main__':
+    main()
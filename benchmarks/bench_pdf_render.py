@@ -0,0 +1,75 @@
+"""
+Benchmark: Abrechnungen (PDF) je Sekunde mit wiederverwendetem bzw. je Dokument neu aufgebautem Renderer.
+
+Aufruf:
+    python -m benchmarks.bench_pdf_render [--documents 200] [--rows 6] [--repeat 3] [--logo pfad/zum/logo.png]
+
+"neu je Dokument" entspricht dem früheren Verhalten (Stylesheet, Tabellenstil und
+Logo bei jedem Dokument bzw. jeder Seite neu), "wiederverwendet" dem Renderer aus
+``get_statement_renderer``; "Canvas" zeichnet mit demselben Renderer direkt auf
+die Zeichenfläche (``PDF_RENDERER = 'canvas'``). Läuft ohne Datenbank und App-Kontext.
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+
+from app.pdf_generation import RENDERER_CANVAS, StatementRenderer, get_statement_renderer
+
+
+def make_payloads(documents: int, rows: int, logo_path) -> list:
+    header = {'logo_path': logo_path, 'name': 'Vermieter GmbH', 'address': 'Musterstraße 1, 12345 Musterstadt',
+              'contact': 'E-Mail: info@vermieter.example'}
+    return [{
+        'contract_id': n,
+        'tenant_name': f'Mieter {n}',
+        'tenant_contact': f'Musterweg {n}\n12345 Musterstadt',
+        'apartment_number': f'W-{n}',
+        'landlord_address': 'Vermieter GmbH\nMusterstraße 1\n12345 Musterstadt',
+        'header': header,
+        'period_start': date(2024, 1, 1),
+        'period_end': date(2024, 12, 31),
+        'rows': [{'name': f'Kostenart {i}', 'total_cost': 1000.0 + i, 'key_desc': f'Anteil (m²: {50 + i})',
+                  'tenant_share': 100.0 + i} for i in range(rows)],
+    } for n in range(1, documents + 1)]
+
+
+def _throughput(render, payloads, repeat) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for payload in payloads:
+            assert render(payload)
+        timings.append(time.perf_counter() - start)
+    return len(payloads) / statistics.median(timings)
+
+
+def run(documents: int, rows: int, repeat: int, logo_path=None) -> dict:
+    payloads = make_payloads(documents, rows, logo_path)
+    fresh = _throughput(lambda payload: StatementRenderer(payload['header']).render(payload), payloads, repeat)
+    reused = _throughput(lambda payload: get_statement_renderer(payload['header']).render(payload), payloads, repeat)
+    canvas = _throughput(lambda payload: get_statement_renderer(payload['header']).render(
+        {**payload, 'renderer': RENDERER_CANVAS}), payloads, repeat)
+    return {'documents': documents, 'rows': rows, 'fresh_pdfs_per_s': fresh, 'reused_pdfs_per_s': reused,
+            'canvas_pdfs_per_s': canvas, 'speedup': reused / fresh, 'canvas_speedup': canvas / fresh}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=6, help='Kostenpositionen je Abrechnung.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--logo', default=None, help='Optionales Logo (PNG/JPG).')
+    args = parser.parse_args(argv)
+
+    result = run(args.documents, args.rows, args.repeat, args.logo)
+    print(f"{'Renderer':<20} {'PDFs/s':>10}")
+    print(f"{'neu je Dokument':<20} {result['fresh_pdfs_per_s']:10.1f}")
+    print(f"{'wiederverwendet':<20} {result['reused_pdfs_per_s']:10.1f}")
+    print(f"{'Canvas':<20} {result['canvas_pdfs_per_s']:10.1f}")
+    print(f"Speedup: {result['speedup']:.2f}x (Canvas: {result['canvas_speedup']:.2f}x)")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark-Suite: Verteilschlüssel, Warnungen, CSV-Import, PDF und Dashboard auf einem synthetischen Portfolio.
+
+Aufruf:
+    python -m benchmarks.bench_suite [--buildings 10] [--apartments 40] [--years 3] [--repeat 5]
+                                     [--output bench.json] [--compare vorher.json]
+
+Ohne ``--database`` läuft alles gegen eine SQLite-In-Memory-Datenbank. Die
+Ergebnisse (min/max/mean/median/stddev je Benchmark, Parameter, Zeilenzahlen)
+werden als JSON gespeichert; mit ``--compare`` wird die Abweichung der Mediane
+gegenüber einem früheren Lauf ausgegeben.
+"""
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+from app import create_app, db
+from app.allocation_kernel import ROUNDING_LARGEST_REMAINDER
+from app.calculations import (
+    calculate_share_allocation,
+    calculate_consumption_allocation,
+    calculate_person_day_allocation,
+    calculate_direct_allocation,
+    calculate_heating_allocation,
+    calculate_combined_allocation,
+)
+from app.import_data import import_consumption_csv
+from app.pdf_generation import generate_utility_statement_pdf
+from app.validation import generate_warnings
+from benchmarks.data_generator import generate_portfolio
+
+
+def measure(fn, repeat: int = 5, warmup: int = 1) -> dict:
+    """Führt ``fn`` ``warmup``-mal ungemessen und ``repeat``-mal gemessen aus (Sekunden)."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        'min': min(timings),
+        'max': max(timings),
+        'mean': statistics.mean(timings),
+        'median': statistics.median(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': len(timings),
+    }
+
+
+def _import_csv_factory(portfolio: dict, rows: int):
+    """Liefert eine Funktion, die bei jedem Aufruf ``rows`` neue Verbrauchszeilen importiert."""
+    from app.models import Apartment
+    numbers = [number for (number,) in db.session.query(Apartment.number).filter(Apartment.number.like('BM-%'))]
+    cost_type_name = 'BM Kaltwasser'
+    calls = {'n': 0}
+
+    def run():
+        calls['n'] += 1
+        # Eigenes Jahr je Aufruf, damit jede Runde wirklich neue Zeilen schreibt
+        year = 2200 + calls['n']
+        lines = ['apartment_number,cost_type_name,date,value']
+        for i in range(rows):
+            lines.append(f'{numbers[i % len(numbers)]},{cost_type_name},{year}-{1 + i // len(numbers) % 12:02d}-01,{i % 7 + 0.5}')
+        result = import_consumption_csv(io.BytesIO(('\n'.join(lines) + '\n').encode('utf-8')))
+        assert result['processed_rows'] == rows, result
+
+    return run
+
+
+def run(buildings: int, apartments: int, years: int, repeat: int, import_rows: int, database_uri: str) -> dict:
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'benchmark',
+        'SERVER_NAME': 'localhost',
+    })
+    results = {
+        'datetime': datetime.now().isoformat(timespec='seconds'),
+        'machine_info': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                         'processor': platform.processor()},
+        'params': {'buildings': buildings, 'apartments_per_building': apartments, 'years': years,
+                   'repeat': repeat, 'import_rows': import_rows, 'database': database_uri.split(':', 1)[0]},
+        'benchmarks': [],
+    }
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        portfolio = generate_portfolio(buildings=buildings, apartments_per_building=apartments, years=years)
+        results['generate_s'] = time.perf_counter() - started
+        results['counts'] = portfolio['counts']
+
+        ps, pe = portfolio['period_start'], portfolio['period_end']
+        mid = date(ps.year, 3, 15) # nicht monatsgenau: Rohdatenpfad
+        ct = portfolio['cost_type_ids']
+        building_id = portfolio['building_ids'][0]
+        contract_id = portfolio['contract_ids'][-1]
+        total = 50_000.0
+        rules = [
+            {'cost_type_id': ct['Grundsteuer'], 'percentage': 30, 'total_cost_part': total * 0.3},
+            {'cost_type_id': ct['Kaltwasser'], 'percentage': 70, 'total_cost_part': total * 0.7,
+             'period_start': ps, 'period_end': pe},
+        ]
+        heating = dict(total_cost=total, hot_water_percentage=30.0,
+                       heating_consumption_cost_type_id=ct['Heizung'],
+                       hot_water_consumption_cost_type_id=ct['Warmwasser'], period_start=ps, period_end=pe)
+        cost_items = [
+            {'cost_type_id': ct['Grundsteuer'], 'total_cost': total},
+            {'cost_type_id': ct['Kaltwasser'], 'total_cost': total},
+            {'cost_type_id': ct['Müllabfuhr'], 'total_cost': total},
+            {'type': 'direct'},
+        ]
+        client = app.test_client()
+
+        cases = [
+            ('allocation', 'share', lambda: calculate_share_allocation(ct['Grundsteuer'], total)),
+            ('allocation', 'share[building]', lambda: calculate_share_allocation(ct['Grundsteuer'], total, building_id=building_id)),
+            ('allocation', 'consumption[rollup]', lambda: calculate_consumption_allocation(ct['Kaltwasser'], total, ps, pe)),
+            ('allocation', 'consumption[raw]', lambda: calculate_consumption_allocation(ct['Kaltwasser'], total, mid, pe)),
+            ('allocation', 'consumption[building]', lambda: calculate_consumption_allocation(ct['Kaltwasser'], total, ps, pe, building_id=building_id)),
+            ('allocation', 'person_days', lambda: calculate_person_day_allocation(ct['Müllabfuhr'], total, ps, pe)),
+            ('allocation', 'direct', lambda: calculate_direct_allocation(ps, pe)),
+            ('allocation', 'heating', lambda: calculate_heating_allocation(**heating)),
+            ('allocation', 'combined', lambda: calculate_combined_allocation(rules)),
+            ('allocation', 'combined[largest_remainder]', lambda: calculate_combined_allocation(rules, rounding=ROUNDING_LARGEST_REMAINDER)),
+            ('warnings', 'generate_warnings', lambda: generate_warnings(ps, pe)),
+            ('pdf', 'generate_utility_statement_pdf', lambda: generate_utility_statement_pdf(contract_id, ps, pe, cost_items)),
+            ('web', 'dashboard_index', lambda: client.get('/').close()),
+            # Zuletzt: der Import verändert den Datenbestand
+            ('import', f'import_consumption_csv[{import_rows}]', _import_csv_factory(portfolio, import_rows)),
+        ]
+        for group, name, fn in cases:
+            stats = measure(fn, repeat=repeat)
+            results['benchmarks'].append({'group': group, 'name': name, 'stats': stats})
+            print(f"{group:>10} {name:<36} median {stats['median'] * 1000:10.2f} ms  (min {stats['min'] * 1000:.2f} ms)")
+        db.session.remove()
+    return results
+
+
+def compare(current: dict, previous: dict):
+    """Gibt die Abweichung der Mediane gegenüber einem früheren Lauf aus."""
+    before = {(b['group'], b['name']): b['stats']['median'] for b in previous.get('benchmarks', [])}
+    print(f"\n{'Benchmark':<48} {'vorher [ms]':>12} {'jetzt [ms]':>12} {'Änderung':>9}")
+    for bench in current['benchmarks']:
+        key = (bench['group'], bench['name'])
+        now = bench['stats']['median']
+        if key not in before:
+            print(f"{bench['group'] + ' ' + bench['name']:<48} {'-':>12} {now * 1000:12.2f} {'neu':>9}")
+            continue
+        change = (now - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"{bench['group'] + ' ' + bench['name']:<48} {before[key] * 1000:12.2f} {now * 1000:12.2f} {change:+8.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--buildings', type=int, default=10)
+    parser.add_argument('--apartments', type=int, default=40, help='Wohnungen je Gebäude.')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--import-rows', type=int, default=5000)
+    parser.add_argument('--database', default='sqlite:///:memory:', help='SQLAlchemy-URL (leere Datenbank).')
+    parser.add_argument('--output', '-o', default=None, help='Ergebnisse als JSON speichern.')
+    parser.add_argument('--compare', default=None, help='Früheres JSON-Ergebnis zum Vergleich.')
+    args = parser.parse_args(argv)
+
+    results = run(args.buildings, args.apartments, args.years, args.repeat, args.import_rows, args.database)
+    print(f"\nDatenbestand: {results['counts']} (erzeugt in {results['generate_s']:.2f} s)")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+        print(f'Ergebnisse gespeichert: {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fh:
+            compare(results, json.load(fh))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Synthetischer Datenbestand für Benchmarks (großes Portfolio).
+
+Erzeugt N Gebäude mit je M Wohnungen, Mieterwechsel (Verträge und
+Belegungszeiträume), monatliche Verbrauchswerte über mehrere Jahre sowie
+Rechnungen je Gebäude und Kostenart (dazu einige direkt zugeordnete). Alle Zeilen
+werden über SQLAlchemy Core als executemany eingefügt (explizite IDs, keine
+ORM-Objekte); der Monats-Rollup wird anschließend einmal neu aufgebaut.
+
+Aufruf innerhalb eines App-Kontexts::
+
+    from benchmarks.data_generator import generate_portfolio
+    summary = generate_portfolio(buildings=10, apartments_per_building=40, years=3)
+"""
+import random
+from datetime import date, datetime
+from typing import Dict, List
+
+from sqlalchemy import func, insert
+
+from app import db
+from app.allocation_cache import TRACKED_TABLES, bump_data_versions
+from app.consumption_rollup import rebuild_rollup, next_month
+from app.models import (
+    Building, Apartment, Tenant, Contract, CostType, ApartmentShare, OccupancyPeriod, ConsumptionData, Invoice,
+)
+
+INSERT_CHUNK_SIZE = 10_000
+
+# (Name, Einheit, Typ, mittlerer Monatsverbrauch je Wohnung)
+COST_TYPES = [
+    ('Grundsteuer', 'm²', 'share', None),
+    ('Kaltwasser', 'm³', 'consumption', 3.5),
+    ('Heizung', 'kWh', 'consumption', 450.0),
+    ('Warmwasser', 'm³', 'consumption', 1.5),
+    ('Müllabfuhr', 'Pers.', 'person_days', None),
+]
+
+
+def _next_id(model) -> int:
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _bulk_insert(model, rows: List[dict]):
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(insert(model.__table__), rows[start:start + INSERT_CHUNK_SIZE])
+
+
+def _month_starts(first: date, months: int) -> List[date]:
+    result = [first]
+    for _ in range(months - 1):
+        result.append(next_month(result[-1]))
+    return result
+
+
+def generate_portfolio(buildings: int = 5, apartments_per_building: int = 20, years: int = 2,
+                       start_year: int = 2022, churn: float = 0.15, spike_rate: float = 0.01,
+                       direct_invoice_rate: float = 0.1, seed: int = 1, prefix: str = 'BM') -> Dict:
+    """
+    Legt einen synthetischen Bestand an und committet ihn.
+
+    Args:
+        buildings: Anzahl Gebäude.
+        apartments_per_building: Wohnungen je Gebäude.
+        years: Anzahl Jahre mit monatlichen Verbrauchswerten (ab ``start_year``).
+        start_year: Erstes Jahr.
+        churn: Wahrscheinlichkeit eines Mieterwechsels je Wohnung und Monat.
+        spike_rate: Anteil auffälliger Verbrauchswerte (Ausreißer bzw. <= 0) für die Warnungen.
+        direct_invoice_rate: Anteil der Verträge mit einer direkt zugeordneten Rechnung je Jahr.
+        seed: Startwert des Zufallsgenerators (gleiche Parameter -> gleiche Daten).
+        prefix: Präfix für Namen/Nummern (eindeutige Wohnungsnummern und Kostenarten).
+
+    Returns:
+        dict: Zeilenzahlen je Tabelle, ``building_ids``, ``cost_type_ids`` ({Name: ID}),
+        ``contract_ids`` sowie ``period_start``/``period_end`` des letzten Jahres.
+    """
+    rng = random.Random(seed)
+    period_first = date(start_year, 1, 1)
+    period_last = date(start_year + years - 1, 12, 31)
+    months = _month_starts(period_first, 12 * years)
+
+    ids = {model: _next_id(model) for model in (Building, Apartment, Tenant, Contract, CostType, Invoice)}
+    rows = {model: [] for model in (Building, Apartment, Tenant, Contract, CostType, ApartmentShare,
+                                    OccupancyPeriod, ConsumptionData, Invoice)}
+
+    def new_id(model):
+        value = ids[model]
+        ids[model] += 1
+        return value
+
+    cost_type_ids = {}
+    for name, unit, ctype, _ in COST_TYPES:
+        ct_id = new_id(CostType)
+        cost_type_ids[name] = ct_id
+        rows[CostType].append({'id': ct_id, 'name': f'{prefix} {name}', 'unit': unit, 'type': ctype})
+    consumption_types = [(cost_type_ids[name], mean) for name, _, ctype, mean in COST_TYPES if ctype == 'consumption']
+
+    building_ids = []
+    contracts = [] # (contract_id, apartment_id, building_id, start, end)
+    for b in range(1, buildings + 1):
+        building_id = new_id(Building)
+        building_ids.append(building_id)
+        rows[Building].append({'id': building_id, 'name': f'{prefix} Haus {b}', 'address': f'{prefix}-Straße {b}',
+                               'notes': None})
+        for a in range(1, apartments_per_building + 1):
+            apartment_id = new_id(Apartment)
+            size = round(rng.uniform(35.0, 120.0), 1)
+            rows[Apartment].append({'id': apartment_id, 'number': f'{prefix}-{b}-{a}', 'address': f'{prefix}-Straße {b}',
+                                    'size_sqm': size, 'building_id': building_id})
+            rows[ApartmentShare].append({'apartment_id': apartment_id, 'cost_type_id': cost_type_ids['Grundsteuer'],
+                                         'value': size})
+
+            # Mieterwechsel: Folge von Verträgen mit Belegungszeiträumen, ggf. mit Leerstand dazwischen
+            tenancy_start = period_first
+            for index, month in enumerate(months[1:], start=1):
+                if rng.random() >= churn:
+                    continue
+                tenancy_end = date.fromordinal(month.toordinal() - 1)
+                if tenancy_end > tenancy_start:
+                    contracts.append(_add_tenancy(rows, new_id, rng, apartment_id, building_id, tenancy_start, tenancy_end))
+                # Bis zu einem Monat Leerstand
+                tenancy_start = months[min(index + rng.randint(0, 1), len(months) - 1)]
+            contracts.append(_add_tenancy(rows, new_id, rng, apartment_id, building_id, tenancy_start, None))
+
+            for cost_type_id, mean in consumption_types:
+                for month in months:
+                    value = round(max(rng.gauss(mean, mean * 0.2), mean * 0.05), 3)
+                    roll = rng.random()
+                    if roll < spike_rate / 2:
+                        value *= 8 # Ausreißer
+                    elif roll < spike_rate:
+                        value = 0.0 # ungültiger Wert
+                    rows[ConsumptionData].append({'apartment_id': apartment_id, 'cost_type_id': cost_type_id,
+                                                  'date': datetime(month.year, month.month, 28), 'value': value,
+                                                  'entry_type': 'csv_import'})
+
+        for year in range(start_year, start_year + years):
+            for name, _, _, _ in COST_TYPES:
+                rows[Invoice].append({
+                    'id': new_id(Invoice), 'invoice_number': f'{prefix}-{b}-{year}-{cost_type_ids[name]}',
+                    'date': date(year, 12, 15), 'amount': round(rng.uniform(1000, 20000), 2),
+                    'cost_type_id': cost_type_ids[name], 'period_start': date(year, 1, 1),
+                    'period_end': date(year, 12, 31), 'direct_allocation_contract_id': None,
+                    'building_id': building_id,
+                })
+
+    for contract_id, apartment_id, building_id, start, end in contracts:
+        if rng.random() < direct_invoice_rate:
+            invoice_date = end or period_last
+            rows[Invoice].append({
+                'id': new_id(Invoice), 'invoice_number': f'{prefix}-D-{contract_id}', 'date': invoice_date,
+                'amount': round(rng.uniform(20, 400), 2), 'cost_type_id': cost_type_ids['Grundsteuer'],
+                'period_start': start, 'period_end': invoice_date, 'direct_allocation_contract_id': contract_id,
+                'building_id': building_id,
+            })
+
+    # Eltern vor Kindern einfügen (Fremdschlüssel)
+    for model in (CostType, Building, Apartment, Tenant, Contract, ApartmentShare, OccupancyPeriod,
+                  ConsumptionData, Invoice):
+        _bulk_insert(model, rows[model])
+    # Core-Inserts laufen an den Session-Listenern vorbei: Rollup und Startseiten-Kennzahlen einmal komplett
+    # aufbauen, Zähler erhöhen
+    rebuild_rollup()
+    bump_data_versions(TRACKED_TABLES)
+    db.session.commit()
+
+    return {
+        'counts': {model.__tablename__: len(model_rows) for model, model_rows in rows.items()},
+        'building_ids': building_ids,
+        'cost_type_ids': cost_type_ids,
+        'contract_ids': [contract[0] for contract in contracts],
+        'period_start': date(start_year + years - 1, 1, 1),
+        'period_end': period_last,
+    }
+
+
+def _add_tenancy(rows, new_id, rng, apartment_id, building_id, start, end):
+    tenant_id = new_id(Tenant)
+    contract_id = new_id(Contract)
+    rows[Tenant].append({'id': tenant_id, 'name': f'Mieter {tenant_id}', 'contact_info': f'mieter{tenant_id}@example.com'})
+    rows[Contract].append({
+        'id': contract_id, 'tenant_id': tenant_id, 'apartment_id': apartment_id, 'start_date': start, 'end_date': end,
+        'rent_amount': round(rng.uniform(400, 1500), 2), 'index_clause_base_value': None,
+        'index_clause_base_date': None, 'contract_pdf_filename': None,
+    })
+    rows[OccupancyPeriod].append({'apartment_id': apartment_id, 'start_date': start, 'end_date': end,
+                                  'number_of_occupants': rng.randint(1, 4)})
+    return contract_id, apartment_id, building_id, start, end
@@ -0,0 +1,38 @@
+"""add indexes for building-scoped allocation joins
+
+Revision ID: 3c5e1a7f9b24
+Revises: 0b3d6f8a2c91
+Create Date: 2026-10-18 15:02:37.664120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '3c5e1a7f9b24'
+down_revision = '0b3d6f8a2c91'
+branch_labels = None
+depends_on = None
+
+
+def _existing_indexes(table_name):
+    return {idx['name'] for idx in inspect(op.get_bind()).get_indexes(table_name)}
+
+
+def upgrade():
+    """Index apartment.building_id and contract.apartment_id for building-scoped joins.
+
+    ix_apartment_building_id is normally created by dynamic_building_add; it is
+    only added here for databases where that step was skipped.
+    """
+    if 'ix_apartment_building_id' not in _existing_indexes('apartment'):
+        op.create_index('ix_apartment_building_id', 'apartment', ['building_id'], unique=False)
+    if 'ix_contract_apartment_id' not in _existing_indexes('contract'):
+        op.create_index('ix_contract_apartment_id', 'contract', ['apartment_id'], unique=False)
+
+
+def downgrade():
+    if 'ix_contract_apartment_id' in _existing_indexes('contract'):
+        op.drop_index('ix_contract_apartment_id', table_name='contract')
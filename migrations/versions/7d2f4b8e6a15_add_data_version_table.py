@@ -0,0 +1,37 @@
+"""add data_version change counters
+
+Revision ID: 7d2f4b8e6a15
+Revises: 3c5e1a7f9b24
+Create Date: 2026-10-18 16:21:08.318402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2f4b8e6a15'
+down_revision = '3c5e1a7f9b24'
+branch_labels = None
+depends_on = None
+
+
+TRACKED_TABLES = ('apartment', 'apartment_share', 'consumption_data', 'contract', 'cost_type', 'invoice',
+                  'occupancy_period')
+
+
+def upgrade():
+    op.create_table('data_version',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    # Zähler vorab anlegen, damit gleichzeitige Flushes nur noch UPDATEs absetzen
+    op.bulk_insert(
+        sa.table('data_version', sa.column('table_name', sa.String), sa.column('version', sa.Integer)),
+        [{'table_name': name, 'version': 0} for name in TRACKED_TABLES],
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
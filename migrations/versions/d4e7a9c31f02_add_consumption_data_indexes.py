@@ -0,0 +1,64 @@
+"""add covering indexes to consumption_data
+
+Revision ID: d4e7a9c31f02
+Revises: bcf621ce4451
+Create Date: 2026-10-18 10:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e7a9c31f02'
+down_revision = 'bcf621ce4451'
+branch_labels = None
+depends_on = None
+
+
+COST_TYPE_INDEX = 'ix_consumption_data_cost_type_date_apartment'
+APARTMENT_INDEX = 'ix_consumption_data_apartment_cost_type_date'
+
+
+def _existing_indexes():
+    inspector = inspect(op.get_bind())
+    if 'consumption_data' not in inspector.get_table_names():
+        return None
+    return {idx['name'] for idx in inspector.get_indexes('consumption_data')}
+
+
+def upgrade():
+    """Add the (cost_type_id, date, apartment_id) index for range aggregations.
+
+    The (apartment_id, cost_type_id, date) index already exists since revision
+    030da51516ae; on PostgreSQL it is rebuilt with INCLUDE (value) so both
+    indexes cover the summed column.
+    """
+    existing = _existing_indexes()
+    if existing is None:
+        return
+    is_postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    if COST_TYPE_INDEX not in existing:
+        op.create_index(COST_TYPE_INDEX, 'consumption_data', ['cost_type_id', 'date', 'apartment_id'],
+                        unique=False, postgresql_include=['value'])
+
+    if APARTMENT_INDEX in existing and is_postgresql:
+        op.drop_index(APARTMENT_INDEX, table_name='consumption_data')
+        existing.discard(APARTMENT_INDEX)
+    if APARTMENT_INDEX not in existing:
+        op.create_index(APARTMENT_INDEX, 'consumption_data', ['apartment_id', 'cost_type_id', 'date'],
+                        unique=False, postgresql_include=['value'])
+
+
+def downgrade():
+    existing = _existing_indexes()
+    if existing is None:
+        return
+    if COST_TYPE_INDEX in existing:
+        op.drop_index(COST_TYPE_INDEX, table_name='consumption_data')
+    if APARTMENT_INDEX in existing and op.get_bind().dialect.name == 'postgresql':
+        # Zustand von 030da51516ae wiederherstellen (ohne INCLUDE)
+        op.drop_index(APARTMENT_INDEX, table_name='consumption_data')
+        op.create_index(APARTMENT_INDEX, 'consumption_data', ['apartment_id', 'cost_type_id', 'date'], unique=False)
@@ -0,0 +1,57 @@
+"""add consumption_monthly rollup table
+
+Revision ID: e81b5c0d7a43
+Revises: d4e7a9c31f02
+Create Date: 2026-10-18 11:02:15.503871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b5c0d7a43'
+down_revision = 'd4e7a9c31f02'
+branch_labels = None
+depends_on = None
+
+
+MONTH_EXPRESSIONS = {
+    'sqlite': "date(date, 'start of month')",
+    'postgresql': "CAST(date_trunc('month', date) AS DATE)",
+}
+
+
+def upgrade():
+    op.create_table('consumption_monthly',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('apartment_id', sa.Integer(), nullable=False),
+    sa.Column('cost_type_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('min_value', sa.Float(), nullable=True),
+    sa.Column('max_value', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['apartment_id'], ['apartment.id'], ),
+    sa.ForeignKeyConstraint(['cost_type_id'], ['cost_type.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('apartment_id', 'cost_type_id', 'month', name='uq_consumption_monthly_bucket')
+    )
+    with op.batch_alter_table('consumption_monthly', schema=None) as batch_op:
+        batch_op.create_index('ix_consumption_monthly_cost_type_month', ['cost_type_id', 'month'], unique=False)
+
+    # Bestehende Verbrauchsdaten übernehmen; andere Backends: `flask consumption rebuild-rollup`
+    month = MONTH_EXPRESSIONS.get(op.get_bind().dialect.name)
+    if month:
+        op.execute(
+            "INSERT INTO consumption_monthly (apartment_id, cost_type_id, month, total, count, min_value, max_value) "
+            f"SELECT apartment_id, cost_type_id, {month}, SUM(value), COUNT(id), MIN(value), MAX(value) "
+            f"FROM consumption_data GROUP BY apartment_id, cost_type_id, {month}"
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('consumption_monthly', schema=None) as batch_op:
+        batch_op.drop_index('ix_consumption_monthly_cost_type_month')
+
+    op.drop_table('consumption_monthly')
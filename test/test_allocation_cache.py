@@ -0,0 +1,125 @@
+import io
+from datetime import date, datetime
+
+from app import create_app, db
+from app.allocation_cache import AllocationCache, data_fingerprint, get_allocation_cache
+from app.billing.engine import compute_billing_run
+from app.import_data import import_consumption_csv
+from app.models import Apartment, ConsumptionData, CostType
+from app.profiling import record_queries
+
+PS, PE = date(2024, 1, 1), date(2024, 12, 31)
+
+
+def create_water_data():
+    ct = CostType(name='Wasser Cache', unit='m³', type='consumption')
+    apt1 = Apartment(number='C-1', address='Cacheweg 1', size_sqm=50.0)
+    apt2 = Apartment(number='C-2', address='Cacheweg 2', size_sqm=60.0)
+    db.session.add_all([ct, apt1, apt2])
+    db.session.commit()
+    db.session.add_all([
+        ConsumptionData(apartment_id=apt1.id, cost_type_id=ct.id, date=datetime(2024, 3, 1), value=10.0),
+        ConsumptionData(apartment_id=apt2.id, cost_type_id=ct.id, date=datetime(2024, 3, 1), value=30.0),
+    ])
+    db.session.commit()
+    return ct.id, apt1.id, apt2.id
+
+
+def test_repeated_run_is_served_from_cache(app_context):
+    ct_id, apt1_id, apt2_id = create_water_data()
+    items = [{'cost_type_id': ct_id, 'total_cost': 100.0}]
+
+    first = compute_billing_run(PS, PE, items)
+    with record_queries() as queries:
+        second = compute_billing_run(PS, PE, items)
+    # Nur noch der Daten-Fingerabdruck
+    assert queries.count == 1
+    assert second.items == first.items
+    assert second.items[0]['allocation'] == {apt1_id: 25.0, apt2_id: 75.0}
+    assert get_allocation_cache().stats()['hits'] == 1
+
+    # Ergebnisse sind Kopien: Änderungen am Lauf verändern den Cache nicht
+    second.items[0]['allocation'][apt1_id] = 0.0
+    assert compute_billing_run(PS, PE, items).items[0]['allocation'][apt1_id] == 25.0
+
+
+def test_changed_data_invalidates_entries(app_context):
+    ct_id, apt1_id, apt2_id = create_water_data()
+    items = [{'cost_type_id': ct_id, 'total_cost': 100.0}]
+    compute_billing_run(PS, PE, items)
+    before = data_fingerprint()
+
+    reading = ConsumptionData.query.filter_by(apartment_id=apt2_id).one()
+    reading.value = 10.0
+    db.session.flush()
+    # Uncommittete Änderungen: kein Fingerabdruck, es wird frisch gerechnet
+    assert data_fingerprint() is None
+    assert compute_billing_run(PS, PE, items).items[0]['allocation'] == {apt1_id: 50.0, apt2_id: 50.0}
+    db.session.commit()
+
+    after = data_fingerprint()
+    assert dict(after)['consumption_data'] == dict(before)['consumption_data'] + 1
+    assert compute_billing_run(PS, PE, items).items[0]['allocation'] == {apt1_id: 50.0, apt2_id: 50.0}
+
+    # Core-Inserts des CSV-Imports erhöhen den Zähler ebenfalls
+    csv_data = 'apartment_number,cost_type_name,date,value\nC-1,Wasser Cache,2024-04-01,20.0\n'
+    assert import_consumption_csv(io.BytesIO(csv_data.encode('utf-8')))['processed_rows'] == 1
+    assert dict(data_fingerprint())['consumption_data'] == dict(after)['consumption_data'] + 1
+    assert compute_billing_run(PS, PE, items).items[0]['allocation'] == {apt1_id: 75.0, apt2_id: 25.0}
+
+
+def test_lru_eviction_and_size_cap():
+    cache = AllocationCache(max_size=2)
+    cache.put('a', {'value': 1})
+    cache.put('b', {'value': 2})
+    assert cache.get('a') == {'value': 1}
+    cache.put('c', {'value': 3})
+    # 'b' war am längsten unbenutzt
+    assert cache.get('b') is None
+    assert cache.get('a') == {'value': 1} and cache.get('c') == {'value': 3}
+    assert len(cache) == 2
+    assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 3, 'misses': 1}
+
+
+def test_cache_can_be_disabled():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'TESTING': True, 'SECRET_KEY': 'test-key',
+                      'ALLOCATION_CACHE_SIZE': 0})
+    with app.app_context():
+        db.create_all()
+        ct_id, _, _ = create_water_data()
+        items = [{'cost_type_id': ct_id, 'total_cost': 100.0}]
+        compute_billing_run(PS, PE, items)
+        with record_queries() as queries:
+            compute_billing_run(PS, PE, items)
+        assert get_allocation_cache() is None
+        statements = [statement for statement, _ in queries.statements]
+        assert not any('data_version' in statement for statement in statements)
+        assert any('consumption_monthly' in statement for statement in statements)
+        db.session.remove()
+        db.drop_all()
+
+
+def test_versions_bumped_once_per_transaction(app_context):
+    """Viele Flushes einer Transaktion erhöhen jeden Zähler nur einmal, und zwar erst beim Commit."""
+    ct_id, apt1_id, _ = create_water_data()
+    before = dict(data_fingerprint())
+
+    with record_queries() as queries:
+        for day in range(1, 4):
+            db.session.add(ConsumptionData(apartment_id=apt1_id, cost_type_id=ct_id, date=datetime(2024, 5, day),
+                                           value=1.0))
+            db.session.flush()
+    assert not any('data_version' in statement for statement, _ in queries.statements)
+    assert data_fingerprint() is None
+
+    with record_queries() as queries:
+        db.session.commit()
+    assert sum('data_version' in statement for statement, _ in queries.statements) == 1
+    after = dict(data_fingerprint())
+    assert after['consumption_data'] == before['consumption_data'] + 1
+    assert after['apartment'] == before['apartment']
+
+    db.session.add(ConsumptionData(apartment_id=apt1_id, cost_type_id=ct_id, date=datetime(2024, 6, 1), value=1.0))
+    db.session.flush()
+    db.session.rollback()
+    assert data_fingerprint() == tuple(sorted(after.items()))
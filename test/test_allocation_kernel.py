@@ -0,0 +1,60 @@
+import pytest
+
+from app.allocation_kernel import HAS_NUMPY, ROUNDING_MODES, allocate_columns, round_cents, sum_allocations
+
+BACKENDS = ['python'] + (['numpy'] if HAS_NUMPY else [])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_allocate_columns_proportional(backend):
+    result = allocate_columns([1, 2, 3], [50.0, 150.0, 0.0], 1000.0, backend=backend)
+    assert result == {1: pytest.approx(250.0), 2: pytest.approx(750.0), 3: 0.0}
+    assert all(type(v) is float for v in result.values())
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_allocate_columns_non_positive_total(backend):
+    assert allocate_columns([1, 2], [0.0, 0.0], 100.0, backend=backend) == {1: 0.0, 2: 0.0}
+    assert allocate_columns([], [], 100.0, backend=backend) == {}
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_allocate_columns_negative_weight_gets_zero(backend):
+    result = allocate_columns([1, 2, 3], [-10.0, 30.0, 80.0], 100.0, backend=backend)
+    # Summe der Gewichte (inkl. negativer) bestimmt den Nenner, wie bisher
+    assert result[1] == 0.0
+    assert result[2] == pytest.approx(30.0)
+    assert result[3] == pytest.approx(80.0)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason='NumPy nicht installiert')
+@pytest.mark.parametrize('rounding', ROUNDING_MODES)
+def test_backends_agree_on_random_weights(rounding):
+    import random
+    rng = random.Random(42)
+    ids = list(range(1, 2001))
+    # Stark unterschiedliche Größenordnungen: Summationsreihenfolge und Rundung müssen übereinstimmen
+    weights = [rng.uniform(0, 500) * 10 ** rng.randint(-3, 6) for _ in ids]
+    for total_cost in (123456.78, 0.05, -987.65):
+        py = allocate_columns(ids, weights, total_cost, backend='python', rounding=rounding)
+        vec = allocate_columns(ids, weights, total_cost, backend='numpy', rounding=rounding)
+        assert py == vec
+    parts = [py, {i: 0.005 * i for i in ids[::3]}]
+    assert sum_allocations(parts, backend='python') == sum_allocations(parts, backend='numpy')
+
+
+def test_round_cents_half_up():
+    assert [round_cents(value) for value in (0.5, 1.5, 2.5, 2.4999, -0.5, -2.5)] == [1, 2, 3, 2, -1, -3]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_sum_allocations_union(backend):
+    result = sum_allocations([{1: 200.0, 2: 300.0}, {1: 100.0, 3: 250.0}], backend=backend)
+    assert result == {1: pytest.approx(300.0), 2: pytest.approx(300.0), 3: pytest.approx(250.0)}
+
+
+def test_invalid_backend_and_length_mismatch():
+    with pytest.raises(ValueError):
+        allocate_columns([1], [1.0], 10.0, backend='fortran')
+    with pytest.raises(ValueError):
+        allocate_columns([1, 2], [1.0], 10.0)
@@ -0,0 +1,43 @@
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import func
+
+from app import db
+from app.models import Apartment, Contract, ConsumptionData, ConsumptionMonthly, OccupancyPeriod, Invoice
+from app.calculations import calculate_share_allocation
+from benchmarks.data_generator import generate_portfolio
+from benchmarks import bench_suite
+
+
+def test_generate_portfolio_is_consistent(app_context):
+    summary = generate_portfolio(buildings=2, apartments_per_building=3, years=2, churn=0.3, seed=7)
+
+    assert summary['counts']['apartment'] == Apartment.query.count() == 6
+    assert summary['counts']['consumption_data'] == ConsumptionData.query.count() == 6 * 3 * 24
+    assert Contract.query.count() == OccupancyPeriod.query.count() == len(summary['contract_ids'])
+    assert Invoice.query.filter(Invoice.direct_allocation_contract_id.is_(None)).count() == 2 * 2 * 5
+    assert (summary['period_start'], summary['period_end']) == (date(2023, 1, 1), date(2023, 12, 31))
+    # Rollup wurde nach den Core-Inserts aufgebaut
+    raw_total = db.session.query(func.sum(ConsumptionData.value)).scalar()
+    assert db.session.query(func.sum(ConsumptionMonthly.total)).scalar() == pytest.approx(raw_total)
+    # Je Wohnung höchstens ein offener Vertrag
+    open_contracts = db.session.query(Contract.apartment_id, func.count()).filter(Contract.end_date.is_(None)).group_by(Contract.apartment_id)
+    assert all(count == 1 for _, count in open_contracts)
+
+    allocation = calculate_share_allocation(summary['cost_type_ids']['Grundsteuer'], 1000.0,
+                                            building_id=summary['building_ids'][0])
+    assert len(allocation) == 3
+
+
+def test_bench_suite_writes_json(tmp_path):
+    output = tmp_path / 'bench.json'
+    bench_suite.main(['--buildings', '1', '--apartments', '2', '--years', '1', '--repeat', '1',
+                      '--import-rows', '10', '--output', str(output)])
+    results = json.loads(output.read_text(encoding='utf-8'))
+    names = {bench['name'] for bench in results['benchmarks']}
+    assert {'share', 'person_days', 'direct', 'generate_warnings', 'generate_utility_statement_pdf',
+            'dashboard_index', 'import_consumption_csv[10]'} <= names
+    assert all(bench['stats']['rounds'] == 1 for bench in results['benchmarks'])
+    assert results['counts']['apartment'] == 2
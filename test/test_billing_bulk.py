@@ -0,0 +1,152 @@
+import io
+import re
+import zipfile
+from datetime import date
+
+from app import db
+from app.models import Building, Apartment, Tenant, Contract, CostType, ApartmentShare, Invoice
+from app.models import Job
+from app.billing.bulk import export_statements_bundle, export_statements_zip, build_statement_payloads
+from app.jobs.queue import run_worker
+
+
+def setup_bulk_data(n_apartments=3):
+    building = Building(name='Bulk-Haus')
+    db.session.add(building)
+    db.session.commit()
+
+    ct = CostType(name='Grundsteuer Bulk', unit='m²', type='share')
+    db.session.add(ct)
+    db.session.commit()
+
+    contracts = []
+    for i in range(1, n_apartments + 1):
+        apt = Apartment(number=f'B-{i}', address=f'Bulkstr {i}', size_sqm=40.0 + i, building_id=building.id)
+        tenant = Tenant(name=f'Bulk Mieter {i}', contact_info='bulk@example.com')
+        db.session.add_all([apt, tenant])
+        db.session.commit()
+        db.session.add(ApartmentShare(apartment_id=apt.id, cost_type_id=ct.id, value=apt.size_sqm))
+        contract = Contract(tenant_id=tenant.id, apartment_id=apt.id, start_date=date(2024, 1, 1), rent_amount=600.0)
+        db.session.add(contract)
+        contracts.append(contract)
+    db.session.add(Invoice(invoice_number='G-BULK', date=date(2024, 12, 1), amount=900.0, cost_type_id=ct.id,
+                           period_start=date(2024, 1, 1), period_end=date(2024, 12, 31), building_id=building.id))
+    db.session.commit()
+    return building, contracts, ct
+
+
+def test_payloads_are_plain_data(client):
+    building, contracts, ct = setup_bulk_data()
+    payloads = build_statement_payloads(building.id, date(2024, 1, 1), date(2024, 12, 31),
+                                        [{'cost_type_id': ct.id, 'total_cost': 900.0}])
+    assert [p['contract_id'] for p in payloads] == [c.id for c in contracts]
+    allowed = (str, int, float, bool, type(None), date, dict, list)
+    for payload in payloads:
+        assert all(isinstance(v, allowed) for v in payload.values())
+
+
+def test_export_zip_inline_and_parallel(client):
+    building, contracts, ct = setup_bulk_data()
+    cost_items = [{'cost_type_id': ct.id, 'total_cost': 900.0}]
+
+    for workers in (1, 2):
+        buffer = io.BytesIO()
+        result = export_statements_zip(buffer, building.id, date(2024, 1, 1), date(2024, 12, 31), cost_items,
+                                       max_workers=workers)
+        assert result == {'statements': 3, 'failed': []}
+        with zipfile.ZipFile(buffer) as zf:
+            names = sorted(zf.namelist())
+            assert names == sorted(f'abrechnung_{c.id}_2024-01-01_2024-12-31.pdf' for c in contracts)
+            assert all(zf.read(n).startswith(b'%PDF') for n in names)
+
+
+def test_bulk_route_enqueues_export_job(client, tmp_path):
+    building, contracts, ct = setup_bulk_data(n_apartments=2)
+    client.application.config['BILLING_BULK_WORKERS'] = 1
+    client.application.config['JOB_RESULTS_FOLDER'] = str(tmp_path)
+    resp = client.post('/billing/bulk', data={
+        'building_id': str(building.id),
+        'period_start': '2024-01-01',
+        'period_end': '2024-12-31',
+        'preset': 'standard',
+    })
+    assert resp.status_code == 302
+    job = Job.query.one()
+    assert resp.headers['Location'].endswith(f'/jobs/{job.id}')
+    assert job.status == 'queued'
+
+    assert run_worker(once=True, echo=lambda msg: None) == 1
+    status = client.get(f'/jobs/{job.id}/status').get_json()
+    assert status['status'] == 'completed'
+    assert status['progress_current'] == status['progress_total'] == 2
+
+    resp = client.get(status['download_url'])
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert len(zf.namelist()) == 2
+    resp.close()
+
+
+def test_bulk_cli_export(runner, tmp_path):
+    building, contracts, ct = setup_bulk_data(n_apartments=2)
+    target = tmp_path / 'out.zip'
+    result = runner.invoke(args=['billing', 'export', '--building', str(building.id), '--start', '2024-01-01',
+                                 '--end', '2024-12-31', '--output', str(target), '--workers', '1'])
+    assert result.exit_code == 0, result.output
+    assert '2 Abrechnungen' in result.output
+    with zipfile.ZipFile(target) as zf:
+        assert len(zf.namelist()) == 2
+
+
+def test_export_bundle_single_pdf(client):
+    building, contracts, ct = setup_bulk_data()
+    cost_items = [{'cost_type_id': ct.id, 'total_cost': 900.0}]
+
+    pages = {}
+    for toc in (False, True):
+        buffer = io.BytesIO()
+        progress = []
+        result = export_statements_bundle(buffer, building.id, date(2024, 1, 1), date(2024, 12, 31), cost_items,
+                                          toc=toc, progress_callback=lambda done, total: progress.append((done, total)))
+        assert result == {'statements': 3, 'failed': []}
+        assert progress == [(1, 3), (2, 3), (3, 3)]
+        pdf_bytes = buffer.getvalue()
+        assert pdf_bytes.startswith(b'%PDF') and pdf_bytes.count(b'%%EOF') == 1
+        pages[toc] = len(re.findall(rb'/Type /Page[^s]', pdf_bytes))
+        # Ein Lesezeichen je Vertrag
+        assert pdf_bytes.count(b'/Outlines') >= 1
+    # Eine Seite je Abrechnung, mit Inhaltsverzeichnis eine mehr
+    assert pages == {False: 3, True: 4}
+
+    empty = io.BytesIO()
+    assert export_statements_bundle(empty, building.id, date(2020, 1, 1), date(2020, 12, 31), cost_items) == \
+        {'statements': 0, 'failed': []}
+
+
+def test_bulk_route_bundle_format(client, tmp_path):
+    building, contracts, ct = setup_bulk_data(n_apartments=2)
+    client.application.config['JOB_RESULTS_FOLDER'] = str(tmp_path)
+    resp = client.post('/billing/bulk', data={
+        'building_id': str(building.id),
+        'period_start': '2024-01-01',
+        'period_end': '2024-12-31',
+        'preset': 'standard',
+        'format': 'pdf',
+        'toc': 'on',
+    })
+    assert resp.status_code == 302
+    assert run_worker(once=True, echo=lambda msg: None) == 1
+    job = Job.query.one()
+    assert job.result_filename.endswith('.pdf')
+
+    resp = client.get(f'/jobs/{job.id}/download')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/pdf'
+    assert len(re.findall(rb'/Type /Page[^s]', resp.data)) == 3
+    resp.close()
+
+    resp = client.post('/billing/bulk', data={'building_id': str(building.id), 'period_start': '2024-01-01',
+                                              'period_end': '2024-12-31', 'format': 'docx'})
+    assert resp.status_code == 200
+    assert Job.query.count() == 1
@@ -0,0 +1,111 @@
+from datetime import date, datetime
+
+import pytest
+
+from app.models import Building, Apartment, Tenant, Contract, CostType, ApartmentShare, ConsumptionData
+from app.billing import engine
+from app.billing.engine import compute_billing_run, run_building_billing
+
+
+@pytest.fixture
+def setup_billing_engine(test_db):
+    """Erstellt ein Haus mit drei vermieteten Wohnungen (Anteile, Wasserverbrauch) und eine in einem anderen Haus."""
+    building = Building(name='Engine-Haus')
+    other = Building(name='Anderes Haus')
+    test_db.session.add_all([building, other])
+    test_db.session.commit()
+
+    apts = [
+        Apartment(number=f'E-{i}', address=f'Enginestr {i}', size_sqm=50.0 + i, building_id=building.id)
+        for i in range(1, 4)
+    ]
+    foreign_apt = Apartment(number='X-1', address='Andere Str 1', size_sqm=40.0, building_id=other.id)
+    test_db.session.add_all(apts + [foreign_apt])
+    test_db.session.commit()
+
+    contracts = []
+    for apt in apts + [foreign_apt]:
+        tenant = Tenant(name=f'Mieter {apt.number}', contact_info='engine@example.com')
+        test_db.session.add(tenant)
+        test_db.session.commit()
+        contract = Contract(tenant_id=tenant.id, apartment_id=apt.id, start_date=date(2024, 1, 1), rent_amount=500.0)
+        test_db.session.add(contract)
+        contracts.append(contract)
+    test_db.session.commit()
+
+    ct_share = CostType(name='Fläche Engine', unit='m²', type='share')
+    ct_water = CostType(name='Wasser Engine', unit='m³', type='consumption')
+    test_db.session.add_all([ct_share, ct_water])
+    test_db.session.commit()
+
+    # Anteile 20/30/50 und Verbrauch 10/30/60 für die Wohnungen des Hauses
+    for apt, value in zip(apts, [20.0, 30.0, 50.0]):
+        test_db.session.add(ApartmentShare(apartment_id=apt.id, cost_type_id=ct_share.id, value=value))
+    for apt, value in zip(apts, [10.0, 30.0, 60.0]):
+        test_db.session.add(ConsumptionData(apartment_id=apt.id, cost_type_id=ct_water.id, date=datetime(2024, 3, 1),
+                                            value=value))
+    test_db.session.commit()
+
+    # Verträge in Reihenfolge der Wohnungen, der letzte im anderen Haus
+    return {
+        'building_id': building.id,
+        'apt_ids': [apt.id for apt in apts],
+        'contract_ids': [contract.id for contract in contracts],
+        'ct_share_id': ct_share.id,
+        'ct_water_id': ct_water.id,
+    }
+
+
+def test_compute_billing_run_matrix(setup_billing_engine):
+    """Testet die Verteilungsmatrix und die Abrechnungszeilen einer Wohnung."""
+    data = setup_billing_engine
+    apt_ids = data['apt_ids']
+    cost_items = [
+        {'cost_type_id': data['ct_share_id'], 'total_cost': 1000.0},
+        {'cost_type_id': data['ct_water_id'], 'total_cost': 500.0},
+        {'type': 'direct'},
+    ]
+
+    run = compute_billing_run(date(2024, 1, 1), date(2024, 12, 31), cost_items)
+
+    assert len(run.items) == 3
+    assert run.matrix[apt_ids[0]][:2] == [pytest.approx(200.0), pytest.approx(50.0)]
+    assert run.matrix[apt_ids[2]][:2] == [pytest.approx(500.0), pytest.approx(300.0)]
+
+    rows = run.rows_for_apartment(apt_ids[1])
+    assert [r['name'] for r in rows] == ['Fläche Engine', 'Wasser Engine', 'Direkt zugeordnete Kosten']
+    assert rows[0]['key_desc'] == 'Anteil (m²: 30.0)'
+    assert rows[1]['key_desc'] == 'Verbrauch (m³: 30.00)'
+    assert rows[1]['tenant_share'] == pytest.approx(150.0)
+
+
+def test_run_building_billing_renders_each_contract_once(setup_billing_engine, monkeypatch):
+    """Testet, dass je Kostenposition einmal verteilt und nur das gewählte Gebäude gerendert wird."""
+    data = setup_billing_engine
+
+    calls = {'share': 0, 'consumption': 0}
+    original_share = engine.get_share_values
+    original_consumption = engine.get_consumption_totals
+
+    def counting_share(*args, **kwargs):
+        calls['share'] += 1
+        return original_share(*args, **kwargs)
+
+    def counting_consumption(*args, **kwargs):
+        calls['consumption'] += 1
+        return original_consumption(*args, **kwargs)
+
+    monkeypatch.setattr(engine, 'get_share_values', counting_share)
+    monkeypatch.setattr(engine, 'get_consumption_totals', counting_consumption)
+
+    cost_items = [
+        {'cost_type_id': data['ct_share_id'], 'total_cost': 1000.0},
+        {'cost_type_id': data['ct_water_id'], 'total_cost': 500.0},
+    ]
+    run = run_building_billing(data['building_id'], date(2024, 1, 1), date(2024, 12, 31), cost_items)
+
+    # Verteilung genau einmal pro Kostenposition, unabhängig von der Anzahl der Verträge
+    assert calls == {'share': 1, 'consumption': 1}
+    # Nur Verträge des gewählten Gebäudes werden gerendert
+    assert set(run.statements) == set(data['contract_ids'][:3])
+    assert all(pdf.startswith(b'%PDF') for pdf in run.statements.values())
@@ -0,0 +1,196 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.models import (
+    Building, Apartment, Tenant, Contract, CostType, ApartmentShare, ConsumptionData, OccupancyPeriod,
+)
+from app.billing.engine import compute_billing_run, run_building_billing
+from app.billing.incremental import apply_row_change, refresh_statements, row_values
+from app.profiling import record_queries
+from app.reference_data import reference_data
+
+PS, PE = date(2024, 1, 1), date(2024, 12, 31)
+
+
+@pytest.fixture
+def setup_incremental_building(test_db):
+    """Erstellt ein Haus mit drei Wohnungen (Anteile, Verbrauch, Belegungen, Verträge) und ein Nachbarhaus."""
+    building = Building(name='Inkrementell-Haus')
+    other = Building(name='Nachbarhaus')
+    test_db.session.add_all([building, other])
+    test_db.session.commit()
+    apts = [Apartment(number=f'I-{i}', address=f'Inkrementweg {i}', size_sqm=40.0 + i, building_id=building.id)
+            for i in range(1, 4)]
+    foreign = Apartment(number='I-X', address='Nachbarweg 1', size_sqm=40.0, building_id=other.id)
+    ct_share = CostType(name='Fläche Inkrementell', unit='m²', type='share')
+    ct_water = CostType(name='Wasser Inkrementell', unit='m³', type='consumption')
+    ct_heat = CostType(name='Heizung Inkrementell', unit='kWh', type='consumption')
+    ct_trash = CostType(name='Müll Inkrementell', unit='Pers.', type='person_days')
+    test_db.session.add_all(apts + [foreign, ct_share, ct_water, ct_heat, ct_trash])
+    test_db.session.commit()
+    for i, apt in enumerate(apts + [foreign], start=1):
+        tenant = Tenant(name=f'Mieter {apt.number}', contact_info='inkrement@example.com')
+        test_db.session.add(tenant)
+        test_db.session.commit()
+        test_db.session.add_all([
+            Contract(tenant_id=tenant.id, apartment_id=apt.id, start_date=PS, rent_amount=500.0),
+            ApartmentShare(apartment_id=apt.id, cost_type_id=ct_share.id, value=10.0 * i),
+            ConsumptionData(apartment_id=apt.id, cost_type_id=ct_water.id, date=datetime(2024, 3, 1), value=5.0 * i),
+            ConsumptionData(apartment_id=apt.id, cost_type_id=ct_heat.id, date=datetime(2024, 2, 1), value=100.0 * i),
+            OccupancyPeriod(apartment_id=apt.id, start_date=PS, number_of_occupants=i),
+        ])
+    test_db.session.commit()
+
+    # Kostenpositionen: Anteil, Verbrauch, Personentage, Heizung
+    return {
+        'building_id': building.id,
+        'apt_ids': [apt.id for apt in apts],
+        'foreign_id': foreign.id,
+        'cost_items': [
+            {'cost_type_id': ct_share.id, 'total_cost': 600.0},
+            {'cost_type_id': ct_water.id, 'total_cost': 300.0},
+            {'cost_type_id': ct_trash.id, 'total_cost': 120.0},
+            {'type': 'heating', 'total_cost': 1000.0, 'hot_water_percentage': 30.0,
+             'heating_consumption_cost_type_id': ct_heat.id, 'hot_water_consumption_cost_type_id': ct_water.id},
+        ],
+    }
+
+
+def assert_same_run(run, fresh):
+    """Vergleicht einen inkrementell angepassten Lauf mit einer vollständigen Neuberechnung."""
+    for item, expected in zip(run.items, fresh.items):
+        assert item['allocation'] == expected['allocation'], item['name']
+        for holder, expected_holder in zip(item.get('parts', [item]), expected.get('parts', [expected])):
+            if 'key_values' in expected_holder:
+                assert holder['key_values'] == pytest.approx(expected_holder['key_values'])
+                assert holder['weight_total'] == pytest.approx(expected_holder['weight_total'])
+
+
+def test_corrected_reading_updates_without_queries(setup_incremental_building):
+    """Testet die Korrektur einer Ablesung: ohne Datenbankabfrage, Ergebnis wie bei voller Neuberechnung."""
+    data = setup_incremental_building
+    building_id = data['building_id']
+    apt_ids = data['apt_ids']
+    cost_items = data['cost_items']
+    run = compute_billing_run(PS, PE, cost_items, building_id)
+    reference_data().apartments_in_building(building_id)
+
+    reading = ConsumptionData.query.filter_by(apartment_id=apt_ids[0], cost_type_id=cost_items[1]['cost_type_id']).one()
+    before = row_values(reading)
+    reading.value = 35.0
+    db.session.commit()
+    after = row_values(reading)
+
+    with record_queries() as queries:
+        changed = apply_row_change(run, ConsumptionData, before, after)
+    assert queries.count == 0
+    # Wasser wird nach Verbrauch verteilt: alle Wohnungen des Hauses betroffen, das Nachbarhaus nicht
+    assert changed == set(apt_ids)
+    assert_same_run(run, compute_billing_run(PS, PE, cost_items, building_id))
+
+
+def test_share_occupancy_and_deleted_rows(setup_incremental_building):
+    """Testet gelöschte Anteile, neue Belegungen und Änderungen außerhalb des Laufs."""
+    data = setup_incremental_building
+    building_id = data['building_id']
+    apt_ids = data['apt_ids']
+    foreign_id = data['foreign_id']
+    cost_items = data['cost_items']
+    run = compute_billing_run(PS, PE, cost_items, building_id)
+
+    share = ApartmentShare.query.filter_by(apartment_id=apt_ids[1]).one()
+    before = row_values(share)
+    db.session.delete(share)
+    db.session.commit()
+    changed = apply_row_change(run, ApartmentShare, before, None)
+    assert apt_ids[1] in changed and apt_ids[1] not in run.items[0]['allocation']
+
+    period = OccupancyPeriod(apartment_id=apt_ids[2], start_date=date(2024, 7, 1), end_date=date(2024, 7, 10),
+                             number_of_occupants=2)
+    db.session.add(period)
+    db.session.commit()
+    apply_row_change(run, OccupancyPeriod, None, row_values(period))
+
+    # Änderungen außerhalb des Zeitraums oder im Nachbarhaus lassen den Lauf unverändert
+    outside = ConsumptionData(apartment_id=apt_ids[0], cost_type_id=cost_items[1]['cost_type_id'],
+                              date=datetime(2025, 1, 1), value=99.0)
+    foreign = ConsumptionData(apartment_id=foreign_id, cost_type_id=cost_items[1]['cost_type_id'],
+                              date=datetime(2024, 5, 1), value=99.0)
+    db.session.add_all([outside, foreign])
+    db.session.commit()
+    assert apply_row_change(run, ConsumptionData, None, row_values(outside)) == set()
+    assert apply_row_change(run, ConsumptionData, None, row_values(foreign)) == set()
+
+    assert_same_run(run, compute_billing_run(PS, PE, cost_items, building_id))
+
+
+def test_refresh_only_changed_statements(setup_incremental_building):
+    """Testet, dass nur die Abrechnungen der betroffenen Wohnungen neu gerendert werden."""
+    data = setup_incremental_building
+    building_id = data['building_id']
+    apt_ids = data['apt_ids']
+    cost_items = data['cost_items']
+    share_items = cost_items[:1]
+    run = run_building_billing(building_id, PS, PE, share_items)
+    assert len(run.statements) == 3
+    old_statements = dict(run.statements)
+
+    share = ApartmentShare.query.filter_by(apartment_id=apt_ids[0]).one()
+    before = row_values(share)
+    share.value = 20.0
+    db.session.commit()
+    changed = apply_row_change(run, ApartmentShare, before, row_values(share))
+    assert changed == set(apt_ids)
+
+    contract_ids = refresh_statements(run, {apt_ids[0]})
+    contract = Contract.query.filter_by(apartment_id=apt_ids[0]).one()
+    assert contract_ids == [contract.id]
+    assert run.statements[contract.id] is not old_statements[contract.id]
+    # Alle anderen Abrechnungen bleiben unangetastet
+    assert [contract_id for contract_id in run.statements
+            if run.statements[contract_id] is not old_statements[contract_id]] == [contract.id]
+    assert refresh_statements(run, set()) == []
+
+
+def test_change_sequence_matches_full_recompute(setup_incremental_building):
+    """Viele Einfügungen, Korrekturen und Löschungen: kein Gleitkommarest, geleerte Wohnungen fallen heraus."""
+    data = setup_incremental_building
+    building_id = data['building_id']
+    apt_ids = data['apt_ids']
+    cost_items = data['cost_items']
+    ct_water = cost_items[1]['cost_type_id']
+    run = compute_billing_run(PS, PE, cost_items, building_id)
+
+    def change(obj, mutate):
+        before = row_values(obj) if obj.id else None
+        mutate(obj)
+        db.session.commit()
+        after = row_values(obj) if obj in db.session else None
+        apply_row_change(run, ConsumptionData, before, after)
+
+    # Wohnung 1: Zusatzablesungen mit Werten, die sich binär nicht exakt darstellen lassen
+    extra = [ConsumptionData(apartment_id=apt_ids[0], cost_type_id=ct_water, date=datetime(2024, month, 15),
+                             value=0.1 * month) for month in range(4, 10)]
+    for reading in extra:
+        change(reading, db.session.add)
+    for reading in extra:
+        change(reading, lambda obj: setattr(obj, 'value', obj.value + 0.2))
+    for reading in extra[::2]:
+        change(reading, db.session.delete)
+    # Wohnung 2: alle Wasser-Ablesungen löschen bzw. aus dem Zeitraum schieben
+    readings = ConsumptionData.query.filter_by(apartment_id=apt_ids[1], cost_type_id=ct_water).all()
+    late = ConsumptionData(apartment_id=apt_ids[1], cost_type_id=ct_water, date=datetime(2024, 11, 3), value=0.3)
+    change(late, db.session.add)
+    for reading in readings:
+        change(reading, db.session.delete)
+    change(late, lambda obj: setattr(obj, 'date', datetime(2025, 1, 3)))
+
+    fresh = compute_billing_run(PS, PE, cost_items, building_id)
+    water, heating = run.items[1], run.items[3]
+    assert apt_ids[1] not in water['key_values'] and apt_ids[1] not in fresh.items[1]['key_values']
+    assert apt_ids[1] not in water['allocation']
+    assert water['weight_total'] == round(sum(fresh.items[1]['key_values'].values()), 6)
+    assert heating['parts'][0]['key_values'].keys() == fresh.items[3]['parts'][0]['key_values'].keys()
+    assert_same_run(run, fresh)
@@ -0,0 +1,125 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.models import (
+    Building, Apartment, Tenant, Contract, CostType, ApartmentShare, ConsumptionData, OccupancyPeriod, Invoice,
+)
+from app.calculations import (
+    calculate_share_allocation,
+    calculate_consumption_allocation,
+    calculate_person_day_allocation,
+    calculate_direct_allocation,
+    calculate_combined_allocation,
+)
+from app.billing.engine import compute_billing_run
+from app.billing.routes import _preview_rows
+
+
+def setup_two_buildings():
+    """Zwei Häuser mit je zwei Wohnungen, Anteilen, Verbrauch, Belegung und Direktkosten."""
+    ct_share = CostType(name='Grundsteuer Scope', unit='m²', type='share')
+    ct_water = CostType(name='Wasser Scope', unit='m³', type='consumption')
+    ct_trash = CostType(name='Müll Scope', unit='Pers.', type='person_days')
+    db.session.add_all([ct_share, ct_water, ct_trash])
+    houses = {}
+    for name in ('Nord', 'Süd'):
+        building = Building(name=f'Haus {name}')
+        db.session.add(building)
+        db.session.commit()
+        apartments = []
+        for i, size in enumerate((40.0, 60.0), start=1):
+            apt = Apartment(number=f'{name}-{i}', address=f'{name}weg {i}', size_sqm=size, building_id=building.id)
+            tenant = Tenant(name=f'Mieter {name} {i}', contact_info='scope@example.com')
+            db.session.add_all([apt, tenant])
+            db.session.commit()
+            contract = Contract(tenant_id=tenant.id, apartment_id=apt.id, start_date=date(2024, 1, 1), rent_amount=500.0)
+            db.session.add_all([
+                contract,
+                ApartmentShare(apartment_id=apt.id, cost_type_id=ct_share.id, value=size),
+                ConsumptionData(apartment_id=apt.id, cost_type_id=ct_water.id, date=datetime(2024, 6, 1), value=10.0 * i),
+                OccupancyPeriod(apartment_id=apt.id, start_date=date(2024, 1, 1), number_of_occupants=i),
+            ])
+            db.session.commit()
+            apartments.append((apt, contract))
+        houses[name] = (building, apartments)
+    nord_contract = houses['Nord'][1][0][1]
+    sued_contract = houses['Süd'][1][1][1]
+    db.session.add_all([
+        Invoice(invoice_number='D-N', date=date(2024, 5, 1), amount=50.0, cost_type_id=ct_share.id,
+                period_start=date(2024, 1, 1), period_end=date(2024, 12, 31), direct_allocation_contract_id=nord_contract.id),
+        Invoice(invoice_number='D-S', date=date(2024, 5, 1), amount=70.0, cost_type_id=ct_share.id,
+                period_start=date(2024, 1, 1), period_end=date(2024, 12, 31), direct_allocation_contract_id=sued_contract.id),
+    ])
+    db.session.commit()
+    return houses, ct_share, ct_water, ct_trash
+
+
+def test_allocators_respect_building_scope(app_context):
+    houses, ct_share, ct_water, ct_trash = setup_two_buildings()
+    nord, (n1, n2) = houses['Nord'][0], [apt for apt, _ in houses['Nord'][1]]
+    s1, s2 = [apt for apt, _ in houses['Süd'][1]]
+    ps, pe = date(2024, 1, 1), date(2024, 12, 31)
+
+    assert calculate_share_allocation(ct_share.id, 100.0, building_id=nord.id) == {n1.id: 40.0, n2.id: 60.0}
+    assert calculate_consumption_allocation(ct_water.id, 90.0, ps, pe, building_id=nord.id) == {n1.id: 30.0, n2.id: 60.0}
+    assert calculate_person_day_allocation(ct_trash.id, 30.0, ps, pe, building_id=nord.id) == {n1.id: 10.0, n2.id: 20.0}
+    assert calculate_direct_allocation(ps, pe, building_id=nord.id) == {n1.id: 50.0}
+    combined = calculate_combined_allocation([
+        {'cost_type_id': ct_share.id, 'percentage': 50, 'total_cost_part': 100.0},
+        {'cost_type_id': ct_water.id, 'percentage': 50, 'total_cost_part': 90.0, 'period_start': ps, 'period_end': pe},
+    ], building_id=nord.id)
+    assert combined == {n1.id: 70.0, n2.id: 120.0}
+
+    # Ohne Scope wird weiterhin über alle Häuser verteilt
+    assert set(calculate_share_allocation(ct_share.id, 100.0)) == {n1.id, n2.id, s1.id, s2.id}
+    assert calculate_direct_allocation(ps, pe) == {n1.id: 50.0, s2.id: 70.0}
+
+
+@pytest.mark.parametrize('period', [(date(2024, 1, 1), date(2024, 12, 31)), (date(2024, 1, 15), date(2024, 12, 20))])
+def test_billing_run_and_preview_are_scoped_per_house(app_context, period):
+    houses, ct_share, ct_water, ct_trash = setup_two_buildings()
+    sued, sued_apartments = houses['Süd']
+    ps, pe = period
+    cost_items = [
+        {'cost_type_id': ct_share.id, 'total_cost': 100.0},
+        {'cost_type_id': ct_water.id, 'total_cost': 90.0},
+        {'cost_type_id': ct_trash.id, 'total_cost': 30.0},
+        {'type': 'direct'},
+    ]
+
+    run = compute_billing_run(ps, pe, cost_items, building_id=sued.id)
+    assert set(run.matrix) == {apt.id for apt, _ in sued_apartments}
+    # Jede Position wird vollständig auf die Wohnungen des Hauses verteilt
+    for item in run.items[:3]:
+        assert sum(item['allocation'].values()) == pytest.approx(item['total_cost'])
+
+    apt, contract = sued_apartments[1]
+    rows, total = _preview_rows(contract.id, ps, pe, cost_items)
+    assert total == pytest.approx(sum(run.matrix[apt.id]))
+    assert total == pytest.approx(60.0 + 60.0 + 20.0 + 70.0)
+
+
+def test_wizard_sums_invoices_of_contract_building(client):
+    """Der Wizard verteilt nur die Rechnungen des Hauses, zu dem der Vertrag gehört."""
+    houses, ct_share, _, _ = setup_two_buildings()
+    nord, sued = houses['Nord'][0], houses['Süd'][0]
+    _, contract = houses['Süd'][1][1]  # 60 von 100 m² im Haus Süd
+    db.session.add_all([
+        Invoice(invoice_number='G-N', date=date(2024, 3, 1), amount=100.0, cost_type_id=ct_share.id,
+                period_start=date(2024, 1, 1), period_end=date(2024, 12, 31), building_id=nord.id),
+        Invoice(invoice_number='G-S', date=date(2024, 3, 1), amount=400.0, cost_type_id=ct_share.id,
+                period_start=date(2024, 1, 1), period_end=date(2024, 12, 31), building_id=sued.id),
+    ])
+    db.session.commit()
+
+    resp = client.post('/billing/wizard', data={
+        'step': '2', 'action': 'preview', 'contract_id': str(contract.id),
+        'period_start': '2024-01-01', 'period_end': '2024-12-31', 'share_ids': [str(ct_share.id)],
+    })
+    html = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert '400,00 €' in html  # Rechnungssumme nur Haus Süd, nicht 500,00 €
+    assert '240,00 €' in html
+    assert '500,00 €' not in html
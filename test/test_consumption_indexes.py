@@ -0,0 +1,74 @@
+from datetime import date, datetime
+
+from sqlalchemy import event, func, text
+
+from app import db
+from app.models import Apartment, CostType, ConsumptionData
+from app.calculations import get_consumption_totals
+
+
+def setup_consumption():
+    apts = [Apartment(number=f'IX-{i}', address=f'Indexweg {i}', size_sqm=40.0) for i in range(1, 4)]
+    ct_water = CostType(name='Wasser Index', unit='m³', type='consumption')
+    ct_heat = CostType(name='Heizung Index', unit='kWh', type='consumption')
+    db.session.add_all(apts + [ct_water, ct_heat])
+    db.session.commit()
+    for apt in apts:
+        for month in range(1, 13):
+            for ct in (ct_water, ct_heat):
+                db.session.add(ConsumptionData(apartment_id=apt.id, cost_type_id=ct.id,
+                                               date=datetime(2024, month, 1), value=float(month)))
+    db.session.commit()
+    return apts, ct_water
+
+
+def explain(statement, parameters):
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return ' | '.join(row[-1] for row in rows)
+
+
+def test_consumption_indexes_exist(app_context):
+    names = {row[0] for row in db.session.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'consumption_data'"
+    ))}
+    assert 'ix_consumption_data_cost_type_date_apartment' in names
+    assert 'ix_consumption_data_apartment_cost_type_date' in names
+
+
+def test_allocation_query_uses_cost_type_date_index(app_context):
+    apts, ct_water = setup_consumption()
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'consumption_data' in statement:
+            captured.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        # Nicht monatsgenauer Zeitraum: Aggregation über die Rohdaten
+        totals = get_consumption_totals(ct_water.id, date(2024, 1, 15), date(2024, 12, 20))
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    assert totals[apts[0].id] > 0
+    assert len(captured) == 1
+    plan = explain(*captured[0])
+    assert 'ix_consumption_data_cost_type_date_apartment' in plan
+    assert 'SCAN consumption_data' not in plan
+
+
+def test_per_apartment_query_uses_apartment_index(app_context):
+    apts, ct_water = setup_consumption()
+
+    query = db.session.query(func.sum(ConsumptionData.value)).filter(
+        ConsumptionData.apartment_id == apts[1].id,
+        ConsumptionData.cost_type_id == ct_water.id,
+        ConsumptionData.date >= date(2024, 1, 1),
+        ConsumptionData.date <= date(2024, 12, 31),
+    )
+    compiled = query.statement.compile(db.engine)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    plan = explain(str(compiled), parameters)
+    assert 'ix_consumption_data_apartment_cost_type_date' in plan
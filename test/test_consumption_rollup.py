@@ -0,0 +1,142 @@
+import io
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.models import Apartment, CostType, ConsumptionData, ConsumptionMonthly, Meter
+from app.calculations import get_consumption_totals
+from app.consumption_rollup import is_month_aligned, monthly_series, rebuild_rollup
+from app.import_data import import_consumption_csv
+
+
+@pytest.fixture
+def setup_rollup_base(test_db):
+    """Erstellt zwei Wohnungen und eine Verbrauchs-Kostenart für die Tests des Monats-Rollups."""
+    apts = [Apartment(number=f'RU-{i}', address=f'Rollupweg {i}', size_sqm=40.0) for i in range(1, 3)]
+    ct = CostType(name='Wasser Rollup', unit='m³', type='consumption')
+    test_db.session.add_all(apts + [ct])
+    test_db.session.commit()
+
+    # Nummern und Name für den CSV-Import
+    return {
+        'apt_ids': [apt.id for apt in apts],
+        'apt_numbers': [apt.number for apt in apts],
+        'ct_id': ct.id,
+        'ct_name': ct.name,
+    }
+
+
+def bucket(apartment_id, cost_type_id, month):
+    """Rollup-Zeile einer Wohnung und Kostenart für einen Monat (oder None)."""
+    return ConsumptionMonthly.query.filter_by(apartment_id=apartment_id, cost_type_id=cost_type_id, month=month).first()
+
+
+def test_is_month_aligned():
+    """Testet die Erkennung ganzer Kalendermonate."""
+    assert is_month_aligned(date(2024, 1, 1), date(2024, 12, 31))
+    assert is_month_aligned(date(2024, 2, 1), date(2024, 2, 29))
+    assert not is_month_aligned(date(2024, 1, 2), date(2024, 12, 31))
+    assert not is_month_aligned(date(2024, 1, 1), date(2024, 12, 30))
+
+
+def test_orm_writes_maintain_rollup(setup_rollup_base):
+    """Testet, dass Einfügen, Verschieben und Löschen über die Session das Rollup fortschreiben."""
+    data = setup_rollup_base
+    apt_ids, ct_id = data['apt_ids'], data['ct_id']
+    db.session.add_all([
+        ConsumptionData(apartment_id=apt_ids[0], cost_type_id=ct_id, date=datetime(2024, 1, 5), value=3.0),
+        ConsumptionData(apartment_id=apt_ids[0], cost_type_id=ct_id, date=datetime(2024, 1, 31), value=5.0),
+        ConsumptionData(apartment_id=apt_ids[0], cost_type_id=ct_id, date=datetime(2024, 2, 1), value=2.0),
+    ])
+    db.session.commit()
+    extra = ConsumptionData(apartment_id=apt_ids[0], cost_type_id=ct_id, date=datetime(2024, 1, 20), value=1.0)
+    db.session.add(extra)
+    db.session.commit()
+
+    jan = bucket(apt_ids[0], ct_id, date(2024, 1, 1))
+    assert (jan.total, jan.count, jan.min_value, jan.max_value) == (9.0, 3, 1.0, 5.0)
+    assert bucket(apt_ids[0], ct_id, date(2024, 2, 1)).total == 2.0
+
+    # Änderung verschiebt den Wert in einen anderen Monat, Löschung berechnet neu
+    extra.date = datetime(2024, 2, 10)
+    db.session.commit()
+    jan = bucket(apt_ids[0], ct_id, date(2024, 1, 1))
+    assert (jan.total, jan.count, jan.min_value) == (8.0, 2, 3.0)
+    assert bucket(apt_ids[0], ct_id, date(2024, 2, 1)).count == 2
+
+    db.session.delete(extra)
+    db.session.commit()
+    feb = bucket(apt_ids[0], ct_id, date(2024, 2, 1))
+    assert (feb.total, feb.count, feb.max_value) == (2.0, 1, 2.0)
+
+
+def test_consumption_totals_rollup_matches_raw(setup_rollup_base):
+    """Testet, dass Summen aus dem Rollup und aus den Rohdaten übereinstimmen."""
+    data = setup_rollup_base
+    apt_ids, ct_id = data['apt_ids'], data['ct_id']
+    for month in range(1, 13):
+        db.session.add(ConsumptionData(apartment_id=apt_ids[0], cost_type_id=ct_id, date=datetime(2024, month, 28), value=float(month)))
+        db.session.add(ConsumptionData(apartment_id=apt_ids[1], cost_type_id=ct_id, date=datetime(2024, month, 1), value=2.0))
+    db.session.commit()
+
+    from_rollup = get_consumption_totals(ct_id, date(2024, 1, 1), date(2024, 12, 31))
+    assert from_rollup == {apt_ids[0]: pytest.approx(78.0), apt_ids[1]: pytest.approx(24.0)}
+    # Gleicher Zeitraum über die Rohdaten (ein Tag früher beginnend, ohne Einträge am 31.12.)
+    from_raw = get_consumption_totals(ct_id, date(2023, 12, 31), date(2024, 12, 31))
+    assert from_raw == from_rollup
+    # Der Endtag zählt vollständig mit
+    assert get_consumption_totals(ct_id, date(2024, 3, 2), date(2024, 3, 28)) == {apt_ids[0]: pytest.approx(3.0)}
+
+
+def test_write_paths_update_rollup(setup_rollup_base, client):
+    """Testet CSV-Import, manuelle Erfassung und Zählerstände als Schreibwege ins Rollup."""
+    data = setup_rollup_base
+    apt_ids, ct_id = data['apt_ids'], data['ct_id']
+
+    csv_data = io.BytesIO(
+        f"apartment_number,cost_type_name,date,value\n"
+        f"{data['apt_numbers'][0]},{data['ct_name']},2024-04-03,7.5\n".encode('utf-8')
+    )
+    assert import_consumption_csv(csv_data)['processed_rows'] == 1
+
+    client.post('/manual_entry/consumption', data={
+        'apartment_id': apt_ids[0], 'cost_type_id': ct_id, 'date': date(2024, 4, 20), 'value': 2.5,
+    }, follow_redirects=True)
+
+    meter = Meter(apartment_id=apt_ids[1], meter_type='Wasser', serial_number='SN-ROLLUP', unit='m³')
+    db.session.add(meter)
+    db.session.commit()
+    client.post('/meters/readings/new', data={'meter_id': meter.id, 'date': date(2024, 4, 30), 'value': 4.0},
+                follow_redirects=True)
+    client.post('/meters/readings/bulk', data={
+        'apartment_id': apt_ids[1], 'date': '2024-05-01', f'value_{meter.id}': '6.0',
+    }, follow_redirects=True)
+
+    assert bucket(apt_ids[0], ct_id, date(2024, 4, 1)).total == pytest.approx(10.0)
+    assert bucket(apt_ids[1], ct_id, date(2024, 4, 1)).total == pytest.approx(4.0)
+    assert bucket(apt_ids[1], ct_id, date(2024, 5, 1)).total == pytest.approx(6.0)
+
+
+def test_rebuild_command_and_dashboard(setup_rollup_base, client, runner):
+    """Testet den Neuaufbau per CLI nach Schreibzugriffen an der Session vorbei."""
+    data = setup_rollup_base
+    apt_ids, ct_id = data['apt_ids'], data['ct_id']
+    # Schreibzugriff an der Session vorbei: Rollup ist danach veraltet
+    db.session.execute(text(
+        "INSERT INTO consumption_data (apartment_id, cost_type_id, date, value, entry_type) "
+        "VALUES (:apt, :ct, '2024-06-15 00:00:00.000000', 11.0, 'csv_import')"
+    ), {'apt': apt_ids[0], 'ct': ct_id})
+    db.session.commit()
+    assert monthly_series() == []
+
+    result = runner.invoke(args=['consumption', 'rebuild-rollup'])
+    assert result.exit_code == 0, result.output
+    assert 'Rollup neu aufgebaut: 1 Monatswerte.' in result.output
+    assert monthly_series() == [(date(2024, 6, 1), 11.0)]
+    assert rebuild_rollup() == 1
+
+    resp = client.get('/')
+    assert resp.status_code == 200
+    assert '2024-06' in resp.get_data(as_text=True)
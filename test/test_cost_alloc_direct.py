@@ -1,6 +1,9 @@
 from app import db
 from app.models import Apartment, Tenant, Contract, Invoice, CostType
+from sqlalchemy import event
 from app.calculations import calculate_direct_allocation
+from app.allocation_kernel import ROUNDING_LARGEST_REMAINDER
+from app.billing.engine import compute_billing_run
 from datetime import date
 
 
@@ -56,3 +59,36 @@ def test_direct_allocation_excludes_outside_period(client):
     assert result.get(apt.id, 0.0) == 0.0
 
 
+
+
+def test_direct_allocation_is_single_statement(client):
+    contracts = [setup_contract(f'A-DIR-N{i}', f'Nplus1 {i}', date(2024, 1, 1)) for i in range(5)]
+    ct = CostType(name='Direktkosten-N', unit='€', type='share')
+    db.session.add(ct)
+    db.session.commit()
+    for i, (apt, _, contract) in enumerate(contracts):
+        for j in range(3):
+            db.session.add(Invoice(invoice_number=f'D-N{i}-{j}', date=date(2024, 2, 1), amount=10.1 * (j + 1),
+                                   cost_type_id=ct.id, period_start=date(2024, 1, 1), period_end=date(2024, 1, 31),
+                                   direct_allocation_contract_id=contract.id))
+    db.session.commit()
+    apartment_ids = [apt.id for apt, _, _ in contracts]
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        per_share = calculate_direct_allocation(date(2024, 1, 1), date(2024, 12, 31))
+        cents = calculate_direct_allocation(date(2024, 1, 1), date(2024, 12, 31), rounding=ROUNDING_LARGEST_REMAINDER)
+        run = compute_billing_run(date(2024, 1, 1), date(2024, 12, 31), [{'type': 'direct'}])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    # Eine Abfrage je Aufruf, unabhängig von der Anzahl Rechnungen/Verträge
+    assert len([statement for statement in statements if 'FROM invoice' in statement]) == 3
+    assert per_share == {apt_id: 60.6 for apt_id in apartment_ids}
+    assert cents == {apt_id: 60.6 for apt_id in apartment_ids}
+    assert run.items[0]['allocation'] == cents
@@ -0,0 +1,111 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.models import Apartment, CostType, ApartmentShare, ConsumptionData
+from app.allocation_kernel import (
+    allocate_columns,
+    sum_allocations,
+    ROUNDING_PER_SHARE,
+    ROUNDING_LARGEST_REMAINDER,
+)
+from app.calculations import (
+    calculate_share_allocation,
+    calculate_combined_allocation,
+    calculate_heating_allocation,
+)
+from app.billing.engine import compute_billing_run
+
+
+def cents_sum(allocation):
+    return round(sum(allocation.values()) * 100)
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'python'])
+def test_largest_remainder_distributes_exact_cents(backend):
+    if backend == 'numpy':
+        pytest.importorskip('numpy')
+    result = allocate_columns([1, 2, 3], [1.0, 1.0, 1.0], 100.0, backend=backend, rounding=ROUNDING_LARGEST_REMAINDER)
+    # Der übrige Cent geht bei Gleichstand an die kleinere Wohnungs-ID
+    assert result == {1: 33.34, 2: 33.33, 3: 33.33}
+
+    per_share = allocate_columns([1, 2, 3], [1.0, 1.0, 1.0], 100.0, backend=backend, rounding=ROUNDING_PER_SHARE)
+    assert cents_sum(per_share) == 9999
+
+
+def test_largest_remainder_ignores_non_positive_weights():
+    result = allocate_columns([1, 2, 3], [2.0, 0.0, 1.0], 10.0, rounding=ROUNDING_LARGEST_REMAINDER)
+    assert result == {1: 6.67, 2: 0.0, 3: 3.33}
+
+
+def test_sum_allocations_in_cents():
+    partials = [{1: 33.34, 2: 33.33, 3: 33.33}, {1: 0.01, 2: 0.0}]
+    assert sum_allocations(partials, rounding=ROUNDING_LARGEST_REMAINDER) == {1: 33.35, 2: 33.33, 3: 33.33}
+
+
+def test_unknown_rounding_mode_raises():
+    with pytest.raises(ValueError):
+        allocate_columns([1], [1.0], 10.0, rounding='banker')
+
+
+def setup_apartments():
+    apts = [Apartment(number=f'LR-{i}', address=f'Reststr {i}', size_sqm=30.0) for i in range(1, 4)]
+    db.session.add_all(apts)
+    db.session.commit()
+
+    ct_share = CostType(name='Fläche LR', unit='m²', type='share')
+    ct_share_2 = CostType(name='MEA LR', unit='‰', type='share')
+    ct_heat = CostType(name='Heizung LR', unit='kWh', type='consumption')
+    ct_water = CostType(name='Warmwasser LR', unit='m³', type='consumption')
+    db.session.add_all([ct_share, ct_share_2, ct_heat, ct_water])
+    db.session.commit()
+
+    for apt, (area, mea) in zip(apts, [(1.0, 7.0), (1.0, 11.0), (1.0, 13.0)]):
+        db.session.add(ApartmentShare(apartment_id=apt.id, cost_type_id=ct_share.id, value=area))
+        db.session.add(ApartmentShare(apartment_id=apt.id, cost_type_id=ct_share_2.id, value=mea))
+    for apt, (heat, water) in zip(apts, [(13.0, 3.0), (17.0, 7.0), (19.0, 11.0)]):
+        db.session.add(ConsumptionData(apartment_id=apt.id, cost_type_id=ct_heat.id, date=datetime(2024, 2, 1), value=heat))
+        db.session.add(ConsumptionData(apartment_id=apt.id, cost_type_id=ct_water.id, date=datetime(2024, 2, 1), value=water))
+    db.session.commit()
+    return apts, ct_share, ct_share_2, ct_heat, ct_water
+
+
+def test_allocators_select_rounding_per_call(client):
+    apts, ct_share, ct_share_2, ct_heat, ct_water = setup_apartments()
+
+    per_share = calculate_share_allocation(ct_share.id, 100.0)
+    exact = calculate_share_allocation(ct_share.id, 100.0, rounding=ROUNDING_LARGEST_REMAINDER)
+    assert cents_sum(per_share) == 9999
+    assert cents_sum(exact) == 10000
+
+    rules = [
+        {'cost_type_id': ct_share.id, 'percentage': 60, 'total_cost_part': 100.0},
+        {'cost_type_id': ct_share_2.id, 'percentage': 40, 'total_cost_part': 55.55},
+    ]
+    combined = calculate_combined_allocation(rules, rounding=ROUNDING_LARGEST_REMAINDER)
+    assert cents_sum(combined) == 15555
+
+    heating = calculate_heating_allocation(
+        total_cost=1234.57,
+        hot_water_percentage=30.0,
+        heating_consumption_cost_type_id=ct_heat.id,
+        hot_water_consumption_cost_type_id=ct_water.id,
+        period_start=date(2024, 1, 1),
+        period_end=date(2024, 12, 31),
+        rounding=ROUNDING_LARGEST_REMAINDER,
+    )
+    assert cents_sum(heating) == 123457
+
+
+def test_billing_run_uses_configured_rounding(app_context):
+    apts, ct_share, *_ = setup_apartments()
+    cost_items = [{'cost_type_id': ct_share.id, 'total_cost': 100.0}]
+
+    run = compute_billing_run(date(2024, 1, 1), date(2024, 12, 31), cost_items)
+    assert run.rounding == ROUNDING_LARGEST_REMAINDER
+    assert cents_sum(run.items[0]['allocation']) == 10000
+
+    app_context.config['BILLING_ROUNDING'] = ROUNDING_PER_SHARE
+    run = compute_billing_run(date(2024, 1, 1), date(2024, 12, 31), cost_items)
+    assert cents_sum(run.items[0]['allocation']) == 9999
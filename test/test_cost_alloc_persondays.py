@@ -1,9 +1,10 @@
 import pytest
 from datetime import date, timedelta
 from app import db
-from app.models import Apartment, OccupancyPeriod, CostType
+from app.models import Apartment, OccupancyPeriod, CostType, Building
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
-from app.calculations import calculate_person_days, calculate_person_day_allocation
+from app.calculations import calculate_person_days, calculate_person_day_allocation, get_person_days_by_apartment
 
 def test_create_occupancy_period(client, test_db):
     """Testet die erfolgreiche Erstellung einer OccupancyPeriod."""
@@ -239,4 +240,45 @@ def test_calculate_person_day_allocation_total_zero_days(client, test_db):
 
     assert len(allocation) == 2
     assert allocation[apt1.id] == 0.00
-    assert allocation[apt2.id] == 0.00 
\ No newline at end of file
+    assert allocation[apt2.id] == 0.00 
+def test_get_person_days_by_apartment_single_statement_per_building(client, test_db):
+    """Testet die SQL-Aggregation: geklemmte Überlappungen, Gebäudefilter, eine Abfrage."""
+    house_a = Building(name='PT Haus A')
+    house_b = Building(name='PT Haus B')
+    db.session.add_all([house_a, house_b])
+    db.session.commit()
+    apt1 = Apartment(number='PT 1', address='PT St 1', size_sqm=50.0, building_id=house_a.id)
+    apt2 = Apartment(number='PT 2', address='PT St 2', size_sqm=50.0, building_id=house_a.id)
+    apt3 = Apartment(number='PT 3', address='PT St 3', size_sqm=50.0, building_id=house_b.id)
+    db.session.add_all([apt1, apt2, apt3])
+    db.session.commit()
+    db.session.add_all([
+        # Beginnt vor dem Zeitraum: 1.1.-31.1. = 31 Tage x 2
+        OccupancyPeriod(apartment_id=apt1.id, start_date=date(2023, 12, 1), end_date=date(2024, 1, 31), number_of_occupants=2),
+        # Läuft offen weiter: 1.12.-31.12. = 31 Tage x 1
+        OccupancyPeriod(apartment_id=apt1.id, start_date=date(2024, 12, 1), number_of_occupants=1),
+        # Schaltjahr, Februar komplett: 29 Tage x 3
+        OccupancyPeriod(apartment_id=apt3.id, start_date=date(2024, 2, 1), end_date=date(2024, 2, 29), number_of_occupants=3),
+        # Außerhalb des Zeitraums
+        OccupancyPeriod(apartment_id=apt2.id, start_date=date(2025, 1, 1), end_date=date(2025, 2, 1), number_of_occupants=4),
+    ])
+    db.session.commit()
+    building_id = house_a.id
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        building_days = get_person_days_by_apartment(date(2024, 1, 1), date(2024, 12, 31), building_id=building_id)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    assert len(statements) == 1
+    assert building_days == {apt1.id: 31 * 2 + 31, apt2.id: 0}
+    assert get_person_days_by_apartment(date(2024, 1, 1), date(2024, 12, 31)) == {
+        apt1.id: 93, apt2.id: 0, apt3.id: 87,
+    }
+    assert calculate_person_days(apt3.id, date(2024, 2, 15), date(2024, 3, 31)) == 15 * 3
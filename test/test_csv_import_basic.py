@@ -88,4 +88,75 @@ def test_csv_import_missing_header(setup_db_for_import):
     
     assert result['processed_rows'] == 0 
     assert result['skipped_rows'] == -1 # Spezialwert für Header-Fehler
-    assert ConsumptionData.query.count() == 0 # Nichts importiert 
\ No newline at end of file
+    assert ConsumptionData.query.count() == 0 # Nichts importiert 
+
+def test_csv_import_chunked_bulk_insert(setup_db_for_import):
+    """Testet den Import über mehrere Batches: konstante Anzahl Abfragen, Rollup gepflegt, Durchsatz im Ergebnis."""
+    from datetime import date
+    from sqlalchemy import event
+    from app.models import ConsumptionMonthly
+
+    test_db = setup_db_for_import
+    lines = ["apartment_number,cost_type_name,date,value"]
+    for day in range(1, 26):
+        lines.append(f"Top 1,Heizung,2023-03-{day:02d},1.0")
+        lines.append(f"Top 2,Wasser,2023-03-{day:02d},2.0")
+    lines.append("Top 9,Heizung,2023-03-01,1.0")
+    csv_stream = io.StringIO("\n".join(lines))
+
+    statements = []
+
+    def count_selects(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(test_db.engine, 'before_cursor_execute', count_selects)
+    try:
+        result = import_consumption_csv(csv_stream, chunk_size=7)
+    finally:
+        event.remove(test_db.engine, 'before_cursor_execute', count_selects)
+
+    assert result['processed_rows'] == 50
+    assert result['skipped_rows'] == 1
+    assert result['rows_per_second'] > 0
+    # Nur die beiden Nachschlage-Abfragen, keine Abfrage pro Zeile
+    assert len(statements) == 2
+    assert ConsumptionData.query.count() == 50
+    assert ConsumptionData.query.first().entry_type == 'csv_import'
+    heizung = ConsumptionMonthly.query.join(CostType).filter(CostType.name == 'Heizung', ConsumptionMonthly.month == date(2023, 3, 1)).one()
+    assert (heizung.total, heizung.count) == (25.0, 25)
+
+
+class NoSlurpBytesIO(io.BytesIO):
+    """BytesIO, das ein vollständiges Einlesen (read() ohne Größe) verweigert."""
+
+    def read(self, size=-1):
+        assert size is not None and size >= 0, "Stream wurde vollständig eingelesen"
+        return super().read(size)
+
+    def read1(self, size=-1):
+        assert size is not None and size >= 0, "Stream wurde vollständig eingelesen"
+        return super().read1(size)
+
+
+def test_csv_import_streams_binary_upload_in_batches(setup_db_for_import):
+    """Testet den Streaming-Import eines Uploads (FileStorage) mit Commit und Fortschritt je Batch."""
+    from werkzeug.datastructures import FileStorage
+
+    lines = ["apartment_number,cost_type_name,date,value"]
+    lines += [f"Top {1 + i % 2},Heizung,2023-05-{1 + i % 28:02d},{i}.5" for i in range(23)]
+    # mit BOM, wie von Excel exportiert
+    stream = NoSlurpBytesIO(("\ufeff" + "\n".join(lines)).encode('utf-8'))
+    upload = FileStorage(stream=stream, filename='verbrauch.csv', content_type='text/csv')
+
+    progress = []
+    result = import_consumption_csv(upload, chunk_size=10, progress_callback=progress.append)
+
+    assert result['processed_rows'] == 23
+    assert result['skipped_rows'] == 0
+    assert [p['batch'] for p in progress] == [1, 2, 3]
+    assert [p['processed_rows'] for p in progress] == [10, 20, 23]
+    assert progress[-1]['row_num'] == 24
+    assert ConsumptionData.query.count() == 23
+    # Der Stream des Aufrufers bleibt offen
+    assert not stream.closed
@@ -83,4 +83,16 @@ def test_import_tenant_csv_unexpected_header(test_db, client):
     assert david is not None
     assert david.contact_info == "david@art.com"
     # Prüfen, dass das unerwartete Feld ignoriert wurde (kein Attribut 'Unerwartet')
-    assert not hasattr(david, 'Unerwartet') 
\ No newline at end of file
+    assert not hasattr(david, 'Unerwartet') 
+
+def test_import_tenant_csv_binary_stream_batches(test_db, client):
+    """Testet den Import aus einem Binär-Stream mit Commit je Batch."""
+    csv_content = "Name,Kontaktinfo\n" + "\n".join(f"Mieter {i},m{i}@mail.de" for i in range(5))
+    progress = []
+
+    result = import_tenant_csv(io.BytesIO(csv_content.encode('utf-8')), chunk_size=2, progress_callback=progress.append)
+
+    assert result['processed_rows'] == 5
+    assert result['skipped_rows'] == 0
+    assert [p['processed_rows'] for p in progress] == [2, 4, 5]
+    assert Tenant.query.filter(Tenant.name.like('Mieter %')).count() == 5
@@ -0,0 +1,167 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.models import Apartment, Building, ConsumptionData, CostType, DashboardStat, Invoice, Tenant
+from app.consumption_rollup import rebuild_rollup
+from app.dashboard_stats import REFRESHED_KEY, dashboard_snapshot, refresh_dashboard_stats
+from app.profiling import record_queries
+
+
+@pytest.fixture
+def setup_dashboard_base(test_db):
+    """Erstellt zwei Gebäude, eine Wohnung und zwei Kostenarten für die Tests der Startseiten-Kennzahlen."""
+    buildings = [Building(name='Kennzahl-Haus'), Building(name='Kennzahl-Nachbar')]
+    test_db.session.add_all(buildings)
+    test_db.session.commit()
+    apt = Apartment(number='K-1', address='Kennzahlweg 1', size_sqm=50.0, building_id=buildings[0].id)
+    ct_tax = CostType(name='Grundsteuer Kennzahl', unit='€', type='share')
+    ct_water = CostType(name='Wasser Kennzahl', unit='m³', type='consumption')
+    test_db.session.add_all([apt, ct_tax, ct_water])
+    test_db.session.commit()
+
+    return {
+        'building_ids': [building.id for building in buildings],
+        'apt_id': apt.id,
+        'ct_tax_id': ct_tax.id,
+        'ct_water_id': ct_water.id,
+    }
+
+
+def invoice(number, amount, cost_type_id, building_id):
+    """Rechnung für das Jahr 2024 (nicht gespeichert)."""
+    return Invoice(invoice_number=number, date=date(2024, 12, 15), amount=amount, cost_type_id=cost_type_id,
+                   period_start=date(2024, 1, 1), period_end=date(2024, 12, 31), building_id=building_id)
+
+
+def assert_matches_refresh():
+    """Vergleicht den fortgeschriebenen Schnappschuss mit einer vollständigen Neuberechnung."""
+    incremental = dashboard_snapshot()
+    refresh_dashboard_stats()
+    db.session.commit()
+    fresh = dashboard_snapshot()
+    assert incremental['counts'] == fresh['counts']
+    assert incremental['invoice_totals'] == pytest.approx(fresh['invoice_totals'])
+    assert [month for month, _ in incremental['consumption_by_month']] == \
+        [month for month, _ in fresh['consumption_by_month']]
+    assert [total for _, total in incremental['consumption_by_month']] == \
+        pytest.approx([total for _, total in fresh['consumption_by_month']])
+    return fresh
+
+
+def test_counters_follow_session_changes(setup_dashboard_base):
+    """Testet das Fortschreiben bei neuen, geänderten und gelöschten Rechnungen und Verbrauchswerten."""
+    data = setup_dashboard_base
+    building_ids, ct_tax_id, ct_water_id = data['building_ids'], data['ct_tax_id'], data['ct_water_id']
+
+    first = invoice('K-1', 1000.0, ct_tax_id, building_ids[0])
+    second = invoice('K-2', 250.0, ct_water_id, building_ids[1])
+    readings = [ConsumptionData(apartment_id=data['apt_id'], cost_type_id=ct_water_id, date=datetime(2024, month, 10),
+                                value=10.0 * month) for month in (1, 2, 2)]
+    db.session.add_all([first, second, Tenant(name='Kennzahl-Mieter', contact_info='k@example.com'), *readings])
+    db.session.commit()
+    snapshot = dashboard_snapshot()
+    assert snapshot['counts']['invoice'] == 2 and snapshot['counts']['tenant'] == 1
+    assert snapshot['invoice_totals'] == {ct_tax_id: 1000.0, ct_water_id: 250.0}
+    assert dashboard_snapshot(building_ids[1])['invoice_totals'] == {ct_water_id: 250.0}
+    assert snapshot['consumption_by_month'] == [(date(2024, 1, 1), 10.0), (date(2024, 2, 1), 40.0)]
+
+    # Betrag, Kostenart und Gebäude ändern, Eintrag löschen, Verbrauch in anderen Monat verschieben
+    first.amount = 1200.0
+    second.cost_type_id, second.building_id = ct_tax_id, building_ids[0]
+    readings[0].value = 15.0
+    readings[1].date = datetime(2024, 3, 5)
+    db.session.delete(readings[2])
+    db.session.commit()
+    snapshot = dashboard_snapshot()
+    assert snapshot['invoice_totals'] == {ct_tax_id: 1450.0}
+    assert dashboard_snapshot(building_ids[1])['invoice_totals'] == {}
+    assert snapshot['consumption_by_month'] == [(date(2024, 1, 1), 15.0), (date(2024, 3, 1), 20.0)]
+    assert_matches_refresh()
+
+    db.session.delete(first)
+    db.session.commit()
+    assert dashboard_snapshot()['counts']['invoice'] == 1
+    fresh = assert_matches_refresh()
+    assert fresh['invoice_totals'] == {ct_tax_id: 250.0}
+
+
+def test_snapshot_read_does_not_write(app_context):
+    """Testet, dass das Lesen des Schnappschusses eine Abfrage ist und nichts schreibt."""
+    with record_queries() as queries:
+        snapshot = dashboard_snapshot()
+    assert queries.count == 1
+    assert snapshot['refreshed_at'] is None and snapshot['counts']['building'] == 0
+    assert DashboardStat.query.count() == 0
+
+
+def test_bulk_statements_trigger_refresh_on_commit(setup_dashboard_base):
+    """Testet die Neuberechnung beim Commit nach ORM-Massenoperationen."""
+    data = setup_dashboard_base
+    building_ids, ct_tax_id = data['building_ids'], data['ct_tax_id']
+    db.session.add_all([invoice('K-B1', 100.0, ct_tax_id, building_ids[0]),
+                        invoice('K-B2', 200.0, data['ct_water_id'], building_ids[1])])
+    db.session.commit()
+
+    Invoice.query.filter_by(invoice_number='K-B1').update({'amount': 150.0})
+    Invoice.query.filter_by(invoice_number='K-B2').delete()
+    db.session.add(invoice('K-B3', 5.0, ct_tax_id, building_ids[1]))  # ausstehend, darf nicht doppelt zählen
+    db.session.commit()
+    snapshot = dashboard_snapshot()
+    assert snapshot['counts']['invoice'] == 2
+    assert snapshot['invoice_totals'] == {ct_tax_id: 155.0}
+    assert db.session.get(DashboardStat, REFRESHED_KEY) is not None
+    assert_matches_refresh()
+
+
+def test_savepoint_rollback_keeps_pending_refresh(setup_dashboard_base):
+    """Testet, dass ein zurückgerollter Savepoint die Neuberechnung für eine Massenoperation davor nicht verwirft."""
+    data = setup_dashboard_base
+    db.session.add(invoice('K-S1', 100.0, data['ct_tax_id'], data['building_ids'][0]))
+    db.session.commit()
+
+    Invoice.query.filter_by(invoice_number='K-S1').update({'amount': 175.0})
+    savepoint = db.session.begin_nested()
+    db.session.add(invoice('K-S2', 5.0, data['ct_tax_id'], data['building_ids'][0]))
+    db.session.flush()
+    savepoint.rollback()
+    db.session.commit()
+    assert dashboard_snapshot()['invoice_totals'] == {data['ct_tax_id']: 175.0}
+    assert_matches_refresh()
+
+
+def test_rollback_and_rebuild(setup_dashboard_base):
+    """Testet, dass ein Rollback die Kennzahlen zurücknimmt und der Rollup-Neuaufbau sie neu berechnet."""
+    data = setup_dashboard_base
+    db.session.add(invoice('K-R', 500.0, data['ct_tax_id'], data['building_ids'][0]))
+    db.session.flush()
+    db.session.rollback()
+    assert dashboard_snapshot()['counts']['invoice'] == 0
+
+    # Leere Tabelle (z. B. nach Änderungen direkt in der Datenbank): Rollup-Neuaufbau baut auch die Kennzahlen neu
+    DashboardStat.query.delete()
+    db.session.commit()
+    rebuild_rollup()
+    db.session.commit()
+    assert db.session.get(DashboardStat, REFRESHED_KEY) is not None
+    assert dashboard_snapshot()['counts']['building'] == 2
+
+
+def test_index_reads_snapshot(setup_dashboard_base, client, runner):
+    """Testet die CLI-Neuberechnung und die Startseite, die nur den Schnappschuss liest."""
+    data = setup_dashboard_base
+    db.session.add(invoice('K-I', 321.0, data['ct_tax_id'], data['building_ids'][0]))
+    db.session.commit()
+
+    result = runner.invoke(args=['dashboard', 'refresh'])
+    assert result.exit_code == 0, result.output
+    assert 'Startseiten-Kennzahlen neu berechnet' in result.output
+
+    with record_queries() as queries:
+        dashboard_snapshot()
+    assert queries.count == 1
+
+    html = client.get('/').get_data(as_text=True)
+    assert 'Grundsteuer Kennzahl' in html and '321.0' in html
+    assert 'Zuletzt aktualisiert' in html
@@ -0,0 +1,139 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app import db
+from app import import_data
+from app.models import Apartment, CostType, ConsumptionData, ImportJob
+from app.import_jobs import import_consumption_file, find_or_create_import_job, file_sha256
+
+
+@pytest.fixture
+def setup_import_data(test_db):
+    test_db.session.add_all([
+        Apartment(number='Job 1', address='Jobweg 1', size_sqm=50.0),
+        Apartment(number='Job 2', address='Jobweg 2', size_sqm=60.0),
+        CostType(name='Strom Job', unit='kWh', type='consumption'),
+    ])
+    test_db.session.commit()
+    return test_db
+
+
+def make_csv(rows=25, start_day=1):
+    lines = ["apartment_number,cost_type_name,date,value"]
+    for i in range(rows):
+        lines.append(f"Job {1 + i % 2},Strom Job,2024-01-{start_day + i // 2:02d},{i + 1}.0")
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def test_file_sha256_restores_position():
+    stream = io.BytesIO(b'abc')
+    stream.seek(2)
+    digest, size = file_sha256(stream)
+    assert size == 3
+    assert digest == 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'
+    assert stream.tell() == 2
+
+
+def test_import_job_resumes_after_failure(setup_import_data, monkeypatch):
+    data = make_csv(25)
+    original_insert = import_data._insert_consumption_chunk
+    calls = {'n': 0}
+
+    def failing_insert(rows):
+        calls['n'] += 1
+        if calls['n'] == 3:
+            raise RuntimeError('Verbindung verloren')
+        original_insert(rows)
+
+    monkeypatch.setattr(import_data, '_insert_consumption_chunk', failing_insert)
+    job = import_consumption_file(io.BytesIO(data), filename='strom.csv', chunk_size=10)
+
+    assert job.status == 'failed'
+    assert 'Verbindung verloren' in job.error
+    # Zwei Batches sind mit ihrem Checkpoint committet
+    assert job.last_committed_row == 21
+    assert job.processed_rows == 20
+    assert ConsumptionData.query.count() == 20
+    header_and_rows = data.split(b'\n')
+    assert job.byte_offset == sum(len(line) + 1 for line in header_and_rows[:21])
+
+    # Zweiter Lauf mit derselben Datei setzt am Checkpoint fort
+    monkeypatch.setattr(import_data, '_insert_consumption_chunk', original_insert)
+    resumed = import_consumption_file(io.BytesIO(data), chunk_size=10)
+
+    assert resumed.id == job.id
+    assert resumed.status == 'completed'
+    assert resumed.processed_rows == 25
+    assert resumed.duplicate_rows == 0
+    assert resumed.byte_offset == len(data)
+    assert ConsumptionData.query.count() == 25
+    assert sorted(v for (v,) in db.session.query(ConsumptionData.value)) == [float(i) for i in range(1, 26)]
+
+
+def test_reimport_is_noop_and_overlapping_files_are_deduplicated(setup_import_data, tmp_path):
+    path = tmp_path / 'strom.csv'
+    path.write_bytes(make_csv(10))
+
+    job = import_consumption_file(str(path), chunk_size=4)
+    assert job.status == 'completed'
+    assert job.filename == 'strom.csv'
+    assert ConsumptionData.query.count() == 10
+
+    again = import_consumption_file(str(path), chunk_size=4)
+    assert again.id == job.id
+    assert ConsumptionData.query.count() == 10
+    assert ImportJob.query.count() == 1
+
+    # Andere Datei (neuer Job) mit 10 bekannten und 4 neuen Zeilen
+    overlapping = make_csv(14) + b"Job 1,Strom Job,2024-01-01,99.0\n"
+    job2 = import_consumption_file(io.BytesIO(overlapping), chunk_size=4)
+    assert job2.id != job.id
+    assert job2.status == 'completed'
+    assert job2.processed_rows == 4
+    assert job2.duplicate_rows == 11
+    assert ConsumptionData.query.count() == 14
+
+
+def test_find_or_create_import_job_matches_hash(setup_import_data):
+    job = find_or_create_import_job(io.BytesIO(make_csv(3)), filename='a.csv')
+    same = find_or_create_import_job(io.BytesIO(make_csv(3)), filename='b.csv')
+    other = find_or_create_import_job(io.BytesIO(make_csv(4)))
+    assert same.id == job.id
+    assert other.id != job.id
+    assert job.status == 'pending'
+    assert job.byte_offset == 0
+
+
+def test_running_import_is_only_resumed_after_lease(setup_import_data, runner, tmp_path):
+    """Ein laufender Import wird erst übernommen, wenn sein letzter Checkpoint älter als die Lease-Zeit ist."""
+    runner.app.config['JOB_LEASE_SECONDS'] = 60
+    path = tmp_path / 'laufend.csv'
+    path.write_bytes(make_csv(6))
+    job = find_or_create_import_job(str(path))
+    job.status = 'running'
+    db.session.commit()
+
+    with pytest.raises(ValueError, match='läuft bereits'):
+        import_consumption_file(str(path), chunk_size=4)
+    result = runner.invoke(args=['consumption', 'import', str(path)])
+    assert result.exit_code == 1 and 'läuft bereits' in result.output
+    assert ConsumptionData.query.count() == 0
+
+    # Prozess abgestürzt: nach Ablauf der Lease setzt ein neuer Start fort
+    db.session.execute(update(ImportJob).where(ImportJob.id == job.id)
+                       .values(updated_at=datetime.utcnow() - timedelta(minutes=5)))
+    db.session.commit()
+    resumed = import_consumption_file(str(path), chunk_size=4)
+    assert resumed.id == job.id and resumed.status == 'completed'
+    assert ConsumptionData.query.count() == 6
+
+
+def test_cli_import_job(setup_import_data, runner, tmp_path):
+    path = tmp_path / 'cli.csv'
+    path.write_bytes(make_csv(6))
+    result = runner.invoke(args=['consumption', 'import', str(path), '--chunk-size', '4'])
+    assert result.exit_code == 0, result.output
+    assert 'completed (6 importiert, 0 übersprungen, 0 Duplikate)' in result.output
@@ -0,0 +1,180 @@
+import io
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import db
+from app.models import Apartment, CostType, ConsumptionData, Job
+from app.jobs import queue
+from app.jobs.queue import enqueue_job, claim_next_job, run_job, run_worker, job_result
+
+
+@pytest.fixture
+def job_app(client, tmp_path):
+    client.application.config['JOB_RESULTS_FOLDER'] = str(tmp_path)
+    return client
+
+
+@pytest.fixture
+def dummy_handlers(monkeypatch):
+    monkeypatch.setitem(queue.JOB_HANDLERS, 'echo', lambda job: {'params': queue.job_params(job)})
+
+    def fail(job):
+        raise RuntimeError('kaputt')
+    monkeypatch.setitem(queue.JOB_HANDLERS, 'fail', fail)
+
+
+def test_enqueue_rejects_unknown_kind(app_context):
+    with pytest.raises(ValueError):
+        enqueue_job('gibt_es_nicht')
+    assert Job.query.count() == 0
+
+
+def test_claim_is_fifo_and_exclusive(app_context, dummy_handlers):
+    first = enqueue_job('echo', {'n': 1})
+    second = enqueue_job('echo', {'n': 2})
+
+    claimed = claim_next_job('worker-a')
+    assert claimed.id == first.id
+    assert claimed.status == 'running'
+    assert claimed.worker_id == 'worker-a'
+    assert claim_next_job('worker-b').id == second.id
+    assert claim_next_job('worker-c') is None
+
+
+def test_run_job_stores_result_and_errors(app_context, dummy_handlers):
+    ok = enqueue_job('echo', {'n': 1})
+    bad = enqueue_job('fail')
+
+    assert run_worker(once=True, echo=lambda msg: None) == 2
+    ok, bad = db.session.get(Job, ok.id), db.session.get(Job, bad.id)
+    assert ok.status == 'completed'
+    assert job_result(ok) == {'params': {'n': 1}}
+    assert ok.finished_at is not None
+    assert bad.status == 'failed'
+    assert bad.error == 'kaputt'
+
+
+def test_warnings_are_computed_by_worker(job_app):
+    apt = Apartment(number='W-1', address='Warnweg 1', size_sqm=50.0)
+    ct = CostType(name='Wasser Warn', unit='m³', type='consumption')
+    db.session.add_all([apt, ct])
+    db.session.commit()
+    db.session.add(ConsumptionData(apartment_id=apt.id, cost_type_id=ct.id, date=datetime(2024, 3, 5), value=-1.0))
+    db.session.commit()
+
+    resp = job_app.get('/warnings/?start=2024-03-01&end=2024-03-31')
+    assert 'Für diesen Zeitraum liegt noch keine Prüfung vor.' in resp.get_data(as_text=True)
+
+    resp = job_app.post('/warnings/run', data={'start': '2024-03-01', 'end': '2024-03-31'})
+    assert resp.status_code == 302
+    job = Job.query.one()
+    run_job(claim_next_job())
+
+    result = job_result(db.session.get(Job, job.id))
+    assert result == {'missing_consumption': 1, 'invalid_consumption_values': 1, 'consumption_spikes': 0}
+    html = job_app.get('/warnings/?start=2024-03-01&end=2024-03-31').get_data(as_text=True)
+    assert f'Aufgabe #{job.id}' in html
+    # Die Zeilen lädt die Seite über die API nach
+    page = job_app.get('/warnings/api?start=2024-03-01&end=2024-03-31&kind=invalid_consumption_values').get_json()
+    assert page['items'][0]['date'] == '2024-03-05T00:00:00'
+    assert page['items'][0]['value'] == -1.0
+
+
+def test_consumption_upload_is_imported_by_cli_worker(job_app, runner, tmp_path):
+    db.session.add_all([
+        Apartment(number='U-1', address='Uploadweg 1', size_sqm=50.0),
+        CostType(name='Strom Upload', unit='kWh', type='consumption'),
+    ])
+    db.session.commit()
+    data = b"apartment_number,cost_type_name,date,value\nU-1,Strom Upload,2024-01-01,3.5\nU-1,Strom Upload,2024-01-02,4.5\n"
+
+    resp = job_app.post('/manual_entry/consumption/import',
+                        data={'file': (io.BytesIO(data), 'strom.csv')}, content_type='multipart/form-data')
+    assert resp.status_code == 302
+    assert ConsumptionData.query.count() == 0
+
+    result = runner.invoke(args=['jobs', 'worker', '--once'])
+    assert result.exit_code == 0, result.output
+    assert '1 Job(s) abgearbeitet.' in result.output
+
+    job = Job.query.one()
+    assert job.status == 'completed'
+    assert job_result(job)['processed_rows'] == 2
+    assert job.progress_current == job.progress_total == len(data)
+    assert ConsumptionData.query.count() == 2
+    assert not list((tmp_path / 'uploads').iterdir())
+
+    html = job_app.get(f'/jobs/{job.id}').get_data(as_text=True)
+    assert '2 importiert' in html
+    assert job_app.get('/jobs/').status_code == 200
+
+
+def test_stale_running_jobs_are_requeued_then_failed(app_context, runner, dummy_handlers):
+    """Ein Job, dessen Worker sich nicht mehr meldet, wird neu vergeben und nach zu vielen Versuchen aufgegeben."""
+    job = enqueue_job('echo', {'n': 1})
+    runner.app.config.update(JOB_LEASE_SECONDS=60, JOB_MAX_ATTEMPTS=2)
+
+    def expire_lease(job_id):
+        db.session.get(Job, job_id).heartbeat_at = datetime.utcnow() - timedelta(minutes=5)
+        db.session.commit()
+
+    dead = claim_next_job('worker-a')
+    assert dead.attempts == 1 and dead.heartbeat_at is not None
+    # Lease noch gültig: nichts neu zu vergeben
+    assert claim_next_job('worker-b') is None
+
+    expire_lease(job.id)
+    retried = claim_next_job('worker-b')
+    assert retried.id == job.id and retried.worker_id == 'worker-b' and retried.attempts == 2
+
+    # Der totgeglaubte Worker (anderer Prozess, alter Stand) meldet sich doch noch: sein Ergebnis wird verworfen
+    late = run_job(SimpleNamespace(id=job.id, kind='echo', worker_id='worker-a', params='{}'))
+    assert late.status == 'running' and late.worker_id == 'worker-b'
+
+    expire_lease(job.id)
+    result = runner.invoke(args=['jobs', 'requeue-stale'])
+    assert result.exit_code == 0, result.output
+    assert '0 Job(s) wieder eingereiht, 1 als fehlgeschlagen markiert.' in result.output
+    failed = db.session.get(Job, job.id)
+    assert failed.status == 'failed' and 'Worker ohne Rückmeldung' in failed.error
+    assert claim_next_job('worker-c') is None
+
+
+def test_long_running_handlers_renew_the_lease(job_app, monkeypatch):
+    """Warnungen und Import melden sich während der Arbeit, damit der Job nicht als verwaist neu vergeben wird."""
+    import app.validation
+    apt = Apartment(number='L-1', address='Leaseweg 1', size_sqm=50.0)
+    ct = CostType(name='Strom Lease', unit='kWh', type='consumption')
+    db.session.add_all([apt, ct])
+    db.session.commit()
+    job_app.application.config['JOB_LEASE_SECONDS'] = 60
+
+    def backdated_claim():
+        job = claim_next_job('worker-a')
+        job.heartbeat_at = datetime.utcnow() - timedelta(minutes=5)
+        db.session.commit()
+        return job
+
+    # Warnungen: während der Berechnung ist die Lease erneuert
+    original_generate = app.validation.generate_warnings
+    requeued_during_run = []
+
+    def slow_generate(**kwargs):
+        requeued_during_run.append(queue.requeue_stale_jobs())
+        return original_generate(**kwargs)
+
+    monkeypatch.setattr(app.validation, 'generate_warnings', slow_generate)
+    job = enqueue_job('warnings', {'period_start': '2024-01-01', 'period_end': '2024-01-31'})
+    assert run_job(backdated_claim()).status == 'completed'
+    assert requeued_during_run == [(0, 0)]
+
+    # Import: jeder Batch erneuert die Lease
+    started = datetime.utcnow()
+    upload = job_app.application.config['JOB_RESULTS_FOLDER'] + '/lease.csv'
+    with open(upload, 'wb') as fh:
+        fh.write(b"apartment_number,cost_type_name,date,value\nL-1,Strom Lease,2024-01-01,3.5\n")
+    job = enqueue_job('consumption_import', {'path': upload, 'filename': 'lease.csv'})
+    job = run_job(backdated_claim())
+    assert job.status == 'completed' and job.heartbeat_at >= started
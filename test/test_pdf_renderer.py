@@ -0,0 +1,147 @@
+import re
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.platypus import Table
+
+from app import create_app
+from app.pdf_generation import (
+    StatementRenderer, get_statement_renderer, render_statement_pdf, build_statement_payload, RENDERER_CANVAS,
+)
+
+HEADER = {'logo_path': '/nonexistent/logo.png', 'name': 'Renderer GmbH', 'address': 'Renderweg 1',
+          'contact': 'info@renderer.example'}
+
+
+def make_payload(contract_id=1, rows=None):
+    return {
+        'contract_id': contract_id,
+        'tenant_name': 'Rita Renderer',
+        'tenant_contact': 'Renderweg 2\n12345 Renderstadt',
+        'apartment_number': 'R-1',
+        'landlord_address': 'Vermieter GmbH\nMusterstraße 1',
+        'header': dict(HEADER),
+        'period_start': date(2024, 1, 1),
+        'period_end': date(2024, 12, 31),
+        'rows': rows if rows is not None else [
+            {'name': 'Grundsteuer', 'total_cost': 1000.0, 'key_desc': 'Anteil (m²: 50.0)', 'tenant_share': 250.0},
+            {'name': 'Unbekannt', 'total_cost': 10.0, 'key_desc': 'Fehler', 'tenant_share': 0.0, 'error': True},
+        ],
+    }
+
+
+def test_renderer_is_built_once_and_reused():
+    renderer = get_statement_renderer(dict(HEADER))
+    assert get_statement_renderer(dict(HEADER)) is renderer
+    assert get_statement_renderer({**HEADER, 'name': 'Andere GmbH'}) is not renderer
+    # Fehlendes Logo: ohne Logo rendern
+    assert renderer.logo is None
+
+    first = render_statement_pdf(make_payload(1))
+    second = render_statement_pdf(make_payload(2, rows=[]))
+    assert first.startswith(b'%PDF') and second.startswith(b'%PDF')
+
+
+def test_renderer_styles_are_not_shared_or_mutated():
+    renderer = StatementRenderer(HEADER)
+    alignments = {name: style.alignment for name, style in renderer.styles.items()}
+    renderer.render(make_payload())
+    renderer.render(make_payload())
+    assert {name: style.alignment for name, style in renderer.styles.items()} == alignments
+    # Datum rechtsbündig, Adressblock und Fließtext unverändert linksbündig
+    assert renderer.styles['date'].alignment == TA_RIGHT
+    assert renderer.styles['address'].alignment != TA_RIGHT
+    assert renderer.styles['body'].alignment != TA_RIGHT
+
+
+def page_count(pdf_bytes):
+    return len(re.findall(rb'/Type /Page[^s]', pdf_bytes))
+
+
+def test_canvas_fast_path_for_one_page_statements():
+    renderer = StatementRenderer(HEADER)
+    payload = make_payload()
+    operations = renderer.canvas_layout(payload)
+    texts = [op[5] for op in operations if op[0] == 'text']
+    assert 'Rita Renderer' in texts and 'Wohnung R-1' in texts
+    assert '250,00 €' in texts and 'Fehler' in texts and 'Summe' in texts
+    assert texts[-1] == 'Gesamtkosten für Sie: 250,00 €'
+
+    pdf_bytes = renderer.render({**payload, 'renderer': RENDERER_CANVAS})
+    assert pdf_bytes.startswith(b'%PDF')
+    assert page_count(pdf_bytes) == 1
+    # Ohne Kostenpositionen: Hinweis statt Tabelle
+    empty = [op[5] for op in renderer.canvas_layout(make_payload(rows=[])) if op[0] == 'text']
+    assert 'Keine Kostenpositionen zum Anzeigen vorhanden.' in empty
+
+
+def test_canvas_mode_falls_back_to_platypus_for_long_statements():
+    renderer = StatementRenderer(HEADER)
+    rows = [{'name': f'Kostenart {i}', 'total_cost': 100.0, 'key_desc': 'Anteil (m²: 1.0)', 'tenant_share': 1.0}
+            for i in range(60)]
+    payload = make_payload(rows=rows)
+    assert renderer.canvas_layout(payload) is None
+    pdf_bytes = renderer.render({**payload, 'renderer': RENDERER_CANVAS})
+    assert pdf_bytes.startswith(b'%PDF')
+    assert page_count(pdf_bytes) > 1
+
+
+def test_renderer_mode_comes_from_config():
+    contract = SimpleNamespace(id=7, tenant=SimpleNamespace(name='Konfig Mieter', contact_info=None),
+                               apartment=SimpleNamespace(number='K-1'))
+    for config, expected in (({}, 'platypus'), ({'PDF_RENDERER': 'canvas'}, 'canvas')):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'TESTING': True, **config})
+        with app.app_context():
+            payload = build_statement_payload(contract, [], date(2024, 1, 1), date(2024, 12, 31))
+        assert payload['renderer'] == expected
+        assert render_statement_pdf(payload).startswith(b'%PDF')
+
+
+def platypus_row_tops(renderer, payload, monkeypatch):
+    """Oberkanten der Tabellenzeilen, wie Platypus die Tabelle tatsächlich zeichnet."""
+    drawn = []
+    original = Table.drawOn
+
+    def record(table, canvas, x, y, *args, **kwargs):
+        drawn.append([y + position for position in table._rowpositions[:-1]])
+        return original(table, canvas, x, y, *args, **kwargs)
+
+    monkeypatch.setattr(Table, 'drawOn', record)
+    pdf_bytes = renderer.render_platypus(payload)
+    monkeypatch.setattr(Table, 'drawOn', original)
+    return drawn, pdf_bytes
+
+
+def test_canvas_layout_matches_platypus_rows_and_pages(monkeypatch):
+    """Zeilenhöhen (Zellstile, Umbrüche, Markup) und Seitenumbruch stimmen mit Platypus überein."""
+    renderer = StatementRenderer(HEADER)
+    rows = [
+        {'name': 'Wasser &amp; Abwasser', 'total_cost': 1200.0, 'key_desc': 'Verbrauch (m³: 12.5)', 'tenant_share': 300.0},
+        {'name': 'Gebäudeversicherung einschließlich Elementarschäden und Glasbruch', 'total_cost': 800.0,
+         'key_desc': 'Anteil nach Wohnfläche, Kellerfläche und Gartennutzung (m²: 62.0)', 'tenant_share': 99.5},
+        {'name': '<b>Hauswart</b>', 'total_cost': 500.0, 'key_desc': 'Anteil (m²: 50.0)', 'tenant_share': 50.0},
+        {'name': 'Unbekannt', 'total_cost': 10.0, 'key_desc': 'Fehler', 'tenant_share': 0.0, 'error': True},
+    ]
+    payload = make_payload(rows=rows)
+    operations = renderer.canvas_layout(payload)
+    canvas_tops = [op[3] for op in operations if op[0] == 'grid']
+    drawn, _ = platypus_row_tops(renderer, payload, monkeypatch)
+    assert len(drawn) == 1
+    assert canvas_tops == pytest.approx(drawn[0])
+
+    texts = [op[5] for op in operations if op[0] == 'text']
+    assert 'Wasser & Abwasser' in texts
+    assert not any('<b>' in text or '&amp;' in text for text in texts)
+    assert ('Helvetica-Bold', 'Hauswart') in [(op[1], op[5]) for op in operations if op[0] == 'text']
+
+    # Gleiche Grenze zwischen einer und mehreren Seiten (einzeilige und umbrochene Zeilen)
+    fits = []
+    for row, counts in ((rows[0], range(14, 24)), (rows[1], range(3, 10))):
+        for count in counts:
+            payload = make_payload(rows=[row] * count)
+            one_page = page_count(renderer.render_platypus(payload)) == 1
+            assert (renderer.canvas_layout(payload) is not None) == one_page, (row['name'], count)
+            fits.append(one_page)
+    assert True in fits and False in fits
@@ -0,0 +1,129 @@
+import json
+import logging
+from datetime import date, datetime
+
+import pytest
+
+from app import create_app, db
+from app.models import Tenant, Apartment, Contract, CostType, ApartmentShare, OccupancyPeriod, ConsumptionData
+from app.billing.routes import _preview_rows
+from app.pdf_generation import generate_utility_statement_pdf
+from app.profiling import QueryCollector, query_budget, record_queries
+
+# Obergrenzen für die Anzahl SQL-Statements (unabhängig von der Anzahl Wohnungen)
+PREVIEW_QUERY_BUDGET = 8
+PDF_QUERY_BUDGET = 8
+
+
+def create_statement_data(n_apartments=5):
+    ct_share = CostType(name='Grundsteuer Perf', unit='m²', type='share')
+    ct_water = CostType(name='Wasser Perf', unit='m³', type='consumption')
+    ct_trash = CostType(name='Müll Perf', unit='Pers.', type='person_days')
+    db.session.add_all([ct_share, ct_water, ct_trash])
+    db.session.commit()
+    contract_ids = []
+    for i in range(1, n_apartments + 1):
+        apt = Apartment(number=f'P-{i}', address=f'Perfweg {i}', size_sqm=40.0 + i)
+        tenant = Tenant(name=f'Perf Mieter {i}', contact_info='perf@example.com')
+        db.session.add_all([apt, tenant])
+        db.session.commit()
+        contract = Contract(tenant_id=tenant.id, apartment_id=apt.id, start_date=date(2024, 1, 1), rent_amount=500.0)
+        db.session.add_all([
+            contract,
+            ApartmentShare(apartment_id=apt.id, cost_type_id=ct_share.id, value=apt.size_sqm),
+            OccupancyPeriod(apartment_id=apt.id, start_date=date(2024, 1, 1), number_of_occupants=1 + i % 3),
+            ConsumptionData(apartment_id=apt.id, cost_type_id=ct_water.id, date=datetime(2024, 5, 1), value=float(i)),
+        ])
+        db.session.commit()
+        contract_ids.append(contract.id)
+    cost_items = [
+        {'cost_type_id': ct_share.id, 'total_cost': 250.0},
+        {'cost_type_id': ct_water.id, 'total_cost': 180.0},
+        {'cost_type_id': ct_trash.id, 'total_cost': 95.0},
+        {'type': 'direct'},
+    ]
+    return contract_ids, cost_items
+
+
+@pytest.mark.parametrize('n_apartments', [2, 12])
+def test_preview_and_pdf_query_budgets(app_context, n_apartments):
+    contract_ids, cost_items = create_statement_data(n_apartments)
+    db.session.expire_all()
+
+    with query_budget(PREVIEW_QUERY_BUDGET):
+        rows, total = _preview_rows(contract_ids[0], date(2024, 1, 1), date(2024, 12, 31), cost_items)
+    assert len(rows) == 4
+
+    with query_budget(PDF_QUERY_BUDGET):
+        pdf_bytes = generate_utility_statement_pdf(contract_ids[-1], date(2024, 1, 1), date(2024, 12, 31), cost_items)
+    assert pdf_bytes.startswith(b'%PDF')
+
+
+def test_query_budget_reports_statements(app_context):
+    with pytest.raises(AssertionError, match='2 SQL statements executed, budget is 1'):
+        with query_budget(1):
+            db.session.query(Apartment).all()
+            db.session.query(Tenant).all()
+
+    with record_queries() as outer:
+        db.session.query(Apartment).count()
+        with record_queries() as inner:
+            db.session.query(Tenant).count()
+    assert (outer.count, inner.count) == (2, 1)
+    assert outer.db_time >= inner.db_time
+
+
+def test_request_profiling_headers_log_and_debug_page(caplog):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test-key',
+        'PROFILING_ENABLED': True,
+    })
+    with app.app_context():
+        db.create_all()
+        contract_ids, cost_items = create_statement_data(3)
+        client = app.test_client()
+
+        with caplog.at_level(logging.INFO, logger='app.profiling'):
+            resp = client.get('/contracts/')
+        assert resp.status_code == 200
+        timing = resp.headers['Server-Timing']
+        assert timing.startswith('db;dur=')
+        assert 'render;dur=' in timing and 'total;dur=' in timing
+
+        logged = [json.loads(r.getMessage()) for r in caplog.records if r.name == 'app.profiling']
+        assert logged[-1]['path'] == '/contracts/'
+        assert logged[-1]['queries'] >= 1
+        assert logged[-1]['render_ms'] > 0
+
+        client.post('/billing/', data={'contract_id': contract_ids[0], 'period_start': '2024-01-01',
+                                       'period_end': '2024-12-31', 'preset': 'standard', 'action': 'preview'})
+        entries = client.get('/debug/perf?format=json').get_json()
+        assert [e['kind'] for e in entries[:2]] == ['request', 'block']
+        assert entries[0]['path'] == '/billing/'
+        assert entries[1]['name'] == 'billing_run'
+        assert entries[0]['queries'] > entries[1]['queries'] > 0
+        assert len(entries[0]['slowest']) <= 5
+        assert client.get('/debug/perf').status_code == 200
+        db.session.remove()
+        db.drop_all()
+
+
+def test_profiling_is_off_by_default(client):
+    resp = client.get('/contracts/')
+    assert 'Server-Timing' not in resp.headers
+    assert client.get('/debug/perf').status_code == 404
+
+
+def test_collector_keeps_only_the_slowest_statements():
+    collector = QueryCollector(slowest=3)
+    for i, duration in enumerate([0.5, 0.1, 0.9, 0.3, 0.7, 0.2]):
+        collector.add(f'SELECT {i}', duration)
+    assert collector.count == 6
+    assert collector.db_time == pytest.approx(2.7)
+    assert collector.statements == []
+    assert len(collector._heap) == 3
+    assert collector.slowest() == [('SELECT 2', 0.9), ('SELECT 4', 0.7), ('SELECT 0', 0.5)]
+    assert collector.slowest(2) == [('SELECT 2', 0.9), ('SELECT 4', 0.7)]
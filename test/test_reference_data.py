@@ -0,0 +1,89 @@
+from datetime import date
+
+from app import db
+from app.models import Apartment, ApartmentShare, CostType
+from app.billing.routes import build_preset_cost_items
+from app.calculations import calculate_share_allocation
+from app.profiling import record_queries
+from app.reference_data import reference_data, reset_reference_data, get_cost_type
+
+
+def create_reference_data():
+    ct_share = CostType(name='Grundsteuer Ref', unit='m²', type='share')
+    ct_water = CostType(name='Kaltwasser Ref', unit='m³', type='consumption')
+    ct_heat = CostType(name='Heizung Ref', unit='kWh', type='consumption')
+    apt1 = Apartment(number='R-1', address='Refweg 1', size_sqm=50.0)
+    apt2 = Apartment(number='R-2', address='Refweg 2', size_sqm=70.0)
+    db.session.add_all([ct_share, ct_water, ct_heat, apt1, apt2])
+    db.session.commit()
+    db.session.add_all([
+        ApartmentShare(apartment_id=apt1.id, cost_type_id=ct_share.id, value=50.0),
+        ApartmentShare(apartment_id=apt2.id, cost_type_id=ct_share.id, value=70.0),
+    ])
+    db.session.commit()
+    return ct_share, ct_water, ct_heat, apt1, apt2
+
+
+def test_cost_types_and_shares_are_loaded_once(app_context):
+    ct_share, ct_water, ct_heat, apt1, apt2 = create_reference_data()
+    ids = (ct_share.id, ct_water.id, ct_heat.id, apt1.id)
+    db.session.expire_all()
+
+    with record_queries() as first:
+        allocation = calculate_share_allocation(ids[0], 120.0)
+        assert get_cost_type(ids[1]).name == 'Kaltwasser Ref'
+        assert reference_data().apartment(ids[3]).number == 'R-1'
+    assert allocation == {ids[3]: 50.0, ids[3] + 1: 70.0}
+    # Kostenarten, Anteile, Wohnung
+    assert first.count == 3
+
+    with record_queries() as second:
+        assert calculate_share_allocation(ids[0], 120.0) == allocation
+        assert reference_data().apartment_by_number('R-1').id == ids[3]
+        assert [ct.id for ct in reference_data().cost_types_by_type('consumption', 'HEIZ')] == [ids[2]]
+    assert second.count == 0
+
+
+def test_preset_lookup_uses_cache(app_context):
+    ct_share, ct_water, ct_heat, apt1, apt2 = create_reference_data()
+    expected = [ct_share.id, ct_water.id, None]
+    build_preset_cost_items('standard', date(2024, 1, 1), date(2024, 12, 31))
+    with record_queries() as queries:
+        items = build_preset_cost_items('standard', date(2024, 1, 1), date(2024, 12, 31))
+    # Nur noch die Rechnungssummen je Kostenart, keine Namenssuche mehr
+    assert queries.count == 2
+    assert [item.get('cost_type_id') for item in items] == expected
+
+
+def test_cache_is_invalidated_on_changes(app_context):
+    ct_share, ct_water, ct_heat, apt1, apt2 = create_reference_data()
+    share_id, apt1_id = ct_share.id, apt1.id
+    assert get_cost_type(share_id).name == 'Grundsteuer Ref'
+    assert reference_data().shares(share_id) == {apt1.id: 50.0, apt2.id: 70.0}
+
+    db.session.get(CostType, share_id).name = 'Grundsteuer Neu'
+    db.session.commit()
+    assert get_cost_type(share_id).name == 'Grundsteuer Neu'
+
+    # Ungeflushte Änderungen werden vor dem Lesen geschrieben (wie beim Autoflush)
+    ApartmentShare.query.filter_by(apartment_id=apt1_id, cost_type_id=share_id).one().value = 55.0
+    assert reference_data().shares(share_id)[apt1_id] == 55.0
+
+    # Zurückgerollte Änderungen verschwinden wieder aus dem Cache
+    db.session.rollback()
+    assert reference_data().shares(share_id)[apt1_id] == 50.0
+
+    apt = db.session.get(Apartment, apt1_id)
+    apt.number = 'R-1a'
+    db.session.commit()
+    assert reference_data().apartment(apt1_id).number == 'R-1a'
+    assert reference_data().apartment_by_number('R-1') is None
+
+
+def test_reset_reference_data(app_context):
+    ct_share, *_ = create_reference_data()
+    get_cost_type(ct_share.id)
+    reset_reference_data()
+    with record_queries() as queries:
+        get_cost_type(ct_share.id)
+    assert queries.count == 1
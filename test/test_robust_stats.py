@@ -0,0 +1,48 @@
+import random
+import statistics
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, insert
+
+from app import db
+from app.robust_stats import P2Quantile, RobustStats, robust_stats_sql, robust_stats_stream
+
+
+def exact_stats(values):
+    median = statistics.median(values)
+    return RobustStats(len(values), median, statistics.median(abs(v - median) for v in values))
+
+
+def test_p2_quantile_exact_for_small_and_close_for_large_samples():
+    estimator = P2Quantile(0.5)
+    assert estimator.value() is None
+    for value in (7.0, 1.0, 3.0, 5.0):
+        estimator.add(value)
+    assert estimator.value() == 4.0
+
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3.0, 0.5) for _ in range(5000)]
+    for p in (0.5, 0.9):
+        estimator = P2Quantile(p)
+        for value in values:
+            estimator.add(value)
+        exact = statistics.quantiles(values, n=100)[int(p * 100) - 1]
+        assert abs(estimator.value() - exact) / exact < 0.03
+
+
+def test_sql_and_stream_statistics_agree(app_context):
+    rng = random.Random(11)
+    groups = {1: [rng.gauss(10, 1) for _ in range(101)], 2: [5.0, 5.0, 5.0, 40.0], 3: [2.0]}
+    table = Table('robust_values', MetaData(), Column('id', Integer, primary_key=True),
+                  Column('grp', Integer), Column('value', Float))
+    table.create(db.session.connection())
+    db.session.execute(insert(table), [{'grp': grp, 'value': v} for grp, values in groups.items() for v in values])
+
+    sql_stats = robust_stats_sql(db.session, table.c.value, (table.c.grp,), (table.c.value > 0,))
+    assert sql_stats == {(grp,): exact_stats(values) for grp, values in groups.items()}
+
+    (stream_stats,) = robust_stats_stream(
+        lambda: db.session.execute(table.select()), (lambda row: ((row.grp,), row.value),))
+    assert stream_stats[(2,)] == sql_stats[(2,)] and stream_stats[(3,)] == sql_stats[(3,)]
+    assert stream_stats[(1,)].count == 101
+    assert abs(stream_stats[(1,)].median - sql_stats[(1,)].median) < 0.3
+    assert abs(stream_stats[(1,)].mad - sql_stats[(1,)].mad) < 0.3
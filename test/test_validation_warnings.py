@@ -1,7 +1,8 @@
 from datetime import date, datetime
 from app import db
 from app.models import Apartment, CostType, ConsumptionData
-from app.validation import generate_warnings
+from app.profiling import record_queries
+from app.validation import generate_warnings, spike_statistics
 
 
 def setup_basic_consumption():
@@ -46,6 +47,21 @@ def test_invalid_consumption_values_warning(client):
     assert any(w['apartment_id'] == a1.id and w['cost_type_id'] == ct.id for w in invalids)
 
 
+def test_period_includes_whole_end_day(client):
+    """Ablesungen am letzten Tag (mit Uhrzeit) zählen zum Zeitraum, der Folgetag 00:00 nicht."""
+    a1, a2, ct = setup_basic_consumption()
+    db.session.add_all([
+        ConsumptionData(apartment_id=a1.id, cost_type_id=ct.id, date=datetime(2024, 1, 31, 14, 30), value=4.0),
+        ConsumptionData(apartment_id=a2.id, cost_type_id=ct.id, date=datetime(2024, 1, 31, 23, 59), value=-1.0),
+        ConsumptionData(apartment_id=a2.id, cost_type_id=ct.id, date=datetime(2024, 2, 1), value=-2.0),
+    ])
+    db.session.commit()
+
+    warnings = generate_warnings(period_start=date(2024, 1, 1), period_end=date(2024, 1, 31))
+    assert {(w['apartment_id'], w['cost_type_id']) for w in warnings['missing_consumption']} == {(a2.id, ct.id)}
+    assert [w['value'] for w in warnings['invalid_consumption_values']] == [-1.0]
+
+
 def test_consumption_spikes_warning(client):
     a1, a2, ct = setup_basic_consumption()
     # Normale Werte ~1, ein Ausreißer 10 (> 3 * median(1,1,1) = 3)
@@ -62,3 +78,58 @@ def test_consumption_spikes_warning(client):
     assert any(w['apartment_id'] == a2.id and w['cost_type_id'] == ct.id and w['value'] == 10.0 for w in spikes)
 
 
+def test_spike_statistics_cover_whole_end_day(client):
+    """Kennzahlen umfassen den ganzen letzten Tag und nicht den Folgetag."""
+    a1, _, ct = setup_basic_consumption()
+    db.session.add_all([
+        ConsumptionData(apartment_id=a1.id, cost_type_id=ct.id, date=datetime(2024, 1, day), value=2.0)
+        for day in (10, 20)
+    ] + [
+        ConsumptionData(apartment_id=a1.id, cost_type_id=ct.id, date=datetime(2024, 1, 31, 18), value=5.0),
+        ConsumptionData(apartment_id=a1.id, cost_type_id=ct.id, date=datetime(2024, 2, 1), value=50.0),
+    ])
+    db.session.commit()
+
+    for backend in ('sql', 'stream'):
+        per_apartment, per_cost_type = spike_statistics(date(2024, 1, 1), date(2024, 1, 31), backend)
+        assert per_apartment[(a1.id, ct.id)].count == 3 and per_cost_type[(ct.id,)].count == 3
+        assert per_apartment[(a1.id, ct.id)].median == 2.0
+
+
+
+def test_spikes_use_own_statistics_per_apartment_and_cost_type(client):
+    a1, a2, water = setup_basic_consumption()
+    a3 = Apartment(number='W-3', address='Warnstr 3', size_sqm=65.0)
+    heat = CostType(name='Heizung-Warn', unit='kWh', type='consumption')
+    db.session.add_all([a3, heat])
+    db.session.commit()
+    readings = [
+        # W-1 Wasser: ein echter Ausreißer gegenüber den eigenen Werten
+        (a1, water, [5.0, 5.5, 4.8, 5.2, 5.1, 20.0]),
+        # W-2 Wasser: dauerhaft hoch, aber gleichmäßig – kein Ausreißer
+        (a2, water, [20.0, 21.0, 19.5, 20.5]),
+        # kWh liegen um Größenordnungen über m³ und werden nur untereinander verglichen
+        (a1, heat, [900.0, 1000.0, 1100.0, 950.0]),
+        (a2, heat, [-1.0]),
+    ]
+    db.session.add_all([
+        ConsumptionData(apartment_id=apt.id, cost_type_id=ct.id, date=datetime(2024, 1, day + 1), value=value)
+        for apt, ct, values in readings for day, value in enumerate(values)
+    ])
+    # Außerhalb des Zeitraums: wird ignoriert
+    db.session.add(ConsumptionData(apartment_id=a3.id, cost_type_id=water.id, date=datetime(2024, 3, 1), value=-5.0))
+    db.session.commit()
+
+    for backend in ('sql', 'stream'):
+        with record_queries() as queries:
+            warnings = generate_warnings(period_start=date(2024, 1, 1), period_end=date(2024, 1, 31), backend=backend)
+        # Zähler, fehlende Paare, Kennzahlen (zwei Abfragen bzw. zwei Durchläufe), ein Durchlauf für die Warnungen
+        assert queries.count == 5
+
+        spikes = warnings['consumption_spikes']
+        assert [(w['apartment_id'], w['cost_type_id'], w['value'], w['scope']) for w in spikes] == \
+            [(a1.id, water.id, 20.0, 'apartment')]
+        assert spikes[0]['median'] < spikes[0]['threshold'] < 20.0
+        assert [w['value'] for w in warnings['invalid_consumption_values']] == [-1.0]
+        missing = {(w['apartment_id'], w['cost_type_id']) for w in warnings['missing_consumption']}
+        assert missing == {(a2.id, heat.id), (a3.id, water.id), (a3.id, heat.id)}
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from app import db
+from app.jobs.queue import claim_next_job, enqueue_job, run_job
+from app.models import Apartment, Building, ConsumptionData, CostType, WarningEntry
+from app.profiling import record_queries
+
+PERIOD = {'start': '2024-01-01', 'end': '2024-01-31'}
+
+
+def setup_portfolio():
+    north, south = Building(name='Nord'), Building(name='Süd')
+    db.session.add_all([north, south])
+    db.session.commit()
+    apartments = [Apartment(number=f'P-{i}', address=f'Portfolioweg {i}', size_sqm=50.0,
+                            building_id=(north, south)[i % 2].id) for i in range(30)]
+    cost_types = [CostType(name=f'Verbrauch {i}', unit='m³', type='consumption') for i in range(5)]
+    db.session.add_all(apartments + cost_types)
+    db.session.commit()
+    # Eine ungültige Ablesung (zählt als fehlend) und ein gültiger Wert: 149 von 150 Paaren fehlen
+    db.session.add(ConsumptionData(apartment_id=apartments[0].id, cost_type_id=cost_types[0].id,
+                                   date=datetime(2024, 1, 5), value=-2.0))
+    db.session.add(ConsumptionData(apartment_id=apartments[1].id, cost_type_id=cost_types[0].id,
+                                   date=datetime(2024, 1, 5), value=3.0))
+    db.session.commit()
+    enqueue_job('warnings', {'period_start': '2024-01-01', 'period_end': '2024-01-31'})
+    run_job(claim_next_job())
+    return north, south, apartments, cost_types
+
+
+def test_keyset_pagination_over_all_entries(client):
+    setup_portfolio()
+    seen = []
+    after = None
+    while True:
+        params = {**PERIOD, 'kind': 'missing_consumption', 'limit': 40}
+        if after is not None:
+            params['after'] = after
+        page = client.get('/warnings/api', query_string=params).get_json()
+        assert len(page['items']) <= 40
+        seen.extend(item['id'] for item in page['items'])
+        after = page['next_after']
+        if after is None:
+            break
+    assert len(seen) == len(set(seen)) == 149
+    assert seen == sorted(seen)
+    first = client.get('/warnings/api', query_string={**PERIOD, 'kind': 'missing_consumption', 'limit': 1}).get_json()
+    assert first['items'][0]['apartment_number'] == 'P-0' and first['items'][0]['cost_type_name'] == 'Verbrauch 0'
+
+
+def test_filters_and_summary(client):
+    north, south, apartments, cost_types = setup_portfolio()
+    summary = client.get('/warnings/api', query_string={**PERIOD, 'summary': 1}).get_json()
+    assert summary['counts'] == {'missing_consumption': 149, 'invalid_consumption_values': 1, 'consumption_spikes': 0}
+
+    summary = client.get('/warnings/api', query_string={**PERIOD, 'summary': 1, 'building': south.id,
+                                                        'cost_type': cost_types[0].id}).get_json()
+    # Süd: ungerade Wohnungen; P-1 hat einen gültigen Wert für Verbrauch 0
+    assert summary['counts']['missing_consumption'] == 14
+    assert summary['counts']['invalid_consumption_values'] == 0
+
+    page = client.get('/warnings/api', query_string={**PERIOD, 'building': north.id,
+                                                     'kind': 'invalid_consumption_values'}).get_json()
+    assert [(item['apartment_id'], item['value']) for item in page['items']] == [(apartments[0].id, -2.0)]
+    assert page['next_after'] is None
+
+
+def test_page_renders_counts_only(client):
+    setup_portfolio()
+    with record_queries() as queries:
+        html = client.get('/warnings/', query_string=PERIOD).get_data(as_text=True)
+    assert '<span class="badge bg-secondary">149</span>' in html
+    assert 'P-17' not in html
+    # Job, laufender Job, Anzahlen, Gebäude, Kostenarten
+    assert queries.count <= 6
+
+
+def test_api_errors(client):
+    assert client.get('/warnings/api', query_string=PERIOD).status_code == 404
+    setup_portfolio()
+    assert client.get('/warnings/api', query_string={**PERIOD, 'kind': 'unbekannt'}).status_code == 400
+    assert client.get('/warnings/api', query_string={**PERIOD, 'after': 'x'}).status_code == 400
+
+
+def test_new_run_replaces_entries_of_previous_run(client):
+    """Ein neuer Lauf für denselben Zeitraum ersetzt die Einträge des vorigen; die API liefert nur den neuesten."""
+    _, _, apartments, cost_types = setup_portfolio()
+    first_job = client.get('/warnings/api', query_string={**PERIOD, 'summary': 1}).get_json()['job_id']
+    # Anderer Zeitraum bleibt unberührt
+    enqueue_job('warnings', {'period_start': '2024-02-01', 'period_end': '2024-02-29'})
+    run_job(claim_next_job())
+    other_period = WarningEntry.query.filter(WarningEntry.job_id != first_job).count()
+
+    db.session.add(ConsumptionData(apartment_id=apartments[2].id, cost_type_id=cost_types[0].id,
+                                   date=datetime(2024, 1, 7), value=4.0))
+    db.session.commit()
+    enqueue_job('warnings', {'period_start': '2024-01-01', 'period_end': '2024-01-31'})
+    run_job(claim_next_job())
+
+    summary = client.get('/warnings/api', query_string={**PERIOD, 'summary': 1}).get_json()
+    assert summary['job_id'] != first_job
+    assert summary['counts']['missing_consumption'] == 148
+    assert WarningEntry.query.filter_by(job_id=first_job).count() == 0
+    assert WarningEntry.query.count() == other_period + 149
+
+    # Weiterblättern im ersetzten Lauf mischt keine Läufe
+    stale = client.get('/warnings/api', query_string={**PERIOD, 'job': first_job, 'kind': 'missing_consumption'})
+    assert stale.status_code == 410 and stale.get_json()['job_id'] == summary['job_id']
+    html = client.get('/warnings/', query_string={**PERIOD, 'job': first_job}).get_data(as_text=True)
+    assert '<span class="badge bg-secondary">148</span>' in html